@@ -0,0 +1,4 @@
+'''
+The :mod:`benchmarks` module contains performance benchmarks of the Percival control software, run against
+the carrier board simulator, together with tools to record the results and compare them against a baseline.
+'''
@@ -0,0 +1,177 @@
+"""
+End-to-end benchmarks of the PercivalDetector against the carrier board simulator.
+
+The simulator is either run in-process through the loopback transport (default, which measures the
+Python hot paths without socket noise) or served over TCP on a local port. A simulator profile can be
+given to model the response latency of the real hardware.
+
+Example:
+
+    percival-benchmark --output results.json
+    percival-benchmark --compare results.json --tolerance 0.2
+"""
+from __future__ import print_function
+
+import argparse
+import logging
+import sys
+from functools import partial
+
+from percival.log import log
+from percival.carrier.simulator import Simulator
+from percival.carrier.txrx import loopback_transport, tcp_transport
+from percival.carrier.configuration import SensorCalibrationParameters
+from percival.detector.detector import PercivalDetector
+from percival.benchmarks.harness import RoundTripCounter, measure, metadata, report, DEFAULT_TOLERANCE
+
+CALIBRATION_FILE = "config/04_Sensor_Settings/SensorCalibration_000_SAFE_START.ini"
+
+SCAN_SETPOINTS = u"[Setpoint_Group<0000>]\n" \
+                 u"Setpoint_name = \"BENCH_LOW\"\n" \
+                 u"Setpoint_description = \"Benchmark scan start\"\n" \
+                 u"VDD_D1V8_1 = 0\n" \
+                 u"VDD_A1V8_1 = 0\n" \
+                 u"VDD_A3V3_1 = 0\n" \
+                 u"VDD_D2V5_1 = 0\n" \
+                 u"VDD_D3V3_1 = 0\n" \
+                 u"\n" \
+                 u"[Setpoint_Group<0001>]\n" \
+                 u"Setpoint_name = \"BENCH_HIGH\"\n" \
+                 u"Setpoint_description = \"Benchmark scan end\"\n" \
+                 u"VDD_D1V8_1 = 100\n" \
+                 u"VDD_A1V8_1 = 100\n" \
+                 u"VDD_A3V3_1 = 100\n" \
+                 u"VDD_D2V5_1 = 100\n" \
+                 u"VDD_D3V3_1 = 100\n"
+"""Two set-points over five control channels used for the scan benchmark"""
+
+SCAN_STEPS = 10
+
+
+class LocalSocket(object):
+    """
+    TCP transport which connects to the simulator on the local host, whatever carrier address is configured
+    """
+    def __init__(self, port):
+        self._port = port
+        self._sock = tcp_transport()
+
+    def connect(self, address):
+        self._sock.connect(("127.0.0.1", self._port))
+
+    def __getattr__(self, item):
+        return getattr(self._sock, item)
+
+
+class EndToEndBenchmarks(object):
+    """
+    Create a simulator and a PercivalDetector connected to it, and time the key detector operations
+    """
+    def __init__(self, transport="loopback", profile=None, ini_file=None):
+        self._log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
+        self.counter = RoundTripCounter()
+        if transport == "loopback":
+            self.simulator = Simulator(port=None, profile=profile)
+            detector_transport = loopback_transport(self.simulator)
+        else:
+            self.simulator = Simulator(port=0, profile=profile)
+            self.simulator.start(forever=True, blocking=False)
+            detector_transport = partial(LocalSocket, self.simulator.port)
+        self.detector = PercivalDetector(ini_file, transport=self.counter.transport(detector_transport))
+        # The periodic status reads would add round trips to every measurement
+        self.detector._status_service.stop()
+        self._calibration = None
+
+    def shutdown(self):
+        self.detector.cleanup()
+        if self.simulator.port is not None:
+            self.simulator.shutdown()
+
+    def bench_connect(self):
+        self.detector.connect()
+
+    def bench_load_configuration(self):
+        self.detector.load_configuration()
+
+    def bench_load_channels(self):
+        self.detector.load_channels()
+
+    def bench_update_status(self):
+        self.detector.update_status()
+
+    def bench_apply_calibration(self):
+        self.detector._sensor.apply_calibration(self._calibration)
+
+    def bench_setpoint_scan(self):
+        self.detector._setpoint_control.scan_set_points(["BENCH_LOW", "BENCH_HIGH"], SCAN_STEPS, 0)
+        self.detector._setpoint_control.wait_for_scan_to_complete()
+
+    def bench_read_status(self):
+        self.detector.read("status")
+
+    def run(self, repeat=5, names=None):
+        """Run the benchmarks (all, or those listed in names) and return the results dictionary"""
+        calibration = SensorCalibrationParameters(CALIBRATION_FILE)
+        calibration.load_ini()
+        self._calibration = calibration.value_map
+        self.detector.load_setpoints(SCAN_SETPOINTS)
+        self.detector.set_global_monitoring(True)
+        # The status service is stopped so read the status once for read('status') to report
+        self.detector.update_status()
+
+        benchmarks = [("connect", self.bench_connect),
+                      ("load_configuration", self.bench_load_configuration),
+                      ("load_channels", self.bench_load_channels),
+                      ("update_status", self.bench_update_status),
+                      ("sensor_apply_calibration", self.bench_apply_calibration),
+                      ("setpoint_scan", self.bench_setpoint_scan),
+                      ("read_status", self.bench_read_status)]
+        results = {}
+        for name, func in benchmarks:
+            if names and name not in names:
+                continue
+            self._log.info("Running benchmark %s", name)
+            results[name] = measure(func, repeat, self.counter)
+        return results
+
+
+def options():
+    desc = """Run end-to-end performance benchmarks of the Percival detector against the carrier board simulator
+    """
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument("-t", "--transport", action="store", default="loopback", choices=["loopback", "tcp"],
+                        help="Connect to the simulator in-process (loopback) or over TCP (default loopback)")
+    parser.add_argument("-p", "--profile", action="store", default=None,
+                        help="Simulator response profile INI file")
+    parser.add_argument("-i", "--ini", action="store", default=None,
+                        help="Percival control INI file (default config/percival.ini)")
+    parser.add_argument("-r", "--repeat", action="store", type=int, default=5,
+                        help="Number of timed repeats of each benchmark (default 5)")
+    parser.add_argument("-b", "--benchmark", action="append", default=None,
+                        help="Benchmark to run, may be given more than once (default all)")
+    parser.add_argument("-o", "--output", action="store", default=None, help="Write the results to a JSON file")
+    parser.add_argument("-c", "--compare", action="store", default=None,
+                        help="Baseline JSON results file to compare against")
+    parser.add_argument("--tolerance", action="store", type=float, default=DEFAULT_TOLERANCE,
+                        help="Fractional slow down over the baseline reported as a regression (default %.2f)" %
+                             DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = options()
+    log.info(args)
+
+    benchmarks = EndToEndBenchmarks(args.transport, args.profile, args.ini)
+    try:
+        results = benchmarks.run(args.repeat, args.benchmark)
+    finally:
+        benchmarks.shutdown()
+    info = metadata(suite="end_to_end", transport=args.transport, profile=args.profile, repeat=args.repeat)
+    regressions = report(results, args.output, args.compare, args.tolerance, info)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
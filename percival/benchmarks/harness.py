@@ -0,0 +1,182 @@
+"""
+Timing harness shared by the Percival benchmarks.
+
+Each benchmark is timed over a number of repeats, recording wall time, process CPU time and
+the number of message round trips to the carrier board. Results are stored as JSON and can be
+compared against a stored baseline to flag regressions.
+"""
+from __future__ import print_function, division
+
+import json
+import logging
+import platform
+import resource
+import sys
+import timeit
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOLERANCE = 0.2
+"""Fractional increase of a timing metric over the baseline which is reported as a regression"""
+
+
+class CountingSocket(object):
+    """
+    Socket-like wrapper around a :class:`percival.carrier.txrx.TxRx` transport which counts the
+    number of messages sent (each of which is a round trip to the carrier board)
+    """
+    def __init__(self, sock, counter):
+        self._sock = sock
+        self._counter = counter
+
+    def sendall(self, msg):
+        self._counter.round_trips += 1
+        return self._sock.sendall(msg)
+
+    def __getattr__(self, item):
+        return getattr(self._sock, item)
+
+
+class RoundTripCounter(object):
+    """
+    Count the round trips made through any TxRx created with the transport returned by :meth:`transport`
+    """
+    def __init__(self):
+        self.round_trips = 0
+
+    def transport(self, transport):
+        """Wrap a TxRx transport factory so that all messages sent through it are counted"""
+        def factory():
+            return CountingSocket(transport(), self)
+        return factory
+
+
+def cpu_time():
+    """Return the CPU time (user + system, seconds) used by this process, including all of its threads"""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2.0
+
+
+def measure(func, repeat=5, counter=None, setup=None):
+    """Time repeated calls of func
+
+    :param func: callable to benchmark
+    :param repeat: number of timed calls
+    :param counter: optional RoundTripCounter to record the round trips made by each call
+    :param setup: optional callable executed (untimed) before each call
+    :returns: dictionary of results
+    """
+    wall = []
+    cpu = []
+    round_trips = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start_trips = counter.round_trips if counter else 0
+        start_cpu = cpu_time()
+        start_wall = timeit.default_timer()
+        func()
+        wall.append(timeit.default_timer() - start_wall)
+        cpu.append(cpu_time() - start_cpu)
+        if counter:
+            round_trips.append(counter.round_trips - start_trips)
+    result = {
+        "repeat": repeat,
+        "wall_min": min(wall),
+        "wall_median": _median(wall),
+        "wall_mean": sum(wall) / len(wall),
+        "cpu_median": _median(cpu),
+        "cpu_mean": sum(cpu) / len(cpu),
+    }
+    if counter:
+        result["round_trips"] = max(round_trips)
+    return result
+
+
+def metadata(**kwargs):
+    """Describe the environment the benchmarks were run in"""
+    info = {
+        "created": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "host": platform.node(),
+    }
+    info.update(kwargs)
+    return info
+
+
+def save_results(filename, results, info=None):
+    """Write benchmark results (and a description of the environment) to a JSON file"""
+    with open(filename, "w") as output:
+        json.dump({"metadata": info or metadata(), "benchmarks": results}, output, indent=2, sort_keys=True)
+
+
+def load_results(filename):
+    """Read the benchmark results dictionary from a JSON file written by :func:`save_results`"""
+    with open(filename) as data:
+        return json.load(data)["benchmarks"]
+
+
+def compare_results(results, baseline, tolerance=DEFAULT_TOLERANCE, metrics=("wall_median", "cpu_median")):
+    """Compare benchmark results against a baseline
+
+    A timing metric regresses if it exceeds the baseline by more than the tolerance (a fraction).
+    Any increase in the number of round trips is a regression.
+
+    :returns: list of (benchmark, metric, baseline value, new value) tuples for each regression
+    """
+    regressions = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        for metric in metrics:
+            if metric in results[name] and metric in baseline[name]:
+                if results[name][metric] > baseline[name][metric] * (1.0 + tolerance):
+                    regressions.append((name, metric, baseline[name][metric], results[name][metric]))
+        if "round_trips" in results[name] and "round_trips" in baseline[name]:
+            if results[name]["round_trips"] > baseline[name]["round_trips"]:
+                regressions.append((name, "round_trips", baseline[name]["round_trips"],
+                                    results[name]["round_trips"]))
+    return regressions
+
+
+def print_results(results, baseline=None, metric="wall_median"):
+    """Print a table of results, with the change in metric relative to the baseline if one is given"""
+    print("%-32s %12s %12s %12s %8s" % ("benchmark", "wall (ms)", "cpu (ms)", "round trips", "change"))
+    for name in sorted(results):
+        result = results[name]
+        change = ""
+        if baseline and name in baseline and baseline[name].get(metric, 0.0) > 0.0:
+            change = "%+.0f%%" % (100.0 * (result[metric] / baseline[name][metric] - 1.0))
+        print("%-32s %12.3f %12.3f %12s %8s" % (name,
+                                                result["wall_median"] * 1000.0,
+                                                result["cpu_median"] * 1000.0,
+                                                result.get("round_trips", "-"),
+                                                change))
+
+
+def report(results, output=None, compare=None, tolerance=DEFAULT_TOLERANCE, info=None,
+           metrics=("wall_median", "cpu_median")):
+    """Save, print and compare a set of results (see :func:`compare_results` for the metrics compared)
+
+    :returns: number of regressions found against the baseline (0 if no baseline given)
+    """
+    if output:
+        save_results(output, results, info)
+    baseline = load_results(compare) if compare else None
+    print_results(results, baseline, metrics[0])
+    if baseline is None:
+        return 0
+    regressions = compare_results(results, baseline, tolerance, metrics)
+    for name, metric, old, new in regressions:
+        print("REGRESSION %s %s: %s -> %s" % (name, metric, old, new))
+    return len(regressions)
@@ -0,0 +1,153 @@
+"""
+Offline benchmarks of logging monitor points to the database.
+
+The status points of a detector with a configurable number of monitor channels are logged through a
+:class:`~percival.carrier.database.FileSink`, which takes the place of the InfluxDB server.  For each batch
+size the time to log and store every point is measured, along with the time spent in log_point by the
+calling (status) thread and the number of points dropped by the bounded buffer.  Use it to choose the
+batching options of the [Database] section of percival.ini.
+
+Example:
+
+    percival-ingest-benchmark --output ingest.json
+    percival-ingest-benchmark --batch-size 100 --batch-size 1000 --compare ingest.json
+"""
+from __future__ import print_function, division
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+from datetime import datetime, timedelta
+
+from percival.log import log
+from percival.carrier.database import FileSink, read_lines
+from percival.benchmarks.harness import measure, metadata, report, DEFAULT_TOLERANCE
+
+DEFAULT_BATCH_SIZES = [1, 10, 100, 500, 2000]
+
+
+def status_points(channels=100, cycles=100, period=0.25):
+    """
+    Generate the points logged by a number of status cycles: one point per monitor channel per cycle
+
+    :returns: list of (time, measurement, data) tuples
+    """
+    start = datetime(2017, 1, 1)
+    points = []
+    for cycle in range(cycles):
+        timestamp = start + timedelta(seconds=cycle * period)
+        for channel in range(channels):
+            points.append((timestamp, "Channel_{}".format(channel),
+                           {"value": 1.25 + channel + 0.001 * cycle,
+                            "raw_value": 1000 + channel + cycle,
+                            "sample_number": cycle % 256,
+                            "i2c_comms_error": False,
+                            "safety_exception": False}))
+    return points
+
+
+class IngestBenchmark(object):
+    """
+    Log a set of points into a new file sink, waiting until they have all been written
+    """
+    def __init__(self, points, directory, batch_size, flush_interval=1.0, max_buffered=20000):
+        self.points = points
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.filename = None
+        self.log_point_time = []
+        self.dropped = 0
+        self.sink = None
+
+    def setup(self):
+        if self.filename and os.path.exists(self.filename):
+            os.remove(self.filename)
+        self.filename = os.path.join(self.directory, "ingest_{}.txt".format(self.batch_size))
+        self.sink = FileSink(self.filename, self.batch_size, self.flush_interval, self.max_buffered)
+        self.sink.connect()
+
+    def run(self):
+        start = timeit.default_timer()
+        for point in self.points:
+            self.sink.log_point(*point)
+        self.log_point_time.append(timeit.default_timer() - start)
+        self.sink.close()
+        self.dropped = max(self.dropped, self.sink.get_status()["writer"]["dropped"])
+
+
+def run(repeat=5, batch_sizes=None, channels=100, cycles=100, flush_interval=1.0, max_buffered=20000):
+    """Run the ingest benchmark for each batch size and return the results dictionary
+
+    :param repeat: number of timed runs for each batch size
+    :param batch_sizes: list of batch sizes to measure
+    :param channels: number of monitor channels logged each status cycle
+    :param cycles: number of status cycles logged per run
+    """
+    points = status_points(channels, cycles)
+    directory = tempfile.mkdtemp(prefix="percival_ingest")
+    results = {}
+    try:
+        for batch_size in batch_sizes or DEFAULT_BATCH_SIZES:
+            benchmark = IngestBenchmark(points, directory, batch_size, flush_interval, max_buffered)
+            result = measure(benchmark.run, repeat, setup=benchmark.setup)
+            log_point_time = sorted(benchmark.log_point_time)[len(benchmark.log_point_time) // 2]
+            result["points"] = len(points)
+            result["stored"] = len(read_lines(benchmark.filename))
+            result["dropped"] = benchmark.dropped
+            result["points_per_second"] = len(points) / result["wall_median"] if result["wall_median"] > 0.0 else 0.0
+            result["log_point_per_call"] = log_point_time / len(points)
+            results["ingest_batch_{}".format(batch_size)] = result
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+def options():
+    desc = """Measure offline the rate at which monitor points are logged and stored by the database sink
+    """
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument("-r", "--repeat", action="store", type=int, default=5,
+                        help="Number of timed runs for each batch size (default 5)")
+    parser.add_argument("-b", "--batch-size", action="append", type=int, default=None,
+                        help="Batch size to measure, may be given more than once (default %s)" %
+                             ", ".join(str(size) for size in DEFAULT_BATCH_SIZES))
+    parser.add_argument("--channels", action="store", type=int, default=100,
+                        help="Number of monitor channels per status cycle (default 100)")
+    parser.add_argument("--cycles", action="store", type=int, default=100,
+                        help="Number of status cycles logged per run (default 100)")
+    parser.add_argument("--flush-interval", action="store", type=float, default=1.0,
+                        help="Maximum time (seconds) a point is buffered (default 1.0)")
+    parser.add_argument("--max-buffered", action="store", type=int, default=20000,
+                        help="Maximum number of buffered points (default 20000)")
+    parser.add_argument("-o", "--output", action="store", default=None, help="Write the results to a JSON file")
+    parser.add_argument("-c", "--compare", action="store", default=None,
+                        help="Baseline JSON results file to compare against")
+    parser.add_argument("--tolerance", action="store", type=float, default=DEFAULT_TOLERANCE,
+                        help="Fractional slow down over the baseline reported as a regression (default %.2f)" %
+                             DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = options()
+    log.info(args)
+
+    results = run(args.repeat, args.batch_size, args.channels, args.cycles, args.flush_interval, args.max_buffered)
+    info = metadata(suite="ingest", repeat=args.repeat, channels=args.channels, cycles=args.cycles,
+                    flush_interval=args.flush_interval, max_buffered=args.max_buffered)
+    regressions = report(results, args.output, args.compare, args.tolerance, info,
+                         metrics=("wall_median", "log_point_per_call"))
+    for name in sorted(results):
+        print("%-32s %12.0f points/s %8d dropped" % (name, results[name]["points_per_second"],
+                                                      results[name]["dropped"]))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
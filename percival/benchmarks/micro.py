@@ -0,0 +1,162 @@
+"""
+Micro-benchmarks of the message codec and register map inner loops.
+
+These run offline (no simulator or hardware) with fixed inputs, timing a batch of calls of each
+function per repeat. They cover the work done on every status cycle and configuration upload:
+encoding and decoding messages, parsing and generating register maps, packing the sensor
+calibration and formatting register dumps.
+
+Example:
+
+    percival-micro-benchmark --output micro.json
+    percival-micro-benchmark --compare micro.json --tolerance 0.2
+"""
+from __future__ import print_function
+
+import argparse
+import sys
+
+from percival.log import log
+import percival.carrier.const as const
+from percival.carrier.encoding import encode_message, encode_multi_message, decode_message
+from percival.carrier.registers import SystemSettingsMap, generate_register_maps
+from percival.carrier.txrx import hexify
+from percival.carrier.sensor import Sensor
+from percival.carrier.configuration import SensorCalibrationParameters
+from percival.benchmarks.harness import measure, metadata, report, DEFAULT_TOLERANCE
+
+CALIBRATION_FILE = "config/04_Sensor_Settings/SensorCalibration_000_SAFE_START.ini"
+
+READ_VALUES_BLOCK = const.READ_VALUES_PERIPHERY_BOTTOM
+"""The largest block read on every status cycle: 84 monitor read values"""
+
+
+class CalibrationSink(object):
+    """Sensor buffer command stand-in which keeps the packed calibration words instead of sending them"""
+    def __init__(self):
+        self.words = None
+
+    def send_calibration_setup_cmd(self, words):
+        self.words = words
+
+
+class MicroBenchmarks(object):
+    """
+    Fixed inputs and the functions to time, each of which performs one call of the code under test
+    """
+    def __init__(self):
+        addresses = range(READ_VALUES_BLOCK.start_address,
+                          READ_VALUES_BLOCK.start_address + READ_VALUES_BLOCK.entries)
+        # Read values with sample numbers and flags set, as returned by the carrier board
+        self.words = [(0x2A << 24) | (index << 16 & 0x3F0000) | (1000 + index) for index in range(len(addresses))]
+        self.registers = list(zip(addresses, self.words))
+        self.message = b"".join(encode_multi_message(READ_VALUES_BLOCK.start_address, self.words))
+        self.settings_map = SystemSettingsMap()
+        # Fixed pseudo-random pattern so that every field of the map carries a non-trivial value
+        self.settings_words = [(0x9E3779B1 * (index + 1)) & 0xFFFFFFFF for index in range(self.settings_map.num_words)]
+        self.settings_map.parse_map(self.settings_words)
+        calibration = SensorCalibrationParameters(CALIBRATION_FILE)
+        calibration.load_ini()
+        self.calibration = calibration.value_map
+        self.sensor = Sensor(CalibrationSink())
+
+    def encode_message(self):
+        encode_message(READ_VALUES_BLOCK.start_address, self.words[0])
+
+    def encode_multi_message(self):
+        encode_multi_message(READ_VALUES_BLOCK.start_address, self.words)
+
+    def decode_message(self):
+        decode_message(self.message)
+
+    def parse_map(self):
+        self.settings_map.parse_map(self.settings_words)
+
+    def generate_map(self):
+        self.settings_map.generate_map()
+
+    def generate_register_maps(self):
+        generate_register_maps(self.registers)
+
+    def apply_calibration(self):
+        self.sensor.apply_calibration(self.calibration)
+
+    def hexify(self):
+        hexify(self.registers)
+
+    def benchmarks(self):
+        """Return the list of (name, function, calls per repeat)"""
+        return [("encode_message", self.encode_message, 10000),
+                ("encode_multi_message_84", self.encode_multi_message, 200),
+                ("decode_message_84", self.decode_message, 2000),
+                ("register_map_parse_map", self.parse_map, 2000),
+                ("register_map_generate_map", self.generate_map, 200),
+                ("generate_register_maps_84", self.generate_register_maps, 100),
+                ("sensor_apply_calibration_packing", self.apply_calibration, 5),
+                ("hexify_84", self.hexify, 1000)]
+
+
+def batch(func, number):
+    """Return a function which calls func number times"""
+    def run():
+        for _ in range(number):
+            func()
+    return run
+
+
+def run(repeat=5, names=None, scale=1.0):
+    """Run the micro-benchmarks (all, or those listed in names) and return the results dictionary
+
+    :param repeat: number of timed batches of each benchmark
+    :param names: optional list of benchmark names to run
+    :param scale: factor applied to the number of calls per batch
+    """
+    suite = MicroBenchmarks()
+    results = {}
+    for name, func, number in suite.benchmarks():
+        if names and name not in names:
+            continue
+        number = max(1, int(round(number * scale)))
+        result = measure(batch(func, number), repeat)
+        result["calls"] = number
+        result["wall_per_call"] = result["wall_median"] / number
+        result["cpu_per_call"] = result["cpu_median"] / number
+        result["calls_per_second"] = number / result["wall_median"] if result["wall_median"] > 0.0 else 0.0
+        results[name] = result
+    return results
+
+
+def options():
+    desc = """Run offline micro-benchmarks of the Percival message codec and register maps
+    """
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument("-r", "--repeat", action="store", type=int, default=5,
+                        help="Number of timed batches of each benchmark (default 5)")
+    parser.add_argument("-s", "--scale", action="store", type=float, default=1.0,
+                        help="Scale the number of calls in each batch (default 1.0)")
+    parser.add_argument("-b", "--benchmark", action="append", default=None,
+                        help="Benchmark to run, may be given more than once (default all)")
+    parser.add_argument("-o", "--output", action="store", default=None, help="Write the results to a JSON file")
+    parser.add_argument("-c", "--compare", action="store", default=None,
+                        help="Baseline JSON results file to compare against")
+    parser.add_argument("--tolerance", action="store", type=float, default=DEFAULT_TOLERANCE,
+                        help="Fractional slow down over the baseline reported as a regression (default %.2f)" %
+                             DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = options()
+    log.info(args)
+
+    results = run(args.repeat, args.benchmark, args.scale)
+    info = metadata(suite="micro", repeat=args.repeat, scale=args.scale)
+    # Compare the time per call so that baselines recorded with a different scale remain valid
+    regressions = report(results, args.output, args.compare, args.tolerance, info,
+                         metrics=("wall_per_call", "cpu_per_call"))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+from __future__ import unicode_literals, absolute_import
+
+import os
+import tempfile
+import unittest
+
+from percival.carrier.simulator import Simulator
+from percival.carrier.txrx import TxRx, loopback_transport
+from percival.carrier.encoding import encode_message
+from percival.benchmarks.harness import RoundTripCounter, measure, compare_results, save_results, load_results
+
+
+class TestHarness(unittest.TestCase):
+    def test_round_trip_counter(self):
+        counter = RoundTripCounter()
+        txrx = TxRx("loopback", transport=counter.transport(loopback_transport(Simulator(port=None))))
+        result = measure(lambda: txrx.send_recv(encode_message(0x0000, 0x00000000), 6), repeat=3, counter=counter)
+        self.assertEqual(result["repeat"], 3)
+        self.assertEqual(result["round_trips"], 1)
+        self.assertEqual(counter.round_trips, 3)
+        self.assertLessEqual(result["wall_min"], result["wall_median"])
+
+    def test_measure_setup(self):
+        calls = []
+        result = measure(lambda: calls.append("func"), repeat=2, setup=lambda: calls.append("setup"))
+        self.assertEqual(calls, ["setup", "func", "setup", "func"])
+        self.assertNotIn("round_trips", result)
+
+    def test_compare_results(self):
+        baseline = {"a": {"wall_median": 1.0, "cpu_median": 1.0, "round_trips": 10},
+                    "b": {"wall_median": 1.0, "cpu_median": 1.0}}
+        results = {"a": {"wall_median": 1.1, "cpu_median": 1.5, "round_trips": 11},
+                   "b": {"wall_median": 0.5, "cpu_median": 0.5},
+                   "c": {"wall_median": 9.0, "cpu_median": 9.0}}
+        regressions = compare_results(results, baseline, tolerance=0.2)
+        self.assertEqual(regressions, [("a", "cpu_median", 1.0, 1.5), ("a", "round_trips", 10, 11)])
+        self.assertEqual(compare_results(results, baseline, tolerance=1.0), [("a", "round_trips", 10, 11)])
+
+    def test_save_load(self):
+        results = {"a": {"wall_median": 1.0, "cpu_median": 2.0}}
+        handle, filename = tempfile.mkstemp(suffix=".json")
+        os.close(handle)
+        try:
+            save_results(filename, results, {"suite": "test"})
+            self.assertEqual(load_results(filename), results)
+        finally:
+            os.remove(filename)
@@ -0,0 +1,17 @@
+from __future__ import unicode_literals, absolute_import
+
+import unittest
+
+from percival.benchmarks.ingest import status_points, run
+
+
+class TestIngestBenchmark(unittest.TestCase):
+    def test_run(self):
+        self.assertEqual(len(status_points(channels=3, cycles=2)), 6)
+        results = run(repeat=1, batch_sizes=[1, 50], channels=10, cycles=10)
+        self.assertEqual(sorted(results), ["ingest_batch_1", "ingest_batch_50"])
+        for result in results.values():
+            self.assertEqual(result["points"], 100)
+            self.assertEqual(result["stored"], 100)
+            self.assertEqual(result["dropped"], 0)
+            self.assertGreater(result["points_per_second"], 0.0)
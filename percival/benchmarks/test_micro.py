@@ -0,0 +1,25 @@
+from __future__ import unicode_literals, absolute_import
+
+import unittest
+
+from percival.benchmarks.micro import MicroBenchmarks, run
+
+
+class TestMicroBenchmarks(unittest.TestCase):
+    def test_inputs(self):
+        suite = MicroBenchmarks()
+        self.assertEqual(len(suite.registers), 84)
+        self.assertEqual(len(suite.message), 84 * 6)
+        suite.apply_calibration()
+        self.assertEqual(len(suite.sensor._buffer_cmd.words), 3240)
+
+    def test_run(self):
+        results = run(repeat=1, scale=0.0001)
+        self.assertEqual(sorted(results), sorted(name for name, func, number in MicroBenchmarks().benchmarks()))
+        for result in results.values():
+            self.assertEqual(result["calls"], 1)
+            self.assertEqual(result["wall_per_call"], result["wall_median"])
+
+        results = run(repeat=1, names=["hexify_84"], scale=0.01)
+        self.assertEqual(list(results), ["hexify_84"])
+        self.assertEqual(results["hexify_84"]["calls"], 10)
@@ -62,7 +62,10 @@ class IniSectionParameters(object):
     """Mixin to be used by classes that load configuration sections from INI files.
 
     Child classes must implement a self._parameters dictionary of tuples: {<name>: (<value>, <datatype>)}
+    Parameters listed in optional_parameters keep their default value if they are not present in a section.
     """
+    optional_parameters = []
+
     def __getattr__(self, name):
         if name in self._parameters.keys():
             return self._parameters[name][0]
@@ -102,6 +105,8 @@ class IniSectionParameters(object):
 
 class ControlChannelIniParameters(IniSectionParameters):
     section_regexp = re.compile(r'^Control_channel<\d{4}>$')
+    # Maximum rate of change (DAC counts per second) when ramping, see percival.detector.scan_plan
+    optional_parameters = ["Maximum_slew_rate"]
 
     def __init__(self, channel_number):
         object.__setattr__(self, '_parameters', {})  # This prevents infinite recursion when setting attributes
@@ -126,11 +131,14 @@ class ControlChannelIniParameters(IniSectionParameters):
                             "Channel_multiplier": (0, int),
                             "Channel_divider": (0, int),
                             "Channel_unit": (0, str),
+                            "Maximum_slew_rate": (0.0, float),
                             }
 
 
 class MonitoringChannelIniParameters(IniSectionParameters):
     section_regexp = re.compile(r'^Monitoring_channel<\d{4}>$')
+    # Changes of a monitored value within the deadbands are not published (see percival.detector.change_filter)
+    optional_parameters = ["Deadband_absolute", "Deadband_relative"]
 
     def __init__(self, channel_number):
         object.__setattr__(self, '_parameters', {})  # This prevents infinite recursion when setting attributes
@@ -165,6 +173,8 @@ class MonitoringChannelIniParameters(IniSectionParameters):
                             "Multiplier": (0, int),
                             "Divider": (0, int),
                             "Unit": (0, str),
+                            "Deadband_absolute": (0.0, float),
+                            "Deadband_relative": (0.0, float),
                             }
 
 
@@ -312,8 +322,12 @@ class ChannelParameters(object):
             channel.ini_section = section
             for param in channel.parameters():
                 parameter_type = channel.get_type(param)
+                if param in channel.optional_parameters and not self.conf.has_option(section, param):
+                    continue
                 if parameter_type == int:
                     value = self.conf.getint(section, param)
+                elif parameter_type == float:
+                    value = self.conf.getfloat(section, param)
                 elif parameter_type == str:
                     value = self.conf.get(section, param)
                     value = str(value.strip("\""))  # Get rid of any double quotes from the ini file
@@ -456,6 +470,54 @@ class ControlParameters(object):
             raise_with_traceback(RuntimeError("Control section not found in ini file %s" % str(self._ini_filename)))
         return self.conf.get("Control", "carrier_ip").strip("\"")
 
+    @property
+    def status_period(self):
+        if "Control" not in self.conf.sections():
+            raise_with_traceback(RuntimeError("Control section not found in ini file %s" % str(self._ini_filename)))
+        if not self.conf.has_option("Control", "status_period"):
+            raise_with_traceback(RuntimeError("status_period not found in ini file %s" % str(self._ini_filename)))
+        return float(self.conf.get("Control", "status_period").strip("\""))
+
+    @property
+    def heartbeat_interval(self):
+        if "Control" not in self.conf.sections():
+            raise_with_traceback(RuntimeError("Control section not found in ini file %s" % str(self._ini_filename)))
+        if not self.conf.has_option("Control", "heartbeat_interval"):
+            raise_with_traceback(RuntimeError("heartbeat_interval not found in ini file %s" % str(self._ini_filename)))
+        return float(self.conf.get("Control", "heartbeat_interval").strip("\""))
+
+    @property
+    def max_slew_rate(self):
+        if "Control" not in self.conf.sections():
+            raise_with_traceback(RuntimeError("Control section not found in ini file %s" % str(self._ini_filename)))
+        if not self.conf.has_option("Control", "max_slew_rate"):
+            raise_with_traceback(RuntimeError("max_slew_rate not found in ini file %s" % str(self._ini_filename)))
+        return float(self.conf.get("Control", "max_slew_rate").strip("\""))
+
+    @property
+    def ramp_period(self):
+        if "Control" not in self.conf.sections():
+            raise_with_traceback(RuntimeError("Control section not found in ini file %s" % str(self._ini_filename)))
+        if not self.conf.has_option("Control", "ramp_period"):
+            raise_with_traceback(RuntimeError("ramp_period not found in ini file %s" % str(self._ini_filename)))
+        return float(self.conf.get("Control", "ramp_period").strip("\""))
+
+    @property
+    def scan_data_dir(self):
+        if "Control" not in self.conf.sections():
+            raise_with_traceback(RuntimeError("Control section not found in ini file %s" % str(self._ini_filename)))
+        if not self.conf.has_option("Control", "scan_data_dir"):
+            raise_with_traceback(RuntimeError("scan_data_dir not found in ini file %s" % str(self._ini_filename)))
+        return self.conf.get("Control", "scan_data_dir").strip("\"")
+
+    @property
+    def history_length(self):
+        if "Control" not in self.conf.sections():
+            raise_with_traceback(RuntimeError("Control section not found in ini file %s" % str(self._ini_filename)))
+        if not self.conf.has_option("Control", "history_length"):
+            raise_with_traceback(RuntimeError("history_length not found in ini file %s" % str(self._ini_filename)))
+        return int(self.conf.get("Control", "history_length").strip("\""))
+
     @property
     def database_ip(self):
         if "Database" not in self.conf.sections():
@@ -474,6 +536,49 @@ class ControlParameters(object):
             raise_with_traceback(RuntimeError("Database section not found in ini file %s" % str(self._ini_filename)))
         return self.conf.get("Database", "name").strip("\"")
 
+    @property
+    def database_type(self):
+        return self.get_database_option("type")
+
+    @property
+    def database_file(self):
+        return self.get_database_option("file")
+
+    @property
+    def database_batch_size(self):
+        return int(self.get_database_option("batch_size"))
+
+    @property
+    def database_flush_interval(self):
+        return float(self.get_database_option("flush_interval"))
+
+    @property
+    def database_max_buffered(self):
+        return int(self.get_database_option("max_buffered"))
+
+    @property
+    def database_ring_file(self):
+        return self.get_database_option("ring_file")
+
+    @property
+    def database_ring_capacity(self):
+        return int(self.get_database_option("ring_capacity"))
+
+    @property
+    def database_aggregate_interval(self):
+        return float(self.get_database_option("aggregate_interval"))
+
+    @property
+    def database_raw_group(self):
+        return self.get_database_option("raw_group")
+
+    def get_database_option(self, item):
+        if "Database" not in self.conf.sections():
+            raise_with_traceback(RuntimeError("Database section not found in ini file %s" % str(self._ini_filename)))
+        if not self.conf.has_option("Database", item):
+            raise_with_traceback(RuntimeError("%s not found in ini file %s" % (item, str(self._ini_filename))))
+        return self.conf.get("Database", item).strip("\"")
+
     def __getattr__(self, item):
         if item in self._ini_file_options:
             return self.get_ini_file(item)
@@ -521,6 +626,18 @@ class ControlParameters(object):
             raise_with_traceback(RuntimeError("Configuration section not found in ini file %s" % str(self._ini_filename)))
         return self.conf.get("Configuration", "setpoints").strip("\"")
 
+    @property
+    def safety_ini_file(self):
+        if "Configuration" not in self.conf.sections():
+            raise_with_traceback(RuntimeError("Configuration section not found in ini file %s" % str(self._ini_filename)))
+        return self.conf.get("Configuration", "safety_rules").strip("\"")
+
+    @property
+    def derived_ini_file(self):
+        if "Configuration" not in self.conf.sections():
+            raise_with_traceback(RuntimeError("Configuration section not found in ini file %s" % str(self._ini_filename)))
+        return self.conf.get("Configuration", "derived_channels").strip("\"")
+
 
 #class BufferParameters(object):
 #    """
@@ -721,6 +838,104 @@ class SetpointGroupParameters(object):
         return sps
 
 
+class SafetyRuleParameters(object):
+    """
+    Loads safety rules (see percival.detector.safety) from an INI file.
+    """
+    def __init__(self, ini_file):
+        self.log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
+        self._ini_filename = None
+        self._ini_buffer = None
+        try:
+            self._ini_filename = find_file(ini_file)
+        except:
+            # If we catch any kind of exception here then treat the parameter as the configuration
+            self._ini_buffer = StringIO(unicode(ini_file))
+
+    def load_ini(self):
+        """
+        Loads and parses the data from INI file. The data is stored internally in the object and can be retrieved
+        through the property methods
+        """
+        self.conf = SafeConfigParser(dict_type=OrderedDict)
+        self.conf.optionxform = str
+        if self._ini_filename:
+            self.conf.read(self._ini_filename)
+            self.log.info("Read Safety Rules INI file: %s", self._ini_filename)
+        else:
+            self.conf.readfp(self._ini_buffer)
+            self.log.info("Read Safety Rules INI object %s", self._ini_buffer)
+        self.log.info("    sections: %s", self.conf.sections())
+
+    @property
+    def sections(self):
+        return self.conf.sections()
+
+    def get_name(self, section):
+        name = ""
+        for item in self.conf.items(section):
+            if "Rule_name" in item[0]:
+                name = item[1].replace('"', '')
+                break
+        return name
+
+    def get_options(self, section):
+        options = {}
+        for item in self.conf.items(section):
+            if "Rule_name" not in item[0]:
+                options[item[0]] = item[1].replace('"', '')
+        return options
+
+
+class DerivedChannelParameters(object):
+    """
+    Loads derived monitor channels (see percival.detector.derived) from an INI file.
+    """
+    def __init__(self, ini_file):
+        self.log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
+        self._ini_filename = None
+        self._ini_buffer = None
+        try:
+            self._ini_filename = find_file(ini_file)
+        except:
+            # If we catch any kind of exception here then treat the parameter as the configuration
+            self._ini_buffer = StringIO(unicode(ini_file))
+
+    def load_ini(self):
+        """
+        Loads and parses the data from INI file. The data is stored internally in the object and can be retrieved
+        through the property methods
+        """
+        self.conf = SafeConfigParser(dict_type=OrderedDict)
+        self.conf.optionxform = str
+        if self._ini_filename:
+            self.conf.read(self._ini_filename)
+            self.log.info("Read Derived Channels INI file: %s", self._ini_filename)
+        else:
+            self.conf.readfp(self._ini_buffer)
+            self.log.info("Read Derived Channels INI object %s", self._ini_buffer)
+        self.log.info("    sections: %s", self.conf.sections())
+
+    @property
+    def sections(self):
+        return self.conf.sections()
+
+    def get_name(self, section):
+        name = ""
+        for item in self.conf.items(section):
+            if "Channel_name" in item[0]:
+                name = item[1].replace('"', '')
+                break
+        return name
+
+    def get_options(self, section):
+        options = {}
+        for item in self.conf.items(section):
+            if "Channel_name" not in item[0]:
+                options[item[0]] = item[1].replace('"', '')
+        return options
+
+
 class SystemSettingsParameters(object):
     """
     Loads groups of controls description from an INI file.
@@ -1046,3 +1261,113 @@ class SensorDebugParameters(object):
         return values
 
 
+
+
+class SimulatorProfileParameters(object):
+    """
+    Loads the response latency and fault injection profile of the carrier board simulator from an INI file
+
+    The [Latency] section maps UART block names (as defined in percival.carrier.const) or "default" to a
+    distribution description "<distribution>, <parameter>[, <parameter>]" with the times in seconds.
+    The [Faults] section contains the fault injection rates.
+    The [Monitors] section describes the simulated monitor dynamics and the [Coupling] section maps
+    monitor channel names to "<control channel name>, <gain>, <offset>".
+    """
+    distributions = {"constant": 1, "uniform": 2, "normal": 2, "exponential": 1}
+
+    def __init__(self, ini_file):
+        self.log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
+        self._ini_filename = None
+        self._ini_buffer = None
+        self._conf = None
+        try:
+            self._ini_filename = find_file(ini_file)
+        except:
+            # If we catch any kind of exception here then treat the parameter as the configuration
+            self._ini_buffer = StringIO(unicode(ini_file))
+
+    def load_ini(self):
+        """
+        Loads and parses the data from INI file. The data is stored internally in the object and can be retrieved
+        through the property methods
+        """
+        self._conf = SafeConfigParser(dict_type=OrderedDict)
+        self._conf.optionxform = str
+        if self._ini_filename:
+            self._conf.read(self._ini_filename)
+            self.log.info("Read Simulator Profile INI file: %s", self._ini_filename)
+        else:
+            self._conf.readfp(self._ini_buffer)
+            self.log.info("Read Simulator Profile INI object %s", self._ini_buffer)
+        self.log.info("    sections: %s", self._conf.sections())
+
+    def _get_option(self, section, item, default):
+        if section not in self._conf.sections() or not self._conf.has_option(section, item):
+            return default
+        return self._conf.get(section, item).strip("\"")
+
+    @property
+    def seed(self):
+        value = self._get_option("Faults", "seed", "")
+        if value == "":
+            return None
+        return int(value)
+
+    @property
+    def i2c_error_rate(self):
+        return float(self._get_option("Faults", "i2c_error_rate", 0.0))
+
+    @property
+    def drop_connection_rate(self):
+        return float(self._get_option("Faults", "drop_connection_rate", 0.0))
+
+    @property
+    def echo_word_delay(self):
+        return float(self._get_option("Faults", "echo_word_delay", 0.0))
+
+    @property
+    def channel_settings_file(self):
+        return self._get_option("Monitors", "channel_settings_file",
+                                "config/00_Device_Settings/Channel parameters.ini")
+
+    @property
+    def monitor_update_period(self):
+        return float(self._get_option("Monitors", "update_period", 0.1))
+
+    @property
+    def monitor_noise(self):
+        return float(self._get_option("Monitors", "noise", 1.0))
+
+    @property
+    def monitor_settle_time(self):
+        return float(self._get_option("Monitors", "settle_time", 0.05))
+
+    @property
+    def coupling(self):
+        """Dictionary of monitor channel name: (control channel name, gain, offset)"""
+        couplings = OrderedDict()
+        if "Coupling" not in self._conf.sections():
+            return couplings
+        for name, value in self._conf.items("Coupling"):
+            fields = [field.strip() for field in value.strip("\"").split(",")]
+            if len(fields) != 3:
+                raise_with_traceback(ValueError("Coupling for %s must be <control channel>, <gain>, <offset>" % name))
+            couplings[name] = (fields[0], float(fields[1]), float(fields[2]))
+        return couplings
+
+    @property
+    def latency(self):
+        """Dictionary of block name: (distribution, (parameters))"""
+        latencies = OrderedDict()
+        if "Latency" not in self._conf.sections():
+            return latencies
+        for name, value in self._conf.items("Latency"):
+            fields = [field.strip() for field in value.strip("\"").split(",")]
+            distribution = fields[0].lower()
+            if distribution not in self.distributions:
+                raise_with_traceback(ValueError("Unsupported latency distribution %s for %s" % (distribution, name)))
+            if len(fields) - 1 != self.distributions[distribution]:
+                raise_with_traceback(ValueError("Latency distribution %s for %s requires %d parameter(s)" %
+                                                (distribution, name, self.distributions[distribution])))
+            latencies[name] = (distribution, tuple([float(field) for field in fields[1:]]))
+        return latencies
@@ -1,19 +1,408 @@
+from __future__ import division
+
 from influxdb import InfluxDBClient
+from collections import deque
+from datetime import datetime
+import calendar
+import numbers
 import requests
 import logging
+import threading
+import time
+
+
+def escape_key(key):
+    """Escape a measurement name, tag or field key for the InfluxDB line protocol"""
+    return str(key).replace("\\", "\\\\").replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+
+def format_field(value):
+    """Format a field value for the InfluxDB line protocol"""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, numbers.Integral):
+        return "{}i".format(int(value))
+    if isinstance(value, numbers.Real):
+        return repr(float(value))
+    return "\"{}\"".format(str(value).replace("\\", "\\\\").replace("\"", "\\\""))
+
+
+def timestamp_ns(time_value):
+    """Convert a UTC datetime, or seconds since the epoch, into integer nanoseconds since the epoch"""
+    if isinstance(time_value, datetime):
+        return calendar.timegm(time_value.utctimetuple()) * 1000000000 + time_value.microsecond * 1000
+    return int(round(time_value * 1e9))
+
+
+def format_line(time_value, measurement, data):
+    """
+    Format a point in the InfluxDB line protocol
+
+    :param time_value: UTC datetime or seconds since the epoch
+    :param measurement: Name of the measurement
+    :param data: Dictionary of field values
+    :returns: Line protocol string, or None if there are no fields to write
+    """
+    fields = ",".join("{}={}".format(escape_key(key), format_field(data[key]))
+                      for key in sorted(data) if data[key] is not None)
+    if not fields:
+        return None
+    return "{} {} {}".format(escape_key(measurement), fields, timestamp_ns(time_value))
+
 
+class BatchWriter(object):
+    """
+    Buffer line protocol points in memory and write them from a background thread in batches.
 
-class InfluxDB(object):
+    A batch is written when batch_size points are buffered or flush_interval seconds after the oldest
+    buffered point was added.  The buffer is bounded: when max_buffered points are waiting, further points
+    are dropped (and counted) so that a slow or unavailable database never blocks the caller.
 
-    def __init__(self, db_host, db_port, db_name):
+    A caller which must know that its points have been stored (rather than only buffered) adds a mark after
+    them with :meth:`mark`; the mark's callback is called once every point buffered before it has been written,
+    with False if any point since the previous mark failed or was dropped.
+    """
+    def __init__(self, write_lines, batch_size=500, flush_interval=1.0, max_buffered=20000):
+        """
+        :param write_lines: Callable which writes a list of line protocol strings to the database
+        :param batch_size: Maximum number of points per write
+        :param flush_interval: Maximum time (seconds) a point waits in the buffer before a write
+        :param max_buffered: Maximum number of points held in the buffer
+        """
         self._log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
+        self._write_lines = write_lines
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_buffered = max_buffered
+        self._condition = threading.Condition()
+        # Buffered (time added, sequence number, line) tuples
+        self._buffer = deque()
+        self._sequence = 0
+        # Pending (sequence number, callback) marks, and the sequence number of the first point being written
+        self._marks = deque()
+        self._in_flight = None
+        self._failed = False
+        self._running = False
+        self._thread = None
+        self._flushing = False
+        self._flush_requested = False
+        self._counters = {"queued": 0,
+                          "written": 0,
+                          "dropped": 0,
+                          "failed": 0,
+                          "batches": 0,
+                          "last_write_latency": 0.0,
+                          "max_write_latency": 0.0,
+                          "total_write_latency": 0.0,
+                          "max_queue_delay": 0.0}
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the writer thread after writing any buffered points"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        # Marks which were not reached will never be
+        with self._condition:
+            marks = [(callback, False) for sequence, callback in self._marks]
+            self._marks.clear()
+        self._call_marks(marks)
+
+    def put(self, line):
+        """Add a line protocol point to the buffer.  Never blocks.
+
+        :returns: True if the point was buffered, False if it was dropped
+        """
+        with self._condition:
+            sequence = self._sequence
+            self._sequence += 1
+            if len(self._buffer) >= self._max_buffered:
+                self._counters["dropped"] += 1
+                self._failed = True
+                return False
+            self._buffer.append((time.time(), sequence, line))
+            self._counters["queued"] += 1
+            # Wake the writer to start the flush interval of a new batch, or to write a full batch
+            if len(self._buffer) == 1 or len(self._buffer) >= self._batch_size:
+                self._condition.notify_all()
+        return True
+
+    def mark(self, callback):
+        """
+        Add a mark after the points buffered so far.  Never blocks.
+
+        :param callback: Callable taking True if every point since the previous mark was written, or False if
+                         any failed or was dropped, called (from the writer thread) once the points have been
+                         written or failed
+        """
+        with self._condition:
+            self._marks.append((self._sequence, callback))
+            marks = self._reached_marks()
+        self._call_marks(marks)
+
+    def _reached_marks(self):
+        # Called with the condition held: remove the marks which every point before has passed
+        oldest = self._in_flight
+        if oldest is None:
+            oldest = self._buffer[0][1] if self._buffer else self._sequence
+        marks = []
+        while self._marks and self._marks[0][0] <= oldest:
+            marks.append((self._marks.popleft()[1], not self._failed))
+        if marks:
+            self._failed = False
+        return marks
+
+    def _call_marks(self, marks):
+        for callback, success in marks:
+            try:
+                callback(success)
+            except Exception as ex:
+                self._log.error("Database write mark callback failed: %s", str(ex))
+
+    def flush(self, timeout=None):
+        """Wait until all buffered points have been written (or failed).
+
+        :returns: True if the buffer was emptied within the timeout
+        """
+        end = None if timeout is None else time.time() + timeout
+        with self._condition:
+            self._flush_requested = True
+            self._condition.notify_all()
+            while (self._buffer or self._flushing) and self._thread is not None:
+                if end is None:
+                    self._condition.wait(0.1)
+                else:
+                    remaining = end - time.time()
+                    if remaining <= 0.0:
+                        break
+                    self._condition.wait(min(remaining, 0.1))
+            return not self._buffer and not self._flushing
+
+    @property
+    def buffered(self):
+        return len(self._buffer)
+
+    @property
+    def free(self):
+        return max(0, self._max_buffered - len(self._buffer))
+
+    def get_status(self):
+        with self._condition:
+            status = dict(self._counters)
+            status["buffered"] = len(self._buffer)
+        batches = status.pop("batches")
+        total_latency = status.pop("total_write_latency")
+        status["batches"] = batches
+        status["mean_write_latency"] = total_latency / batches if batches else 0.0
+        return status
+
+    def _next_batch(self):
+        # Called with the condition held: wait until a batch is due, then take it from the buffer
+        while True:
+            if self._buffer:
+                if len(self._buffer) >= self._batch_size or not self._running or self._flush_requested:
+                    break
+                remaining = self._buffer[0][0] + self._flush_interval - time.time()
+                if remaining <= 0.0:
+                    break
+                self._condition.wait(remaining)
+            elif not self._running:
+                return None
+            else:
+                self._condition.wait()
+        count = min(self._batch_size, len(self._buffer))
+        delay = time.time() - self._buffer[0][0]
+        self._counters["max_queue_delay"] = max(self._counters["max_queue_delay"], delay)
+        self._in_flight = self._buffer[0][1]
+        batch = [self._buffer.popleft()[2] for _ in range(count)]
+        if not self._buffer:
+            self._flush_requested = False
+        self._flushing = True
+        return batch
+
+    def _run(self):
+        while True:
+            with self._condition:
+                batch = self._next_batch()
+            if batch is None:
+                break
+            start = time.time()
+            try:
+                self._write_lines(batch)
+                success = True
+            except Exception as ex:
+                self._log.warning("Failed to write %d points to the database: %s", len(batch), str(ex))
+                success = False
+            latency = time.time() - start
+            with self._condition:
+                if success:
+                    self._counters["written"] += len(batch)
+                else:
+                    self._counters["failed"] += len(batch)
+                    self._failed = True
+                self._counters["batches"] += 1
+                self._counters["last_write_latency"] = latency
+                self._counters["total_write_latency"] += latency
+                self._counters["max_write_latency"] = max(self._counters["max_write_latency"], latency)
+                self._flushing = False
+                self._in_flight = None
+                marks = self._reached_marks()
+                self._condition.notify_all()
+            self._call_marks(marks)
+
+
+class DatabaseSink(object):
+    """
+    Base class of the time-series stores that monitor points are logged to.
+
+    Points passed to :meth:`log_point` are formatted in the InfluxDB line protocol and buffered by a
+    :class:`BatchWriter`, which passes them in batches to :meth:`write_lines` from a background thread.
+    Subclasses implement :meth:`_open`, :meth:`write_lines` and optionally :meth:`_close`.
+
+    A sink which cannot be opened, or whose writes fail, is disconnected: points logged are not buffered and
+    the store is opened again every reconnect_interval seconds from a background thread until it succeeds.
+    """
+    sink_type = None
+
+    def __init__(self, batch_size=500, flush_interval=1.0, max_buffered=20000, reconnect_interval=10.0):
+        self._log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
+        self._connected = False
+        self._reconnect_interval = reconnect_interval
+        self._closing = threading.Event()
+        self._reconnect_lock = threading.Lock()
+        self._reconnect_thread = None
+        self._reconnects = 0
+        self._writer = BatchWriter(self._write, batch_size, flush_interval, max_buffered)
+
+    @property
+    def connected(self):
+        return self._connected
+
+    def connect(self):
+        self._closing.clear()
+        if self._open():
+            self._connected = True
+            self._writer.start()
+        else:
+            self._start_reconnect()
+
+    def close(self):
+        """Write any buffered points and stop the background writer"""
+        self._closing.set()
+        self._writer.stop()
+        if self._connected:
+            self._close()
+            self._connected = False
+
+    def _write(self, lines):
+        # Called by the writer thread; a failed write disconnects the sink until it can be opened again
+        if not self._connected:
+            raise IOError("Database disconnected")
+        try:
+            self.write_lines(lines)
+        except Exception as ex:
+            if self._connected:
+                self._connected = False
+                self._log.error("Database write failed, disconnected: %s", str(ex))
+                self._start_reconnect()
+            raise
+
+    def _start_reconnect(self):
+        with self._reconnect_lock:
+            if self._reconnect_thread is not None and self._reconnect_thread.is_alive():
+                return
+            self._reconnect_thread = threading.Thread(target=self._reconnect)
+            self._reconnect_thread.daemon = True
+            self._reconnect_thread.start()
+
+    def _reconnect(self):
+        while not self._closing.wait(self._reconnect_interval):
+            try:
+                self._close()
+            except Exception as ex:
+                self._log.debug("Closing the database before reconnecting failed: %s", str(ex))
+            try:
+                opened = self._open()
+            except Exception as ex:
+                self._log.info("Unable to reconnect to the database: %s", str(ex))
+                opened = False
+            if opened:
+                if self._closing.is_set():
+                    self._close()
+                    return
+                self._reconnects += 1
+                self._connected = True
+                self._writer.start()
+                self._log.info("Database reconnected")
+                return
+
+    @property
+    def buffer_free(self):
+        """Number of points which can be logged before the buffer is full"""
+        return self._writer.free
+
+    def flush(self, timeout=None):
+        """Wait until all buffered points have been written"""
+        return self._writer.flush(timeout)
+
+    def get_status(self):
+        status = {
+            "type": self.sink_type,
+            "connected": self._connected,
+            "reconnects": self._reconnects,
+            "writer": self._writer.get_status()
+        }
+        return status
+
+    def log_point(self, time, measurement, data):
+        """Queue a point to be written to the database in the next batch.  Never blocks on the database."""
+        if self._connected:
+            line = format_line(time, measurement, data)
+            if line is not None:
+                self._writer.put(line)
+
+    def mark(self, callback):
+        """
+        Call back once the points logged so far have been written, with False if any of the points logged since
+        the previous mark were not stored (see :meth:`BatchWriter.mark`).
+        """
+        self._writer.mark(callback)
+
+    def _open(self):
+        """Open the store, returning True if successful"""
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+    def write_lines(self, lines):
+        """Write a list of line protocol strings to the store"""
+        raise NotImplementedError
+
+
+class InfluxDB(DatabaseSink):
+    sink_type = "influxdb"
+
+    def __init__(self, db_host, db_port, db_name, batch_size=500, flush_interval=1.0, max_buffered=20000,
+                 reconnect_interval=10.0):
+        super(InfluxDB, self).__init__(batch_size, flush_interval, max_buffered, reconnect_interval)
         self._db_host = db_host
         self._db_port = db_port
         self._db_name = db_name
         self._influx_client = None
-        self._connected = False
 
-    def connect(self):
+    def _open(self):
         self._log.info("Opening connection to influxDB at {:s}:{:d}".format(self._db_host, self._db_port))
 
         try:
@@ -33,29 +422,85 @@ class InfluxDB(object):
                 self._influx_client.create_database(self._db_name)
 
             self._influx_client.switch_database(self._db_name)
-            self._connected = True
+            return True
 
         except requests.ConnectionError:
             self._log.info("Unable to connect to {} database".format(self._db_name))
+        return False
 
     def get_status(self):
-        status = {
+        status = super(InfluxDB, self).get_status()
+        status.update({
             "address": self._db_host,
             "port": self._db_port,
-            "name": self._db_name,
-            "connected": self._connected
-        }
+            "name": self._db_name
+        })
         return status
 
-    def log_point(self, time, measurement, data):
-        if self._connected:
-            point = {
-                "measurement": measurement,
-                "time": time,
-                "fields": {}
-            }
+    def write_lines(self, lines):
+        self._influx_client.write_points(lines, protocol='line')
+
+
+class FileSink(DatabaseSink):
+    """
+    Record points to a local file in the InfluxDB line protocol, one point per line.
+
+    Used in place of an InfluxDB server when running offline; the file can later be loaded into InfluxDB
+    (for example with ``influx -import``) or read back with :func:`read_lines`.
+    """
+    sink_type = "file"
+
+    def __init__(self, filename, batch_size=500, flush_interval=1.0, max_buffered=20000, reconnect_interval=10.0):
+        super(FileSink, self).__init__(batch_size, flush_interval, max_buffered, reconnect_interval)
+        self._filename = filename
+        self._file = None
+
+    def _open(self):
+        self._log.info("Recording database points to %s", self._filename)
+        try:
+            self._file = open(self._filename, "a")
+            return True
+        except (IOError, OSError) as ex:
+            self._log.info("Unable to open %s: %s", self._filename, str(ex))
+        return False
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def get_status(self):
+        status = super(FileSink, self).get_status()
+        status["file"] = self._filename
+        return status
+
+    def write_lines(self, lines):
+        self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+
+
+def read_lines(filename):
+    """Return the line protocol points recorded to a file by a :class:`FileSink`"""
+    with open(filename) as data:
+        return [line.rstrip("\n") for line in data if line.strip()]
+
 
-            for item in data:
-                point["fields"][item] = data[item]
+def create_database(settings):
+    """
+    Create the database sink described by a settings dictionary.
 
-            self._influx_client.write_points([point])
+    :param settings: Dictionary with the sink "type" ("influxdb" or "file"), the InfluxDB "address", "port"
+                     and "name", the "file" to record to and optionally "batch_size", "flush_interval" and
+                     "max_buffered"
+    :type  settings: dict
+    :returns: The (unconnected) database sink
+    :rtype: DatabaseSink
+    """
+    batching = {key: settings[key] for key in ("batch_size", "flush_interval", "max_buffered", "reconnect_interval")
+                if key in settings}
+    sink_type = settings.get("type", InfluxDB.sink_type)
+    if sink_type == InfluxDB.sink_type:
+        return InfluxDB(settings["address"], settings["port"], settings["name"], **batching)
+    if sink_type == FileSink.sink_type:
+        return FileSink(settings["file"], **batching)
+    raise ValueError("Unknown database type {}".format(sink_type))
@@ -5,6 +5,7 @@ Created on 8 May 2015
 """
 from __future__ import unicode_literals, absolute_import
 from percival.carrier.const import DeviceFamily, DeviceCmd, DeviceFunction
+from percival.carrier.monitor_block import MonitorBlock
 
 import logging
 logger = logging.getLogger(__name__)
@@ -220,27 +221,38 @@ class AD5669(object):
         return self._device.name
 
 
-class MAX31730(object):
+class MonitorDevice(object):
     """
-    Representation of the MAX31730 temperature device
+    Base of the monitor devices.  The state of a monitor device is one row of a
+    :class:`percival.carrier.monitor_block.MonitorBlock`, which holds the calibration and latest values of all
+    monitors of a board in arrays.  A device not attached to a board's block keeps its state in a block of its own.
     """
+    family = None
+    value_field = "value"
+
     def __init__(self, name, channel):
         self._name = name
         self._channel = channel
-        self._device = DeviceFamily.MAX31730
-        self._raw_value = 0
-        self._temperature = 0.0
-        self._low_threshold = 0
-        self._extreme_low_threshold = 0
-        self._high_threshold = 0
-        self._extreme_high_threshold = 0
-        self._safety_exception = 0
-        self._i2c_comms_error = 0
-        self._sample_number = 0
+        self._device = self.family
         self._offset = float(self._channel._channel_ini.Offset)
         self._divider = float(self._channel._channel_ini.Divider)
         self._multiplier = float(self._channel._channel_ini.Multiplier)
         self._unit = self._channel._channel_ini.Unit
+        self._block = None
+        self._row = 0
+        self.attach(MonitorBlock(1), 0)
+
+    def attach(self, block, row):
+        """
+        Keep the state of the device in a row of a monitor block
+
+        :param block: Monitor block of the board
+        :type  block: :obj:`percival.carrier.monitor_block.MonitorBlock`
+        :param row: Row of the device (its entry in the board's read values block)
+        """
+        block.attach(row, self, self._offset, self._divider, self._multiplier)
+        self._block = block
+        self._row = row
 
     def update(self, data=None):
         """
@@ -252,36 +264,17 @@ class MAX31730(object):
         :param data: the data object for the device (or None)
         """
         if data is not None:
-            self._update_status(data)
+            self._block.update_row(self._row, data)
         else:
-            data = self._channel.get_value()
-        self._update_value(data)
+            self._block.update_row(self._row, self._channel.get_value(), thresholds=False)
 
-    def _update_value(self, data):
-        """Internal update of status items
+    def convert(self, raw_value):
+        """Return the calibrated status fields for a raw value
 
-            :param data: Data object containing all related values
-            :type data:  :obj:`percival.carrier.registers.ReadValueMap`
-        """
-        self._i2c_comms_error = data.i2c_communication_error
-        self._raw_value = data.read_value
-        self._temperature = (float(data.read_value) - self._offset) / self._divider * self._multiplier
-        self._sample_number = data.sample_number
-
-    def _update_status(self, data):
-        """Internal update of status items
-             :param data: Data object containing all related values
-             :type data:  :obj:`percival.carrier.registers.ReadValueMap`
+            :param raw_value: Value read from the device
+            :returns: Dictionary of the calibrated value
         """
-        self._low_threshold = data.below_low_threshold
-        self._extreme_low_threshold = data.below_extreme_low_threshold
-        self._high_threshold = data.above_high_threshold
-        self._extreme_high_threshold = data.above_extreme_high_threshold
-        self._safety_exception = data.safety_exception_detected
-
-    @property
-    def temperature(self):
-        return self._temperature
+        return {self.value_field: float(self._block.convert([raw_value], [self._row])[0])}
 
     @property
     def unit(self):
@@ -297,111 +290,30 @@ class MAX31730(object):
 
     @property
     def status(self):
-        return {
-            "device":                 "MAX31730",
-            "temperature":            self._temperature,
-            "raw_value":              self._raw_value,
-            "sample_number":          self._sample_number,
-            "low_threshold":          self._low_threshold,
-            "extreme_low_threshold":  self._extreme_low_threshold,
-            "high_threshold":         self._high_threshold,
-            "extreme_high_threshold": self._extreme_high_threshold,
-            "safety_exception":       self._safety_exception,
-            "i2c_comms_error":        self._i2c_comms_error,
-            "unit":                   self._unit
-        }
-
-
-class LTC2309:
-    """
-    Representation of the LTC2309 ADC device
-    """
-    def __init__(self, name, channel):
-        self._name = name
-        self._channel = channel
-        self._device = DeviceFamily.LTC2309
-        self._raw_value = 0
-        self._value = 0.0
-        self._low_threshold = 0
-        self._extreme_low_threshold = 0
-        self._high_threshold = 0
-        self._extreme_high_threshold = 0
-        self._safety_exception = 0
-        self._i2c_comms_error = 0
-        self._sample_number = 0
-        self._offset = float(self._channel._channel_ini.Offset)
-        self._divider = float(self._channel._channel_ini.Divider)
-        self._multiplier = float(self._channel._channel_ini.Multiplier)
-        self._unit = self._channel._channel_ini.Unit
-
-    def update(self, data=None):
-        """
-        Update the device status.  If data is provided (from reading a shortcut) then
-        the device will update its fields accordingly.  If no data is provided then
-        the device will request its current value from the hardware and update its own
-        value accordingly.
+        return self._block.status(self._row)
 
-        :param data: the data object for the device (or None)
-        """
-        if data is not None:
-            self._update_status(data)
-        else:
-            data = self._channel.get_value()
-        self._update_value(data)
-
-    def _update_value(self, data):
-        """Internal update of status items
-
-            :param data: Data object containing all related values
-            :type data:  :obj:`percival.carrier.registers.ReadValueMap`
-        """
-        self._i2c_comms_error = data.i2c_communication_error
-        self._raw_value = data.read_value
-        self._value = (float(data.read_value) - self._offset) / self._divider * self._multiplier
-        self._sample_number = data.sample_number
-
-    def _update_status(self, data):
-        """Internal update of status items
-             :param data: Data object containing all related values
-             :type data:  :obj:`percival.carrier.registers.ReadValueMap`
-        """
-        self._low_threshold = data.below_low_threshold
-        self._extreme_low_threshold = data.below_extreme_low_threshold
-        self._high_threshold = data.above_high_threshold
-        self._extreme_high_threshold = data.above_extreme_high_threshold
-        self._safety_exception = data.safety_exception_detected
 
-    @property
-    def value(self):
-        return self._value
+class MAX31730(MonitorDevice):
+    """
+    Representation of the MAX31730 temperature device
+    """
+    family = DeviceFamily.MAX31730
+    value_field = "temperature"
 
     @property
-    def unit(self):
-        return self._unit
+    def temperature(self):
+        return self._block.value(self._row)
 
-    @property
-    def name(self):
-        return self._name
 
-    @property
-    def device(self):
-        return self._device.name
+class LTC2309(MonitorDevice):
+    """
+    Representation of the LTC2309 ADC device
+    """
+    family = DeviceFamily.LTC2309
 
     @property
-    def status(self):
-        return {
-            "device":                 "LTC2309",
-            "value":                  self._value,
-            "raw_value":              self._raw_value,
-            "sample_number":          self._sample_number,
-            "low_threshold":          self._low_threshold,
-            "extreme_low_threshold":  self._extreme_low_threshold,
-            "high_threshold":         self._high_threshold,
-            "extreme_high_threshold": self._extreme_high_threshold,
-            "safety_exception":       self._safety_exception,
-            "i2c_comms_error":        self._i2c_comms_error,
-            "unit":                   self._unit
-        }
+    def value(self):
+        return self._block.value(self._row)
 
 
 DeviceFactory = {
@@ -0,0 +1,149 @@
+"""
+Vectorised state of the monitor devices of one board.
+
+A :class:`MonitorBlock` holds, for each entry of a board's READ_VALUES block, the calibration (offset, divider
+and multiplier) and the latest raw value, calibrated value, sample number and status flags in NumPy arrays.
+Decoding and converting a whole block of read values is a handful of vector operations, and the status
+reports of all channels are built from the arrays in one pass.  The monitor device objects
+(:class:`percival.carrier.devices.MAX31730`, :class:`percival.carrier.devices.LTC2309`) are lightweight views
+of one row of a block.
+"""
+from __future__ import division
+
+import threading
+
+import numpy as np
+
+STATUS_FLAGS = [("low_threshold",          "below_low_threshold",          19),
+                ("extreme_low_threshold",  "below_extreme_low_threshold",  18),
+                ("high_threshold",         "above_high_threshold",         20),
+                ("extreme_high_threshold", "above_extreme_high_threshold", 21),
+                ("safety_exception",       "safety_exception_detected",    17)]
+"""Threshold and safety flags: (status field, ReadValueMap field, bit of the read value word)"""
+
+I2C_ERROR_BIT = 16
+READ_VALUE_MASK = 0xFFFF
+SAMPLE_NUMBER_SHIFT = 24
+SAMPLE_NUMBER_MASK = 0xFF
+
+
+class MonitorBlock(object):
+    """
+    Calibration and latest values of the monitor devices attached to the rows of a board's read values block.
+    """
+    def __init__(self, entries):
+        """
+        :param entries: Number of rows (the number of entries of the read values block)
+        """
+        self._entries = entries
+        self._lock = threading.Lock()
+        self._devices = [None] * entries
+        self._offset = np.zeros(entries)
+        self._divider = np.ones(entries)
+        self._multiplier = np.ones(entries)
+        self._raw_value = np.zeros(entries, dtype=np.int64)
+        self._value = np.zeros(entries)
+        self._sample_number = np.zeros(entries, dtype=np.int64)
+        self._i2c_comms_error = np.zeros(entries, dtype=np.int64)
+        self._flags = np.zeros((len(STATUS_FLAGS), entries), dtype=np.int64)
+        self._flag_bits = np.array([bit for field, map_field, bit in STATUS_FLAGS], dtype=np.int64)
+
+    @property
+    def entries(self):
+        return self._entries
+
+    @property
+    def rows(self):
+        """Rows with a device attached"""
+        return [row for row in range(self._entries) if self._devices[row] is not None]
+
+    def attach(self, row, device, offset, divider, multiplier):
+        """
+        Attach a monitor device to a row, with the calibration of its value: (raw - offset) / divider * multiplier
+        """
+        with self._lock:
+            self._devices[row] = device
+            self._offset[row] = offset
+            self._divider[row] = divider
+            self._multiplier[row] = multiplier
+
+    def convert(self, raw_values, rows):
+        """Return the calibrated values of raw values read from a set of rows"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (np.asarray(raw_values, dtype=float) - self._offset[rows]) / self._divider[rows] * \
+                self._multiplier[rows]
+
+    def update(self, words, rows=None):
+        """
+        Update rows from the words of a read values block.
+
+        :param words: Read value words
+        :type  words: list
+        :param rows: Row of each word, defaults to the words being the whole block in order
+        :type  rows: list
+        :returns: Status report of each device updated, keyed by device name
+        :rtype: dict
+        """
+        words = np.asarray(words, dtype=np.int64)
+        rows = np.arange(len(words)) if rows is None else np.asarray(rows, dtype=np.int64)
+        raw_values = words & READ_VALUE_MASK
+        with self._lock:
+            self._raw_value[rows] = raw_values
+            self._value[rows] = self.convert(raw_values, rows)
+            self._sample_number[rows] = (words >> SAMPLE_NUMBER_SHIFT) & SAMPLE_NUMBER_MASK
+            self._i2c_comms_error[rows] = (words >> I2C_ERROR_BIT) & 1
+            self._flags[:, rows] = (words[np.newaxis, :] >> self._flag_bits[:, np.newaxis]) & 1
+            attached = [row for row in rows.tolist() if self._devices[row] is not None]
+            return self._status_map(attached)
+
+    def update_row(self, row, data, thresholds=True):
+        """
+        Update one row from a decoded read value.
+
+        :param row: Row to update
+        :param data: Decoded read value
+        :type  data: :obj:`percival.carrier.registers.ReadValueMap`
+        :param thresholds: Also update the threshold and safety flags
+        """
+        with self._lock:
+            self._raw_value[row] = int(data.read_value)
+            self._value[row] = self.convert([self._raw_value[row]], [row])[0]
+            self._sample_number[row] = int(data.sample_number)
+            self._i2c_comms_error[row] = int(data.i2c_communication_error)
+            if thresholds:
+                for index, (field, map_field, bit) in enumerate(STATUS_FLAGS):
+                    self._flags[index, row] = int(getattr(data, map_field))
+
+    def value(self, row):
+        return float(self._value[row])
+
+    def status(self, row):
+        """Return the status report of the device attached to a row"""
+        with self._lock:
+            return self._status_map([row])[self._devices[row].name]
+
+    def status_map(self):
+        """Return the status reports of all attached devices, keyed by device name"""
+        with self._lock:
+            return self._status_map(self.rows)
+
+    def _status_map(self, rows):
+        # Called with the lock held.  Convert the columns to Python values once, then assemble the reports
+        columns = [self._value[rows].tolist(),
+                   self._raw_value[rows].tolist(),
+                   self._sample_number[rows].tolist(),
+                   self._i2c_comms_error[rows].tolist()]
+        flags = self._flags[:, rows].tolist()
+        reports = {}
+        for index, row in enumerate(rows):
+            device = self._devices[row]
+            report = {"device": device.device,
+                      device.value_field: columns[0][index],
+                      "raw_value": columns[1][index],
+                      "sample_number": columns[2][index],
+                      "i2c_comms_error": columns[3][index],
+                      "unit": device.unit}
+            for flag_index, (field, map_field, bit) in enumerate(STATUS_FLAGS):
+                report[field] = flags[flag_index][index]
+            reports[device.name] = report
+        return reports
@@ -0,0 +1,383 @@
+"""
+Durable record of the monitor channel values read by the status loop.
+
+A :class:`MonitorRing` is a fixed size, memory-mapped file of compact binary records (timestamp, channel id,
+raw value and flags).  Every status read is appended, whether or not the database is available, so the file
+always holds the most recent history of every monitor channel.  Records not yet written to the database are
+replayed into it when it becomes available again, and the file can be queried directly.
+
+The replay position only moves once the database has acknowledged the write of the records (see
+:meth:`percival.carrier.database.DatabaseSink.mark`).  If a write fails the records sent since the last
+acknowledgement are sent again; a point written twice to InfluxDB is stored once.
+
+File layout:
+
+- Header: magic, version, record size, capacity, maximum channels, number of channels, total records
+  written (head) and total records replayed to the database.
+- Channel table: maximum channels fixed width, NUL padded UTF-8 channel names.  The channel id of a record is
+  the index of its name in this table.
+- Records: capacity records, record n being stored at n % capacity.
+"""
+from __future__ import division
+
+from builtins import range  # pylint: disable=W0622
+from datetime import datetime
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+RECORD_DTYPE = np.dtype([("time", "<f8"),
+                         ("channel", "<u2"),
+                         ("flags", "<u2"),
+                         ("raw_value", "<u4")])
+"""Binary monitor record: time (seconds since the epoch), channel id, flags and raw value"""
+
+FLAG_FIELDS = ["low_threshold",
+               "extreme_low_threshold",
+               "high_threshold",
+               "extreme_high_threshold",
+               "safety_exception",
+               "i2c_comms_error"]
+"""Monitor status fields stored as single bits (in this order) in the low byte of the record flags"""
+
+SAMPLE_NUMBER_SHIFT = 8
+"""The sample number is stored in the high byte of the record flags"""
+
+MAGIC = b"PCVLRING"
+VERSION = 1
+HEADER = struct.Struct("<8sIIQIIQQ")
+HEADER_SIZE = 64
+NAME_SIZE = 64
+
+_HEAD_OFFSET = 32
+_REPLAYED_OFFSET = 40
+_CHANNEL_COUNT_OFFSET = 28
+
+
+def encode_flags(status):
+    """Pack the flags and sample number of a monitor status dictionary into the 16 bit record flags"""
+    flags = 0
+    for bit, field in enumerate(FLAG_FIELDS):
+        if status.get(field):
+            flags |= 1 << bit
+    return flags | (int(status.get("sample_number", 0)) & 0xFF) << SAMPLE_NUMBER_SHIFT
+
+
+def decode_flags(flags):
+    """Unpack record flags into a dictionary of the monitor status fields"""
+    status = {field: (flags >> bit) & 1 for bit, field in enumerate(FLAG_FIELDS)}
+    status["sample_number"] = (flags >> SAMPLE_NUMBER_SHIFT) & 0xFF
+    return status
+
+
+class MonitorRing(object):
+    """
+    Fixed size ring of monitor records in a memory-mapped file.
+
+    Appending is cheap (a vectorised copy into the mapped file and an update of the head counter) and never
+    waits on the database.  The file is opened again on restart, keeping the records and replay position.
+    """
+    def __init__(self, filename, capacity=2000000, max_channels=512):
+        """
+        :param filename: Path of the ring file, created if it does not exist
+        :param capacity: Number of records held; the oldest records are overwritten once full
+        :param max_channels: Maximum number of distinct channel names
+        """
+        self._log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
+        self._filename = filename
+        self._capacity = capacity
+        self._max_channels = max_channels
+        self._lock = threading.Lock()
+        self._file = None
+        self._map = None
+        self._records = None
+        self._channels = []
+        self._channel_ids = {}
+        self._head = 0
+        self._replayed = 0
+        # Records up to _sent have been passed to the database, those after _replayed are not yet acknowledged.
+        # A failed write starts a new generation, whose acknowledgements are the only ones accepted.
+        self._sent = 0
+        self._generation = 0
+
+    @property
+    def filename(self):
+        return self._filename
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def is_open(self):
+        return self._map is not None
+
+    @property
+    def head(self):
+        """Total number of records written since the file was created"""
+        return self._head
+
+    @property
+    def count(self):
+        """Number of records held in the file"""
+        return min(self._head, self._capacity)
+
+    @property
+    def pending(self):
+        """Number of records held in the file which the database has not acknowledged"""
+        return self._head - max(self._replayed, self._head - self._capacity)
+
+    @property
+    def unsent(self):
+        """Number of records held in the file which have not been passed to the database"""
+        return self._head - max(self._sent, self._replayed, self._head - self._capacity)
+
+    @property
+    def channels(self):
+        return list(self._channels)
+
+    def _size(self):
+        return HEADER_SIZE + self._max_channels * NAME_SIZE + self._capacity * RECORD_DTYPE.itemsize
+
+    def open(self):
+        """Open (creating or reformatting if required) and map the ring file"""
+        with self._lock:
+            if self._map is not None:
+                return
+            header = None
+            if os.path.exists(self._filename) and os.path.getsize(self._filename) == self._size():
+                with open(self._filename, "rb") as existing:
+                    header = HEADER.unpack(existing.read(HEADER.size))
+                if header[0:5] != (MAGIC, VERSION, RECORD_DTYPE.itemsize, self._capacity, self._max_channels):
+                    self._log.warning("Ring file %s has a different format, reformatting", self._filename)
+                    header = None
+            if header is None:
+                with open(self._filename, "wb") as new_file:
+                    new_file.truncate(self._size())
+            self._file = open(self._filename, "r+b")
+            self._map = mmap.mmap(self._file.fileno(), self._size())
+            self._records = np.ndarray((self._capacity,), dtype=RECORD_DTYPE, buffer=self._map,
+                                       offset=HEADER_SIZE + self._max_channels * NAME_SIZE)
+            if header is None:
+                self._map[0:HEADER.size] = HEADER.pack(MAGIC, VERSION, RECORD_DTYPE.itemsize, self._capacity,
+                                                       self._max_channels, 0, 0, 0)
+                self._head = 0
+                self._replayed = 0
+                self._channels = []
+            else:
+                self._head = header[6]
+                self._replayed = header[7]
+                self._channels = [self._read_name(index) for index in range(header[5])]
+            self._sent = self._replayed
+            self._channel_ids = {name: index for index, name in enumerate(self._channels)}
+            self._log.info("Opened monitor ring file %s holding %d records", self._filename, self.count)
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._records = None
+                self._map.flush()
+                self._map.close()
+                self._file.close()
+                self._map = None
+                self._file = None
+
+    def _read_name(self, index):
+        offset = HEADER_SIZE + index * NAME_SIZE
+        return self._map[offset:offset + NAME_SIZE].rstrip(b"\0").decode("utf-8")
+
+    def _channel_id(self, name):
+        # Called with the lock held
+        channel_id = self._channel_ids.get(name)
+        if channel_id is None:
+            if len(self._channels) >= self._max_channels:
+                raise ValueError("Ring file {} is limited to {} channels".format(self._filename,
+                                                                                 self._max_channels))
+            encoded = name.encode("utf-8")
+            if len(encoded) > NAME_SIZE:
+                raise ValueError("Channel name {} is longer than {} bytes".format(name, NAME_SIZE))
+            channel_id = len(self._channels)
+            offset = HEADER_SIZE + channel_id * NAME_SIZE
+            self._map[offset:offset + NAME_SIZE] = encoded.ljust(NAME_SIZE, b"\0")
+            self._channels.append(name)
+            self._channel_ids[name] = channel_id
+            struct.pack_into("<I", self._map, _CHANNEL_COUNT_OFFSET, len(self._channels))
+        return channel_id
+
+    def append_status(self, timestamp, channels, sink=None):
+        """
+        Append a record for each channel of a status read.
+
+        :param timestamp: Time of the status read (seconds since the epoch)
+        :type  timestamp: float
+        :param channels: Status dictionary of each monitor channel (with raw_value and flag fields), by name
+        :type  channels: dict
+        :param sink: Database sink the values have also been logged to.  If there are no other records waiting to
+                     be sent the new records are not replayed, once the sink acknowledges the values are written.
+        :returns: Number of records appended
+        """
+        if not channels or self._map is None:
+            return 0
+        with self._lock:
+            ids = []
+            for name in channels:
+                try:
+                    ids.append(self._channel_id(name))
+                except ValueError as ex:
+                    self._log.error("Not recording %s: %s", name, str(ex))
+                    ids.append(None)
+            records = np.empty(len(ids), dtype=RECORD_DTYPE)
+            records["time"] = timestamp
+            records["channel"] = [channel_id or 0 for channel_id in ids]
+            records["raw_value"] = [int(channels[name].get("raw_value", 0)) for name in channels]
+            records["flags"] = [encode_flags(channels[name]) for name in channels]
+            records = records[[channel_id is not None for channel_id in ids]]
+            count = len(records)
+            up_to_date = self.unsent == 0
+            positions = (self._head + np.arange(count)) % self._capacity
+            self._records[positions] = records
+            # The head is updated after the records so a reader never sees a partially written record
+            self._head += count
+            struct.pack_into("<Q", self._map, _HEAD_OFFSET, self._head)
+            acknowledge = None
+            if sink is not None and up_to_date:
+                self._sent = self._head
+                acknowledge = self._acknowledgement(self._head)
+        if acknowledge is not None:
+            sink.mark(acknowledge)
+        return count
+
+    def _acknowledgement(self, position):
+        # Called with the lock held: the callback of the database write of the records up to position
+        generation = self._generation
+        return lambda success: self._acknowledge(position, generation, success)
+
+    def _acknowledge(self, position, generation, success):
+        with self._lock:
+            if generation != self._generation or self._map is None:
+                return
+            if success:
+                if position > self._replayed:
+                    self._set_replayed(position)
+            else:
+                # Send everything after the last acknowledged record again, ignoring the outcome of any writes
+                # already made
+                self._generation += 1
+                self._sent = self._replayed
+                self._log.warning("Database write of monitor records failed, %d records to be sent again",
+                                  self.unsent)
+
+    def _set_replayed(self, replayed):
+        self._replayed = replayed
+        struct.pack_into("<Q", self._map, _REPLAYED_OFFSET, self._replayed)
+
+    def _slice(self, first, last):
+        # Records numbered first (inclusive) to last (exclusive), which must be held in the file
+        if last <= first:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        start = first % self._capacity
+        end = start + (last - first)
+        if end <= self._capacity:
+            return self._records[start:end].copy()
+        return np.concatenate((self._records[start:], self._records[:end - self._capacity]))
+
+    def records(self, start=None, end=None, channels=None):
+        """
+        Return the records held in the file, oldest first, optionally filtered by time and channel.
+
+        :param start: Earliest time (seconds since the epoch) of records to return
+        :param end: Latest time (seconds since the epoch) of records to return
+        :param channels: Names of the channels to return
+        :returns: Array of records with dtype :data:`RECORD_DTYPE`
+        :rtype: numpy.ndarray
+        """
+        if self._map is None:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        with self._lock:
+            records = self._slice(self._head - self.count, self._head)
+        mask = np.ones(len(records), dtype=bool)
+        if start is not None:
+            mask &= records["time"] >= start
+        if end is not None:
+            mask &= records["time"] <= end
+        if channels is not None:
+            selected = np.zeros(self._max_channels, dtype=bool)
+            selected[[self._channel_ids[name] for name in channels if name in self._channel_ids]] = True
+            mask &= selected[records["channel"]]
+        return records[mask]
+
+    def last(self, hours, channels=None, now=None):
+        """
+        Return the history of each channel over the last hours.
+
+        :param hours: Length of the history (hours)
+        :param channels: Names of the channels to return, defaults to all
+        :param now: End of the history (seconds since the epoch), defaults to the current time
+        :returns: Dictionary of channel name to a dictionary of "time", "raw_value" and flag field lists
+        :rtype: dict
+        """
+        now = now or time.time()
+        records = self.records(now - hours * 3600.0, now, channels)
+        history = {}
+        for channel_id in np.unique(records["channel"]):
+            selected = records[records["channel"] == channel_id]
+            channel = {"time": selected["time"].tolist(),
+                       "raw_value": selected["raw_value"].tolist()}
+            flags = decode_flags(selected["flags"].astype(np.int64))
+            for field in flags:
+                channel[field] = flags[field].tolist()
+            history[self._channels[channel_id]] = channel
+        return history
+
+    def replay(self, sink, limit=None, convert=None, measurement=None):
+        """
+        Log the oldest records which have not been sent into a database sink.  They are replayed once the sink
+        acknowledges they are written.
+
+        :param sink: Connected database sink with log_point and mark methods
+        :param limit: Maximum number of records to replay in this call
+        :param convert: Optional callable (channel name, raw value) returning a dictionary of extra fields
+                        (for example the calibrated value) to log with each record
+        :param measurement: Optional callable returning the measurement to log the records of a channel to,
+                            defaults to the channel name
+        :returns: Number of records replayed
+        """
+        if self._map is None:
+            return 0
+        with self._lock:
+            first = max(self._sent, self._replayed, self._head - self._capacity)
+            last = self._head if limit is None else min(self._head, first + limit)
+            records = self._slice(first, last)
+            self._sent = max(self._sent, last)
+            acknowledge = self._acknowledgement(last)
+        for record in records:
+            name = self._channels[record["channel"]]
+            point = decode_flags(int(record["flags"]))
+            point["raw_value"] = int(record["raw_value"])
+            if convert is not None:
+                point.update(convert(name, point["raw_value"]))
+            sink.log_point(datetime.utcfromtimestamp(float(record["time"])),
+                           name if measurement is None else measurement(name), point)
+        if len(records):
+            sink.mark(acknowledge)
+            self._log.info("Replayed %d monitor records into the database, %d unsent", len(records), self.unsent)
+        return len(records)
+
+    def get_status(self):
+        status = {"file": self._filename,
+                  "open": self.is_open,
+                  "capacity": self._capacity,
+                  "records": self.count,
+                  "pending": self.pending,
+                  "unsent": self.unsent,
+                  "channels": len(self._channels)}
+        if self.is_open and self.count:
+            with self._lock:
+                oldest = float(self._records[(self._head - self.count) % self._capacity]["time"])
+            status["oldest"] = str(datetime.utcfromtimestamp(oldest))
+        return status
@@ -5,22 +5,61 @@ Created on 12 May 2016
 """
 from __future__ import print_function
 
+import errno
 import socket
+import select
 import numpy as np
 from threading import Thread
 import math
 import time
+import argparse
+from collections import deque
 
 import signal
-from datetime import datetime
 from builtins import bytes    # pylint: disable=W0622
-from percival.carrier.encoding import DATA_ENCODING, END_OF_MESSAGE
+from percival.carrier.encoding import DATA_ENCODING, END_OF_MESSAGE, NUM_BYTES_PER_MSG
 from percival.carrier.encoding import (encode_message, decode_message)
 from percival.log import log
 from percival.carrier.const import *
+import percival.carrier.const as const
+from percival.carrier.configuration import SimulatorProfileParameters, ChannelParameters
+from percival.carrier.registers import BoardRegisters, BoardValueRegisters, ControlChannelMap
 
 board_ip_port = 10001
 
+BLOCK_READ_BYTES = 65536
+# Requests from a client are not read while more than this many reply bytes are waiting to be sent to it
+MAX_UNSENT_BYTES = 4 * BLOCK_READ_BYTES
+"""Maximum number of bytes read from a client socket in one go"""
+
+MSG_DTYPE = np.dtype([('address', '>u2'), ('word', '>u4')])
+"""numpy representation of a single 6 byte message: 2 byte address followed by 4 byte data word"""
+
+SENSOR_BUFFER_EOM = bytes('\xFF\xF3\xAB\xBA\x33\x33', encoding=DATA_ENCODING)
+"""Additional end of message sent for sensor buffer commands: 0xFFF3ABBA3333"""
+
+I2C_ERROR_BIT = 16
+"""Position of the i2c_communication_error bit in the ReadValueMap and EchoWordMap words"""
+
+CONTROL_VALUE_WORD = ControlChannelMap()._mem_map['value'].word_index
+"""Index of the word holding the control value within a control channel settings entry"""
+
+MONITOR_BOARDS = [BoardTypes.left, BoardTypes.bottom, BoardTypes.carrier, BoardTypes.plugin]
+
+MONITOR_DEFAULT_VALUE = 2000.0
+"""Raw baseline of a monitor which does not have any thresholds configured"""
+
+MONITOR_DRIFT_AMPLITUDE = 0.05
+"""Amplitude of the slow monitor drift as a fraction of the baseline"""
+
+MONITOR_DRIFT_PERIOD = 200.0
+"""Period (seconds) of the slow monitor drift"""
+
+CONTROL_SETTINGS = [CONTROL_SETTINGS_LEFT,
+                    CONTROL_SETTINGS_BOTTOM,
+                    CONTROL_SETTINGS_CARRIER,
+                    CONTROL_SETTINGS_PLUGIN]
+
 
 def bytes_to_str(byte_list):
     return "".join([chr(b) for b in byte_list])
@@ -39,27 +78,224 @@ class ShortcutRegister(object):
         return self.register, self.length
 
 
-class Temperature(object):
+class MonitorModel(object):
+    """
+    Simulated dynamics of the monitoring channels of all boards
+
+    Every READ_VALUES channel drifts slowly around a baseline (the centre of its configured
+    low/high thresholds) with some noise. Channels coupled to a control channel settle towards
+    offset + gain * raw control value. Threshold flags are derived from the monitoring settings
+    registers and each channel has its own advancing sample number.
     """
-    Simple temperature monitor
+    def __init__(self, registers, random, update_period=0.1, noise=1.0, settle_time=0.05):
+        self._registers = registers
+        self._random = random
+        self.update_period = update_period
+        self.noise = noise
+        self.settle_time = settle_time
+
+        value_addresses = []
+        settings_addresses = []
+        for board in MONITOR_BOARDS:
+            values = BoardValueRegisters[board]
+            settings = BoardRegisters[board][2]
+            value_addresses.append(np.arange(values.start_address, values.start_address + values.entries))
+            settings_addresses.append(np.arange(settings.start_address,
+                                                settings.start_address + settings.entries * settings.words_per_entry,
+                                                settings.words_per_entry))
+        self.value_addresses = np.concatenate(value_addresses)
+        self._settings_addresses = np.concatenate(settings_addresses)
+        self._index = dict([(int(address), index) for index, address in enumerate(self.value_addresses)])
+
+        num_channels = len(self.value_addresses)
+        self.values = np.full(num_channels, MONITOR_DEFAULT_VALUE, dtype=np.float64)
+        self.sample_numbers = np.zeros(num_channels, dtype=np.uint32)
+        self._phase = self._random.uniform(0.0, 2 * math.pi, num_channels)
+        self._coupled = np.zeros(num_channels, dtype=bool)
+        self._control_addresses = np.zeros(num_channels, dtype=np.int64)
+        self._gain = np.zeros(num_channels, dtype=np.float64)
+        self._offset = np.zeros(num_channels, dtype=np.float64)
+        self._start_time = time.time()
+        self._last_update = self._start_time
+
+    @staticmethod
+    def channel_address(board, channel_id):
+        """Return the READ_VALUES register address of a monitoring channel"""
+        return BoardValueRegisters[BoardTypes(board)].start_address + channel_id
+
+    def couple(self, monitor_address, control_address, gain, offset):
+        """Make the monitor at monitor_address follow the control value stored at control_address"""
+        index = self._index[monitor_address]
+        self._coupled[index] = True
+        self._control_addresses[index] = control_address
+        self._gain[index] = gain
+        self._offset[index] = offset
+
+    def _targets(self, now):
+        ext_thresholds = self._registers[self._settings_addresses + 1]
+        thresholds = self._registers[self._settings_addresses + 2]
+        low = (thresholds >> 16).astype(np.float64)
+        high = (thresholds & 0xFFFF).astype(np.float64)
+        targets = np.where(high > low, (low + high) / 2.0, MONITOR_DEFAULT_VALUE)
+        drift = MONITOR_DRIFT_AMPLITUDE * targets * np.sin(2 * math.pi * (now - self._start_time) /
+                                                           MONITOR_DRIFT_PERIOD + self._phase)
+        controls = (self._registers[self._control_addresses[self._coupled]] & 0xFFFF).astype(np.float64)
+        targets = targets + drift
+        targets[self._coupled] = self._offset[self._coupled] + self._gain[self._coupled] * controls
+        return ext_thresholds, thresholds, targets
+
+    def update(self, now=None):
+        """Advance the model by the number of sample periods elapsed and write the READ_VALUES registers"""
+        if now is None:
+            now = time.time()
+        num_samples = int((now - self._last_update) / self.update_period)
+        if num_samples < 1:
+            return
+        self._last_update += num_samples * self.update_period
+        self._advance(np.ones(len(self.values), dtype=bool), num_samples, now)
+
+    def sample(self, address, now=None):
+        """Take a new sample of a single channel (a get value command), returning the READ_VALUES word"""
+        if now is None:
+            now = time.time()
+        selection = np.zeros(len(self.values), dtype=bool)
+        selection[self._index[address]] = True
+        self._advance(selection, 1, now)
+        return int(self._registers[address])
+
+    def _advance(self, selection, num_samples, now):
+        ext_thresholds, thresholds, targets = self._targets(now)
+        elapsed = num_samples * self.update_period
+        if self.settle_time > 0.0:
+            settle = 1.0 - math.exp(-elapsed / self.settle_time)
+        else:
+            settle = 1.0
+        self.values[selection] += (targets[selection] - self.values[selection]) * settle
+        self.sample_numbers[selection] += num_samples
+
+        raw = self.values[selection] + self._random.normal(0.0, self.noise, np.count_nonzero(selection)) \
+            if self.noise > 0.0 else self.values[selection]
+        raw = np.clip(np.round(raw), 0, 0xFFFF).astype(np.uint32)
+
+        ext_low = ext_thresholds[selection] >> 16
+        ext_high = ext_thresholds[selection] & 0xFFFF
+        low = thresholds[selection] >> 16
+        high = thresholds[selection] & 0xFFFF
+        ext_configured = ext_high > ext_low
+        configured = high > low
+        below_ext_low = ext_configured & (raw < ext_low)
+        above_ext_high = ext_configured & (raw > ext_high)
+        flags = ((below_ext_low | above_ext_high).astype(np.uint32) << 17) | \
+                (below_ext_low.astype(np.uint32) << 18) | \
+                ((configured & (raw < low)).astype(np.uint32) << 19) | \
+                ((configured & (raw > high)).astype(np.uint32) << 20) | \
+                (above_ext_high.astype(np.uint32) << 21)
+
+        self._registers[self.value_addresses[selection]] = \
+            raw | flags | ((self.sample_numbers[selection] & 0xFF) << 24)
+
+
+class ResponseProfile(object):
     """
-    def __init__(self, address):
-        self._address = address
-        self._time = datetime.now()
-        self._value = 0
+    Response latency and fault injection model of the simulated carrier board
 
-    def update(self):
-        new_time = datetime.now()
-        delta_t = (new_time - self._time).total_seconds() % 200
-        self._value = (100 * math.sin(delta_t / 200 * 2 * math.pi)) + 2000
+    The model is described by a SimulatorProfileParameters INI file. Without a profile
+    the simulator answers instantly and never fails.
+    """
+    def __init__(self, parameters=None):
+        self._latency = {}
+        self._default_latency = ("constant", (0.0,))
+        self._blocks = []
+        self.i2c_error_rate = 0.0
+        self.drop_connection_rate = 0.0
+        self.echo_word_delay = 0.0
+        self.parameters = None
+        self.random = np.random.RandomState()
+        if parameters is not None:
+            self.load(parameters)
+
+    def load(self, parameters):
+        """Load the model from a SimulatorProfileParameters object (which has been loaded)"""
+        self.parameters = parameters
+        self.random = np.random.RandomState(parameters.seed)
+        self.i2c_error_rate = parameters.i2c_error_rate
+        self.drop_connection_rate = parameters.drop_connection_rate
+        self.echo_word_delay = parameters.echo_word_delay
+        self._blocks = []
+        for name, distribution in parameters.latency.items():
+            if name == "default":
+                self._default_latency = distribution
+            else:
+                block = getattr(const, name)
+                self._blocks.append((block.start_address,
+                                     block.start_address + block.entries * block.words_per_entry,
+                                     distribution))
+        self._latency = {}
+
+    def _distribution(self, address):
+        if address not in self._latency:
+            self._latency[address] = self._default_latency
+            for start, end, distribution in self._blocks:
+                if start <= address < end:
+                    self._latency[address] = distribution
+                    break
+        return self._latency[address]
+
+    def latency(self, address):
+        """Sample the time (seconds) taken to respond to a message sent to address"""
+        distribution, params = self._distribution(address)
+        if distribution == "constant":
+            value = params[0]
+        elif distribution == "uniform":
+            value = self.random.uniform(params[0], params[1])
+        elif distribution == "normal":
+            value = self.random.normal(params[0], params[1])
+        else:
+            value = self.random.exponential(params[0])
+        return max(value, 0.0)
+
+    def i2c_errors(self, num_words):
+        """Return a mask of I2C communication error bits to be applied to num_words read values"""
+        if self.i2c_error_rate <= 0.0:
+            return np.zeros(num_words, dtype=np.uint32)
+        errors = self.random.random_sample(num_words) < self.i2c_error_rate
+        return errors.astype(np.uint32) << I2C_ERROR_BIT
+
+    def drop_connection(self):
+        """Decide whether the connection should be dropped instead of replying to a message"""
+        return self.drop_connection_rate > 0.0 and self.random.random_sample() < self.drop_connection_rate
+
+
+class SimulatorClient(object):
+    """
+    Connection state of a single simulator client: partially received messages, replies waiting until they
+    are due and reply bytes that are due but have not yet been accepted by the socket
+    """
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.buffer = b""
+        self.replies = deque()
+        self.unsent = b""
 
     @property
-    def value(self):
-        return self._value
+    def last_due(self):
+        if self.replies:
+            return self.replies[-1][0]
+        return 0.0
 
 
 class Simulator(object):
-    def __init__(self):
+    """
+    Simulates the carrier board UART register interface over TCP
+
+    A single thread multiplexes any number of connected clients.
+    """
+    def __init__(self, port=board_ip_port, profile=None):
+        """
+        :param port: TCP port to serve on (0 to pick any free port, None for in-process use only)
+        :param profile: optional response profile INI filename or contents, see ResponseProfile
+        """
         self.registers = np.zeros(READBACK_READ_ECHO_WORD.start_address +
                                   (READBACK_READ_ECHO_WORD.entries *
                                    READBACK_READ_ECHO_WORD.words_per_entry),
@@ -166,31 +402,67 @@ class Simulator(object):
                                                READ_ECHO_WORD.entries *
                                                READ_ECHO_WORD.words_per_entry)}
 
-        self.server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.server_sock.settimeout(None)
-        self.server_sock.bind(('', board_ip_port))
-        self.server_sock.listen(5)
-        self._t1 = Temperature(0x33E)
-        self.sim_value_thread = None
-
+        # Pre-compute the register addresses returned by each shortcut so that replies can be
+        # encoded in a single vectorised operation straight from the register array
+        self._shortcut_addresses = {}
+        for shortcut, sc_reg in self.shortcuts.items():
+            reg, length = sc_reg.getshortcut()
+            self._shortcut_addresses[shortcut] = np.arange(reg, reg + length, dtype=np.uint32)
+        # Readbacks whose words carry an I2C communication error bit (ReadValueMap and EchoWordMap)
+        self._value_readbacks = [READBACK_READ_VALUES_PERIPHERY_LEFT.start_address,
+                                 READBACK_READ_VALUES_PERIPHERY_BOTTOM.start_address,
+                                 READBACK_READ_VALUES_CARRIER.start_address,
+                                 READBACK_READ_VALUES_PLUGIN.start_address,
+                                 READBACK_READ_ECHO_WORD.start_address]
+
+        # Without a profile file the defaults apply: instant, fault free responses
+        parameters = SimulatorProfileParameters(profile if profile is not None else "")
+        parameters.load_ini()
+        self.profile = ResponseProfile(parameters)
+        self._echo_update = None
+
+        self.monitors = MonitorModel(self.registers, self.profile.random,
+                                     parameters.monitor_update_period,
+                                     parameters.monitor_noise,
+                                     parameters.monitor_settle_time)
+        # Monitoring channel index (as used by device commands) to READ_VALUES register address
+        self._monitor_addresses = {}
+        self._load_channels(parameters)
+
+        # With no port the simulator is only used in-process (see percival.carrier.txrx.loopback_transport)
+        self.server_sock = None
+        self.port = None
+        if port is not None:
+            self.server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.server_sock.settimeout(None)
+            self.server_sock.bind(('', port))
+            self.server_sock.listen(5)
+            self.server_sock.setblocking(False)
+            self.port = self.server_sock.getsockname()[1]
+
+        self._clients = {}
+        self._running = False
         self.thread = None
 
     def shutdown(self):
         """Wait a few moments for the thread to shutdown before killing it and closing the TCP socket"""
+        self._running = False
         if self.thread is not None:
             log.debug("Waiting for sim thread to complete")
             self.thread.join(2.0)
-        log.debug("Closing socket")
-#        socket.socket(socket.AF_INET, socket.SOCK_STREAM).connect(("localhost", board_ip_port))
-        self.server_sock.close()
-        self.thread.join(2.0)
-        if self.thread.isAlive():
-            log.warning("Simulation thread is still running. This should not happen")
+            if self.thread.is_alive():
+                log.warning("Simulation thread is still running. This should not happen")
+        for client_sock in list(self._clients):
+            self._disconnect(client_sock)
+        if self.server_sock is not None:
+            log.debug("Closing socket")
+            self.server_sock.close()
 
     def start(self, forever=False, blocking=False):
-        #self.sim_value_thread = Thread(target=self._update_sim_values)
-        #self.sim_value_thread.start()
+        if self.server_sock is None:
+            raise RuntimeError("Simulator was created without a TCP port to serve on")
+        self._running = True
         if forever and blocking:
             self._serve_forever()
         elif forever and not blocking:
@@ -206,120 +478,253 @@ class Simulator(object):
             self.thread.daemon = True
             self.thread.start()
 
-    def _update_sim_values(self):
-        while 1:
-            time.sleep(0.2)
-            self._t1.update()
-            for index in range(0x392, 0x3A5):
-                self.registers[index] = self._t1.value
+    def _load_channels(self, parameters):
+        """Locate the monitoring channels and set up the control to monitor coupling from the channel INI file"""
+        try:
+            channels = ChannelParameters(parameters.channel_settings_file)
+        except IOError:
+            log.warning("Channel settings file %s not found, monitors can only be read by board",
+                        parameters.channel_settings_file)
+            return
+        channels.load_ini()
+
+        monitors = {}
+        for channel in channels.monitoring_channels:
+            try:
+                address = MonitorModel.channel_address(channel.Board_type, channel.Channel_ID)
+            except (KeyError, ValueError):
+                continue
+            if address in self.monitors.value_addresses:
+                self._monitor_addresses[channel.channel_index] = address
+                monitors[channel.Channel_name] = address
+        controls = dict([(channel.Channel_name, channel.UART_address + CONTROL_VALUE_WORD)
+                         for channel in channels.control_channels])
+
+        for name, (control, gain, offset) in parameters.coupling.items():
+            if name not in monitors or control not in controls:
+                log.warning("Unable to couple monitor %s to control %s", name, control)
+                continue
+            self.monitors.couple(monitors[name], controls[control], gain, offset)
+
+    def _encode_registers(self, addresses, flags=None):
+        """Encode the current value of a set of registers as a stream of 6 byte messages
+
+        :param addresses: numpy array of register addresses
+        :param flags: optional array of bits to set in the returned words
+        :returns: encoded reply bytes
+        """
+        reply = np.empty(len(addresses), dtype=MSG_DTYPE)
+        reply['address'] = addresses
+        reply['word'] = self.registers[addresses]
+        if flags is not None:
+            reply['word'] |= flags
+        return reply.tobytes()
+
+    def _set_echo_word(self, value):
+        """Update the echo word, after the configured convergence delay"""
+        if self.profile.echo_word_delay > 0.0:
+            self._echo_update = (time.time() + self.profile.echo_word_delay, value)
+        else:
+            self.registers[READ_ECHO_WORD.start_address] = value
+
+    def _apply_echo_word(self):
+        if self._echo_update is not None and time.time() >= self._echo_update[0]:
+            self.registers[READ_ECHO_WORD.start_address] = self._echo_update[1]
+            self._echo_update = None
+
+    def _device_command(self, w):
+        """A get value command on a monitoring device takes a new sample which is returned in the echo word"""
+        device_cmd = (w >> 28) & 0x7
+        device_type = (w >> 23) & 0x3
+        device_index = w & 0xFFFF
+        if device_type == DeviceFunction.monitoring.value and \
+                device_cmd in (DeviceCmd.get_value.value, DeviceCmd.set_and_get_value.value) and \
+                device_index in self._monitor_addresses:
+            self._set_echo_word(self.monitors.sample(self._monitor_addresses[device_index]))
+
+    def handle_message(self, a, w):
+        """Apply a single (address, word) message to the simulated registers and
+        generate the response that the carrier board would send back
+
+        :param a: UART address (16bit integer)
+        :param w: data word (32bit integer)
+        :returns: encoded reply bytes
+        """
+        log.debug("Message received: (0x%04X) 0x%08X", a, w)
+        self._apply_echo_word()
+        # Save the message to the register
+        if a < len(self.registers):
+            self.registers[a] = w
+
+        if a == COMMAND.start_address:
+            self._device_command(w)
+
+        if a in self.shortcuts:
+            log.debug("Shortcut found: (0x%04X)", a)
+            addresses = self._shortcut_addresses[a]
+            flags = None
+            if a in self._value_readbacks:
+                if a != READBACK_READ_ECHO_WORD.start_address:
+                    self.monitors.update()
+                flags = self.profile.i2c_errors(len(addresses))
+            reply = self._encode_registers(addresses, flags)
+        elif a in self.eoms:
+            # We need to send FFFFABBABAC1 as an end of message
+            reply = END_OF_MESSAGE
+            # Check for special buffer command case where two responses are required:
+            # every command to the sensor buffer target is acknowledged a second time
+            if a == COMMAND.start_address + 1:
+                if (w >> 28) == BufferTarget.percival_sensor.value:
+                    reply = reply + SENSOR_BUFFER_EOM
+        else:
+            # Simply send back the registers
+            reply = encode_message(a, int(self.registers[a]))
+
+        # Implementation of some expected results
+        # If set value called for a control device then the next read echo
+        # is happy if it sees the same value
+        for settings in CONTROL_SETTINGS:
+            if settings.start_address <= a < settings.start_address + settings.entries * settings.words_per_entry:
+                log.debug("***** SETTING VALUE: 0x%04X = 0x%04X", a, w)
+                self._set_echo_word(w & 0xFFFF)
+
+        return bytes(reply)
+
+    def handle_data(self, data):
+        """Process a block of received data containing any number of complete 6 byte messages
+
+        Latency and faults from the response profile are not applied.
+
+        :param data: received bytes, the length must be a multiple of NUM_BYTES_PER_MSG
+        :returns: encoded reply bytes for all of the messages, in order
+        """
+        messages = np.frombuffer(data, dtype=MSG_DTYPE)
+        return b"".join([self.handle_message(int(a), int(w))
+                         for a, w in zip(messages['address'], messages['word'])])
 
     def _serve_forever(self):
-        while 1:
-            self._serve()
+        while self._running:
+            self._poll()
 
     def _serve(self):
-        """Serve a TCP socket, simulating a Percival Carrier board
-
-        The address space is empty on startup just like the Carrier.
-        The function return when the client disconnects.
+        """Serve clients until the first connected client (and any others) have disconnected"""
+        while self._running and not self._clients:
+            self._poll()
+        while self._running and self._clients:
+            self._poll()
+
+    def _poll(self, timeout=0.1):
+        """Wait for activity on the server and client sockets and service it
+
+        All connected clients are multiplexed from the single server thread, with
+        data read in large blocks. Replies are queued with the time they are due
+        (according to the response profile) and sent when that time is reached.
+        Client sockets are non-blocking: bytes a client is not ready to accept are
+        kept until its socket is writable, so a slow client cannot stall the others,
+        and its requests are not read while too many of its replies are outstanding.
         """
-        log.info("Listening for connections...")
-        # Accept connections
-        (client_sock, address) = self.server_sock.accept()
+        now = time.time()
+        for client in self._clients.values():
+            if client.replies:
+                timeout = max(0.0, min(timeout, client.replies[0][0] - now))
+        receiving = [sock for sock, client in self._clients.items() if len(client.unsent) <= MAX_UNSENT_BYTES]
+        pending = [sock for sock, client in self._clients.items() if client.unsent]
+        try:
+            readable, writable, _ = select.select([self.server_sock] + receiving, pending, [], timeout)
+        except (select.error, socket.error, ValueError):
+            # A socket has been closed underneath us (shutdown)
+            return
+        for sock in readable:
+            if sock is self.server_sock:
+                self._accept()
+            elif sock in self._clients:
+                self._service(self._clients[sock])
+        for sock in writable:
+            if sock in self._clients:
+                self._flush(self._clients[sock])
+        self._send_replies()
+
+    def _accept(self):
+        try:
+            client_sock, address = self.server_sock.accept()
+        except socket.error:
+            return
+        client_sock.setblocking(False)
+        client_sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._clients[client_sock] = SimulatorClient(client_sock, address)
         log.info("Client connected: %s", str(address))
 
-        msg = bytes()
-        block_read_bytes = 6
-        # expected_resp_len = 6
-
-        # set_value = 0
-        chunk = client_sock.recv(block_read_bytes)
-        log.info("Here!")
-        while len(chunk) > 0:
-            if isinstance(chunk, str):
-                chunk = bytes(chunk, encoding=DATA_ENCODING)
-            data = decode_message(chunk)
-            for (a, w) in data:
-                log.info("Message received: (0x%04X) 0x%08X", a, w)
-                # Save the message to the register
-                self.registers[a] = w
-                if a in self.shortcuts:
-                    log.info("Shortcut found: (0x%04X)", a)
-                    reg, length = self.shortcuts[a].getshortcut()
-                    msg = bytes()
-                    for creg in range(reg, reg+length):
-                        log.debug("creg: 0x%04X   reg: (0x%08X)", creg, self.registers[creg])
-                        msg = msg + encode_message(creg, self.registers[creg])
-                    log.debug("Message length of reply: %d", len(msg))
-                    client_sock.send(msg)
-                else:
-                    if a in self.eoms:
-                        log.info("EOM required")
-                        # We need to send FFFFABBABAC1 as an end of message
-                        log.info("Sending 0xFFFFABBABAC1")
-                        client_sock.send(END_OF_MESSAGE)
-                        # Check for special buffer command case where two responses may be required
-                        if a == COMMAND.start_address + 1:
-                            # Sensor DAC command
-                            if (w & 0x50000001):
-                                log.info("Sending 0xFFF3ABBA3333")
-                                client_sock.send(bytes('\xFF\xF3\xAB\xBA\x33\x33', encoding=DATA_ENCODING))
-                            if (w & 0x51000000) == 0x51000000 \
-                                    or (w & 0x52000000) == 0x52000000 \
-                                    or (w & 0x54000000) == 0x54000000:
-                                client_sock.send(bytes('\xFF\xF3\xAB\xBA\x33\x33', encoding=DATA_ENCODING))
-                    else:
-                        # Simply send back the registers
-                        client_sock.send(encode_message(a, self.registers[a]))
-
-                if CONTROL_SETTINGS_CARRIER.start_address <= a < MONITORING_SETTINGS_CARRIER.start_address:
-                    log.debug("***** SETTING VALUE: 0x%04X = 0x%04X", a, w)
-                    self.registers[READ_ECHO_WORD.start_address] = w&0xFFFF
-
-                if CONTROL_SETTINGS_BOTTOM.start_address <= a < MONITORING_SETTINGS_BOTTOM.start_address:
-                    log.debug("***** SETTING VALUE: 0x%04X = 0x%04X", a, w)
-                    self.registers[READ_ECHO_WORD.start_address] = w&0xFFFF
-
-                if CONTROL_SETTINGS_LEFT.start_address <= a < MONITORING_SETTINGS_LEFT.start_address:
-                    log.debug("***** SETTING VALUE: 0x%04X = 0x%04X", a, w)
-                    self.registers[READ_ECHO_WORD.start_address] = w&0xFFFF
-
-                if CONTROL_SETTINGS_PLUGIN.start_address <= a < MONITORING_SETTINGS_PLUGIN.start_address:
-                    log.debug("***** SETTING VALUE: 0x%04X = 0x%04X", a, w)
-                    self.registers[READ_ECHO_WORD.start_address] = w&0xFFFF
-
-                # Implementation of some expected results
-                # If set value called for VCH device then the next read echo
-                # is happy if it sees the same value
-                #if a == 0x022E or\
-                #    a == 0x0232 or\
-                #    a == 0x0236 or\
-                #    a == 0x023A or\
-                #    a == 0x023E or\
-                #    a == 0x0242 or\
-                #    a == 0x0246 or\
-                #    a == 0x0250:
-                #    log.debug("***** SETTING VALUE: 0x%04X", a)
-                #    self.registers[READ_ECHO_WORD.start_address] = w
-
-                # Implementation of some expected results
-                # If set value called for DPOT device then the next read echo
-                # is happy if it sees the same value without the flag for power
-                #if a == 0x0254 or\
-                #    a == 0x0258 or\
-                #    a == 0x025C or\
-                #    a == 0x0260 or\
-                #    a == 0x0264 or\
-                #    a == 0x0268:
-                #    self.registers[READ_ECHO_WORD.start_address] = w & 0x0FFFF
-
-            chunk = client_sock.recv(block_read_bytes)
-
+    def _service(self, client):
+        try:
+            chunk = client.sock.recv(BLOCK_READ_BYTES)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            chunk = b""
+        if len(chunk) == 0:
+            self._disconnect(client.sock)
+            return
+        data = client.buffer + chunk
+        complete = len(data) - (len(data) % NUM_BYTES_PER_MSG)
+        client.buffer = data[complete:]
+        # The board processes messages serially so each reply is due after the previous one
+        due = max(time.time(), client.last_due)
+        messages = np.frombuffer(data[:complete], dtype=MSG_DTYPE)
+        for a, w in zip(messages['address'], messages['word']):
+            if self.profile.drop_connection():
+                log.info("Dropping connection to %s", str(client.address))
+                self._disconnect(client.sock)
+                return
+            reply = self.handle_message(int(a), int(w))
+            due += self.profile.latency(int(a))
+            client.replies.append((due, reply))
+
+    def _send_replies(self):
+        now = time.time()
+        for client in list(self._clients.values()):
+            replies = []
+            while client.replies and client.replies[0][0] <= now:
+                replies.append(client.replies.popleft()[1])
+            if replies:
+                client.unsent += b"".join(replies)
+                self._flush(client)
+
+    def _flush(self, client):
+        """Send as much of the client's unsent data as its socket will accept without blocking"""
+        if not client.unsent:
+            return
+        try:
+            sent = client.sock.send(client.unsent)
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            self._disconnect(client.sock)
+            return
+        client.unsent = client.unsent[sent:]
+
+    def _disconnect(self, client_sock):
+        self._clients.pop(client_sock, None)
+        try:
+            client_sock.close()
+        except socket.error:
+            pass
         log.info("Client has disconnected")
 
 
+def options():
+    desc = "Carrier board simulator"
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument("-p", "--port", action="store", type=int, default=board_ip_port,
+                        help="TCP port to serve on")
+    profile_help = "Response latency and fault injection profile INI file (e.g. config/simulator_profile.ini)"
+    parser.add_argument("--profile", action="store", default=None, help=profile_help)
+    args = parser.parse_args()
+    return args
+
+
 def main():
-    sim = Simulator()
+    args = options()
+    sim = Simulator(port=args.port, profile=args.profile)
     sim.start(forever=True, blocking=True)
     #sim.shutdown()
     log.debug("Sim out!")
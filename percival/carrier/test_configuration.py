@@ -1,7 +1,8 @@
 import unittest
 import os
 from percival.carrier.configuration import find_file, ChannelParameters, BoardParameters, ControlParameters,\
-    SensorConfigurationParameters, SensorCalibrationParameters, SensorDebugParameters
+    SensorConfigurationParameters, SensorCalibrationParameters, SensorDebugParameters, \
+    SimulatorProfileParameters
 from percival.carrier.const import BoardTypes
 
 
@@ -405,5 +406,36 @@ class TestSensorDebugParameters(unittest.TestCase):
                          'G': [3, 2, 1]})
 
 
+class TestSimulatorProfileParameters(unittest.TestCase):
+    def setUp(self):
+        self._ini_description = u"[Latency]\n" \
+                                u"default = constant, 0.001\n" \
+                                u"READBACK_READ_ECHO_WORD = uniform, 0.001, 0.003\n" \
+                                u"\n" \
+                                u"[Faults]\n" \
+                                u"i2c_error_rate = 0.5\n" \
+                                u"seed = 10\n"
+
+    def test_profile_parameters(self):
+        pp = SimulatorProfileParameters(self._ini_description)
+        pp.load_ini()
+        self.assertEqual(pp.latency, {'default': ('constant', (0.001,)),
+                                      'READBACK_READ_ECHO_WORD': ('uniform', (0.001, 0.003))})
+        self.assertEqual(pp.i2c_error_rate, 0.5)
+        self.assertEqual(pp.seed, 10)
+        self.assertEqual(pp.drop_connection_rate, 0.0)
+        self.assertEqual(pp.echo_word_delay, 0.0)
+
+    def test_profile_exceptions(self):
+        pp = SimulatorProfileParameters(u"[Latency]\ndefault = gamma, 1.0\n")
+        pp.load_ini()
+        with self.assertRaises(ValueError):
+            pp.latency
+        pp = SimulatorProfileParameters(u"[Latency]\ndefault = normal, 1.0\n")
+        pp.load_ini()
+        with self.assertRaises(ValueError):
+            pp.latency
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,188 @@
+from __future__ import unicode_literals, absolute_import
+
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+from mock import MagicMock, patch
+
+from percival.carrier.database import format_line, timestamp_ns, BatchWriter, InfluxDB, FileSink, read_lines, \
+    create_database
+
+
+class TestLineProtocol(unittest.TestCase):
+    def test_format_line(self):
+        line = format_line(datetime(2017, 1, 1, 0, 0, 1, 500), "Temp sensor,1",
+                           {"value": 1.5, "raw_value": 2000, "safety_exception": True, "unit": "V", "none": None})
+        self.assertEqual(line, 'Temp\\ sensor\\,1 raw_value=2000i,safety_exception=true,unit="V",value=1.5 '
+                               '1483228801000500000')
+        self.assertIsNone(format_line(0.0, "empty", {}))
+        self.assertEqual(timestamp_ns(1.5), 1500000000)
+
+
+class TestBatchWriter(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+        self.writer = BatchWriter(self.batches.append, batch_size=10, flush_interval=0.2, max_buffered=25)
+
+    def tearDown(self):
+        self.writer.stop()
+
+    def test_batch_size(self):
+        self.writer.start()
+        for index in range(20):
+            self.writer.put("line{}".format(index))
+        self.assertTrue(self.writer.flush(2.0))
+        self.assertEqual([len(batch) for batch in self.batches], [10, 10])
+        self.assertEqual(self.batches[0][0], "line0")
+        status = self.writer.get_status()
+        self.assertEqual(status["written"], 20)
+        self.assertEqual(status["batches"], 2)
+        self.assertEqual(status["buffered"], 0)
+
+    def test_flush_interval(self):
+        self.writer.start()
+        self.writer.put("line")
+        time.sleep(0.05)
+        self.assertEqual(self.batches, [])
+        time.sleep(0.4)
+        self.assertEqual(self.batches, [["line"]])
+        self.assertGreaterEqual(self.writer.get_status()["max_queue_delay"], 0.2)
+
+    def test_lone_point(self):
+        # A point buffered while the writer is idle is written after the flush interval, not held for a full batch
+        self.writer.start()
+        time.sleep(0.1)
+        self.writer.put("line")
+        time.sleep(0.4)
+        self.assertEqual(self.batches, [["line"]])
+
+    def test_backpressure(self):
+        # A database which blocks must not block the caller; excess points are dropped
+        release = threading.Event()
+        self.writer = BatchWriter(lambda lines: release.wait(), batch_size=10, flush_interval=0.2, max_buffered=25)
+        self.writer.start()
+        start = time.time()
+        accepted = [self.writer.put("line") for index in range(100)]
+        self.assertLess(time.time() - start, 0.5)
+        status = self.writer.get_status()
+        self.assertEqual(status["dropped"], 100 - accepted.count(True))
+        self.assertLessEqual(accepted.count(True), 35)
+        release.set()
+
+    def test_write_failure(self):
+        self.writer = BatchWriter(MagicMock(side_effect=IOError("Down")), batch_size=10, flush_interval=0.2)
+        self.writer.start()
+        for index in range(10):
+            self.writer.put("line")
+        self.writer.flush(2.0)
+        status = self.writer.get_status()
+        self.assertEqual(status["failed"], 10)
+        self.assertEqual(status["written"], 0)
+
+    def test_mark(self):
+        fail = threading.Event()
+        results = []
+
+        def write(lines):
+            if fail.is_set():
+                raise IOError("Down")
+        self.writer = BatchWriter(write, batch_size=10, flush_interval=0.05)
+        # A mark with nothing buffered is reached at once
+        self.writer.mark(results.append)
+        self.assertEqual(results, [True])
+        self.writer.start()
+        self.writer.put("line1")
+        self.writer.mark(results.append)
+        self.assertEqual(results, [True])
+        self.writer.flush(2.0)
+        self.assertEqual(results, [True, True])
+        fail.set()
+        self.writer.put("line2")
+        self.writer.mark(results.append)
+        self.writer.flush(2.0)
+        self.assertEqual(results[-1], False)
+        # A mark not reached before the writer stops fails
+        self.writer.stop()
+        self.writer.put("line3")
+        self.writer.mark(results.append)
+        self.writer.stop()
+        self.assertEqual(results, [True, True, False, False])
+
+
+class TestInfluxDB(unittest.TestCase):
+    @patch("percival.carrier.database.InfluxDBClient")
+    def test_log_point(self, client_class):
+        client = client_class.return_value
+        client.get_list_database.return_value = [{"name": "percival"}]
+        db = InfluxDB("127.0.0.1", 8086, "percival", batch_size=2, flush_interval=10.0)
+        db.log_point(datetime(2017, 1, 1), "m1", {"value": 1})
+        # Points are not queued until connected
+        self.assertEqual(db.get_status()["writer"]["queued"], 0)
+        db.connect()
+        db.log_point(datetime(2017, 1, 1), "m1", {"value": 1})
+        db.log_point(datetime(2017, 1, 1), "m2", {"value": 2})
+        db._writer.flush(2.0)
+        client.write_points.assert_called_once_with(["m1 value=1i 1483228800000000000",
+                                                     "m2 value=2i 1483228800000000000"], protocol='line')
+        db.close()
+        self.assertEqual(db.get_status()["writer"]["written"], 2)
+
+    @patch("percival.carrier.database.InfluxDBClient")
+    def test_reconnect(self, client_class):
+        client = client_class.return_value
+        client.get_list_database.return_value = [{"name": "percival"}]
+        client.write_points.side_effect = IOError("Down")
+        db = InfluxDB("127.0.0.1", 8086, "percival", batch_size=1, flush_interval=10.0, reconnect_interval=0.1)
+        db.connect()
+        db.log_point(datetime(2017, 1, 1), "m1", {"value": 1})
+        db.flush(2.0)
+        # A failed write disconnects the sink, which is opened again in the background
+        self.assertFalse(db.connected)
+        db.log_point(datetime(2017, 1, 1), "m1", {"value": 2})
+        self.assertEqual(db.get_status()["writer"]["queued"], 1)
+        client.write_points.side_effect = None
+        time.sleep(0.3)
+        self.assertTrue(db.connected)
+        self.assertEqual(db.get_status()["reconnects"], 1)
+        db.log_point(datetime(2017, 1, 1), "m1", {"value": 3})
+        db.flush(2.0)
+        db.close()
+        self.assertEqual(db.get_status()["writer"]["written"], 1)
+
+
+class TestFileSink(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "points.txt")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_record(self):
+        sink = create_database({"type": "file", "file": self.filename, "batch_size": 2})
+        self.assertIsInstance(sink, FileSink)
+        sink.connect()
+        self.assertTrue(sink.connected)
+        for index in range(5):
+            sink.log_point(float(index), "m1", {"value": index})
+        self.assertTrue(sink.flush(2.0))
+        sink.close()
+        self.assertFalse(sink.connected)
+        self.assertEqual(read_lines(self.filename), ["m1 value={}i {}".format(index, index * 1000000000)
+                                                     for index in range(5)])
+        status = sink.get_status()
+        self.assertEqual(status["type"], "file")
+        self.assertEqual(status["writer"]["batches"], 3)
+
+    def test_create_database(self):
+        self.assertIsInstance(create_database({"address": "127.0.0.1", "port": 8086, "name": "percival"}), InfluxDB)
+        with self.assertRaises(ValueError):
+            create_database({"type": "unknown"})
+        # A file which cannot be opened leaves the sink disconnected
+        sink = FileSink(os.path.join(self.directory, "missing", "points.txt"))
+        sink.connect()
+        self.assertFalse(sink.connected)
@@ -0,0 +1,94 @@
+from __future__ import unicode_literals, absolute_import
+
+import unittest
+from mock import MagicMock
+
+from percival.carrier.devices import MAX31730, LTC2309
+from percival.carrier.monitor_block import MonitorBlock
+from percival.carrier.registers import ReadValueMap
+
+
+def read_value_word(value, sample_number=0, i2c_error=0, safety=0, extreme_low=0, low=0, high=0, extreme_high=0):
+    read_map = ReadValueMap()
+    read_map.read_value = value
+    read_map.i2c_communication_error = i2c_error
+    read_map.safety_exception_detected = safety
+    read_map.below_extreme_low_threshold = extreme_low
+    read_map.below_low_threshold = low
+    read_map.above_high_threshold = high
+    read_map.above_extreme_high_threshold = extreme_high
+    read_map.sample_number = sample_number
+    return read_map.generate_map()[0]
+
+
+def monitor_channel(offset, divider, multiplier, unit):
+    channel = MagicMock()
+    channel._channel_ini.Offset = offset
+    channel._channel_ini.Divider = divider
+    channel._channel_ini.Multiplier = multiplier
+    channel._channel_ini.Unit = unit
+    return channel
+
+
+class TestMonitorBlock(unittest.TestCase):
+    def setUp(self):
+        self.block = MonitorBlock(4)
+        self.temperature = MAX31730("temp", monitor_channel(100, 10, 2, "C"))
+        self.voltage = LTC2309("supply", monitor_channel(0, 1000, 1, "V"))
+        self.temperature.attach(self.block, 0)
+        self.voltage.attach(self.block, 2)
+
+    def test_update(self):
+        words = [read_value_word(350, sample_number=7, high=1),
+                 read_value_word(1234),
+                 read_value_word(2500, sample_number=9, i2c_error=1, safety=1, extreme_low=1, low=1),
+                 read_value_word(0)]
+        status = self.block.update(words)
+        # Only rows with a device attached are reported
+        self.assertEqual(sorted(status), ["supply", "temp"])
+        self.assertAlmostEqual(status["temp"]["temperature"], 50.0)
+        self.assertEqual(status["temp"]["raw_value"], 350)
+        self.assertEqual(status["temp"]["sample_number"], 7)
+        self.assertEqual(status["temp"]["high_threshold"], 1)
+        self.assertEqual(status["temp"]["low_threshold"], 0)
+        self.assertEqual(status["temp"]["unit"], "C")
+        self.assertEqual(status["temp"]["device"], "MAX31730")
+        self.assertAlmostEqual(status["supply"]["value"], 2.5)
+        self.assertEqual(status["supply"]["i2c_comms_error"], 1)
+        self.assertEqual(status["supply"]["safety_exception"], 1)
+        self.assertEqual(status["supply"]["extreme_low_threshold"], 1)
+        self.assertEqual(status["supply"]["low_threshold"], 1)
+        self.assertEqual(status["supply"]["extreme_high_threshold"], 0)
+        # The device views read from the block
+        self.assertAlmostEqual(self.temperature.temperature, 50.0)
+        self.assertAlmostEqual(self.voltage.value, 2.5)
+        self.assertEqual(self.voltage.status, status["supply"])
+        self.assertEqual(self.block.status_map(), status)
+
+    def test_update_rows(self):
+        self.block.update([read_value_word(450)], [0])
+        status = self.block.update([read_value_word(1500, sample_number=3)], [2])
+        self.assertEqual(list(status), ["supply"])
+        self.assertAlmostEqual(self.temperature.temperature, 70.0)
+        self.assertAlmostEqual(self.voltage.value, 1.5)
+
+    def test_device_update(self):
+        data = ReadValueMap()
+        data.parse_map([read_value_word(200, sample_number=4, high=1)])
+        self.temperature.update(data)
+        self.assertAlmostEqual(self.temperature.temperature, 20.0)
+        self.assertEqual(self.temperature.status["high_threshold"], 1)
+        self.assertEqual(self.temperature.status["sample_number"], 4)
+        # Reading the value directly leaves the thresholds unchanged
+        data = ReadValueMap()
+        data.parse_map([read_value_word(300, sample_number=5)])
+        self.temperature._channel.get_value.return_value = data
+        self.temperature.update()
+        self.assertAlmostEqual(self.temperature.temperature, 40.0)
+        self.assertEqual(self.temperature.status["high_threshold"], 1)
+        self.assertEqual(self.temperature.status["sample_number"], 5)
+
+    def test_convert(self):
+        self.assertEqual(self.temperature.convert(150), {"temperature": 10.0})
+        self.assertEqual(self.voltage.convert(3000), {"value": 3.0})
+        self.assertEqual(self.block.rows, [0, 2])
@@ -0,0 +1,169 @@
+from __future__ import unicode_literals, absolute_import
+
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from mock import MagicMock
+
+from percival.carrier.database import DatabaseSink
+from percival.carrier.monitor_ring import MonitorRing, encode_flags, decode_flags
+
+
+def channel_status(raw_value, sample_number=0, safety_exception=0):
+    return {"raw_value": raw_value, "sample_number": sample_number, "safety_exception": safety_exception,
+            "value": 1.0, "unit": "V"}
+
+
+class OutageSink(DatabaseSink):
+    """Database sink recording the lines written, which fails every write while it is down"""
+    def __init__(self):
+        super(OutageSink, self).__init__(batch_size=5, flush_interval=0.02, reconnect_interval=0.05)
+        self.down = False
+        self.lines = []
+
+    def _open(self):
+        return not self.down
+
+    def write_lines(self, lines):
+        if self.down:
+            raise IOError("Database down")
+        self.lines += lines
+
+
+class TestMonitorRing(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "monitor.ring")
+        self.ring = MonitorRing(self.filename, capacity=8, max_channels=4)
+        self.ring.open()
+
+    def tearDown(self):
+        self.ring.close()
+        shutil.rmtree(self.directory)
+
+    def test_flags(self):
+        flags = encode_flags({"safety_exception": True, "i2c_comms_error": 1, "sample_number": 300})
+        self.assertEqual(decode_flags(flags)["sample_number"], 300 & 0xFF)
+        self.assertEqual(decode_flags(flags)["safety_exception"], 1)
+        self.assertEqual(decode_flags(flags)["low_threshold"], 0)
+
+    def test_append_and_query(self):
+        for index in range(3):
+            self.assertEqual(self.ring.append_status(1000.0 + index, {"m1": channel_status(index, index),
+                                                                      "m2": channel_status(10 + index)}), 2)
+        self.assertEqual(self.ring.count, 6)
+        self.assertEqual(list(self.ring.records(channels=["m2"])["raw_value"]), [10, 11, 12])
+        history = self.ring.last(1.0, now=1002.0)
+        self.assertEqual(history["m1"]["time"], [1000.0, 1001.0, 1002.0])
+        self.assertEqual(history["m1"]["sample_number"], [0, 1, 2])
+        self.assertEqual(self.ring.last(1.0 / 3600.0, ["m1"], now=1002.0)["m1"]["raw_value"], [1, 2])
+
+        # The oldest records are overwritten once the ring is full
+        self.ring.append_status(1003.0, {"m1": channel_status(3), "m2": channel_status(13), "m3": channel_status(23)})
+        self.assertEqual(self.ring.count, 8)
+        self.assertEqual(self.ring.head, 9)
+        self.assertEqual(list(self.ring.records()["time"]), [1000.0, 1001.0, 1001.0, 1002.0, 1002.0,
+                                                           1003.0, 1003.0, 1003.0])
+
+    def test_reopen(self):
+        self.ring.append_status(1000.0, {"m1": channel_status(5, safety_exception=1)})
+        self.ring.close()
+        self.ring = MonitorRing(self.filename, capacity=8, max_channels=4)
+        self.ring.open()
+        self.assertEqual(self.ring.channels, ["m1"])
+        self.assertEqual(self.ring.pending, 1)
+        self.assertEqual(self.ring.last(1.0, now=1000.0)["m1"]["safety_exception"], [1])
+        self.ring.close()
+        # A file of a different capacity is reformatted
+        self.ring = MonitorRing(self.filename, capacity=16, max_channels=4)
+        self.ring.open()
+        self.assertEqual(self.ring.count, 0)
+
+    def test_replay(self):
+        sink = MagicMock()
+        # Writes are acknowledged immediately
+        sink.mark.side_effect = lambda callback: callback(True)
+        for index in range(5):
+            self.ring.append_status(1000.0 + index, {"m1": channel_status(index)})
+        self.assertEqual(self.ring.pending, 5)
+        self.assertEqual(self.ring.replay(sink, limit=2, convert=lambda name, raw: {"value": raw * 2.0}), 2)
+        self.assertEqual(self.ring.pending, 3)
+        time_value, name, point = sink.log_point.call_args_list[1][0]
+        self.assertEqual(name, "m1")
+        self.assertEqual(point["raw_value"], 1)
+        self.assertEqual(point["value"], 2.0)
+        self.assertEqual(self.ring.replay(sink, measurement=lambda name: name + "_replay"), 3)
+        self.assertEqual(self.ring.pending, 0)
+        self.assertEqual(sink.log_point.call_args[0][1], "m1_replay")
+
+        # Records delivered directly to the database are not replayed when nothing else is pending
+        self.ring.append_status(1005.0, {"m1": channel_status(5)}, sink)
+        self.assertEqual(self.ring.pending, 0)
+        self.ring.append_status(1006.0, {"m1": channel_status(6)})
+        self.ring.append_status(1007.0, {"m1": channel_status(7)}, sink)
+        self.assertEqual(self.ring.pending, 2)
+
+        # Records overwritten before they were replayed are lost
+        for index in range(10):
+            self.ring.append_status(1010.0 + index, {"m1": channel_status(index)})
+        self.assertEqual(self.ring.pending, 8)
+
+    def test_acknowledge(self):
+        marks = []
+        sink = MagicMock()
+        sink.mark.side_effect = marks.append
+        for index in range(3):
+            self.ring.append_status(1000.0 + index, {"m1": channel_status(index)})
+        self.assertEqual(self.ring.replay(sink, limit=2), 2)
+        # Records are only replayed once their write is acknowledged
+        self.assertEqual(self.ring.pending, 3)
+        self.assertEqual(self.ring.unsent, 1)
+        self.assertEqual(self.ring.replay(sink), 1)
+        self.assertEqual(self.ring.unsent, 0)
+        marks.pop(0)(True)
+        self.assertEqual(self.ring.pending, 1)
+        # A failed write sends everything after the last acknowledged record again
+        marks.pop(0)(False)
+        self.assertEqual(self.ring.unsent, 1)
+        self.ring.append_status(1003.0, {"m1": channel_status(3)}, sink)
+        self.assertEqual(marks, [])
+        self.assertEqual(self.ring.replay(sink), 2)
+        self.assertEqual(sink.log_point.call_args[0][2]["raw_value"], 3)
+        marks.pop(0)(True)
+        self.assertEqual(self.ring.pending, 0)
+
+    def test_outage(self):
+        # A database which fails in the middle of a run, then recovers
+        self.ring.close()
+        self.ring = MonitorRing(self.filename, capacity=64, max_channels=4)
+        self.ring.open()
+        sink = OutageSink()
+        sink.connect()
+        for index in range(30):
+            if index == 10:
+                sink.down = True
+            if index == 20:
+                sink.down = False
+            delivered = sink.connected
+            if delivered:
+                sink.log_point(1000.0 + index, "m1", {"raw_value": index})
+            self.ring.append_status(1000.0 + index, {"m1": channel_status(index)}, sink if delivered else None)
+            if delivered and self.ring.unsent:
+                self.ring.replay(sink)
+            time.sleep(0.03)
+        self.assertTrue(sink.flush(2.0))
+        time.sleep(0.1)
+        sink.close()
+        self.assertGreater(sink.get_status()["writer"]["failed"], 0)
+        self.assertEqual(sink.get_status()["reconnects"], 1)
+        # Every value has been written, including those read during the outage, and acknowledged
+        written = set(int(line.split("raw_value=")[1].split("i")[0]) for line in sink.lines)
+        self.assertEqual(written, set(range(30)))
+        self.assertEqual(self.ring.pending, 0)
+
+    def test_channel_limit(self):
+        channels = {"m{}".format(index): channel_status(index) for index in range(6)}
+        self.assertEqual(self.ring.append_status(1000.0, channels), 4)
+        self.assertEqual(len(self.ring.channels), 4)
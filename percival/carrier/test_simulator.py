@@ -0,0 +1,208 @@
+from __future__ import unicode_literals, absolute_import
+
+import unittest, socket, logging, time
+
+from percival.carrier.const import *
+from percival.carrier.encoding import encode_message, decode_message, END_OF_MESSAGE
+from percival.carrier.simulator import Simulator
+from percival.carrier.registers import generate_register_maps
+from percival.carrier.configuration import ChannelParameters
+from percival.carrier.channels import MonitoringChannel
+from percival.carrier.txrx import TxRxContext
+
+
+class TestSimulator(unittest.TestCase):
+    def setUp(self):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.sim = Simulator(port=0)
+        self.sim.start(forever=True, blocking=False)
+
+    def tearDown(self):
+        self.sim.shutdown()
+
+    def _connect(self):
+        sock = socket.create_connection(("127.0.0.1", self.sim.port), 2.0)
+        return sock
+
+    def _recv(self, sock, num_bytes):
+        data = b""
+        while len(data) < num_bytes:
+            chunk = sock.recv(num_bytes - len(data))
+            self.assertGreater(len(chunk), 0)
+            data += chunk
+        return data
+
+    def test_handle_message(self):
+        # A write to a settings register is acknowledged with an EOM
+        self.assertEqual(self.sim.handle_message(CONTROL_SETTINGS_CARRIER.start_address, 0x1234),
+                         END_OF_MESSAGE)
+        # ...and the value is reflected in the echo word
+        self.assertEqual(self.sim.handle_message(READBACK_READ_ECHO_WORD.start_address, 0),
+                         encode_message(READ_ECHO_WORD.start_address, 0x1234))
+
+    def test_shortcut(self):
+        start = CONTROL_SETTINGS_CARRIER.start_address
+        self.sim.registers[start:start + 4] = [1, 2, 3, 4]
+        reply = decode_message(self.sim.handle_message(READBACK_CONTROL_SETTINGS_CARRIER.start_address, 0))
+        self.assertEqual(reply, [(start + i, i + 1) for i in range(4)])
+
+    def test_multiple_clients(self):
+        client1 = self._connect()
+        client2 = self._connect()
+        try:
+            # Send several messages in a single block from the first client
+            client1.sendall(encode_message(CONTROL_SETTINGS_LEFT.start_address, 0x55) +
+                            encode_message(READBACK_READ_ECHO_WORD.start_address, 0))
+            reply = decode_message(self._recv(client1, 12))
+            self.assertEqual(reply[1], (READ_ECHO_WORD.start_address, 0x55))
+            # The second client sees the same registers
+            client2.sendall(encode_message(READBACK_READ_ECHO_WORD.start_address, 0))
+            reply = decode_message(self._recv(client2, 6))
+            self.assertEqual(reply, [(READ_ECHO_WORD.start_address, 0x55)])
+        finally:
+            client1.close()
+            client2.close()
+
+    def test_slow_client(self):
+        # The slow client never reads, and small socket buffers make its replies back up quickly
+        slow = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        slow.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        slow.connect(("127.0.0.1", self.sim.port))
+        while not self.sim._clients:
+            time.sleep(0.01)
+        list(self.sim._clients)[0].setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        fast = self._connect()
+        try:
+            # Each of these requests has a 2016 byte reply
+            request = encode_message(READBACK_MONITORING_SETTINGS_BOTTOM.start_address, 0)
+            expected = self.sim.handle_message(READBACK_MONITORING_SETTINGS_BOTTOM.start_address, 0)
+            slow.sendall(request * 500)
+            time.sleep(0.5)
+            # ...but the other client is still served
+            fast.sendall(encode_message(READBACK_READ_ECHO_WORD.start_address, 0))
+            reply = decode_message(self._recv(fast, 6))
+            self.assertEqual(reply[0][0], READ_ECHO_WORD.start_address)
+            # The slow client still receives all of its replies once it reads them
+            slow.settimeout(5.0)
+            self.assertEqual(self._recv(slow, 500 * len(expected)), expected * 500)
+        finally:
+            slow.close()
+            fast.close()
+
+
+class TestSimulatorProfile(unittest.TestCase):
+    def setUp(self):
+        self.sim = None
+
+    def tearDown(self):
+        if self.sim is not None:
+            self.sim.shutdown()
+
+    def _start(self, profile):
+        self.sim = Simulator(port=0, profile=profile)
+        self.sim.start(forever=True, blocking=False)
+        return socket.create_connection(("127.0.0.1", self.sim.port), 2.0)
+
+    def test_latency(self):
+        client = self._start(u"[Latency]\ndefault = constant, 0.0\nREADBACK_READ_ECHO_WORD = constant, 0.2\n")
+        try:
+            start = time.time()
+            client.sendall(encode_message(CONTROL_SETTINGS_LEFT.start_address, 0x55))
+            client.recv(6)
+            self.assertLess(time.time() - start, 0.2)
+            start = time.time()
+            client.sendall(encode_message(READBACK_READ_ECHO_WORD.start_address, 0))
+            client.recv(6)
+            self.assertGreaterEqual(time.time() - start, 0.19)
+        finally:
+            client.close()
+
+    def test_i2c_errors(self):
+        self.sim = Simulator(port=0, profile=u"[Faults]\ni2c_error_rate = 1.0\n")
+        reply = decode_message(self.sim.handle_message(READBACK_READ_VALUES_CARRIER.start_address, 0))
+        self.assertEqual(len(reply), 4)
+        for address, word in reply:
+            self.assertTrue(word & 0x10000)
+        # The system status is not a ReadValueMap so must not be touched
+        reply = decode_message(self.sim.handle_message(READBACK_READ_VALUES_STATUS.start_address, 0))
+        for address, word in reply:
+            self.assertFalse(word & 0x10000)
+
+    def test_echo_word_delay(self):
+        self.sim = Simulator(port=0, profile=u"[Faults]\necho_word_delay = 0.2\n")
+        self.sim.handle_message(CONTROL_SETTINGS_CARRIER.start_address, 0x1234)
+        self.assertEqual(decode_message(self.sim.handle_message(READBACK_READ_ECHO_WORD.start_address, 0)),
+                         [(READ_ECHO_WORD.start_address, 0)])
+        time.sleep(0.25)
+        self.assertEqual(decode_message(self.sim.handle_message(READBACK_READ_ECHO_WORD.start_address, 0)),
+                         [(READ_ECHO_WORD.start_address, 0x1234)])
+
+    def test_dropped_connection(self):
+        client = self._start(u"[Faults]\ndrop_connection_rate = 1.0\n")
+        try:
+            client.sendall(encode_message(READBACK_READ_ECHO_WORD.start_address, 0))
+            self.assertEqual(client.recv(6), b"")
+        finally:
+            client.close()
+
+
+class TestMonitorModel(unittest.TestCase):
+    def setUp(self):
+        self.sim = Simulator(port=0, profile=u"[Monitors]\nupdate_period = 0.01\nnoise = 0.0\nsettle_time = 0.0\n"
+                                             u"[Coupling]\nVDD_D3V3 = VDD_D3V3_1, 10.0, 100\n")
+
+    def tearDown(self):
+        self.sim.shutdown()
+
+    def _read_carrier(self):
+        reply = decode_message(self.sim.handle_message(READBACK_READ_VALUES_CARRIER.start_address, 0))
+        return generate_register_maps(reply)
+
+    def test_sample_number(self):
+        first = self._read_carrier()
+        time.sleep(0.05)
+        second = self._read_carrier()
+        for before, after in zip(first, second):
+            self.assertNotEqual(before.sample_number, after.sample_number)
+
+    def test_thresholds(self):
+        # Configure the first carrier monitor so that it settles around 1000 (+/- drift), then move the
+        # low threshold above the value without letting it settle again
+        settings = MONITORING_SETTINGS_CARRIER.start_address
+        self.sim.registers[settings + 1] = (0 << 16) | 4000
+        self.sim.registers[settings + 2] = (500 << 16) | 1500
+        time.sleep(0.02)
+        value = self._read_carrier()[0]
+        self.assertAlmostEqual(value.read_value, 1000, delta=60)
+        self.assertEqual(value.above_high_threshold, 0)
+        self.assertEqual(value.below_low_threshold, 0)
+        self.sim.monitors.settle_time = 1000.0
+        self.sim.registers[settings + 2] = (1200 << 16) | 1500
+        time.sleep(0.02)
+        value = self._read_carrier()[0]
+        self.assertEqual(value.below_low_threshold, 1)
+        self.assertEqual(value.above_high_threshold, 0)
+        self.assertEqual(value.below_extreme_low_threshold, 0)
+        self.assertEqual(value.safety_exception_detected, 0)
+
+    def test_coupling(self):
+        control = ChannelParameters("config/00_Device_Settings/Channel parameters.ini")
+        control.load_ini()
+        vdd = [ch for ch in control.control_channels if ch.Channel_name == "VDD_D3V3_1"][0]
+        monitor = [ch for ch in control.monitoring_channels if ch.Channel_name == "VDD_D3V3"][0]
+        self.sim.handle_message(vdd.UART_address + 3, 200)
+        time.sleep(0.02)
+        self.sim.handle_message(READBACK_READ_VALUES_PERIPHERY_BOTTOM.start_address, 0)
+        word = self.sim.registers[READ_VALUES_PERIPHERY_BOTTOM.start_address + monitor.Channel_ID]
+        self.assertEqual(word & 0xFFFF, 2100)
+
+    def test_monitoring_channel_get_value(self):
+        self.sim.start(forever=True, blocking=False)
+        channels = ChannelParameters("config/00_Device_Settings/Channel parameters.ini")
+        channels.load_ini()
+        ini = [ch for ch in channels.monitoring_channels if ch.Channel_name == "VDD_D3V3"][0]
+        with TxRxContext("127.0.0.1", self.sim.port) as txrx:
+            channel = MonitoringChannel(txrx, ini, [0, 0, 0, 0])
+            first = channel.get_value()
+            second = channel.get_value()
+        self.assertNotEqual(first.sample_number, second.sample_number)
@@ -7,8 +7,9 @@ from builtins import bytes
 
 import percival.carrier.const as const
 from percival.carrier.devices import DeviceFamilyFeatures, MAX31730, LTC2309
-from percival.carrier.txrx import hexify, TxRx, TxMessage, TxRxContext
-from percival.carrier.encoding import END_OF_MESSAGE, DATA_ENCODING
+from percival.carrier.txrx import hexify, TxRx, TxMessage, TxRxContext, loopback_transport
+from percival.carrier.encoding import END_OF_MESSAGE, DATA_ENCODING, encode_message
+from percival.carrier.simulator import Simulator
 from percival.carrier.errors import PercivalProtocolError, PercivalCommsError
 
 
@@ -240,3 +241,29 @@ class TestTxRx(unittest.TestCase):
         msg = self.connection.recv(6)
         # Verify the bytes are the same as those sent
         self.assertEquals(msg, byte_array_message)
+
+
+class TestLoopbackTransport(unittest.TestCase):
+    def setUp(self):
+        self.sim = Simulator(port=None)
+        self.txrx = TxRx("loopback", transport=loopback_transport(self.sim))
+
+    def test_send_recv_message(self):
+        self.assertTrue(self.txrx.connected)
+        # A control settings write is acknowledged with an EOM and reflected in the echo word
+        msg = TxMessage(encode_message(const.CONTROL_SETTINGS_CARRIER.start_address, 0x1234), expect_eom=True)
+        self.txrx.send_recv_message(msg)
+        msg = TxMessage(encode_message(const.READBACK_READ_ECHO_WORD.start_address, 0))
+        self.assertEqual(self.txrx.send_recv_message(msg), [(const.READ_ECHO_WORD.start_address, 0x1234)])
+        # A shortcut returns the whole block
+        msg = TxMessage(encode_message(const.READBACK_READ_VALUES_CARRIER.start_address, 0), num_response_msg=4)
+        self.assertEqual(len(self.txrx.send_recv_message(msg)), 4)
+
+    def test_timeout_and_clean(self):
+        # Waiting for a response which never comes raises a comms error and disconnects
+        with self.assertRaises(PercivalCommsError):
+            self.txrx.send_recv(encode_message(const.CONTROL_SETTINGS_CARRIER.start_address, 0), 12)
+        self.assertFalse(self.txrx.connected)
+        # Reconnecting creates a new transport
+        self.txrx.connect()
+        self.assertTrue(self.txrx.connected)
@@ -10,6 +10,7 @@ import logging
 import binascii
 import socket
 from contextlib import contextmanager
+from functools import partial
 from multiprocessing import Lock
 
 from percival.carrier.encoding import DATA_ENCODING, NUM_BYTES_PER_MSG, END_OF_MESSAGE
@@ -94,12 +95,77 @@ class TxMessage(object):
         return not self.__eq__(other)
 
 
+def tcp_transport():
+    """Create the default transport: a TCP socket to the XPort device"""
+    return socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+
+class LoopbackSocket(object):
+    """
+    In-process transport which passes messages straight to a message handler instead of through a TCP socket
+
+    The handler must provide handle_data(data) which takes a block of complete 6 byte messages and
+    returns the encoded response (for example :class:`percival.carrier.simulator.Simulator`).
+    This object provides the subset of the socket interface used by :class:`TxRx`.
+    """
+    def __init__(self, handler):
+        self._handler = handler
+        self._timeout = None
+        self._open = True
+        self._tx_buffer = b""
+        self._rx_buffer = b""
+
+    def settimeout(self, value):
+        self._timeout = value
+
+    def gettimeout(self):
+        return self._timeout
+
+    def connect(self, address):
+        if not self._open:
+            raise socket.error("Loopback transport has been closed")
+
+    def sendall(self, msg):
+        if not self._open:
+            raise socket.error("Loopback transport has been closed")
+        data = self._tx_buffer + msg
+        complete = len(data) - (len(data) % NUM_BYTES_PER_MSG)
+        self._tx_buffer = data[complete:]
+        if complete > 0:
+            self._rx_buffer += self._handler.handle_data(data[:complete])
+
+    def recv(self, num_bytes):
+        if not self._open:
+            return b""
+        if len(self._rx_buffer) == 0:
+            # Nothing will ever arrive, so behave as a socket which has timed out
+            raise socket.timeout("timed out")
+        chunk = self._rx_buffer[:num_bytes]
+        self._rx_buffer = self._rx_buffer[num_bytes:]
+        return chunk
+
+    def shutdown(self, how):
+        self._open = False
+
+    def close(self):
+        self._open = False
+
+
+def loopback_transport(handler):
+    """Return a transport factory for :class:`TxRx` which connects in-process to handler (see :class:`LoopbackSocket`)
+
+    >>> sim = Simulator(port=None)
+    >>> txrx = TxRx("loopback", transport=loopback_transport(sim))
+    """
+    return partial(LoopbackSocket, handler)
+
+
 class TxRx(object):
     """
     Transmit and receive data and commands to/from the Carrier Board through the XPort Ethernet
     """
 
-    def __init__(self, fpga_addr, port = 10001, timeout = 2.0):
+    def __init__(self, fpga_addr, port = 10001, timeout = 2.0, transport = None):
         """TxRx Constructor
 
             :param fpga_addr: IP address or network name of the Carrier Board XPort device
@@ -108,19 +174,23 @@ class TxRx(object):
             :type  port:      `int`
             :param timeout:   Socket communication timeout (seconds)
             :type  timeout:   `float`
+            :param transport: Callable which creates the socket-like transport object, defaults to a TCP socket
+                              (see :func:`loopback_transport` for an in-process alternative)
+            :type  transport: `callable`
         """
         self.log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
         
         self._fpga_addr = (fpga_addr, port)
         self._connected = False
         self._mutex = Lock()
+        self._transport = transport or tcp_transport
         self.sock = None
         self.connect(timeout)
 
     def connect(self, timeout=2.0):
         if not self._connected:
             try:
-                self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.sock = self._transport()
                 self.sock.settimeout(timeout)
                 self.log.debug("connecting to FPGA: %s", str(self._fpga_addr))
                 self.sock.connect(self._fpga_addr)
@@ -0,0 +1,17 @@
+"""
+Monotonic clock for measuring intervals, unaffected by steps of the system time.
+"""
+from __future__ import absolute_import
+
+import time
+
+try:
+    from time import monotonic
+except ImportError:
+    # Python 2 has no monotonic clock in the standard library, use the backport
+    try:
+        from monotonic import monotonic
+    except ImportError:
+        # Without the backport the wall clock is used: the scan deadlines, status read intervals and safety latencies
+        # are then thrown out by any step of the system time (e.g. by NTP)
+        monotonic = time.time
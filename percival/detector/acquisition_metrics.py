@@ -0,0 +1,116 @@
+"""
+Acquisition rate metrics derived from the system status counters.
+
+The system status holds the free-running Image_counter, Acquisition_counter and Train_number of the detector.
+:class:`AcquisitionMetrics` samples them from each status snapshot, timed by the monotonic clock at the start of the
+status read (not when the sample is taken, which may be later), and derives:
+
+- the frame, acquisition and train rates over a sliding window of recent samples,
+- the trains missed while acquiring, counting one acquisition per train: a train which passed without the
+  acquisition counter advancing is missed,
+- the duration and number of frames of the current (or last) acquisition, from the acquiring flag.
+
+A counter which goes backwards (a reset of the detector) restarts the window.
+"""
+from __future__ import division
+
+from collections import deque
+import logging
+import threading
+
+import numpy as np
+
+COUNTERS = ["Image_counter", "Acquisition_counter", "Train_number"]
+
+
+class AcquisitionMetrics(object):
+    """
+    Frame and train rates, missed trains and acquisition duration from consecutive status snapshots.
+    """
+    def __init__(self, window=5.0):
+        """
+        :param window: Length (seconds) of the window the rates are measured over
+        """
+        self._log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
+        self._lock = threading.Lock()
+        self._window = window
+        self._samples = deque()
+        self._acquiring = False
+        self._start = None
+        self._start_frames = 0
+        self._duration = None
+        self._frames = None
+        self._missed = 0
+        self._missed_total = 0
+        self._metrics = {}
+
+    def update(self, snapshot):
+        """
+        Sample the counters of a status snapshot.
+
+        :param snapshot: The status snapshot
+        :type  snapshot: :obj:`percival.detector.status_service.StatusSnapshot`
+        """
+        detector = snapshot.detector
+        if not snapshot.detector_updated or not detector or any(name not in detector for name in COUNTERS):
+            return
+        now = snapshot.read_clock
+        counters = [int(detector[name]) for name in COUNTERS]
+        acquiring = bool(detector.get("acquiring", 0))
+        with self._lock:
+            if self._samples:
+                last = self._samples[-1]
+                if any(value < previous for value, previous in zip(counters, last[1:])):
+                    self._log.info("Acquisition counters reset, restarting the rate window")
+                    self._samples.clear()
+                elif acquiring and self._acquiring:
+                    trains = counters[2] - last[3]
+                    acquisitions = counters[1] - last[2]
+                    missed = max(trains - acquisitions, 0)
+                    self._missed += missed
+                    self._missed_total += missed
+            if acquiring and not self._acquiring:
+                self._start = now
+                self._start_frames = counters[0]
+                self._missed = 0
+            if acquiring or self._acquiring:
+                if self._start is not None:
+                    self._duration = now - self._start
+                    self._frames = counters[0] - self._start_frames
+            self._acquiring = acquiring
+            self._samples.append([now] + counters)
+            while now - self._samples[0][0] > self._window:
+                self._samples.popleft()
+            self._metrics = self._calculate(counters)
+
+    def _calculate(self, counters):
+        metrics = {"acquiring": self._acquiring,
+                   "frames_per_second": None,
+                   "acquisitions_per_second": None,
+                   "trains_per_second": None,
+                   "window": 0.0,
+                   "missed_trains": self._missed,
+                   "missed_trains_total": self._missed_total,
+                   "duration": self._duration,
+                   "frames": self._frames}
+        metrics.update(zip(COUNTERS, counters))
+        samples = np.array(self._samples, dtype=float)
+        span = samples[-1, 0] - samples[0, 0]
+        if span > 0:
+            rates = (samples[-1, 1:] - samples[0, 1:]) / span
+            metrics["frames_per_second"] = float(rates[0])
+            metrics["acquisitions_per_second"] = float(rates[1])
+            metrics["trains_per_second"] = float(rates[2])
+            metrics["window"] = float(span)
+        return metrics
+
+    def get_status(self):
+        """
+        :returns: Dictionary of the rates (per second, None until two samples have been taken) and the span of the
+                  window they are measured over, the trains missed in the current or last acquisition and in total,
+                  the duration (seconds) and frames of the current or last acquisition, whether the detector is
+                  acquiring and the last value of each counter
+        :rtype: dict
+        """
+        with self._lock:
+            return dict(self._metrics)
@@ -4,7 +4,6 @@ Created on 22nd July 2016
 :author: Alan Greer
 """
 import logging
-import time
 import traceback
 from odin.adapters.adapter import ApiAdapter, ApiAdapterResponse, request_types, response_types
 from percival.detector.detector import PercivalDetector
@@ -41,15 +40,23 @@ class PercivalAdapter(ApiAdapter):
         self._detector = PercivalDetector(ini_file, False, False)
         self._detector.set_global_monitoring(True)
         self._auto_read = False
+        self._status_request = None
         self.status_update(0.1)
 
-    @run_on_executor
     def status_update(self, task_interval):
+        # Schedule from the IOLoop rather than sleeping in the executor, so the worker is only busy while
+        # a status read is actually required.  A new read is not requested until the previous one has
+        # finished, so a blocked read cannot build up a backlog of requests on the executor
         if self._detector:
             if self._auto_read:
-                self._detector.update_status()
-        time.sleep(task_interval)
-        IOLoop.instance().add_callback(self.status_update, task_interval)
+                if self._status_request is None or self._status_request.done():
+                    self._status_request = self.request_status()
+        IOLoop.instance().call_later(task_interval, self.status_update, task_interval)
+
+    @run_on_executor
+    def request_status(self):
+        # The status service shares its latest snapshot, so this only reads the hardware if it is out of date
+        self._detector.update_status(max_age=self._detector.status_period)
 
     @request_types('application/json')
     @response_types('application/json', default='application/json')
@@ -95,6 +102,7 @@ class PercivalAdapter(ApiAdapter):
 
         status_code = 200
         response = {'response': 'Submitted',
+                    'job_ids': [],
                     'error': '',
                     'command': 'Unknown',
                     'param_names': 'Unknown',
@@ -114,7 +122,13 @@ class PercivalAdapter(ApiAdapter):
                 self._auto_read = False
             else:
                 #cmd_response = self._detector.execute_command(cmd)
-                self._detector.queue_command(cmd)
+                jobs = self._detector.queue_command(cmd)
+                response['job_ids'] = [job.id for job in jobs]
+                if jobs:
+                    response['sequence'] = jobs[0].sequence if jobs[0].sequence is not None else ''
+                else:
+                    # Executed immediately (abort or cancel)
+                    response['response'] = 'Completed'
                 # Merge the response from the command execution
                 #for key in cmd_response:
                 #    response[key] = cmd_response[key]
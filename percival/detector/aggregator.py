@@ -0,0 +1,157 @@
+"""
+Streaming aggregation of monitor channel samples before they are written to the database.
+
+The :class:`StatusAggregator` accumulates the samples of each channel over fixed intervals (aligned to
+multiples of the interval since the epoch) in NumPy arrays, and emits one point per channel per interval with
+the min, max, mean and last calibrated value, the last raw value, the number of samples and the number of
+samples with each flag set.  Excursions and flag changes within an interval are therefore still visible in
+the database, at a fraction of the number of points.
+"""
+from __future__ import division
+
+from datetime import datetime
+import logging
+import math
+import threading
+
+import numpy as np
+
+from percival.carrier.monitor_ring import FLAG_FIELDS, encode_flags
+from percival.detector.history import channel_value
+
+
+class StatusAggregator(object):
+    """
+    Per-channel min/max/mean/last and flag counts over fixed intervals.
+    """
+    def __init__(self, interval, max_channels=256):
+        """
+        :param interval: Length of each aggregation interval (seconds)
+        :param max_channels: Maximum number of channels aggregated
+        """
+        self._log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
+        self._interval = interval
+        self._max_channels = max_channels
+        self._lock = threading.Lock()
+        self._channels = []
+        self._channel_ids = {}
+        # Name of the calibrated value field ("value" or "temperature") of each channel
+        self._fields = []
+        self._bit_shifts = np.arange(len(FLAG_FIELDS))
+        self._start = None
+        self._samples = 0
+        self._points = 0
+        self._reset()
+
+    @property
+    def interval(self):
+        return self._interval
+
+    def _reset(self):
+        self._count = np.zeros(self._max_channels, dtype=np.int64)
+        self._sum = np.zeros(self._max_channels)
+        self._min = np.full(self._max_channels, np.inf)
+        self._max = np.full(self._max_channels, -np.inf)
+        self._last = np.zeros(self._max_channels)
+        self._last_raw = np.zeros(self._max_channels, dtype=np.int64)
+        self._flag_counts = np.zeros((len(FLAG_FIELDS), self._max_channels), dtype=np.int64)
+
+    def _channel_id(self, name, status):
+        # Called with the lock held
+        channel_id = self._channel_ids.get(name)
+        if channel_id is None and len(self._channels) < self._max_channels:
+            channel_id = len(self._channels)
+            self._channels.append(name)
+            self._channel_ids[name] = channel_id
+            self._fields.append("temperature" if "temperature" in status else "value")
+        return channel_id
+
+    def add(self, read_time, channels):
+        """
+        Add the channels read by a status read.
+
+        :param read_time: Time of the status read (seconds since the epoch)
+        :type  read_time: float
+        :param channels: Status dictionary of each channel read, keyed by channel name
+        :type  channels: dict
+        :returns: The points of the interval completed by this read (if any), as (time, measurement, fields)
+                  tuples ready to be logged to the database
+        :rtype: list
+        """
+        start = math.floor(read_time / self._interval) * self._interval
+        with self._lock:
+            points = []
+            if self._start is not None and start != self._start:
+                points = self._emit()
+            self._start = start
+            if not channels:
+                return points
+            ids = []
+            statuses = []
+            for name in channels:
+                channel_id = self._channel_id(name, channels[name])
+                if channel_id is None:
+                    self._log.warning("Aggregation is limited to %d channels, not aggregating %s",
+                                      self._max_channels, name)
+                else:
+                    ids.append(channel_id)
+                    statuses.append(channels[name])
+            ids = np.array(ids, dtype=np.int64)
+            values = np.array([channel_value(status) for status in statuses], dtype=float)
+            flags = np.array([encode_flags(status) for status in statuses], dtype=np.int64)
+            self._count[ids] += 1
+            self._sum[ids] += values
+            self._min[ids] = np.minimum(self._min[ids], values)
+            self._max[ids] = np.maximum(self._max[ids], values)
+            self._last[ids] = values
+            self._last_raw[ids] = [status.get("raw_value", 0) for status in statuses]
+            self._flag_counts[:, ids] += (flags[np.newaxis, :] >> self._bit_shifts[:, np.newaxis]) & 1
+            self._samples += len(ids)
+        return points
+
+    def flush(self):
+        """
+        Complete the current interval.
+
+        :returns: The points of the current interval
+        :rtype: list
+        """
+        with self._lock:
+            points = self._emit()
+            self._start = None
+        return points
+
+    def _emit(self):
+        # Called with the lock held
+        active = np.flatnonzero(self._count[:len(self._channels)])
+        if not len(active):
+            return []
+        timestamp = datetime.utcfromtimestamp(self._start)
+        count = self._count[active]
+        mean = self._sum[active] / count
+        minimum = self._min[active]
+        maximum = self._max[active]
+        last = self._last[active]
+        last_raw = self._last_raw[active]
+        flag_counts = self._flag_counts[:, active]
+        points = []
+        for index, channel_id in enumerate(active):
+            field = self._fields[channel_id]
+            point = {field: float(mean[index]),
+                     field + "_min": float(minimum[index]),
+                     field + "_max": float(maximum[index]),
+                     field + "_last": float(last[index]),
+                     "raw_value": int(last_raw[index]),
+                     "samples": int(count[index])}
+            for flag_index, flag in enumerate(FLAG_FIELDS):
+                point[flag + "_count"] = int(flag_counts[flag_index, index])
+            points.append((timestamp, self._channels[channel_id], point))
+        self._points += len(points)
+        self._reset()
+        return points
+
+    def get_status(self):
+        return {"interval": self._interval,
+                "channels": len(self._channels),
+                "samples": self._samples,
+                "points": self._points}
@@ -0,0 +1,176 @@
+"""
+Change filtering of monitor channel status before it is published.
+
+Most monitor channels are steady, so republishing every channel on every status read sends mostly duplicate
+values to the database, the ZeroMQ status publisher and the UI.  The :class:`ChangeFilter` passes a channel
+only when there is something new to report:
+
+- the channel has not been published before,
+- a new sample was read (the sample number advanced) and the value moved outside its deadband, which is the
+  larger of an absolute deadband and a relative deadband times the last published value (a channel without
+  deadbands is published on any change of value),
+- a threshold, safety exception or communication error flag changed,
+- no new sample has been read for longer than the stale time (the channel is flagged stale once), or a stale
+  channel has a new sample again,
+- a heartbeat keyframe is due, when every channel is published so consumers stay complete.
+"""
+from __future__ import division
+
+import logging
+import threading
+
+import numpy as np
+
+from percival.carrier.monitor_ring import encode_flags
+from percival.detector.history import channel_value
+
+
+class ChangeFilter(object):
+    """
+    Per-channel freshness, deadband and flag change filter with a periodic keyframe.
+    """
+    def __init__(self, heartbeat=10.0, stale_after=None, max_channels=256):
+        """
+        :param heartbeat: Interval (seconds) between keyframes publishing every channel
+        :param stale_after: Time (seconds) without a new sample after which a channel is stale, defaults to the
+                            heartbeat interval
+        :param max_channels: Maximum number of channels filtered, further channels are always published
+        """
+        self._log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
+        self._heartbeat = heartbeat
+        self._stale_after = stale_after if stale_after is not None else heartbeat
+        self._max_channels = max_channels
+        self._lock = threading.Lock()
+        self._channels = []
+        self._channel_ids = {}
+        self._deadbands = {}
+        self._known = np.zeros(max_channels, dtype=bool)
+        self._value = np.zeros(max_channels)
+        self._flags = np.zeros(max_channels, dtype=np.int64)
+        self._sample = np.zeros(max_channels, dtype=np.int64)
+        self._fresh_time = np.zeros(max_channels)
+        self._changed_time = np.zeros(max_channels)
+        self._stale = np.zeros(max_channels, dtype=bool)
+        self._absolute = np.zeros(max_channels)
+        self._relative = np.zeros(max_channels)
+        self._last_keyframe = None
+        self._reads = 0
+        self._passed = 0
+
+    @property
+    def heartbeat(self):
+        return self._heartbeat
+
+    @property
+    def last_keyframe(self):
+        return self._last_keyframe
+
+    def set_deadband(self, name, absolute=0.0, relative=0.0):
+        """
+        Set the deadbands of a channel.
+
+        :param name: Name of the channel
+        :param absolute: Change of the calibrated value below which the channel is not published
+        :param relative: Fraction of the last published value below which a change is not published
+        """
+        with self._lock:
+            self._deadbands[name] = (abs(absolute), abs(relative))
+            if name in self._channel_ids:
+                self._absolute[self._channel_ids[name]] = abs(absolute)
+                self._relative[self._channel_ids[name]] = abs(relative)
+
+    def _channel_id(self, name):
+        # Called with the lock held
+        channel_id = self._channel_ids.get(name)
+        if channel_id is None and len(self._channels) < self._max_channels:
+            channel_id = len(self._channels)
+            self._channels.append(name)
+            self._channel_ids[name] = channel_id
+            self._absolute[channel_id], self._relative[channel_id] = self._deadbands.get(name, (0.0, 0.0))
+        return channel_id
+
+    def update(self, read_time, channels):
+        """
+        Filter the channels read by a status read.
+
+        :param read_time: Time of the status read (seconds since the epoch)
+        :type  read_time: float
+        :param channels: Status dictionary of each channel read, keyed by channel name
+        :type  channels: dict
+        :returns: Tuple of the names of the channels to publish and True if this read is a keyframe
+        :rtype: tuple
+        """
+        with self._lock:
+            keyframe = self._last_keyframe is None or read_time - self._last_keyframe >= self._heartbeat
+            if keyframe:
+                self._last_keyframe = read_time
+            self._reads += 1
+            if not channels:
+                return [], keyframe
+            names = []
+            unfiltered = []
+            ids = []
+            for name in channels:
+                channel_id = self._channel_id(name)
+                if channel_id is None:
+                    unfiltered.append(name)
+                else:
+                    names.append(name)
+                    ids.append(channel_id)
+            ids = np.array(ids, dtype=np.int64)
+            statuses = [channels[name] for name in names]
+            values = np.array([channel_value(status) for status in statuses], dtype=float)
+            flags = np.array([encode_flags(status) & 0xFF for status in statuses], dtype=np.int64)
+            samples = np.array([status.get("sample_number", 0) for status in statuses], dtype=np.int64)
+
+            new = ~self._known[ids]
+            fresh = new | (samples != self._sample[ids])
+            self._sample[ids] = samples
+            self._fresh_time[ids[fresh]] = read_time
+            stale = self._stale[ids]
+            became_stale = ~fresh & ~stale & (read_time - self._fresh_time[ids] >= self._stale_after)
+            recovered = fresh & stale
+            last = self._value[ids]
+            band = np.maximum(self._absolute[ids], self._relative[ids] * np.abs(last))
+            moved = np.abs(values - last) > band
+            changed = new | (fresh & moved) | (flags != self._flags[ids]) | became_stale | recovered
+            if keyframe:
+                changed[:] = True
+
+            published = ids[changed]
+            self._known[published] = True
+            self._value[published] = values[changed]
+            self._flags[published] = flags[changed]
+            self._changed_time[published] = read_time
+            self._stale[ids[became_stale]] = True
+            self._stale[ids[recovered]] = False
+            result = [name for name, selected in zip(names, changed) if selected] + unfiltered
+            self._passed += len(result)
+        return result, keyframe
+
+    def changed_since(self, since=None):
+        """
+        Return the names of the channels published after a time.
+
+        :param since: Time (seconds since the epoch), None returns every channel
+        :rtype: list
+        """
+        with self._lock:
+            if since is None:
+                return list(self._channels)
+            count = len(self._channels)
+            return [self._channels[index] for index in np.flatnonzero(self._changed_time[:count] > since)]
+
+    @property
+    def stale(self):
+        """Names of the channels which have not had a new sample for longer than the stale time"""
+        with self._lock:
+            return [self._channels[index] for index in np.flatnonzero(self._stale[:len(self._channels)])]
+
+    def get_status(self):
+        return {"heartbeat": self._heartbeat,
+                "stale_after": self._stale_after,
+                "channels": len(self._channels),
+                "stale": self.stale,
+                "reads": self._reads,
+                "published": self._passed}
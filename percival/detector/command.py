@@ -40,6 +40,10 @@ class PercivalCommandNames(Enum):
     cmd_refresh_write_buffer = 17 # Put only
     cmd_refresh_read_buffer = 18  # Put only
     cmd_buffer_transfer = 19      # Put only
+    cmd_cancel_job = 20           # Put only
+    cmd_queue_sequence = 21       # Put only
+    cmd_ramp_setpoint = 22        # Put only
+    cmd_scan_grid = 23            # Put only
 
 
 @unique
@@ -142,6 +146,21 @@ class Command(object):
             self._command_state = 'Failed'
         self._command_message = message
 
+    def sub_command(self, name, parameters):
+        """
+        Create a command of the same type and trace as this one, used to expand a sequence of commands.
+
+        :param name: Name of the new command
+        :param parameters: Dictionary of parameters for the new command
+        :returns: Command
+        """
+        command = Command(None)
+        command._command_type = self._command_type
+        command._command_name = name
+        command._parameters = dict(parameters)
+        command._trace = dict(self._trace)
+        return command
+
     def has_param(self, name):
         found_name = False
         if name in self._parameters:
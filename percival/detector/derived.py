@@ -0,0 +1,273 @@
+"""
+Derived monitor channels.
+
+A derived channel is an arithmetic expression over monitor channels, for example the power of a supply::
+
+    [Derived_channel<0000>]
+    Channel_name = "P_VDD"
+    Expression = "V_VDD * I_VDD"
+    Unit = "W"
+
+Channel names which are not Python identifiers are written in braces, e.g. ``{-8V_supply} * 2``.  Expressions may
+use + - * / **, parentheses, numbers, the functions abs, sqrt, exp, log, log10, min and max, and the values of
+derived channels defined before them.
+
+Each expression is parsed and checked once, when the channels are loaded, and compiled to code calling the numpy
+functions.  On every status read each derived channel with a new input value is evaluated in turn, over the
+scalar values of its inputs; the same compiled expressions also evaluate whole arrays of values, such as a history
+window.  The derived values are added to the status read, so they are served by read('status'), recorded in the
+history and written to the database like the values of the hardware monitors.  They are not written to the
+monitor ring file, which holds raw values only, so readings replayed from it into the database have no derived
+channels.
+"""
+from __future__ import division
+
+import ast
+import logging
+import re
+import threading
+
+import numpy as np
+
+from percival.detector.history import channel_value
+
+FUNCTIONS = {"abs": np.abs,
+             "sqrt": np.sqrt,
+             "exp": np.exp,
+             "log": np.log,
+             "log10": np.log10,
+             "min": np.minimum,
+             "max": np.maximum}
+"""Functions available to the expressions of derived channels"""
+
+ARITY = {"abs": 1,
+         "sqrt": 1,
+         "exp": 1,
+         "log": 1,
+         "log10": 1,
+         "min": 2,
+         "max": 2}
+"""Number of arguments of each function"""
+
+_NODES = tuple(getattr(ast, name) for name in ["Expression", "BinOp", "UnaryOp", "Call", "Name", "Load", "Num",
+                                                "Constant", "Add", "Sub", "Mult", "Div", "Pow", "USub", "UAdd"]
+               if hasattr(ast, name))
+_BRACED = re.compile(r"\{([^{}]+)\}")
+
+
+def compile_expression(expression):
+    """
+    Parse and check the expression of a derived channel.
+
+    :param expression: The expression
+    :returns: Tuple of the compiled code and the names of the channels it uses, keyed by their name in the code
+    :raises ValueError: If the expression is invalid or uses anything other than arithmetic and the functions
+    """
+    braced = {}
+
+    def substitute(match):
+        # Replace a braced channel name by an identifier
+        identifier = "_channel_{}".format(len(braced))
+        braced[identifier] = match.group(1).strip()
+        return identifier
+
+    text = _BRACED.sub(substitute, expression).strip()
+    try:
+        tree = ast.parse(text, mode="eval")
+    except SyntaxError as ex:
+        raise ValueError("Invalid expression {}: {}".format(expression, str(ex)))
+    functions = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, _NODES):
+            raise ValueError("Invalid expression {}: {} is not allowed".format(expression, node.__class__.__name__))
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+                raise ValueError("Invalid expression {}: unknown function".format(expression))
+            if node.keywords or getattr(node, "starargs", None) or getattr(node, "kwargs", None):
+                raise ValueError("Invalid expression {}: functions take positional arguments".format(expression))
+            if len(node.args) != ARITY[node.func.id]:
+                raise ValueError("Invalid expression {}: {} takes {} argument(s)".format(expression, node.func.id,
+                                                                                       ARITY[node.func.id]))
+            functions.add(node.func)
+        if isinstance(node, getattr(ast, "Constant", ())) and not isinstance(node.value, (int, float)):
+            raise ValueError("Invalid expression {}: only numbers are allowed".format(expression))
+    channels = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node not in functions:
+            channels[node.id] = braced.get(node.id, node.id)
+    return compile(tree, "<derived>", "eval"), channels
+
+
+class DerivedChannel(object):
+    """
+    A monitor channel computed from other channels.
+    """
+    def __init__(self, name, expression, unit=""):
+        """
+        :param name: Name of the channel
+        :param expression: Expression of the value of the channel
+        :param unit: Unit of the value
+        :raises ValueError: If the expression is invalid
+        """
+        self.name = name
+        self.expression = expression
+        self.unit = unit
+        self._code, self._variables = compile_expression(expression)
+
+    @classmethod
+    def from_ini(cls, name, options):
+        """
+        Create a derived channel from the options of its INI section.
+
+        :param name: Name of the channel
+        :param options: Option values of the section, keyed by option name
+        :type  options: dict
+        """
+        if not options.get("Expression"):
+            raise ValueError("Derived channel {} has no expression".format(name))
+        return cls(name, options["Expression"], options.get("Unit", ""))
+
+    @property
+    def inputs(self):
+        """Names of the channels the expression uses"""
+        return sorted(set(self._variables.values()))
+
+    def evaluate(self, values):
+        """
+        Evaluate the expression.
+
+        :param values: Value (or array of values) of each input channel, keyed by channel name
+        :type  values: dict
+        :returns: The value, or array of values
+        """
+        namespace = dict(FUNCTIONS)
+        for variable, channel in self._variables.items():
+            namespace[variable] = values[channel]
+        with np.errstate(all="ignore"):
+            return eval(self._code, {"__builtins__": {}}, namespace)
+
+
+class DerivedChannels(object):
+    """
+    The derived channels, evaluated together on each status read.
+    """
+    def __init__(self):
+        self._log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
+        self._lock = threading.Lock()
+        self._channels = []
+        self._names = {}
+        self._inputs = []
+
+    def load(self, channels):
+        """
+        Replace the derived channels.  A channel which uses a derived channel defined after it is left out.
+
+        :param channels: The derived channels, in order of evaluation
+        :type  channels: list of :obj:`DerivedChannel`
+        """
+        loaded = []
+        names = {}
+        inputs = []
+        for channel in channels:
+            forward = [name for name in channel.inputs
+                       if name not in names and any(later.name == name for later in channels)]
+            if forward:
+                self._log.error("Derived channel %s uses derived channels %s defined after it", channel.name, forward)
+                continue
+            names[channel.name] = len(loaded)
+            loaded.append(channel)
+            inputs += [name for name in channel.inputs if name not in names and name not in inputs]
+        with self._lock:
+            self._channels = loaded
+            self._names = names
+            self._inputs = inputs
+        self._log.info("Loaded %d derived channels over %d monitor channels", len(loaded), len(inputs))
+
+    def __contains__(self, name):
+        return name in self._names
+
+    @property
+    def names(self):
+        return [channel.name for channel in self._channels]
+
+    def inputs(self, names=None):
+        """
+        Return the monitor channels the derived channels use.
+
+        :param names: Names of the derived channels, defaults to all
+        :returns: Names of the monitor channels (not derived channels) used, directly or through other derived
+                  channels
+        :rtype: list
+        """
+        with self._lock:
+            if names is None:
+                return list(self._inputs)
+            pending = [name for name in names if name in self._names]
+            seen = set()
+            inputs = []
+            while pending:
+                channel = self._channels[self._names[pending.pop()]]
+                for name in channel.inputs:
+                    if name in self._names:
+                        if name not in seen:
+                            seen.add(name)
+                            pending.append(name)
+                    elif name not in inputs:
+                        inputs.append(name)
+            return inputs
+
+    def evaluate(self, channels, previous=None):
+        """
+        Evaluate the derived channels from a status read.  Inputs not read are taken from the previous status; a
+        derived channel is only evaluated if at least one of its inputs was read, and only a finite result is
+        reported.  A channel whose expression fails is logged and left out.
+
+        :param channels: Status of each monitor channel read, keyed by name
+        :type  channels: dict
+        :param previous: Status of each monitor channel from earlier reads, keyed by name
+        :type  previous: dict
+        :returns: Status (value and unit) of each derived channel evaluated, keyed by name
+        :rtype: dict
+        """
+        with self._lock:
+            derived_channels = list(self._channels)
+            inputs = list(self._inputs)
+        if not derived_channels:
+            return {}
+        previous = previous or {}
+        statuses = [channels.get(name, previous.get(name)) for name in inputs]
+        values = np.array([channel_value(status) if status is not None else np.nan for status in statuses],
+                          dtype=float)
+        values = dict(zip(inputs, values))
+        read = set(name for name in inputs if name in channels)
+        status = {}
+        for channel in derived_channels:
+            if not any(name in read for name in channel.inputs):
+                # Derived channels using this one take its previous value
+                last = previous.get(channel.name)
+                values[channel.name] = channel_value(last) if last is not None else np.nan
+                continue
+            try:
+                value = float(channel.evaluate(values))
+            except Exception as ex:
+                # A failing expression only loses its own channel, and those using it
+                self._log.error("Unable to evaluate derived channel %s: %s", channel.name, str(ex))
+                value = np.nan
+            values[channel.name] = value
+            read.add(channel.name)
+            if np.isfinite(value):
+                status[channel.name] = {"value": value, "unit": channel.unit}
+        return status
+
+    def get_status(self):
+        """
+        :returns: The definition (expression, unit and inputs) of each derived channel, with the list of names
+        :rtype: dict
+        """
+        with self._lock:
+            status = {"derived": [channel.name for channel in self._channels]}
+            for channel in self._channels:
+                status[channel.name] = {"expression": channel.expression,
+                                        "unit": channel.unit,
+                                        "inputs": channel.inputs}
+        return status
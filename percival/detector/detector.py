@@ -7,24 +7,21 @@ from __future__ import print_function
 import os
 import logging
 import threading
-import time
 from percival.log import get_exclusive_file_logger
-from datetime import datetime, timedelta
+from datetime import datetime
 import getpass
+import json
 import sys
 import traceback
-is_py2 = sys.version[0] == '2'
-if is_py2:
-    import Queue as queue
-else:
-    import queue as queue
 
 from percival.carrier import const
 from percival.carrier.buffer import BufferCommand, SensorBufferCommand
 from percival.carrier.channels import ControlChannel, MonitoringChannel
 from percival.carrier.devices import DeviceFactory
-from percival.carrier.database import InfluxDB
-from percival.carrier.registers import generate_register_maps, BoardValueRegisters
+from percival.carrier.database import create_database
+from percival.carrier.monitor_block import MonitorBlock
+from percival.carrier.monitor_ring import MonitorRing
+from percival.carrier.registers import BoardValueRegisters
 from percival.carrier.sensor import Sensor
 from percival.carrier.settings import BoardSettings
 from percival.carrier.system import SystemCommand, SystemSettings, ClockSettings, SystemStatus
@@ -42,12 +39,25 @@ from percival.carrier.configuration import SystemSettingsParameters, \
     ControlParameters,\
     ChannelGroupParameters,\
     SetpointGroupParameters,\
+    SafetyRuleParameters,\
+    DerivedChannelParameters,\
     SensorDACParameters,\
     env_carrier_ip
 from percival.detector.errors import PercivalDetectorError
 from percival.detector.groups import Group
 from percival.detector.command import PercivalCommandNames
+from percival.detector.job_queue import JobQueue, Job
+from percival.detector.snapshot import SnapshotStore
+from percival.detector.status_service import StatusService
+from percival.detector.history import HistoryBuffer, to_lists
+from percival.detector.aggregator import StatusAggregator
+from percival.detector.change_filter import ChangeFilter
 from percival.detector.set_point import SetPointControl
+from percival.detector.scan_recorder import ScanRecorder
+from percival.detector.safety import SafetyEngine, SafetyRule
+from percival.detector.derived import DerivedChannel, DerivedChannels
+from percival.detector.events import EventLog
+from percival.detector.acquisition_metrics import AcquisitionMetrics
 
 
 class PercivalParameters(object):
@@ -88,6 +98,8 @@ class PercivalParameters(object):
         self._control_group_params = None
         self._monitor_group_params = None
         self._setpoint_group_params = None
+        self._safety_params = None
+        self._derived_params = None
 
     def load_ini(self):
         """
@@ -167,6 +179,16 @@ class PercivalParameters(object):
         except:
             self._log.debug("No default setpoints ini file to load")
 
+        try:
+            self.load_safety_ini(self._control_params.safety_ini_file)
+        except:
+            self._log.debug("No default safety rules ini file to load")
+
+        try:
+            self.load_derived_ini(self._control_params.derived_ini_file)
+        except:
+            self._log.debug("No default derived channels ini file to load")
+
     def load_system_settings_ini(self, filename):
         # Create the ini object from either filename or raw file
         self._system_settings_params = SystemSettingsParameters(filename)
@@ -217,6 +239,16 @@ class PercivalParameters(object):
         self._setpoint_group_params = SetpointGroupParameters(filename)
         self._setpoint_group_params.load_ini()
 
+    def load_safety_ini(self, filename):
+        # Create the ini object from either filename or raw file
+        self._safety_params = SafetyRuleParameters(filename)
+        self._safety_params.load_ini()
+
+    def load_derived_ini(self, filename):
+        # Create the ini object from either filename or raw file
+        self._derived_params = DerivedChannelParameters(filename)
+        self._derived_params.load_ini()
+
     @property
     def carrier_ip(self):
         """
@@ -235,12 +267,94 @@ class PercivalParameters(object):
             self._log.warning("No carrier IP address found in configuration file")
         return os.getenv(env_carrier_ip, default_carrier_ip)
 
+    @property
+    def status_period(self):
+        """
+        Return the period of the detector status reads in seconds, loaded from the percival.ini config file.
+        If no configuration can be found it will default to 0.25 s.
+
+        :returns: Status read period (s)
+        :rtype: float
+        """
+        try:
+            period = self._control_params.status_period
+        except RuntimeError:
+            period = 0.25
+        return period
+
+    @property
+    def heartbeat_interval(self):
+        """
+        Return the interval between status keyframes, when every monitor channel is published whether or not it
+        has changed, loaded from the percival.ini config file.  If no configuration can be found it will default
+        to 10 s.
+
+        :returns: Heartbeat interval (s)
+        :rtype: float
+        """
+        try:
+            interval = self._control_params.heartbeat_interval
+        except RuntimeError:
+            interval = 10.0
+        return interval
+
+    @property
+    def ramp(self):
+        """
+        Return the default maximum slew rate of the control channels (used for channels without a
+        Maximum_slew_rate) and the period of the writes of a ramp, loaded from the percival.ini config file.
+        If no configuration can be found the slew rate defaults to 0 (no limit) and the period to 0.1 s.
+
+        :returns: Dictionary of "max_slew_rate" (DAC counts per second) and "period" (s)
+        :rtype: dict
+        """
+        try:
+            max_slew_rate = self._control_params.max_slew_rate
+        except RuntimeError:
+            max_slew_rate = 0.0
+        try:
+            period = self._control_params.ramp_period
+        except RuntimeError:
+            period = 0.1
+        return {"max_slew_rate": max_slew_rate, "period": period}
+
+    @property
+    def scan_data_dir(self):
+        """
+        Return the directory the HDF5 files of recorded scans are written to, loaded from the percival.ini config
+        file.  If no directory is configured scans can only be recorded in memory.
+
+        :returns: Scan data directory, or None
+        :rtype: str
+        """
+        try:
+            directory = self._control_params.scan_data_dir
+        except RuntimeError:
+            directory = None
+        return directory or None
+
+    @property
+    def history_length(self):
+        """
+        Return the number of status reads held in the monitor history, loaded from the percival.ini config file.
+        If no configuration can be found it will default to 2400 (10 minutes of reads at 4 Hz).
+
+        :returns: Number of status reads
+        :rtype: int
+        """
+        try:
+            length = self._control_params.history_length
+        except RuntimeError:
+            length = 2400
+        return length
+
     @property
     def database(self):
         """
-        Return the IP address, port number and name of the database.
+        Return the type of the database, the IP address, port number and name of an InfluxDB database, the
+        file a file database records to and the batching of database writes.
 
-        The IP address configuration will be loaded from the percival.ini config file.
+        The configuration will be loaded from the percival.ini config file.
 
         :returns: Database configuration object
         :rtype: Dict
@@ -261,8 +375,70 @@ class PercivalParameters(object):
         except RuntimeError:
             db["name"] = "percival"
 
+        try:
+            db["type"] = self._control_params.database_type
+        except RuntimeError:
+            db["type"] = "influxdb"
+
+        try:
+            db["file"] = self._control_params.database_file
+        except RuntimeError:
+            db["file"] = "percival_db.txt"
+
+        # Batching of the database writes, defaults are used for any option not present
+        for option in ["batch_size", "flush_interval", "max_buffered"]:
+            try:
+                db[option] = getattr(self._control_params, "database_" + option)
+            except RuntimeError:
+                pass
+
         return db
 
+    @property
+    def aggregation(self):
+        """
+        Return the interval (seconds) over which monitor values are aggregated before they are written to the
+        database, and the monitor group whose channels are written on every read instead.  The configuration
+        is loaded from the percival.ini config file; by default every read is written.
+
+        :returns: Aggregation configuration object
+        :rtype: Dict
+        """
+        aggregation = {}
+        try:
+            aggregation["interval"] = self._control_params.database_aggregate_interval
+        except RuntimeError:
+            aggregation["interval"] = 0.0
+
+        try:
+            aggregation["raw_group"] = self._control_params.database_raw_group
+        except RuntimeError:
+            aggregation["raw_group"] = None
+
+        return aggregation
+
+    @property
+    def monitor_ring(self):
+        """
+        Return the file and capacity (number of records) of the monitor ring file, loaded from the percival.ini
+        config file.  If no file is configured the file is None and monitor reads are not recorded.
+
+        :returns: Monitor ring file configuration object
+        :rtype: Dict
+        """
+        ring = {}
+        try:
+            ring["file"] = self._control_params.database_ring_file
+        except RuntimeError:
+            ring["file"] = None
+
+        try:
+            ring["capacity"] = self._control_params.database_ring_capacity
+        except RuntimeError:
+            ring["capacity"] = 2000000
+
+        return ring
+
     @property
     def download_system_settings(self):
         download = False
@@ -489,6 +665,34 @@ class PercivalParameters(object):
     def setpoint_params(self):
         return self._setpoint_group_params
 
+    @property
+    def safety_params(self):
+        return self._safety_params
+
+    @property
+    def derived_params(self):
+        return self._derived_params
+
+
+SNAPSHOT_PARAMETERS = ["status", "controls", "monitors", "boards", "groups", "setpoints", "system_values",
+                       "commands", "write_buffer", "read_buffer"]
+"""Parameters served to readers from the published snapshot"""
+
+LIVE_PARAMETERS = ["driver", "action", "jobs", "monitor_log", "history", "scan_timing", "scan_data",
+                   "setpoint_distance", "scan_progress",
+                   "safety", "derived", "events", "acquisition_metrics"]
+"""Parameters which are read directly as they never access the hardware"""
+
+SAFETY_ABORT_TIMEOUT = 1.0
+"""Time (seconds) a safety action waits for an aborted scan to stop before warning; a safety scan only starts once
+the aborted scan has stopped"""
+
+RING_REPLAY_LIMIT = 5000
+"""Maximum number of monitor ring records replayed into the database per status read"""
+
+REPLAY_MEASUREMENT_SUFFIX = "_replay"
+"""Suffix of the measurements the replayed records of aggregated monitor channels are written to"""
+
 
 class PercivalDetector(object):
     """
@@ -500,7 +704,7 @@ class PercivalDetector(object):
 
     This class has no threading internally but should be considered thread safe (needs checking)
     """
-    def __init__(self, ini_file=None, download_config=True, initialise_hardware=True):
+    def __init__(self, ini_file=None, download_config=True, initialise_hardware=True, transport=None):
         self._log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
         logging.getLogger('requests').setLevel(self._log.level)
         logging.getLogger('urllib3').setLevel(self._log.level)
@@ -511,14 +715,22 @@ class PercivalDetector(object):
         self._username = getpass.getuser()
         self._download_configuration = download_config
         self._initialise_hardware = initialise_hardware
+        # Optional TxRx transport factory, e.g. percival.carrier.txrx.loopback_transport for in-process use
+        self._transport = transport
         self._txrx = None
         self._db = None
+        self._ring = None
+        self._aggregator = None
+        self._raw_channels = set()
+        self._change_filter = None
         self._global_monitoring = False
         self._log.info("Executing detector constructor")
         self._percival_params = PercivalParameters(ini_file)
         self._board_settings = {}
         self._board_values ={}
         self._monitors = {}
+        self._monitor_blocks = {}
+        self._monitor_boards = {}
         self._controls = {}
         self._sys_cmd = None
         self._system_status = None
@@ -529,6 +741,7 @@ class PercivalDetector(object):
         self._active_command = None
         self._write_buffer = []
         self._read_buffer = []
+        self._snapshots = SnapshotStore()
         self._log.info("Creating SystemSettings object")
         self._system_settings = SystemSettings()
         self._log.info("SystemSettings : %s", self._system_settings.settings)
@@ -541,39 +754,247 @@ class PercivalDetector(object):
         self._setpoint_control = SetPointControl(self)
         self._log.info("Starting setpoint control scan loop")
         self._setpoint_control.start_scan_loop()
+        self._safety = SafetyEngine(self.safety_action)
+        self._derived = DerivedChannels()
+        self._events = EventLog()
+        self._acquisition_metrics = AcquisitionMetrics()
         self._log.info("Calling load_ini for detector")
         self.load_ini()
-        self._log.info("Setting up database connection to influxdb")
+        self._change_filter = ChangeFilter(self._percival_params.heartbeat_interval)
+        self._log.info("Setting up database connection")
         self.setup_db()
+        self.setup_monitor_ring()
+        self.setup_aggregation()
         self._log.info("Setting up control interface")
         self.setup_control()
         self.connect()
-        self._command_lock = threading.Lock()
-        self._command_queue = queue.Queue(1)
+        self._jobs = JobQueue()
+        self.publish_snapshot()
         self._command_thread = threading.Thread(target=self.command_loop)
         self._command_thread.start()
-        self._run_status_loop = True
-        self._status_thread = threading.Thread(target=self.system_status_loop)
-        self._status_thread.start()
+        self._history = HistoryBuffer(self._percival_params.history_length)
+        self._status_service = StatusService(self.read_status_hardware, self._percival_params.status_period,
+                                             self._change_filter)
+        # The safety rules are checked first, as soon as each read completes
+        self._status_service.add_listener(self.check_safety)
+        # Change events are detected next so that subscribers are notified within the same read
+        self._status_service.add_listener(self._events.update)
+        self._status_service.add_listener(self._acquisition_metrics.update)
+        self._status_service.add_listener(self.record_history)
+        self._status_service.add_listener(self.log_status)
+        self._status_service.add_listener(self.publish_status)
+        self._status_service.start()
+
+    def read_status_hardware(self):
+        """
+        Read the system status and (if global monitoring is enabled) all monitor channels from the hardware.
+        This is called by the status service, other consumers should use :meth:`update_status`.
 
-    def system_status_loop(self):
-        while self._run_status_loop:
+        :returns: Tuple of the system status (None if it could not be read) and the monitor channel status
+        :rtype: tuple
+        """
+        detector = None
+        try:
+            self._system_status.read_values()
+            detector = self._system_status.get_status()
+        except Exception as ex:
+            self._log.debug("Unable to read system status: %s", str(ex))
+        channels = {}
+        if self._global_monitoring:
+            for board in [const.BoardTypes.carrier, const.BoardTypes.bottom,
+                          const.BoardTypes.left, const.BoardTypes.plugin]:
+                try:
+                    channels.update(self.update_board_status(board))
+                except Exception as ex:
+                    self._log.error("Caught exception: %s", str(ex))
+            latest = self._status_service.latest
             try:
-                self._system_status.read_values()
-                if self._db:
-                    time_now = datetime.utcnow()
-                    data = self._system_status.get_status()
-                    point = {}
-                    for key in ['Image_counter', 'system_armed', 'acquiring']:
-                        point[key] = data[key]
-                    self._db.log_point(time_now, 'Detector', point)
-            except:
-                pass
-            time.sleep(0.25)
+                channels.update(self._derived.evaluate(channels, latest.channels if latest is not None else None))
+            except Exception as ex:
+                self._log.error("Unable to evaluate derived channels: %s", str(ex))
+        return detector, channels
+
+    def log_status(self, snapshot):
+        """
+        Status service listener writing the values read into a status snapshot to the database.
+        The monitor values are always recorded to the monitor ring file; records made while the database
+        was unavailable, or whose write failed, are replayed into it once it is connected again.
+        """
+        delivered = self._db is not None and self._db.connected
+        if delivered:
+            if snapshot.detector_updated:
+                point = {}
+                for key in ['Image_counter', 'system_armed', 'acquiring']:
+                    point[key] = snapshot.detector[key]
+                self._db.log_point(snapshot.timestamp, 'Detector', point)
+                self._db.log_point(snapshot.timestamp, 'Acquisition', self._acquisition_metrics.get_status())
+            if self._aggregator:
+                # Only the high rate channels are written on every read (when changed), the rest once per interval
+                for name in snapshot.changed:
+                    if name in self._raw_channels:
+                        self._db.log_point(snapshot.timestamp, name, snapshot.channels[name])
+                aggregated = {name: snapshot.channels[name] for name in snapshot.updated
+                              if name not in self._raw_channels}
+                for point in self._aggregator.add(snapshot.read_time, aggregated):
+                    self._db.log_point(*point)
+            else:
+                for name in snapshot.changed:
+                    self._db.log_point(snapshot.timestamp, name, snapshot.channels[name])
+        if self._ring:
+            # Derived channels are not recorded as they have no raw value, so readings replayed from the ring into
+            # the database have no derived channels
+            self._ring.append_status(snapshot.read_time,
+                                     {name: snapshot.channels[name] for name in snapshot.updated
+                                      if name in self._monitors},
+                                     self._db if delivered else None)
+            if delivered and self._ring.unsent:
+                # Replay no more than half of the free space of the database buffer to leave room for live points
+                limit = min(RING_REPLAY_LIMIT, self._db.buffer_free // 2)
+                self._ring.replay(self._db, limit, self.convert_raw_value, self.replay_measurement)
+
+    def replay_measurement(self, name):
+        """
+        Return the database measurement the replayed monitor ring records of a channel are written to.  The ring
+        holds every read, so when a channel is aggregated its replayed records are written to a measurement of
+        their own rather than among the interval means.
+        """
+        if self._aggregator and name not in self._raw_channels:
+            return name + REPLAY_MEASUREMENT_SUFFIX
+        return name
+
+    def load_safety(self):
+        """
+        Compile the loaded safety rules over the monitor channels.  Rule sections which are invalid or whose
+        set-point or system command does not exist, and monitor groups or channels which do not exist, are logged
+        and left out.
+        """
+        ini = self._percival_params.safety_params
+        rules = []
+        if ini is not None:
+            for section in ini.sections:
+                try:
+                    rule = SafetyRule.from_ini(ini.get_name(section), ini.get_options(section))
+                except ValueError as ex:
+                    self._log.error("Invalid safety rule [%s]: %s", section, str(ex))
+                    continue
+                if rule.action == "setpoint" and rule.target not in self._setpoint_control.set_points:
+                    self._log.error("Invalid safety rule [%s]: unknown set-point %s", section, rule.target)
+                elif rule.action == "system_command" and rule.target not in const.SystemCmd.__members__:
+                    self._log.error("Invalid safety rule [%s]: unknown system command %s", section, rule.target)
+                else:
+                    rules.append(rule)
+        self._safety.load(rules, self.safety_channels)
+        if not self._global_monitoring and any(rule.enabled for rule in rules):
+            self._log.warning("Safety rules loaded while global monitoring is off, they are not evaluated until it "
+                              "is turned on")
+
+    def load_derived(self):
+        """
+        Compile the loaded derived channel expressions.  Channel sections which are invalid, or which have the name
+        of a monitor channel, are logged and left out.
+        """
+        ini = self._percival_params.derived_params
+        channels = []
+        if ini is not None:
+            for section in ini.sections:
+                name = ini.get_name(section)
+                if name in self._monitors:
+                    self._log.error("Derived channel [%s] has the name of a monitor channel %s", section, name)
+                    continue
+                try:
+                    channels.append(DerivedChannel.from_ini(name, ini.get_options(section)))
+                except ValueError as ex:
+                    self._log.error("Invalid derived channel [%s]: %s", section, str(ex))
+        self._derived.load(channels)
+        unknown = [name for name in self._derived.inputs() if name not in self._monitors]
+        if unknown and self._monitors:
+            self._log.warning("Derived channels use unknown monitor channels %s", unknown)
+
+    def safety_channels(self, names):
+        """
+        Expand the monitor group and channel names of a safety rule, leaving out (and logging) unknown names.
+        """
+        channels = []
+        for name in names:
+            try:
+                channels += self.monitor_channels([name])
+            except PercivalDetectorError as ex:
+                self._log.error("Safety rule channel ignored: %s", str(ex))
+        return channels
+
+    def check_safety(self, snapshot):
+        """
+        Status service listener checking the safety rules against the values read into a status snapshot.  Each
+        trip is written to the database.
+        """
+        for event in self._safety.evaluate(snapshot):
+            if self._db is not None and self._db.connected:
+                self._db.log_point(snapshot.timestamp, 'Safety', {"rule": event["rule"],
+                                                                  "action": event["action"],
+                                                                  "target": event["target"],
+                                                                  "success": event["success"],
+                                                                  "read_to_detection": event["read_to_detection"],
+                                                                  "detection_to_action":
+                                                                      event["detection_to_action"]})
+
+    def safety_action(self, rule, channels):
+        """
+        Take the action of a safety rule which has tripped.  Like cmd_abort_scan the action is taken immediately
+        rather than queued: any scan in progress is aborted, and its job fails, then the safety scan to the rule's
+        set-point is started (once the aborted scan has stopped) or its system command is sent.  Scans requested while the safety scan runs are rejected until it has
+        finished or has been aborted with cmd_abort_scan.
+
+        :param rule: The rule which tripped
+        :type  rule: :obj:`percival.detector.safety.SafetyRule`
+        :param channels: Names of the channels which tripped the rule
+        :type  channels: list
+        """
+        self._trace_log.info("Safety rule [%s] tripped by %s, action %s %s", rule.name, channels, rule.action,
+                             rule.target)
+        # The job of the scan aborted fails rather than completing
+        error = PercivalDetectorError("Scan aborted by safety rule {}".format(rule.name))
+        if not self._setpoint_control.abort_scan(SAFETY_ABORT_TIMEOUT, error):
+            self._log.warning("Scan still stopping %.1f s after the abort by safety rule %s", SAFETY_ABORT_TIMEOUT,
+                              rule.name)
+        if rule.action == "setpoint":
+            self._setpoint_control.safety_scan_set_point(rule.target, rule.steps, rule.dwell)
+        else:
+            self.system_command(rule.target)
+
+    def record_history(self, snapshot):
+        """
+        Status service listener adding the monitor values read into a status snapshot to the history.
+        """
+        self._history.record(snapshot.read_time, {name: snapshot.channels[name] for name in snapshot.updated})
+
+    def convert_raw_value(self, name, raw_value):
+        """
+        Return the calibrated status fields of a monitor channel for a raw value read from the hardware.
+        """
+        if name in self._monitors:
+            return self._monitors[name].convert(raw_value)
+        return {}
+
+    def publish_status(self, snapshot):
+        """
+        Status service listener publishing a status snapshot to the snapshot served to readers.
+        """
+        self._snapshots.publish({"status": snapshot.get_status()})
+
+    @property
+    def status_period(self):
+        return self._status_service.period
 
     def cleanup(self):
-        self._run_status_loop = False
-        self.queue_command(None)
+        self._status_service.stop()
+        self._jobs.shutdown()
+        if self._db:
+            if self._aggregator and self._db.connected:
+                for point in self._aggregator.flush():
+                    self._db.log_point(*point)
+            self._db.close()
+        if self._ring:
+            self._ring.close()
         self._setpoint_control.stop_scan_loop()
 
     def load_ini(self):
@@ -597,7 +1018,7 @@ class PercivalDetector(object):
         Creates a SystemCommand instance which can be used to send system commands to the hardware.
         """
         self._log.info("Carrier IP set as: %s", self._percival_params.carrier_ip)
-        self._txrx = TxRx(self._percival_params.carrier_ip)
+        self._txrx = TxRx(self._percival_params.carrier_ip, transport=self._transport)
         self._board_settings[const.BoardTypes.left] = BoardSettings(self._txrx, const.BoardTypes.left)
         self._board_settings[const.BoardTypes.bottom] = BoardSettings(self._txrx, const.BoardTypes.bottom)
         self._board_settings[const.BoardTypes.carrier] = BoardSettings(self._txrx, const.BoardTypes.carrier)
@@ -672,20 +1093,57 @@ class PercivalDetector(object):
         """
         Provide a DB interface for logging data from the detector.
         This will store the DB object for use when reading status.
-        The DB object must support the following interface:
-        ...
-        ...
-        ...
-
-        :param db:
-        :return:
+        The type of DB (an InfluxDB server or a local file) is taken from the [Database] section of the
+        percival.ini file.  The DB object is a DatabaseSink, supporting connect, close, get_status and
+        log_point.
         """
-        self._db = InfluxDB(self._percival_params.database["address"],
-                            self._percival_params.database["port"],
-                            self._percival_params.database["name"]
-                            )
+        if self._db:
+            # Write out anything buffered by the previous connection
+            self._db.close()
+            self._db = None
+        try:
+            self._db = create_database(self._percival_params.database)
+        except ValueError as ex:
+            self._log.error("Unable to set up database: %s", str(ex))
+            return
         self._connect_db()
 
+    def setup_monitor_ring(self):
+        """
+        Open the monitor ring file configured in the [Database] section of the percival.ini file, which records
+        every monitor read whether or not the database is available.
+        """
+        settings = self._percival_params.monitor_ring
+        if not settings["file"]:
+            self._log.info("No monitor ring file configured")
+            return
+        try:
+            ring = MonitorRing(settings["file"], settings["capacity"])
+            ring.open()
+            self._ring = ring
+        except (IOError, OSError, ValueError) as ex:
+            self._log.error("Unable to open monitor ring file %s: %s", settings["file"], str(ex))
+
+    def setup_aggregation(self):
+        """
+        Create the aggregator of monitor values written to the database, if an aggregation interval is
+        configured in the [Database] section of the percival.ini file.
+        """
+        settings = self._percival_params.aggregation
+        if settings["interval"] > 0.0:
+            self._log.info("Aggregating monitor values over %.1f s", settings["interval"])
+            self._aggregator = StatusAggregator(settings["interval"])
+
+    def update_raw_channels(self):
+        """
+        Update the set of monitor channels written to the database on every read from the raw monitor group.
+        """
+        group = self._percival_params.aggregation["raw_group"]
+        channels = set()
+        if group and self._monitor_groups is not None and group in self._monitor_groups.group_names:
+            channels = set(self._monitor_groups.get_channels(group))
+        self._raw_channels = channels
+
     def _connect_db(self):
         # Attempt connection to the database
         self._db.connect()
@@ -770,6 +1228,12 @@ class PercivalDetector(object):
                                            mc._channel_ini.Channel_name)
                         description, device = DeviceFactory[const.DeviceFamily(mc._channel_ini.Component_family_ID)]
                         self._monitors[mc._channel_ini.Channel_name] = device(mc._channel_ini.Channel_name, mc)
+                        self._change_filter.set_deadband(mc._channel_ini.Channel_name,
+                                                         mc._channel_ini.Deadband_absolute,
+                                                         mc._channel_ini.Deadband_relative)
+            self.load_monitor_blocks()
+            self.load_derived()
+            self.load_safety()
 
             # Readback the control settings
             self._board_settings[const.BoardTypes.left].readback_control_settings()
@@ -804,6 +1268,7 @@ class PercivalDetector(object):
 
             # Load in control groups from the ini file
             self._monitor_groups = Group(self._percival_params.monitor_group_params)
+            self.update_raw_channels()
 
     def load_system_settings(self, system_settings_ini):
         self._log.debug("Loading system settings with config: %s", system_settings_ini)
@@ -845,20 +1310,60 @@ class PercivalDetector(object):
         self._log.debug("Loading monitor groups with config: %s", monitor_groups_ini)
         self._percival_params.load_monitor_group_ini(monitor_groups_ini)
         self._monitor_groups = Group(self._percival_params.monitor_group_params)
+        self.update_raw_channels()
+        self.load_safety()
+
+    def load_safety_rules(self, safety_ini):
+        self._log.debug("Loading safety rules with config: %s", safety_ini)
+        self._percival_params.load_safety_ini(safety_ini)
+        self.load_safety()
+
+    def load_derived_channels(self, derived_ini):
+        self._log.debug("Loading derived channels with config: %s", derived_ini)
+        self._percival_params.load_derived_ini(derived_ini)
+        self.load_derived()
+        # Safety rules may watch derived channels
+        self.load_safety()
 
     def load_setpoints(self, setpoint_ini):
         self._log.debug("Loading set-points with config: %s", setpoint_ini)
         self._percival_params.load_setpoint_group_ini(setpoint_ini)
         self._setpoint_control.load_ini(self._percival_params.setpoint_params)
+        # Safety rules may apply set-points
+        self.load_safety()
 
     def queue_command(self, command):
-        # Special command case is an abort of a scan
-        if not self.check_for_abort_command(command):
-            if self._command_lock.acquire(False):
-                self._command_queue.put(command, block=False)
-                self._command_lock.release()
-            else:
-                raise PercivalDetectorError("Cannot submit command whilst another is active")
+        """
+        Submit a command to the job queue.  Abort and cancel commands are executed immediately and a
+        sequence command queues each of the commands it contains, which cannot include abort, cancel
+        or another sequence.
+
+        :param command: The command to submit
+        :type command: percival.detector.command.Command
+        :returns: The queued jobs (empty if the command was executed immediately)
+        :rtype: list
+        """
+        if self.check_for_abort_command(command) or self.check_for_cancel_command(command):
+            return []
+        if command.command_name in str(PercivalCommandNames.cmd_queue_sequence):
+            if not command.has_param('commands'):
+                raise PercivalDetectorError("No commands supplied to the sequence command")
+            commands = []
+            for item in command.get_param('commands'):
+                if 'command' not in item:
+                    raise PercivalDetectorError("Sequence item {} does not name a command".format(item))
+                sub_command = command.sub_command(item['command'], item.get('parameters', {}))
+                # Abort and cancel are executed immediately rather than queued, and sequences cannot be nested
+                for name in (PercivalCommandNames.cmd_abort_scan, PercivalCommandNames.cmd_cancel_job,
+                             PercivalCommandNames.cmd_queue_sequence):
+                    if sub_command.command_name in str(name):
+                        raise PercivalDetectorError("Command {} cannot be part of a sequence".format(
+                            sub_command.command_name))
+                commands.append(sub_command)
+            if len(commands) == 0:
+                raise PercivalDetectorError("Empty sequence of commands supplied")
+            return self._jobs.submit_sequence(commands)
+        return [self._jobs.submit(command)]
 
     def check_for_abort_command(self, command):
         if command is not None:
@@ -873,22 +1378,54 @@ class PercivalDetector(object):
                     return True
         return False
 
+    def check_for_cancel_command(self, command):
+        if command is not None:
+            if 'PUT' in command.command_type:
+                if command.command_name in str(PercivalCommandNames.cmd_cancel_job):
+                    self._trace_log.info("{} Command [{}] executed, parameters: {}".format(command.command_type,
+                                                                                           command.command_name,
+                                                                                           command.parameters))
+                    self._trace_log.info(command.format_trace)
+                    # Parameter [id] is the ID of a queued job to cancel
+                    # Parameter [sequence] is the ID of a sequence whose queued jobs are cancelled
+                    if command.has_param('id'):
+                        job_id = int(command.get_param('id'))
+                        if not self._jobs.cancel(job_id):
+                            raise PercivalDetectorError("Job {} is not queued and cannot be cancelled".format(job_id))
+                    elif command.has_param('sequence'):
+                        self._jobs.cancel_sequence(int(command.get_param('sequence')))
+                    else:
+                        raise PercivalDetectorError("No job id or sequence supplied to the cancel command")
+                    return True
+        return False
+
     def command_loop(self):
-        running = True
-        while running:
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            command = job.command
+            self._active_command = command
             try:
-                command = self._command_queue.get()
-                if command:
-                    with self._command_lock:
-                        self.execute_command(command)
+                response = self.execute_command(command)
+                if command.state == Job.COMPLETED:
+                    self._jobs.finish(job, True, result=response)
+                elif command.state == Job.FAILED:
+                    self._jobs.finish(job, False, command.message, response)
                 else:
-                    running = False
+                    # The command was not recognised or was missing a parameter
+                    command.complete(success=False, message="Command did not complete")
+                    self._jobs.finish(job, False, command.message, response)
             except PercivalDetectorError as e:
-                self._active_command.complete(success=False, message=str(e))
+                command.complete(success=False, message=str(e))
+                self._jobs.finish(job, False, command.message)
             except Exception as e:
                 type_, value_, traceback_ = sys.exc_info()
                 ex = traceback.format_exception(type_, value_, traceback_)
-                self._active_command.complete(success=False, message="Unhandled exception: {} => {}".format(str(e), str(ex)))
+                command.complete(success=False, message="Unhandled exception: {} => {}".format(str(e), str(ex)))
+                self._jobs.finish(job, False, command.message)
+            # Commands can change any part of the configuration so refresh the whole snapshot
+            self.publish_snapshot()
 
     def execute_command(self, command):
         """
@@ -940,6 +1477,10 @@ class PercivalDetector(object):
                                 self.load_control_groups(config_desc)
                             elif 'monitor_groups' in config_type:
                                 self.load_monitor_groups(config_desc)
+                            elif 'safety_rules' in config_type:
+                                self.load_safety_rules(config_desc)
+                            elif 'derived_channels' in config_type:
+                                self.load_derived_channels(config_desc)
                             elif 'system_settings' in config_type:
                                 self.load_system_settings(config_desc)
                                 self.download_system_settings()
@@ -1014,7 +1555,9 @@ class PercivalDetector(object):
                             dwell = int(command.get_param('dwell'))
                             if command.has_param('steps'):
                                 steps = int(command.get_param('steps')) + 1
-                                self._setpoint_control.scan_set_points(setpoints, steps, dwell)
+                                recorder, settle = self._scan_recorder(command)
+                                self._setpoint_control.scan_set_points(setpoints, steps, dwell,
+                                                                       recorder=recorder, settle=settle)
                                 self._setpoint_control.wait_for_scan_to_complete()
                                 self._active_command.complete(success=True)
                             else:
@@ -1036,6 +1579,39 @@ class PercivalDetector(object):
                             raise PercivalDetectorError("Dwell time (ms) required to scan")
                 else:
                     raise PercivalDetectorError("No setpoints defined to scan between")
+            elif command.command_name in str(PercivalCommandNames.cmd_ramp_setpoint):
+                # Parameter [setpoint] is the setpoint to ramp to from the current values
+                # Parameter [period] is the optional time in ms between the writes of the ramp
+                if command.has_param('setpoint'):
+                    setpoint = command.get_param('setpoint')
+                    if command.has_param('period'):
+                        period = float(command.get_param('period')) / 1000.0
+                    else:
+                        period = self._percival_params.ramp["period"]
+                    slew_rates = self.slew_rates(self._setpoint_control.get_channels(setpoint))
+                    self._setpoint_control.ramp_set_point(setpoint, slew_rates, period)
+                    self._setpoint_control.wait_for_scan_to_complete()
+                    self._active_command.complete(success=True)
+                else:
+                    raise PercivalDetectorError("No setpoint defined to ramp to")
+            elif command.command_name in str(PercivalCommandNames.cmd_scan_grid):
+                # Parameter [dimensions] is a list of the dimensions of the grid, outermost first, each a dictionary
+                # of [setpoints] or [channels] with [start] and [stop] or [values], the [steps] between the points
+                # and the [dwell] time in ms after the dimension moves
+                # Parameter [snake] optionally disables snake ordering (default true)
+                if command.has_param('dimensions'):
+                    dimensions = command.get_param('dimensions')
+                    if not isinstance(dimensions, list):
+                        dimensions = json.loads(dimensions)
+                    snake = True
+                    if command.has_param('snake'):
+                        snake = str(command.get_param('snake')).lower() == "true"
+                    recorder, settle = self._scan_recorder(command)
+                    self._setpoint_control.scan_grid(dimensions, snake, recorder=recorder, settle=settle)
+                    self._setpoint_control.wait_for_scan_to_complete()
+                    self._active_command.complete(success=True)
+                else:
+                    raise PercivalDetectorError("No dimensions defined to scan")
             elif command.command_name in str(PercivalCommandNames.cmd_write_buffer):
                 # Manual buffer write operation
                 if command.has_param('data'):
@@ -1098,7 +1674,33 @@ class PercivalDetector(object):
         # Check if the command is a GET command
         elif 'GET' in command.command_type:
             # Request for reading information
-            response = self.read(command.command_name)
+            if command.command_name == "jobs" and command.has_param('id'):
+                response = self.read_job(int(command.get_param('id')))
+            elif command.command_name == "status" and command.has_param('since'):
+                response = self.read_status_changes(float(command.get_param('since')))
+            elif command.command_name == "events" and (command.has_param('since') or command.has_param('field')):
+                since = None
+                if command.has_param('since'):
+                    since = int(command.get_param('since'))
+                fields = None
+                if command.has_param('field'):
+                    fields = command.get_param('field').split(",")
+                response = self.read_events(since, fields)
+            elif command.command_name == "history" and (command.has_param('channel') or command.has_param('group')):
+                window = None
+                if command.has_param('window'):
+                    window = float(command.get_param('window'))
+                if command.has_param('group'):
+                    response = self.read_history(group=command.get_param('group'), window=window)
+                else:
+                    response = self.read_history(command.get_param('channel').split(","), window)
+            elif command.command_name == "monitor_log" and command.has_param('hours'):
+                channels = None
+                if command.has_param('channel'):
+                    channels = command.get_param('channel').split(",")
+                response = self.read_monitor_log(float(command.get_param('hours')), channels)
+            else:
+                response = self.read_snapshot(command.command_name)
 
         return response
 
@@ -1128,6 +1730,8 @@ class PercivalDetector(object):
             self._global_monitoring = True
         else:
             self._global_monitoring = False
+            if self._safety.rules:
+                self._log.warning("Global monitoring turned off, the safety rules are not evaluated")
             #self._sys_cmd.send_command(const.SystemCmd.disable_global_monitoring)
             #self._sys_cmd.send_command(const.SystemCmd.disable_device_level_safety_controls)
 
@@ -1186,6 +1790,67 @@ class PercivalDetector(object):
             self._log.info("Device  %s not found", device)
             raise PercivalDetectorError("Cannot set value, device {} does not exist".format(device))
 
+    def _scan_recorder(self, command):
+        """
+        Create the recorder of a scan command.  Parameter [record] optionally lists monitor groups (or channels) to
+        capture at each step, [settle] ms after the step, into memory or an HDF5 [file].
+
+        :returns: Tuple of the recorder (None if the scan is not recorded) and the settle time (ms)
+        """
+        recorder = None
+        settle = 0.0
+        if command.has_param('record'):
+            record = command.get_param('record')
+            if not isinstance(record, list):
+                record = record.split(",")
+            filename = self.scan_data_file(command.get_param('file')) if command.has_param('file') else None
+            recorder = ScanRecorder(self.monitor_channels(record), self.read_monitors, filename)
+            if command.has_param('settle'):
+                settle = float(command.get_param('settle'))
+        return recorder, settle
+
+    def scan_data_file(self, name):
+        """
+        Return the path of a new scan data file in the configured scan data directory.
+
+        :param name: Name of the file, without any directory
+        :type name: str
+        :returns: Path of the file
+        :raises PercivalDetectorError: If no scan data directory is configured, the name is not a plain file name or
+                                       the file already exists
+        """
+        directory = self._percival_params.scan_data_dir
+        if directory is None:
+            raise PercivalDetectorError("No scan data directory is configured, scans can only be recorded in memory")
+        name = str(name).strip()
+        if not name or name in [".", ".."] or os.path.basename(name) != name or (os.altsep and os.altsep in name):
+            raise PercivalDetectorError("Invalid scan data file name {}, give a file name without a directory"
+                                        .format(name))
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            raise PercivalDetectorError("Scan data file {} already exists".format(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        return path
+
+    def slew_rates(self, devices):
+        """
+        Return the maximum slew rate of control devices: the Maximum_slew_rate of the channel, or the default
+        maximum slew rate if the channel has none.
+
+        :param devices: Names of the control devices
+        :type devices: list
+        :returns: Maximum slew rate (DAC counts per second, 0 for no limit) of each device, keyed by name
+        :rtype: dict
+        """
+        default = self._percival_params.ramp["max_slew_rate"]
+        rates = {}
+        for device in devices:
+            channel_ini = self._percival_params.control_channel_by_name(device)
+            rate = channel_ini.Maximum_slew_rate if channel_ini is not None else 0.0
+            rates[device] = rate if rate > 0.0 else default
+        return rates
+
     def get_value(self, device):
         """
         Get the last set value of a control device.
@@ -1208,7 +1873,7 @@ class PercivalDetector(object):
     def apply_sensor_dac_values(self):
         self._sensor.apply_dac_values()
 
-    def read(self, parameter):
+    def read(self, parameter, channel=None, window=None):
         """
         Read a parameter from the detector.
         The parameters currently include:
@@ -1217,20 +1882,40 @@ class PercivalDetector(object):
         - hardware description
         - status of all monitors
         - status of a specific monitor
+        - recent history of a monitor or monitor group, read('history', channel, window)
+        - timing of the current or last set-point scan, read('scan_timing')
+        - monitor values recorded at each step of the current or last set-point scan, read('scan_data')
+        - distance of every set-point from the current control demands, read('setpoint_distance')
+        - progress of the current or last set-point or grid scan, read('scan_progress')
+        - safety rules, the recent trips and the detection to action latency, read('safety')
+        - expressions of the derived channels, read('derived')
+        - changes of the system status fields and monitor flags held in the event log, read('events')
+        - frame and train rates, missed trains and acquisition duration, read('acquisition_metrics')
 
         :param parameter: Name of parameter to read status of
         :type parameter: str
+        :param channel: Name of the monitor or monitor group (history only)
+        :type channel: str
+        :param window: Length of the history (seconds), defaults to all of the history held (history only)
+        :type window: float
         :returns: Status report of the requested parameter
         :rtype: dict
         """
         self._log.debug("Reading data %s", parameter)
 
+        if parameter == "history" and channel is not None:
+            if self._monitor_groups is not None and channel in self._monitor_groups.group_names:
+                return self.read_history(group=channel, window=window)
+            return self.read_history([channel], window)
+
         # First check to see if parameter is a keyword
         if parameter == "driver":
             reply = {"username": self._username,
                      "start_time": self._start_time.strftime("%B %d, %Y %H:%M:%S"),
                      "up_time": str(datetime.now() - self._start_time),
-                     "influx_db": self._db.get_status(),
+                     "influx_db": self._db.get_status() if self._db else {"connected": False},
+                     "aggregation": self._aggregator.get_status() if self._aggregator else {"interval": 0.0},
+                     "change_filter": self._change_filter.get_status(),
                      "hardware": self._txrx.get_status()
                      }
 
@@ -1252,6 +1937,17 @@ class PercivalDetector(object):
                          'time': ''
                          }
 
+        elif parameter == "jobs":
+            reply = self._jobs.get_status()
+
+        elif parameter == "history":
+            reply = {"capacity": self._history.capacity,
+                     "count": self._history.count,
+                     "channels": self._history.channels}
+
+        elif parameter == "monitor_log":
+            reply = self._ring.get_status() if self._ring else {"open": False}
+
         elif parameter == "write_buffer":
             reply = {'data': self._write_buffer}
 
@@ -1296,6 +1992,31 @@ class PercivalDetector(object):
             reply["status"] = self._setpoint_control.get_status()
             self._log.debug("Setpoints: %s", reply)
 
+        elif parameter == "scan_timing":
+            reply = self._setpoint_control.get_timing()
+
+        elif parameter == "scan_data":
+            recorder = self._setpoint_control.recorder
+            reply = recorder.get_data() if recorder is not None else {"channels": [], "controls": []}
+
+        elif parameter == "setpoint_distance":
+            reply = self._setpoint_control.get_distances()
+
+        elif parameter == "scan_progress":
+            reply = self._setpoint_control.get_progress()
+
+        elif parameter == "safety":
+            reply = self._safety.get_status()
+
+        elif parameter == "derived":
+            reply = self._derived.get_status()
+
+        elif parameter == "events":
+            reply = self.read_events()
+
+        elif parameter == "acquisition_metrics":
+            reply = self._acquisition_metrics.get_status()
+
         elif parameter == "controls":
             reply = {}
             reply["controls"] = []
@@ -1344,55 +2065,272 @@ class PercivalDetector(object):
             }
 
         elif parameter == "status":
-            reply = {'detector': self._system_status.get_status()}
+            snapshot = self._status_service.latest
+            if snapshot is not None:
+                reply = snapshot.get_status()
+            else:
+                reply = {'detector': self._system_status.get_status()}
+            # Include monitors which have not been read (e.g. global monitoring is disabled)
             for monitor in self._monitors:
-                reply[monitor] = self._monitors[monitor].status
+                if monitor not in reply:
+                    reply[monitor] = self._monitors[monitor].status
 
         # Check to see if the parameter is a monitoring device that we own
         elif parameter in self._monitors:
-            reply = { parameter: self._monitors[parameter].status }
+            snapshot = self._status_service.latest
+            if snapshot is not None and parameter in snapshot.channels:
+                reply = { parameter: snapshot.get_status()[parameter] }
+            else:
+                reply = { parameter: self._monitors[parameter].status }
+
+        elif parameter in self._derived:
+            snapshot = self._status_service.latest
+            if snapshot is not None and parameter in snapshot.channels:
+                reply = { parameter: snapshot.get_status()[parameter] }
+            else:
+                reply = { "error": "Derived channel {} has not been evaluated".format(parameter) }
 
         else:
             reply = { "error": "Parameter not found" }
 
         return reply
 
-    def update_status(self):
+    def publish_snapshot(self, parameters=None):
         """
-        Update the status of the monitor devices.
-        The values shortcut is read out from the hardware and the status of all
-        monitors is updated appropriately.
+        Read the current value of parameters and publish them in the snapshot served to readers.
+
+        :param parameters: Names of parameters to publish, defaults to all of SNAPSHOT_PARAMETERS
+        :type parameters: list
         """
-        self._log.info("Update status callback called")
-        status_msg = {}
-        if self._global_monitoring:
+        items = {}
+        for parameter in parameters or SNAPSHOT_PARAMETERS:
             try:
-                status_msg.update(self.update_board_status(const.BoardTypes.carrier))
-                status_msg.update(self.update_board_status(const.BoardTypes.bottom))
-                status_msg.update(self.update_board_status(const.BoardTypes.left))
-                status_msg.update(self.update_board_status(const.BoardTypes.plugin))
+                items[parameter] = self.read(parameter)
             except Exception as ex:
-                self._log.error("Caught exception: %s", str(ex))
+                # The parameter may not be available yet (e.g. groups before they are loaded)
+                self._log.debug("Unable to publish %s: %s", parameter, str(ex))
+        self._snapshots.publish(items)
 
-            self._log.debug("Status: %s", status_msg)
+    def read_snapshot(self, parameter):
+        """
+        Read a parameter without waiting on the hardware or on running commands.
+        Values are served from the most recently published snapshot, see :meth:`read` for the parameters.
+
+        :param parameter: Name of parameter to read status of
+        :type parameter: str
+        :returns: Status report of the requested parameter
+        :rtype: dict
+        """
+        snapshot = self._snapshots.current
+        if parameter in LIVE_PARAMETERS:
+            reply = self.read(parameter)
+        elif parameter == "setpoints" and parameter in snapshot:
+            # The set-points are fixed until reloaded but the scan progress is live
+            reply = dict(snapshot.get(parameter))
+            reply["status"] = self._setpoint_control.get_status()
+        elif parameter in snapshot:
+            reply = snapshot.get(parameter)
+        elif parameter in snapshot.get("status", {}) and parameter != "detector":
+            reply = {parameter: snapshot.get("status")[parameter]}
+        else:
+            reply = {"error": "Parameter not found"}
+        return reply
+
+    def read_job(self, job_id):
+        """
+        Read the state, timestamps and result of a job submitted through :meth:`queue_command`.
+
+        :param job_id: ID of the job
+        :type job_id: int
+        :returns: Status report of the job
+        :rtype: dict
+        """
+        job = self._jobs.get_job(job_id)
+        if job is None:
+            return {"error": "Job {} not found".format(job_id)}
+        return job.get_status()
+
+    def read_history(self, channels=None, window=None, group=None):
+        """
+        Read the recent history of monitor channels from memory.
+
+        :param channels: Names of the channels to read
+        :type channels: list
+        :param window: Length of the history (seconds), defaults to all of the history held
+        :type window: float
+        :param group: Name of a monitor group to read instead of a list of channels
+        :type group: str
+        :returns: The channel names, a list of the read times and for each of raw_value, value, sample_number
+                  and flags a list per channel of the values at those times (None where a channel was not read)
+        :rtype: dict
+        """
+        if group is not None:
+            if self._monitor_groups is None or group not in self._monitor_groups.group_names:
+                return {"error": "Monitor group {} not found".format(group)}
+            # Channels of the group which have not been read yet are omitted
+            recorded = self._history.channels
+            channels = [name for name in self._monitor_groups.get_channels(group) if name in recorded]
+        try:
+            return to_lists(self._history.window(channels, window))
+        except KeyError as ex:
+            return {"error": ex.args[0]}
+
+    def read_monitor_log(self, hours, channels=None):
+        """
+        Read the history of monitor channels over the last hours from the monitor ring file.
+
+        :param hours: Length of the history (hours)
+        :type hours: float
+        :param channels: Names of the channels to read, defaults to all
+        :type channels: list
+        :returns: History of each channel: lists of the read times, raw values, flags and calibrated values
+        :rtype: dict
+        """
+        if not self._ring:
+            return {"error": "No monitor ring file is open"}
+        history = self._ring.last(hours, channels)
+        for name in history:
+            values = [self.convert_raw_value(name, raw_value) for raw_value in history[name]["raw_value"]]
+            for key in (values[0] if values else {}):
+                history[name][key] = [value[key] for value in values]
+        return history
+
+    def update_status(self, max_age=None):
+        """
+        Update the status of the monitor devices.
+        A status snapshot is requested from the status service, which reads the values shortcut from the
+        hardware and updates the status of all monitors appropriately.  Concurrent requests share one read.
+
+        :param max_age: Maximum age (seconds) of an acceptable existing snapshot; None forces a new read
+        :type max_age: float
+        :returns: Status of the monitors read into the snapshot
+        :rtype: dict
+        """
+        self._log.info("Update status callback called")
+        snapshot = self._status_service.refresh(max_age)
+        status_msg = {}
+        if snapshot is None:
+            self._log.error("No status snapshot is available")
+            return status_msg
+        for name in snapshot.updated:
+            status_msg[name] = snapshot.channels[name]
+        self._log.debug("Status: %s", status_msg)
         return status_msg
 
+    def read_status_changes(self, since=None):
+        """
+        Read the status of the monitors which have changed since a previous read of the changes, without waiting
+        on the hardware.  Channels are selected by the change filter (freshness, deadbands, flag changes and
+        heartbeat keyframes).
+
+        :param since: Timestamp returned by the previous call, None returns every monitor
+        :type since: float
+        :returns: The detector status, the status of each changed monitor, the names of the stale monitors, a
+                  keyframe flag and the timestamp to pass to the next call
+        :rtype: dict
+        """
+        snapshot = self._status_service.latest
+        if snapshot is None:
+            return {"timestamp": since, "detector": None, "channels": {}, "stale": [], "keyframe": False}
+        status = snapshot.get_status()
+        channels = {}
+        for name in self._change_filter.changed_since(since):
+            if name in status:
+                channels[name] = status[name]
+        return {"timestamp": snapshot.read_time,
+                "detector": snapshot.detector,
+                "channels": channels,
+                "stale": self._change_filter.stale,
+                "keyframe": snapshot.keyframe}
+
+    def read_events(self, since=None, fields=None):
+        """
+        Read the change events of the system status fields and monitor flags detected after an event.
+
+        :param since: Number of the last event received (the "last" value returned by the previous call), None
+                      returns every event held
+        :type since: int
+        :param fields: Names of the status fields, monitor flags or monitor channels to return the events of,
+                       defaults to all
+        :type fields: list
+        :returns: The events, the number of the last event to pass to the next call and whether events have been
+                  lost from the log since the previous call
+        :rtype: dict
+        """
+        return self._events.since(since, fields)
+
+    def add_event_listener(self, listener):
+        """
+        Subscribe to the change events of the system status fields and monitor flags.  The listener is called with
+        the list of events detected by each status read, from the thread which made the read.
+        """
+        self._events.add_listener(listener)
+
+    def load_monitor_blocks(self):
+        """
+        Attach the monitor devices of each board to a :class:`percival.carrier.monitor_block.MonitorBlock`, indexed
+        by the position of the device's channel in the board's READ_VALUES block.  Reading a board's status then
+        decodes and converts all of its values at once.
+        """
+        self._monitor_blocks = {}
+        self._monitor_boards = {}
+        for board in [const.BoardTypes.left, const.BoardTypes.bottom,
+                      const.BoardTypes.carrier, const.BoardTypes.plugin]:
+            block = MonitorBlock(BoardValueRegisters[board].entries)
+            for offset in range(block.entries):
+                name = self._percival_params.monitoring_channel_name_by_index_and_board_type(offset, board)
+                if name in self._monitors:
+                    self._monitors[name].attach(block, offset)
+                    self._monitor_boards[name] = board
+            self._monitor_blocks[board] = block
+
+    def read_monitors(self, channels):
+        """
+        Read a set of monitor channels from the hardware, reading only the boards they are on.  This is a fresh
+        read regardless of the status service and of global monitoring.
+
+        :param channels: Names of the monitor channels
+        :type channels: list
+        :returns: Status of each channel read, keyed by channel name
+        :rtype: dict
+        """
+        # The inputs of derived channels are read with them
+        inputs = self._derived.inputs([name for name in channels if name in self._derived])
+        boards = set(self._monitor_boards[name] for name in channels + inputs if name in self._monitor_boards)
+        status = {}
+        for board in boards:
+            status.update(self.update_board_status(board))
+        if inputs:
+            latest = self._status_service.latest
+            status.update(self._derived.evaluate(status, latest.channels if latest is not None else None))
+        return {name: status[name] for name in channels if name in status}
+
+    def monitor_channels(self, names):
+        """
+        Expand a list of monitor group and monitor channel names into the list of monitor channel names.
+
+        :param names: Monitor group or channel names
+        :type names: list
+        :rtype: list
+        """
+        channels = []
+        for name in names:
+            if self._monitor_groups is not None and name in self._monitor_groups.group_names:
+                members = self._monitor_groups.get_channels(name)
+            elif name in self._monitors or name in self._derived:
+                members = [name]
+            else:
+                raise PercivalDetectorError("No monitor group or channel called {}".format(name))
+            channels.extend(member for member in members if member not in channels)
+        return channels
+
     def update_board_status(self, board):
-        status_msg = {}
         response = self._board_values[board].read_values()
-        time_now = datetime.utcnow()
         self._log.debug(response)
-        read_maps = generate_register_maps(response)
-        self._log.debug(read_maps)
-
-        readback_block = BoardValueRegisters[board]
-        for addr, value in response:  # pylint: disable=W0612
-            offset = addr - readback_block.start_address
-            name = self._percival_params.monitoring_channel_name_by_index_and_board_type(offset, board)
-            if name in self._monitors:
-                self._monitors[name].update(read_maps[offset])
-                status_msg[name] = self._monitors[name].status
-                if self._db:
-                    self._db.log_point(time_now, name, self._monitors[name].status)
-
-        return status_msg
+        block = self._monitor_blocks.get(board)
+        if block is None or not response:
+            return {}
+        start_address = BoardValueRegisters[board].start_address
+        values = [(addr - start_address, value) for addr, value in response
+                  if 0 <= addr - start_address < block.entries]
+        return block.update([value for row, value in values], [row for row, value in values])
@@ -0,0 +1,144 @@
+"""
+Change events of the system status and of the monitor flags.
+
+Each status snapshot is compared with the one before it: every field of the system status
+(:meth:`percival.carrier.system.SystemStatus.get_status`) and every threshold, safety and communication flag of
+the monitor channels read which has changed produces an event holding the field, the old and new values, the read
+time and the train number.  The fields are compared as arrays, so a snapshot without changes costs a couple of
+array comparisons.
+
+Events are numbered and held in a bounded log.  Readers ask for the events after the last one they received, so no
+event is missed between two reads (unless it has been dropped from the log, which is reported), and listeners are
+called with the events of each snapshot as soon as it has been read, which is how they are published over ZeroMQ.
+"""
+from __future__ import division
+
+from collections import deque
+from datetime import datetime
+import logging
+import threading
+
+import numpy as np
+
+from percival.carrier.monitor_ring import FLAG_FIELDS
+
+COUNTER_FIELDS = ["Image_counter", "Acquisition_counter", "Train_number"]
+"""System status counters, which change on every read while acquiring and so are not reported as events"""
+
+
+class EventLog(object):
+    """
+    Detection and log of the changes of the system status fields and monitor flags.
+    """
+    def __init__(self, max_events=1000, ignore=None):
+        """
+        :param max_events: Number of events held in the log
+        :param ignore: Names of the system status fields which are not reported, defaults to the counters
+        :type  ignore: list
+        """
+        self._log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=max_events)
+        self._ignore = set(COUNTER_FIELDS if ignore is None else ignore)
+        self._listeners = []
+        self._last_id = 0
+        self._fields = []
+        self._values = np.zeros(0, dtype=np.int64)
+        self._flags = {}
+
+    @property
+    def last_id(self):
+        """Number of the last event detected, 0 if there have been none"""
+        return self._last_id
+
+    def add_listener(self, listener):
+        """
+        Add a callable which is called with the list of events detected in each snapshot which has any.  It is
+        called from the thread which read the status and must not block.
+        """
+        self._listeners.append(listener)
+
+    def update(self, snapshot):
+        """
+        Detect the changes in a status snapshot.
+
+        :param snapshot: The status snapshot
+        :type  snapshot: :obj:`percival.detector.status_service.StatusSnapshot`
+        :returns: The events detected
+        :rtype: list
+        """
+        train_number = None
+        changes = []
+        if snapshot.detector_updated and snapshot.detector:
+            train_number = snapshot.detector.get("Train_number")
+            changes += self._status_changes(snapshot.detector)
+        for name in snapshot.updated:
+            changes += self._flag_changes(name, snapshot.channels[name])
+        if not changes:
+            return []
+        time = str(datetime.fromtimestamp(snapshot.read_time))
+        events = []
+        with self._lock:
+            for event_type, channel, field, old, new in changes:
+                self._last_id += 1
+                event = {"id": self._last_id,
+                         "type": event_type,
+                         "field": field,
+                         "old": old,
+                         "new": new,
+                         "timestamp": snapshot.read_time,
+                         "time": time,
+                         "Train_number": train_number}
+                if channel is not None:
+                    event["channel"] = channel
+                events.append(event)
+            self._events.extend(events)
+        for listener in self._listeners:
+            try:
+                listener(events)
+            except Exception as ex:
+                self._log.error("Event listener %s failed: %s", listener, str(ex))
+        return events
+
+    def _status_changes(self, status):
+        fields = sorted(name for name in status if name not in self._ignore)
+        values = np.array([status[name] for name in fields], dtype=np.int64)
+        if fields != self._fields:
+            # The first read (or a change of the set of fields) is the reference for the next reads
+            self._fields = fields
+            self._values = values
+            return []
+        changed = np.flatnonzero(values != self._values)
+        changes = [("status", None, fields[index], int(self._values[index]), int(values[index])) for index in changed]
+        self._values = values
+        return changes
+
+    def _flag_changes(self, name, status):
+        flags = [int(status.get(field, 0)) for field in FLAG_FIELDS]
+        last = self._flags.get(name)
+        self._flags[name] = flags
+        if last is None or last == flags:
+            return []
+        return [("monitor", name, FLAG_FIELDS[index], last[index], flags[index])
+                for index in range(len(FLAG_FIELDS)) if last[index] != flags[index]]
+
+    def since(self, event_id=None, fields=None):
+        """
+        Return the events after an event.
+
+        :param event_id: Number of the last event received, None returns every event held
+        :type  event_id: int
+        :param fields: Names of the fields, or monitor channels, whose events are returned, defaults to all
+        :type  fields: list
+        :returns: Dictionary of the "events", the number of the "last" event detected (to pass to the next call)
+                  and "lost", True if events after event_id have been dropped from the log
+        :rtype: dict
+        """
+        with self._lock:
+            events = [event for event in self._events if event_id is None or event["id"] > event_id]
+            lost = event_id is not None and event_id < self._last_id and \
+                (not self._events or self._events[0]["id"] > event_id + 1)
+            last_id = self._last_id
+        if fields:
+            events = [event for event in events if event["field"] in fields or event.get("channel") in fields]
+        return {"events": events, "last": last_id, "lost": lost}
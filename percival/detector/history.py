@@ -0,0 +1,167 @@
+"""
+In-memory history of recent monitor channel samples.
+
+The :class:`HistoryBuffer` keeps the last N status reads in NumPy ring buffers: one vector of read times and,
+for each stored quantity, a matrix of reads by channels.  A channel not read by a status read holds a missing
+value (NaN, or -1 for the integer quantities) in that row.  Windowed queries of one channel or of a group of
+channels return aligned arrays, which makes trend plots and stability checks cheap.
+"""
+from __future__ import division
+
+import logging
+import threading
+import time
+
+import numpy as np
+
+from percival.carrier.monitor_ring import encode_flags
+
+FLOAT_FIELDS = ["raw_value", "value"]
+INT_FIELDS = ["sample_number", "flags"]
+
+
+def channel_value(status):
+    """Return the calibrated value of a monitor channel status dictionary"""
+    if "value" in status:
+        return status["value"]
+    return status.get("temperature", np.nan)
+
+
+class HistoryBuffer(object):
+    """
+    Ring buffers of the recent raw value, calibrated value, sample number and flags of every monitor channel.
+    """
+    def __init__(self, capacity=2400, max_channels=256):
+        """
+        :param capacity: Number of status reads held
+        :param max_channels: Maximum number of channels held
+        """
+        self._log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
+        self._capacity = capacity
+        self._max_channels = max_channels
+        self._lock = threading.Lock()
+        self._time = np.full(capacity, np.nan)
+        self._data = {}
+        for field in FLOAT_FIELDS:
+            self._data[field] = np.full((capacity, max_channels), np.nan)
+        for field in INT_FIELDS:
+            self._data[field] = np.full((capacity, max_channels), -1, dtype=np.int32)
+        self._channels = []
+        self._channel_ids = {}
+        self._head = 0
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def count(self):
+        """Number of status reads held"""
+        return min(self._head, self._capacity)
+
+    @property
+    def channels(self):
+        return list(self._channels)
+
+    def _channel_id(self, name):
+        # Called with the lock held
+        channel_id = self._channel_ids.get(name)
+        if channel_id is None and len(self._channels) < self._max_channels:
+            channel_id = len(self._channels)
+            self._channels.append(name)
+            self._channel_ids[name] = channel_id
+        return channel_id
+
+    def record(self, read_time, channels):
+        """
+        Add the channels read by a status read.
+
+        :param read_time: Time of the status read (seconds since the epoch)
+        :type  read_time: float
+        :param channels: Status dictionary of each channel read, keyed by channel name
+        :type  channels: dict
+        """
+        if not channels:
+            return
+        with self._lock:
+            ids = []
+            statuses = []
+            for name in channels:
+                channel_id = self._channel_id(name)
+                if channel_id is None:
+                    self._log.warning("History is limited to %d channels, not recording %s", self._max_channels, name)
+                else:
+                    ids.append(channel_id)
+                    statuses.append(channels[name])
+            row = self._head % self._capacity
+            self._time[row] = read_time
+            for field in FLOAT_FIELDS:
+                self._data[field][row, :] = np.nan
+            for field in INT_FIELDS:
+                self._data[field][row, :] = -1
+            self._data["raw_value"][row, ids] = [status.get("raw_value", np.nan) for status in statuses]
+            self._data["value"][row, ids] = [channel_value(status) for status in statuses]
+            self._data["sample_number"][row, ids] = [status.get("sample_number", -1) for status in statuses]
+            self._data["flags"][row, ids] = [encode_flags(status) & 0xFF for status in statuses]
+            self._head += 1
+
+    def window(self, channels=None, window=None, now=None):
+        """
+        Return the samples of a set of channels read within a time window, oldest first.
+
+        :param channels: Names of the channels, defaults to all
+        :type  channels: list
+        :param window: Length of the window (seconds) ending now, defaults to all samples held
+        :type  window: float
+        :param now: End of the window (seconds since the epoch), defaults to the current time
+        :returns: Dictionary of "channels" (names), "time" (vector of read times) and for each of raw_value,
+                  value, sample_number and flags a matrix of channels by reads
+        :rtype: dict
+        """
+        with self._lock:
+            if channels is None:
+                channels = list(self._channels)
+            unknown = [name for name in channels if name not in self._channel_ids]
+            if unknown:
+                raise KeyError("No history for channels {}".format(", ".join(unknown)))
+            ids = [self._channel_ids[name] for name in channels]
+            count = self.count
+            rows = (self._head - count + np.arange(count)) % self._capacity
+            times = self._time[rows]
+            if window is not None:
+                now = now or time.time()
+                rows = rows[(times >= now - window) & (times <= now)]
+                times = self._time[rows]
+            result = {"channels": list(channels), "time": times}
+            for field in FLOAT_FIELDS + INT_FIELDS:
+                result[field] = self._data[field][rows][:, ids].T
+        return result
+
+    def channel(self, name, window=None, now=None):
+        """
+        Return the samples of one channel read within a time window, oldest first.  Reads of other channels are
+        excluded.
+
+        :returns: Dictionary of "time", "raw_value", "value", "sample_number" and "flags" vectors
+        :rtype: dict
+        """
+        samples = self.window([name], window, now)
+        read = samples["sample_number"][0] >= 0
+        result = {"time": samples["time"][read]}
+        for field in FLOAT_FIELDS + INT_FIELDS:
+            result[field] = samples[field][0][read]
+        return result
+
+
+def to_lists(samples):
+    """Convert the arrays of a history query into lists, with missing values as None, for JSON replies"""
+    reply = {}
+    for key, value in samples.items():
+        if isinstance(value, np.ndarray):
+            if value.dtype.kind == "f":
+                value = np.where(np.isnan(value), None, value)
+            else:
+                value = np.where(value < 0, None, value.astype(object))
+            value = value.tolist()
+        reply[key] = value
+    return reply
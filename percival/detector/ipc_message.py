@@ -27,6 +27,7 @@ class IpcMessage(object):
     MSG_VAL_NOTIFY_FRAME_READY = 2  # Frame ready notification message
     MSG_VAL_NOTIFY_FRAME_RELEASE = 3  # Frame release notification message
     MSG_VAL_CMD_CONFIGURE = 4  # Configure command message
+    MSG_VAL_NOTIFY_EVENT = 5  # Status change events notification message
 
     def __init__(self, msg_type=None, msg_val=None, from_str=None):
 
@@ -0,0 +1,282 @@
+"""
+A bounded queue of detector commands (jobs).
+
+Each command submitted to the detector is wrapped in a :class:`Job` which is given a unique ID and
+records its state, timestamps and result.  Jobs are executed one at a time in submission order by the
+detector command thread.  Queued jobs can be cancelled and any job still held in the history can be
+queried by its ID.  A sequence of commands can be submitted as a group; if one of the jobs of a sequence
+fails, the remaining queued jobs of that sequence are cancelled.
+"""
+from __future__ import print_function
+
+from collections import OrderedDict, deque
+from datetime import datetime
+import logging
+import threading
+
+from percival.detector.errors import PercivalDetectorError
+
+
+class Job(object):
+    """
+    A command submitted to the detector along with its execution state
+    """
+    QUEUED = 'Queued'
+    ACTIVE = 'Active'
+    COMPLETED = 'Completed'
+    FAILED = 'Failed'
+    CANCELLED = 'Cancelled'
+
+    def __init__(self, job_id, command, sequence=None):
+        """ Job constructor.
+
+        :param job_id: Unique ID of the job
+        :type  job_id: int
+        :param command: The command to execute
+        :type  command: percival.detector.command.Command
+        :param sequence: ID of the sequence this job is part of (None if submitted on its own)
+        :type  sequence: int
+        """
+        self._id = job_id
+        self._command = command
+        self._sequence = sequence
+        self._state = Job.QUEUED
+        self._message = ''
+        self._result = None
+        self._queued_time = datetime.now()
+        self._start_time = None
+        self._finish_time = None
+
+    @property
+    def id(self):
+        return self._id
+
+    @property
+    def command(self):
+        return self._command
+
+    @property
+    def sequence(self):
+        return self._sequence
+
+    @property
+    def state(self):
+        return self._state
+
+    @property
+    def message(self):
+        return self._message
+
+    @property
+    def result(self):
+        return self._result
+
+    @property
+    def finished(self):
+        return self._state in (Job.COMPLETED, Job.FAILED, Job.CANCELLED)
+
+    def start(self):
+        self._state = Job.ACTIVE
+        self._start_time = datetime.now()
+
+    def finish(self, success, message='', result=None):
+        if success:
+            self._state = Job.COMPLETED
+        else:
+            self._state = Job.FAILED
+        self._message = message
+        self._result = result
+        self._finish_time = datetime.now()
+
+    def cancel(self, message='Cancelled'):
+        self._state = Job.CANCELLED
+        self._message = message
+        self._finish_time = datetime.now()
+
+    @staticmethod
+    def _format_time(timestamp):
+        if timestamp:
+            return str(timestamp)
+        return ''
+
+    def get_status(self):
+        return {'id': self._id,
+                'sequence': self._sequence if self._sequence is not None else '',
+                'response': self._state,
+                'error': self._message,
+                'command': self._command.command_name,
+                'param_names': self._command.param_names,
+                'parameters': self._command.parameters,
+                'time': self._command.command_time,
+                'queued': self._format_time(self._queued_time),
+                'started': self._format_time(self._start_time),
+                'finished': self._format_time(self._finish_time),
+                'result': self._result if self._result is not None else {}
+                }
+
+
+class JobQueue(object):
+    """
+    Thread safe bounded queue of jobs with a history of finished jobs.
+    """
+
+    def __init__(self, max_queued=64, max_history=256):
+        """ JobQueue constructor.
+
+        :param max_queued: Maximum number of jobs waiting to be executed
+        :type  max_queued: int
+        :param max_history: Maximum number of finished jobs retained for querying
+        :type  max_history: int
+        """
+        self._log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
+        self._max_queued = max_queued
+        self._max_history = max_history
+        self._condition = threading.Condition()
+        self._queued = deque()
+        self._jobs = OrderedDict()
+        self._next_id = 1
+        self._next_sequence = 1
+        self._active = None
+        self._running = True
+
+    @property
+    def active(self):
+        return self._active
+
+    @property
+    def queued(self):
+        with self._condition:
+            return len(self._queued)
+
+    def _create_job(self, command, sequence):
+        job = Job(self._next_id, command, sequence)
+        self._next_id += 1
+        self._jobs[job.id] = job
+        self._queued.append(job)
+        return job
+
+    def _trim_history(self):
+        # Drop the oldest finished jobs; queued and active jobs are always kept
+        excess = len(self._jobs) - self._max_history
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].finished:
+                del self._jobs[job_id]
+                excess -= 1
+
+    def submit(self, command):
+        """
+        Queue a single command for execution.
+
+        :param command: The command to execute
+        :returns: The queued job
+        :rtype: Job
+        """
+        return self.submit_sequence([command])[0]
+
+    def submit_sequence(self, commands):
+        """
+        Queue a list of commands to be executed in order.  If more than one command is supplied the jobs
+        are given a common sequence ID.
+
+        :param commands: The commands to execute
+        :returns: The queued jobs
+        :rtype: list
+        """
+        with self._condition:
+            if not self._running:
+                raise PercivalDetectorError("Cannot submit command, the command queue has been shut down")
+            if len(self._queued) + len(commands) > self._max_queued:
+                raise PercivalDetectorError("Cannot submit {} command(s), the command queue is full "
+                                            "({} queued)".format(len(commands), len(self._queued)))
+            sequence = None
+            if len(commands) > 1:
+                sequence = self._next_sequence
+                self._next_sequence += 1
+            jobs = [self._create_job(command, sequence) for command in commands]
+            self._trim_history()
+            self._condition.notify_all()
+        self._log.debug("Queued job(s) %s", [job.id for job in jobs])
+        return jobs
+
+    def get(self):
+        """
+        Wait for the next queued job and mark it as active.
+
+        :returns: The job to execute, or None once the queue has been shut down
+        :rtype: Job
+        """
+        with self._condition:
+            while self._running and not self._queued:
+                self._condition.wait()
+            if not self._running:
+                return None
+            job = self._queued.popleft()
+            job.start()
+            self._active = job
+            return job
+
+    def finish(self, job, success, message='', result=None):
+        """
+        Record the outcome of an executed job.  A failure cancels the rest of the job's sequence.
+        """
+        with self._condition:
+            job.finish(success, message, result)
+            if not success and job.sequence is not None:
+                for queued in list(self._queued):
+                    if queued.sequence == job.sequence:
+                        self._queued.remove(queued)
+                        queued.cancel("Cancelled after failure of job {}".format(job.id))
+            self._condition.notify_all()
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued job.  Active and finished jobs cannot be cancelled.
+
+        :returns: True if the job was cancelled
+        """
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job.state != Job.QUEUED:
+                return False
+            self._queued.remove(job)
+            job.cancel()
+            self._condition.notify_all()
+        self._log.debug("Cancelled job %d", job_id)
+        return True
+
+    def cancel_sequence(self, sequence):
+        """
+        Cancel all queued jobs of a sequence.
+
+        :returns: The number of jobs cancelled
+        """
+        with self._condition:
+            cancelled = [job for job in self._queued if job.sequence == sequence]
+            for job in cancelled:
+                self._queued.remove(job)
+                job.cancel()
+            self._condition.notify_all()
+        return len(cancelled)
+
+    def get_job(self, job_id):
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def get_status(self):
+        with self._condition:
+            return {'active': self._active.id if self._active and not self._active.finished else '',
+                    'queued': [job.id for job in self._queued],
+                    'jobs': [job.get_status() for job in self._jobs.values()]
+                    }
+
+    def shutdown(self):
+        """
+        Stop the queue, cancelling any queued jobs and releasing the consumer.
+        """
+        with self._condition:
+            self._running = False
+            while self._queued:
+                self._queued.popleft().cancel("Command queue shut down")
+            self._condition.notify_all()
@@ -0,0 +1,265 @@
+"""
+Autonomous safety rules evaluated on every status read.
+
+Each :class:`SafetyRule` watches a set of monitor channels (monitor groups are expanded to their channels) against a
+high and/or low threshold.  A channel trips when its value crosses a threshold and only clears once it is back
+inside the thresholds by the rule's hysteresis.  A rule trips when any of its channels trips; its action is taken
+once, when it trips, and the rule is armed again when all of its channels have cleared.
+
+The :class:`SafetyEngine` compiles the channels of every rule into threshold arrays, so each status snapshot is
+checked with a few array operations however many rules are loaded.  The actions are taken by a callback of the
+detector at abort priority, bypassing the command queue.  Each trip is recorded with the time from the start of
+the status read to the detection and from the detection until the action has been taken.
+
+Rules are loaded from an INI file with a section per rule::
+
+    [Safety_rule<0000>]
+    Rule_name = "Carrier_overtemperature"
+    # Monitor groups or channels, comma separated
+    Channels = "Temperatures"
+    High_threshold = 60.0
+    Low_threshold = -20.0
+    Hysteresis = 2.0
+    # "setpoint" for a safety scan to a set-point, or "system_command"
+    Action = "setpoint"
+    Setpoint = "SAFE_OFF"
+    # Steps and dwell (ms) of the safety scan
+    Steps = 10
+    Dwell = 100
+"""
+from __future__ import division
+
+from collections import deque
+from datetime import datetime
+import logging
+import threading
+import time
+
+import numpy as np
+
+from percival.clock import monotonic
+from percival.detector.history import channel_value
+
+SAFETY_ACTIONS = ["setpoint", "system_command"]
+
+
+class SafetyRule(object):
+    """
+    A threshold rule over a set of monitor channels and the action taken when it trips.
+    """
+    def __init__(self, name, channels, action, target, high=None, low=None, hysteresis=0.0, steps=10, dwell=100.0,
+                 enabled=True):
+        """
+        :param name: Name of the rule
+        :param channels: Names of the monitor groups or channels watched
+        :type  channels: list
+        :param action: "setpoint" (safety scan to a set-point) or "system_command"
+        :param target: Name of the set-point or of the system command
+        :param high: Value above which a channel trips, None for no high threshold
+        :param low: Value below which a channel trips, None for no low threshold
+        :param hysteresis: Distance inside the thresholds a channel must return to before it clears
+        :param steps: Number of steps of the safety scan
+        :param dwell: Dwell time (ms) of each step of the safety scan
+        :param enabled: False to load the rule without evaluating it
+        """
+        if action not in SAFETY_ACTIONS:
+            raise ValueError("Safety rule {} has an invalid action {}".format(name, action))
+        if not target:
+            raise ValueError("Safety rule {} has no set-point or system command to apply".format(name))
+        if high is None and low is None:
+            raise ValueError("Safety rule {} has no thresholds".format(name))
+        self.name = name
+        self.channels = list(channels)
+        self.action = action
+        self.target = target
+        self.high = high
+        self.low = low
+        self.hysteresis = hysteresis
+        self.steps = steps
+        self.dwell = dwell
+        self.enabled = enabled
+
+    @classmethod
+    def from_ini(cls, name, options):
+        """
+        Create a rule from the options of its INI section.
+
+        :param name: Name of the rule
+        :param options: Option values of the section, keyed by option name
+        :type  options: dict
+        """
+        action = options.get("Action", "").strip()
+        target = options.get("Setpoint" if action == "setpoint" else "Command", "").strip()
+        high = options.get("High_threshold")
+        low = options.get("Low_threshold")
+        return cls(name,
+                   [channel.strip() for channel in options.get("Channels", "").split(",") if channel.strip()],
+                   action,
+                   target,
+                   float(high) if high else None,
+                   float(low) if low else None,
+                   float(options.get("Hysteresis", 0.0)),
+                   int(options.get("Steps", 10)),
+                   float(options.get("Dwell", 100.0)),
+                   options.get("Enabled", "true").strip().lower() not in ["false", "no", "off", "0"])
+
+    def as_dict(self):
+        return {"name": self.name,
+                "channels": self.channels,
+                "action": self.action,
+                "target": self.target,
+                "high": self.high,
+                "low": self.low,
+                "hysteresis": self.hysteresis,
+                "enabled": self.enabled}
+
+
+class SafetyEngine(object):
+    """
+    Evaluation of the safety rules against each status snapshot.
+    """
+    def __init__(self, act, max_events=100):
+        """
+        :param act: Callable taking a :class:`SafetyRule` and the names of its tripped channels, which takes the
+                    action of the rule
+        :param max_events: Number of trips held in the event log
+        """
+        self._log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
+        self._act = act
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=max_events)
+        self._latencies = deque(maxlen=max_events)
+        self._trips = 0
+        self.load([], lambda names: names)
+
+    def load(self, rules, expand):
+        """
+        Compile a set of rules, replacing the rules loaded before.  Every rule is armed.
+
+        :param rules: The rules
+        :type  rules: list of :obj:`SafetyRule`
+        :param expand: Callable expanding a list of monitor group or channel names to monitor channel names
+        """
+        names = []
+        columns = {}
+        entries = []
+        for index, rule in enumerate(rules):
+            if not rule.enabled:
+                continue
+            for channel in expand(rule.channels):
+                if channel not in columns:
+                    columns[channel] = len(names)
+                    names.append(channel)
+                entries.append((index, columns[channel]))
+        with self._lock:
+            self._rules = list(rules)
+            self._channels = names
+            self._rule = np.array([rule for rule, channel in entries], dtype=np.int64)
+            self._column = np.array([channel for rule, channel in entries], dtype=np.int64)
+            self._high = np.array([np.inf if rules[rule].high is None else rules[rule].high
+                                   for rule, channel in entries])
+            self._low = np.array([-np.inf if rules[rule].low is None else rules[rule].low
+                                  for rule, channel in entries])
+            self._hysteresis = np.array([rules[rule].hysteresis for rule, channel in entries])
+            self._tripped = np.zeros(len(entries), dtype=bool)
+            self._rule_tripped = np.zeros(len(rules), dtype=bool)
+        self._log.info("Loaded %d safety rules over %d channels", len(rules), len(names))
+
+    @property
+    def rules(self):
+        return list(self._rules)
+
+    @property
+    def channels(self):
+        """Names of the monitor channels watched by the rules"""
+        return list(self._channels)
+
+    def evaluate(self, snapshot):
+        """
+        Check the monitor values read into a status snapshot against the rules, taking the action of each rule
+        which trips.  Channels which were not read keep their state.
+
+        :param snapshot: The status snapshot
+        :type  snapshot: :obj:`percival.detector.status_service.StatusSnapshot`
+        :returns: The events of the rules which tripped
+        :rtype: list
+        """
+        with self._lock:
+            if len(self._rule) == 0:
+                return []
+            # Only the channels read into this snapshot are checked, the values carried over from earlier reads
+            # may be stale
+            updated = set(snapshot.updated)
+            values = np.array([channel_value(snapshot.channels[name]) if name in updated else np.nan
+                               for name in self._channels], dtype=float)[self._column]
+            # Comparisons with missing values (NaN) are False, so a missing value neither trips nor clears
+            with np.errstate(invalid="ignore"):
+                outside = (values > self._high) | (values < self._low)
+                inside = (values <= self._high - self._hysteresis) & (values >= self._low + self._hysteresis)
+            self._tripped = (self._tripped | outside) & ~inside
+            tripped = np.bincount(self._rule, weights=self._tripped, minlength=len(self._rules)) > 0
+            triggered = np.flatnonzero(tripped & ~self._rule_tripped)
+            self._rule_tripped = tripped
+            detected = time.time()
+            trips = []
+            for index in triggered:
+                entries = np.flatnonzero((self._rule == index) & self._tripped)
+                trips.append((self._rules[index], [self._channels[self._column[entry]] for entry in entries],
+                              values[entries].tolist()))
+        # The actions are taken outside of the lock so that the status can be read while they run
+        return [self._trigger(rule, channels, values, detected - snapshot.read_time)
+                for rule, channels, values in trips]
+
+    def _trigger(self, rule, channels, values, read_to_detection):
+        self._log.critical("Safety rule %s tripped by %s = %s, taking action %s %s", rule.name, channels, values,
+                           rule.action, rule.target)
+        start = monotonic()
+        success = True
+        message = ""
+        try:
+            self._act(rule, channels)
+        except Exception as ex:
+            success = False
+            message = str(ex)
+            self._log.critical("Safety action of rule %s failed: %s", rule.name, message)
+        latency = monotonic() - start
+        event = {"rule": rule.name,
+                 "channels": channels,
+                 "values": values,
+                 "action": rule.action,
+                 "target": rule.target,
+                 "time": str(datetime.now()),
+                 "read_to_detection": read_to_detection,
+                 "detection_to_action": latency,
+                 "success": success,
+                 "message": message}
+        with self._lock:
+            self._events.append(event)
+            self._latencies.append(latency)
+            self._trips += 1
+        return event
+
+    def get_status(self):
+        """
+        :returns: Dictionary of the rules and whether each is tripped, the tripped channels, the recent trips and the
+                  detection to action latency (seconds) of the last trip, with the mean and maximum over the recent
+                  trips
+        :rtype: dict
+        """
+        with self._lock:
+            rules = []
+            for index, rule in enumerate(self._rules):
+                status = rule.as_dict()
+                status["tripped"] = bool(self._rule_tripped[index])
+                rules.append(status)
+            status = {"rules": rules,
+                      "tripped": sorted(set(self._channels[self._column[entry]]
+                                            for entry in np.flatnonzero(self._tripped))),
+                      "events": list(self._events),
+                      "latency": {"count": self._trips}}
+            if self._latencies:
+                latencies = np.array(self._latencies)
+                status["latency"].update({"last": float(latencies[-1]),
+                                          "mean": float(latencies.mean()),
+                                          "max": float(latencies.max())})
+        return status
@@ -0,0 +1,144 @@
+"""
+Multi-dimensional set-point scans.
+
+A grid scan moves a group of control channels through each point of every dimension of a grid: the first dimension
+is the outermost (slowest) and the last the innermost.  Each dimension scans its own channels, either through a
+sequence of set-points or between start and stop values.  With snake ordering every other pass of a dimension runs
+backwards, so that consecutive steps only ever move one dimension by one point.
+
+Each dimension has its own dwell, the time a step is held after that dimension has moved, so an outer dimension
+which needs a long settle time does not slow down the inner dimensions.  A :class:`GridPlan` is a
+:class:`percival.detector.scan_plan.ScanPlan` and is executed in the same way.
+"""
+from __future__ import division
+
+import numpy as np
+
+from percival.detector.scan_plan import ScanPlan, interpolate
+
+
+def grid_indices(sizes, snake=True):
+    """
+    Return the index into each dimension of every step of a grid scan.
+
+    :param sizes: Number of points of each dimension, outermost first
+    :param snake: Reverse every other pass of each dimension
+    :returns: Matrix of steps by dimensions
+    :rtype: numpy.ndarray
+    """
+    total = int(np.prod(sizes)) if len(sizes) else 0
+    steps = np.arange(total)
+    indices = np.empty((total, len(sizes)), dtype=np.int64)
+    inner = total
+    for dimension, size in enumerate(sizes):
+        inner //= size
+        index = (steps // inner) % size
+        if snake:
+            # Passes of the dimension are counted by the steps of the dimensions outside it
+            passes = steps // (inner * size)
+            index = np.where(passes % 2 == 1, size - 1 - index, index)
+        indices[:, dimension] = index
+    return indices
+
+
+class GridDimension(object):
+    """
+    One dimension of a grid scan: the values of its channels at each of its points.
+    """
+    def __init__(self, channels, values, dwell):
+        """
+        :param channels: Names of the control channels
+        :type  channels: list
+        :param values: Matrix of channels by points
+        :param dwell: Time a step is held after this dimension has moved (seconds)
+        """
+        self._channels = list(channels)
+        self._values = np.asarray(values, dtype=np.int64).reshape(len(self._channels), -1)
+        self._dwell = dwell
+        if self.size == 0:
+            raise ValueError("A scan dimension must have at least one point")
+
+    @classmethod
+    def from_set_points(cls, channels, values, steps, dwell):
+        """
+        Create a dimension through a sequence of set-points.
+
+        :param channels: Names of the control channels
+        :param values: Matrix of channels by set-points
+        :param steps: Number of steps between (and including) each pair of consecutive set-points
+        :param dwell: Time a step is held after this dimension has moved (seconds)
+        """
+        points = interpolate(values, steps)
+        if steps > 1:
+            # Each set-point between two segments ends one segment and starts the next, keep it once
+            keep = np.ones(points.shape[1], dtype=bool)
+            keep[steps::steps] = False
+            points = points[:, keep]
+        return cls(channels, points, dwell)
+
+    @property
+    def channels(self):
+        return list(self._channels)
+
+    @property
+    def values(self):
+        return self._values
+
+    @property
+    def size(self):
+        return self._values.shape[1]
+
+    @property
+    def dwell(self):
+        return self._dwell
+
+
+class GridPlan(ScanPlan):
+    """
+    A grid scan compiled into a step matrix.
+    """
+    def __init__(self, dimensions, snake=True):
+        """
+        :param dimensions: Dimensions of the grid, outermost first
+        :type  dimensions: list of :obj:`GridDimension`
+        :param snake: Reverse every other pass of each dimension
+        """
+        channels = [channel for dimension in dimensions for channel in dimension.channels]
+        if len(set(channels)) != len(channels):
+            raise ValueError("A channel can only be scanned by one dimension of a grid", channels)
+        self._dimensions = list(dimensions)
+        self._snake = snake
+        self._indices = grid_indices([dimension.size for dimension in dimensions], snake)
+        points = [dimension.values[:, self._indices[:, index]] for index, dimension in enumerate(dimensions)]
+        # Each step is held for the longest dwell of the dimensions which moved into it
+        moved = np.ones(self._indices.shape, dtype=bool)
+        moved[1:] = self._indices[1:] != self._indices[:-1]
+        dwells = np.array([dimension.dwell for dimension in dimensions], dtype=float)
+        holds = np.where(moved, dwells[np.newaxis, :], 0.0).max(axis=1) if len(dimensions) else []
+        super(GridPlan, self).__init__(channels, np.vstack(points) if points else [], holds)
+
+    @property
+    def shape(self):
+        """Number of points of each dimension"""
+        return [dimension.size for dimension in self._dimensions]
+
+    @property
+    def snake(self):
+        return self._snake
+
+    @property
+    def indices(self):
+        """Matrix of steps by dimensions, the index into each dimension of every step"""
+        return self._indices
+
+    def get_progress(self, step):
+        """
+        :param step: Number of steps applied
+        :returns: Progress of the scan (see :meth:`ScanPlan.get_progress`), with the shape of the grid and the
+                  position in each dimension of the last step applied
+        """
+        progress = super(GridPlan, self).get_progress(step)
+        progress["shape"] = self.shape
+        if 0 < step <= self.steps:
+            progress["position"] = self._indices[step - 1].tolist()
+        return progress
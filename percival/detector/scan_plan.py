@@ -0,0 +1,248 @@
+"""
+Compiled set-point scans.
+
+A :class:`ScanPlan` holds a whole scan as a matrix of channels by steps of integer demands, along with a mask of
+the demands which differ from the previous step (only those are written to the hardware).  The plan is built
+once, with vectorised interpolation between the set-points, and executed against absolute deadlines: step n is
+applied at start + n * dwell on a monotonic clock, so the time spent writing the demands does not accumulate and a
+scan finishes at a predictable time.  The lateness of each step against its deadline is recorded.
+
+A ramp (:meth:`ScanPlan.from_ramp`) moves every channel towards its target at no more than its own maximum slew
+rate, all channels concurrently: the demand of each channel is a function of the time since the start of the
+ramp, sampled every tick.  The ramp takes as long as its slowest channel.  A ramp plan catches up when its writes
+overrun a tick, skipping to the latest step due rather than falling behind.
+
+The dwell may also be given per step, the time each step is held before the next, for scans whose steps settle
+for different times (:class:`percival.detector.scan_grid.GridPlan`).
+"""
+from __future__ import division
+
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from percival.clock import monotonic
+
+
+def interpolate(values, steps):
+    """
+    Interpolate linearly between consecutive set-points.
+
+    Each segment between two set-points is the same as numpy.linspace(start, stop, steps, dtype=int) for every
+    channel, computed for all channels at once.
+
+    :param values: Matrix of channels by set-points
+    :param steps: Number of steps of each segment (including both of its end points)
+    :returns: Matrix of channels by (set-points - 1) * steps integer demands
+    :rtype: numpy.ndarray
+    """
+    values = np.asarray(values, dtype=float)
+    channels, count = values.shape
+    points = np.empty((channels, (count - 1) * steps), dtype=np.int64)
+    fractions = np.arange(steps, dtype=float)
+    for segment in range(count - 1):
+        start = values[:, segment]
+        stop = values[:, segment + 1]
+        if steps > 1:
+            demands = start[:, np.newaxis] + fractions[np.newaxis, :] * ((stop - start) / (steps - 1))[:, np.newaxis]
+            demands[:, -1] = stop
+        else:
+            demands = start[:, np.newaxis]
+        points[:, segment * steps:(segment + 1) * steps] = demands.astype(np.int64)
+    return points
+
+
+def ramp(start, target, slew, period):
+    """
+    Sample the demands of channels moving from start to target values at their maximum slew rates.
+
+    The demand of each channel at time t is start + min(slew * t, |target - start|) towards the target, rounded
+    towards the start so that the slew rate is never exceeded.  The last step holds every target.
+
+    :param start: Start value of each channel
+    :param target: Target value of each channel
+    :param slew: Maximum slew rate (counts per second) of each channel, 0 for no limit
+    :param period: Time between steps (seconds)
+    :returns: Matrix of channels by steps integer demands
+    :rtype: numpy.ndarray
+    """
+    start = np.asarray(start, dtype=float)
+    target = np.asarray(target, dtype=float)
+    slew = np.asarray(slew, dtype=float)
+    distance = np.abs(target - start)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        durations = np.where(slew > 0.0, distance / slew, 0.0)
+    duration = float(durations.max()) if len(durations) else 0.0
+    steps = int(np.ceil(duration / period)) + 1 if period > 0.0 else 1
+    times = np.arange(steps, dtype=float) * period
+    travelled = np.where(slew[:, np.newaxis] > 0.0, slew[:, np.newaxis] * times[np.newaxis, :], np.inf)
+    travelled = np.floor(np.minimum(travelled, distance[:, np.newaxis]))
+    points = start[:, np.newaxis] + np.sign(target - start)[:, np.newaxis] * travelled
+    points[:, -1] = target
+    return np.round(points).astype(np.int64)
+
+
+class ScanPlan(object):
+    """
+    A set-point scan compiled into a step matrix, with the timing of its execution.
+    """
+    def __init__(self, channels, points, dwell, catch_up=False):
+        """
+        :param channels: Names of the control channels
+        :type  channels: list
+        :param points: Matrix of channels by steps of demands
+        :param dwell: Time between the start of consecutive steps (seconds), or the time each step is held
+        :param catch_up: Skip to the latest step due when steps are overdue, rather than applying every step
+        """
+        self._channels = list(channels)
+        self._points = np.asarray(points, dtype=np.int64).reshape(len(self._channels), -1)
+        self._dwell = dwell
+        # Time of each step from the start of the scan
+        holds = np.broadcast_to(np.asarray(dwell, dtype=float), (self.steps,))
+        self._offsets = np.concatenate([[0.0], np.cumsum(holds[:-1])]) if self.steps else np.zeros(0)
+        self._catch_up = catch_up
+        self._changes = np.ones(self._points.shape, dtype=bool)
+        self._changes[:, 1:] = self._points[:, 1:] != self._points[:, :-1]
+        self._lateness = np.full(self.steps, np.nan)
+        self._start = None
+        self._start_time = None
+
+    @classmethod
+    def from_set_points(cls, channels, values, steps, dwell):
+        """
+        Compile a scan through a sequence of set-points.
+
+        :param channels: Names of the control channels
+        :param values: Matrix of channels by set-points
+        :param steps: Number of steps between (and including) each pair of consecutive set-points
+        :param dwell: Time between the start of consecutive steps (seconds)
+        """
+        return cls(channels, interpolate(values, steps), dwell)
+
+    @classmethod
+    def from_ramp(cls, channels, start, target, slew, period):
+        """
+        Compile a ramp of every channel from its start to its target value at its maximum slew rate.
+
+        :param channels: Names of the control channels
+        :param start: Start value of each channel
+        :param target: Target value of each channel
+        :param slew: Maximum slew rate (counts per second) of each channel, 0 for no limit
+        :param period: Time between steps (seconds)
+        """
+        return cls(channels, ramp(start, target, slew, period), period, catch_up=True)
+
+    @property
+    def channels(self):
+        return list(self._channels)
+
+    @property
+    def points(self):
+        return self._points
+
+    @property
+    def changes(self):
+        """Mask of channels by steps, True where a demand has to be written"""
+        return self._changes
+
+    @property
+    def steps(self):
+        return self._points.shape[1]
+
+    @property
+    def dwell(self):
+        """Time between the start of consecutive steps (seconds), or the time each step is held"""
+        return self._dwell
+
+    @property
+    def catch_up(self):
+        return self._catch_up
+
+    @property
+    def duration(self):
+        """Time from the first step to the last step (seconds)"""
+        return float(self._offsets[-1]) if self.steps else 0.0
+
+    @property
+    def lateness(self):
+        """Time (seconds) each executed step started after its deadline, NaN for steps not executed"""
+        return self._lateness
+
+    def writes(self, step, previous=None):
+        """
+        Return the (channel, demand) pairs to write at a step.
+
+        :param step: Index of the step
+        :param previous: Index of the step applied before, defaults to the step before
+        """
+        if previous is None or previous == step - 1:
+            changed = np.flatnonzero(self._changes[:, step])
+        else:
+            changed = np.flatnonzero(self._points[:, step] != self._points[:, previous])
+        return [(self._channels[index], int(self._points[index, step])) for index in changed]
+
+    def due_step(self, step):
+        """
+        Return the step to apply next: the given step, or for a plan which catches up the latest step already due
+        (never beyond the last step).
+        """
+        if not self._catch_up or self._start is None:
+            return step
+        due = int(np.searchsorted(self._offsets, monotonic() - self._start, side="right")) - 1
+        return min(max(step, due), self.steps - 1)
+
+    def start(self):
+        """Start the clock of the scan; step 0 is due immediately"""
+        self._start = monotonic()
+        self._start_time = datetime.now()
+        self._lateness[:] = np.nan
+
+    def deadline(self, step):
+        """Monotonic clock time at which a step is due"""
+        return self._start + self._offsets[step]
+
+    def time_to(self, step):
+        """Time (seconds) until a step is due, negative if it is overdue"""
+        return self.deadline(step) - monotonic()
+
+    def record(self, step):
+        """Record that a step has started now"""
+        self._lateness[step] = monotonic() - self.deadline(step)
+
+    def get_progress(self, step):
+        """
+        :param step: Number of steps applied
+        :returns: Dictionary of the steps applied out of the total, the fraction complete and the time (seconds)
+                  elapsed and remaining
+        """
+        progress = {"step": step,
+                    "steps": self.steps,
+                    "fraction": float(step) / self.steps if self.steps else 1.0}
+        if self._start is not None:
+            elapsed = monotonic() - self._start
+            progress["elapsed"] = elapsed
+            progress["remaining"] = max(self.duration - elapsed, 0.0) if step < self.steps else 0.0
+        return progress
+
+    def as_dict(self):
+        """Return the demands of each channel, keyed by channel name"""
+        return {channel: self._points[index] for index, channel in enumerate(self._channels)}
+
+    def get_timing(self):
+        """
+        :returns: Dictionary of the scan timing: start and expected end, dwell, and the lateness (seconds) of each
+                  step executed with its summary statistics
+        """
+        executed = self._lateness[~np.isnan(self._lateness)]
+        timing = {"steps": self.steps,
+                  "executed": len(executed),
+                  "dwell": np.asarray(self._dwell).tolist(),
+                  "lateness": executed.tolist()}
+        if self._start_time is not None:
+            timing["start"] = str(self._start_time)
+            timing["expected_end"] = str(self._start_time + timedelta(seconds=self.duration))
+        if len(executed):
+            timing["mean_lateness"] = float(executed.mean())
+            timing["max_lateness"] = float(executed.max())
+            timing["jitter"] = float(executed.std())
+        return timing
@@ -0,0 +1,162 @@
+"""
+Recording of monitor channels at every step of a set-point scan.
+
+A :class:`ScanRecorder` captures a fresh read of a set of monitor channels once each scan step has settled.
+The demands written at the step and the values read are held in arrays of steps by channels, which clients can
+retrieve once the scan is complete, and optionally streamed to a chunked HDF5 file as the scan progresses:
+
+- ``/time``: time of each read (seconds since the epoch)
+- ``/step``: index of the scan step of each read
+- ``/demands``: steps by control channels, the demands applied (attribute ``channels`` holds their names)
+- ``/monitors/<field>``: steps by monitor channels, for each of value, raw_value, sample_number and flags
+  (attribute ``channels`` of the group holds their names)
+
+Channels which could not be read hold NaN (value) or -1 (integer fields).
+"""
+from __future__ import division
+
+import logging
+import time
+
+import h5py
+import numpy as np
+
+from percival.carrier.monitor_ring import encode_flags
+from percival.detector.history import channel_value, to_lists
+
+MONITOR_FIELDS = [("value", float), ("raw_value", np.int32), ("sample_number", np.int16), ("flags", np.int16)]
+
+
+class ScanRecorder(object):
+    """
+    Capture of monitor channels at each step of a scan, in memory and optionally to an HDF5 file.
+    """
+    def __init__(self, channels, read_channels, filename=None, chunk_rows=64):
+        """
+        :param channels: Names of the monitor channels to record
+        :type  channels: list
+        :param read_channels: Callable taking a list of channel names and returning a fresh status dictionary of
+                              each channel read, keyed by name
+        :param filename: HDF5 file to stream the records to, None to record in memory only
+        :param chunk_rows: Number of steps per HDF5 chunk; the file is written and flushed every chunk
+        """
+        self._log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
+        self._channels = list(channels)
+        self._read_channels = read_channels
+        self._filename = filename
+        self._chunk_rows = chunk_rows
+        self._file = None
+        self._plan = None
+        self._data = {}
+        self._rows = 0
+        self._written = 0
+
+    @property
+    def channels(self):
+        return list(self._channels)
+
+    @property
+    def filename(self):
+        return self._filename
+
+    @property
+    def rows(self):
+        """Number of steps recorded"""
+        return self._rows
+
+    def open(self, plan):
+        """
+        Prepare to record a scan.
+
+        :param plan: The compiled scan
+        :type  plan: :obj:`percival.detector.scan_plan.ScanPlan`
+        """
+        self._plan = plan
+        self._rows = 0
+        self._written = 0
+        steps = plan.steps
+        channels = len(self._channels)
+        self._data = {"time": np.full(steps, np.nan),
+                      "step": np.full(steps, -1, dtype=np.int32),
+                      "demands": np.full((steps, len(plan.channels)), -1, dtype=np.int64)}
+        for field, dtype in MONITOR_FIELDS:
+            self._data[field] = np.full((steps, channels), np.nan if dtype is float else -1, dtype=dtype)
+        if self._filename:
+            # Never overwrite an existing file
+            self._file = h5py.File(self._filename, "w-")
+            self._file.attrs["steps"] = steps
+            self._file.attrs["dwell"] = plan.dwell
+            chunk_rows = max(1, min(self._chunk_rows, steps))
+            for name in ["time", "step"]:
+                self._file.create_dataset(name, shape=(0,), maxshape=(None,), chunks=(chunk_rows,),
+                                          dtype=self._data[name].dtype)
+            demands = self._file.create_dataset("demands", shape=(0, len(plan.channels)),
+                                                maxshape=(None, len(plan.channels)),
+                                                chunks=(chunk_rows, max(1, len(plan.channels))), dtype=np.int64)
+            demands.attrs["channels"] = [name.encode("utf-8") for name in plan.channels]
+            group = self._file.create_group("monitors")
+            group.attrs["channels"] = [name.encode("utf-8") for name in self._channels]
+            for field, dtype in MONITOR_FIELDS:
+                group.create_dataset(field, shape=(0, channels), maxshape=(None, channels),
+                                     chunks=(chunk_rows, max(1, channels)), dtype=dtype)
+            self._log.info("Recording scan of %d steps to %s", steps, self._filename)
+
+    def record(self, step):
+        """
+        Read the monitor channels and record them against a scan step.
+
+        :param step: Index of the scan step which has been applied
+        """
+        read_time = time.time()
+        status = self._read_channels(self._channels)
+        row = self._rows
+        self._data["time"][row] = read_time
+        self._data["step"][row] = step
+        self._data["demands"][row] = self._plan.points[:, step]
+        read = [index for index, name in enumerate(self._channels) if name in status]
+        statuses = [status[self._channels[index]] for index in read]
+        self._data["value"][row, read] = [channel_value(channel) for channel in statuses]
+        self._data["raw_value"][row, read] = [channel.get("raw_value", -1) for channel in statuses]
+        self._data["sample_number"][row, read] = [channel.get("sample_number", -1) for channel in statuses]
+        self._data["flags"][row, read] = [encode_flags(channel) & 0xFF for channel in statuses]
+        self._rows += 1
+        if self._file is not None and self._rows - self._written >= self._chunk_rows:
+            self._write()
+
+    def _write(self):
+        # Append the rows recorded since the last write to the file
+        start, end = self._written, self._rows
+        if end > start:
+            datasets = [(self._file["time"], "time"), (self._file["step"], "step"), (self._file["demands"], "demands")]
+            datasets += [(self._file["monitors"][field], field) for field, dtype in MONITOR_FIELDS]
+            for dataset, name in datasets:
+                dataset.resize(end, axis=0)
+                dataset[start:end] = self._data[name][start:end]
+            self._written = end
+        self._file.flush()
+
+    def close(self):
+        """Complete the recording, writing any remaining records to the file"""
+        if self._file is not None:
+            self._write()
+            self._file.close()
+            self._file = None
+            self._log.info("Recorded %d scan steps to %s", self._rows, self._filename)
+
+    def get_data(self):
+        """
+        :returns: Dictionary of the recorded arrays as lists (missing values as None), with the names of the monitor
+                  "channels" and control channels ("controls")
+        :rtype: dict
+        """
+        data = {name: values[:self._rows] for name, values in self._data.items()}
+        reply = to_lists(data)
+        reply["channels"] = self.channels
+        reply["controls"] = self._plan.channels if self._plan is not None else []
+        return reply
+
+    def get_status(self):
+        return {"channels": self.channels,
+                "file": self._filename,
+                "rows": self._rows,
+                "steps": self._plan.steps if self._plan is not None else 0}
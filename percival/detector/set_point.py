@@ -5,14 +5,20 @@ Created on 30 May 2017
 
 A class to provide set-point scanning capability for a Percival group of channels.  This class allows set-points
 to be defined along with a number of steps and delay times and executes the required scan for the specified
-control channels.
+control channels.  The set-points are compiled into a :class:`percival.detector.set_point_matrix.SetPointMatrix`
+when they are loaded, scans are compiled into a :class:`percival.detector.scan_plan.ScanPlan` and each step is
+applied at a fixed time from the start of the scan.
 """
 from __future__ import print_function
 
 from datetime import datetime
 import logging
 import threading
-import numpy
+
+from percival.detector.errors import PercivalDetectorError
+from percival.detector.scan_grid import GridDimension, GridPlan
+from percival.detector.scan_plan import ScanPlan
+from percival.detector.set_point_matrix import SetPointMatrix
 
 
 class SetPointControl(object):
@@ -29,6 +35,7 @@ class SetPointControl(object):
         self._log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
         self._detector = detector
         self._set_point_ini = None
+        self._matrix = SetPointMatrix([], [], [], [])
         self._sp_dict = {}
         self._executing = False
         self._scanning = False
@@ -37,19 +44,26 @@ class SetPointControl(object):
         self._wait_for_scan_complete = threading.Event()
         self._start_time = None
         self._scan_index = 0
-        self._scan_delay = 0.0
-        self._scan_steps = 0
         self._thread = None
-        self._scan_points = None
+        self._plan = None
+        self._recorder = None
+        self._settle = 0.0
+        self._last_step = None
         self._error = None
+        self._safety_scan = False
+        self._plan_lock = threading.Lock()
+        # Number of the current (or last) scan, and the number and error of the scan it replaced
+        self._scan_id = 0
+        self._replaced = (None, None)
         self._log.info("SetPointControl object created")
 
     def load_ini(self, set_point_ini):
         if set_point_ini:
             self._log.info("Ini loaded for setpoints: %s", set_point_ini)
             self._set_point_ini = set_point_ini
-            for section in self._set_point_ini.sections:
-                self._sp_dict[self._set_point_ini.get_name(section)] = section
+            # Read all of the set-point values once
+            self._matrix = SetPointMatrix.compile(self._set_point_ini)
+            self._sp_dict = dict(zip(self._matrix.names, self._set_point_ini.sections))
 
     def start_scan_loop(self):
         if not self._executing:
@@ -66,189 +80,297 @@ class SetPointControl(object):
         self._start_scan.set()
         self._stop_scan.set()
 
-    def abort_scan(self):
+    def abort_scan(self, timeout=None, error=None):
+        """
+        Abort the scan in progress.
+
+        :param timeout: Time (seconds) to wait for the scan loop to stop, None to return immediately
+        :param error: Exception raised to the caller waiting for the scan to complete, by default an aborted scan
+                      completes normally
+        :returns: True if the scan loop is idle
+        """
+        if error is not None and self._scanning:
+            self._error = error
         self._scanning = False
         self._stop_scan.set()
+        if not self._executing:
+            return True
+        if timeout is not None:
+            self._wait_for_scan_complete.wait(timeout)
+        return self._wait_for_scan_complete.is_set()
+
+    @property
+    def safety_scan_active(self):
+        """True while a safety scan is in progress"""
+        return self._scanning and self._safety_scan
+
+    def _check_safety_scan(self):
+        # A scan requested by a user must not replace a safety scan in progress
+        if self.safety_scan_active:
+            self._log.error("Scan rejected, a safety scan is in progress")
+            raise PercivalDetectorError("A safety scan is in progress, abort it before starting another scan")
 
     @property
     def set_points(self):
         return self._sp_dict.keys()
 
+    def get_channels(self, set_point):
+        """Return the names of the control channels of a set-point"""
+        return sorted(self._set_point_values(set_point))
+
     def get_description(self, set_point):
         return self._set_point_ini.get_description(self._sp_dict[set_point])
 
+    @property
+    def matrix(self):
+        """The compiled values of the set-points"""
+        return self._matrix
+
     def apply_set_point(self, set_point, device_list=None):
         self._log.info("Apply set point called with: %s", set_point)
         self._log.info("Set point names: %s", self.set_points)
-        if set_point in self.set_points:
-            sps = self._set_point_ini.get_setpoints(self._sp_dict[set_point])
+        if set_point in self._matrix:
+            # If device_list is left as default then apply all values in the set_point, otherwise the values of
+            # the listed devices (or single device) in the set_point
+            sps = self._matrix.get(set_point, device_list or None)
             self._log.info("Set points: %s", sps)
-            # If device_list is left as default then apply all values in the set_point
-            if not device_list:
-                for sp in sps:
-                    value = int(float(sps[sp]))
-                    self._log.info("Applying set_point [%s] = %d", sp, value)
-                    self._detector.set_value(sp, value)
-            elif isinstance(device_list, list):
-                # Iterate through the list setting the set point
-                for item in device_list:
-                    if item in sps:
-                        self._log.debug("Applying set_point [%s] = %d", item, sps[item])
-                        self._detector.set_value(item, sps[item])
-            else:
-                # Single item requested, so execute the set point
-                if device_list in sps:
-                    self._log.debug("Applying set_point [%s] = %d", device_list, sps[device_list])
-                    self._detector.set_value(device_list, sps[device_list])
+            for sp in sps:
+                self._log.info("Applying set_point [%s] = %d", sp, sps[sp])
+                self._detector.set_value(sp, sps[sp])
         else:
             self._log.error("The set point [%s] is not available", set_point)
 
-    def scan_set_points(self, set_points, steps, delay, device_list=None):
-        # Need to create a dictionary of discrete position steps for each channel
-        set_point_map = {}
-        for set_point in set_points:
-            if set_point in self.set_points:
-                sps = self._set_point_ini.get_setpoints(self._sp_dict[set_point])
-                # If device_list is left as default then append all values in the set_point
-                if not device_list:
-                    for sp in sps:
-                        value = int(float(sps[sp]))
-                        self._log.info("Construct scan over set_point [%s] = %d", sp, value)
-                        if sp not in set_point_map:
-                            set_point_map[sp] = []
-                        set_point_map[sp].append(value)
-                elif isinstance(device_list, list):
-                    # Iterate through the list appending the set point
-                    for item in device_list:
-                        if item in sps:
-                            self._log.debug("Construct scan over set_point [%s] = %d", item, sps[item])
-                            if item not in set_point_map:
-                                set_point_map[item] = []
-                            set_point_map[item].append(sps[item])
-                else:
-                    # Single item requested, so append the set point
-                    if device_list in sps:
-                        item = device_list
-                        self._log.debug("Construct scan over set_point [%s] = %d", item, sps[item])
-                        if item not in set_point_map:
-                            set_point_map[item] = []
-                        set_point_map[item].append(sps[item])
-            else:
-                # Serious error, generate exception
-                self._log.error("The set point [%s] is not available", set_point)
-                raise ValueError("Set point is not available", set_point)
-        self._log.debug("Setpoints: %s", set_point_map)
-        # Now use the steps value to create the full scan range
-        self._scan_points = {}
-        for sp in set_point_map:
-            self._scan_points[sp] = numpy.empty([0], dtype=float)
-            if len(set_point_map[sp]) < 2:
-                # Serious error, generate exception
-                self._log.error("Invalid set point values given, check they map the same devices")
-                raise ValueError("Invalid set point values given, check they map the same devices")
-            for index in range(0, len(set_point_map[sp])-1):
-                start_value = set_point_map[sp][index]
-                stop_value = set_point_map[sp][index+1]
-                self._scan_points[sp] = numpy.append(self._scan_points[sp],
-                                                     numpy.linspace(start_value, stop_value, steps, dtype=int))
-        self._log.debug("Scan description: %s", self._scan_points)
-        self._scan_delay = float(delay) / 1000.0
-        self._scan_steps = steps
-        # Now that the set of scan points have been generated for each device notify the scan_loop
-        # that we are ready to begin the scan
-        # First clear the waiting flag
-        self._wait_for_scan_complete.clear()
-        # Set the scanning flag to True
-        self._error = None
-        self._scanning = True
-        self._start_scan.set()
+    def _set_point_values(self, set_point, device_list=None):
+        """
+        Return the values of a set-point for a list of devices (all of the devices of the set-point by default),
+        keyed by device name.
+        """
+        values = self._matrix.get(set_point, device_list or None)
+        for item in values:
+            self._log.debug("Construct scan over set_point [%s] = %s", item, values[item])
+        return values
+
+    def get_distances(self):
+        """
+        Return the distance of every set-point from the current demands of the control channels.
+
+        :returns: Dictionary for each set-point of the largest change of any channel ("max"), the sum of the
+                  changes ("total") and the number of channels which would change ("channels")
+        :rtype: dict
+        """
+        current = {}
+        for channel in self._matrix.channels:
+            try:
+                current[channel] = self._detector.get_value(channel)
+            except PercivalDetectorError:
+                # Channels which are not loaded have no current demand
+                pass
+        return self._matrix.distance(current)
+
+    def scan_set_points(self, set_points, steps, delay, device_list=None, recorder=None, settle=0.0):
+        """
+        Scan through a sequence of set-points.
+
+        :param set_points: Names of the set-points
+        :param steps: Number of steps between (and including) each pair of consecutive set-points
+        :param delay: Dwell time at each step (ms)
+        :param device_list: Control channels to scan, defaults to all of the channels of the set-points
+        :param recorder: Recorder capturing monitor channels at each step (optional)
+        :type  recorder: :obj:`percival.detector.scan_recorder.ScanRecorder`
+        :param settle: Time (ms) after each step is applied before the recorder captures the monitors
+        """
+        self._check_safety_scan()
+        # The values of each channel at each set point, as a matrix of channels by set points
+        if len(set_points) < 2:
+            self._log.error("Invalid set point values given, check they map the same devices")
+            raise ValueError("Invalid set point values given, check they map the same devices")
+        channels, matrix = self._matrix.path(set_points, device_list or None)
+        self._log.debug("Setpoints: %s %s", channels, matrix)
+        plan = ScanPlan.from_set_points(channels, matrix, steps, float(delay) / 1000.0)
+        if recorder is not None:
+            if float(settle) > float(delay):
+                self._log.warning("Settle time %s ms is longer than the dwell time %s ms", settle, delay)
+            recorder.open(plan)
+        self._start_plan(plan, recorder, float(settle) / 1000.0)
+
+    def scan_grid(self, dimensions, snake=True, recorder=None, settle=0.0):
+        """
+        Scan over an N-dimensional grid, the first dimension outermost.  Each dimension is a dictionary of:
+
+        - "setpoints": names of the set-points to scan through, with optional "channels" to scan, or
+        - "channels" (or "channel"): control channels to scan, with "start" and "stop" values (one per channel)
+          or a list of "values" for each channel
+        - "steps": number of steps between the set-points or from start to stop (default 1)
+        - "dwell": time (ms) each step is held after this dimension has moved
+
+        :param dimensions: Description of each dimension
+        :type  dimensions: list
+        :param snake: Reverse every other pass of each dimension, so that each step moves one dimension by one point
+        :param recorder: Recorder capturing monitor channels at each step (optional)
+        :type  recorder: :obj:`percival.detector.scan_recorder.ScanRecorder`
+        :param settle: Time (ms) after each step is applied before the recorder captures the monitors
+        """
+        self._check_safety_scan()
+        if len(dimensions) < 1:
+            raise ValueError("A grid scan requires at least one dimension")
+        plan = GridPlan([self._grid_dimension(dimension) for dimension in dimensions], snake)
+        self._log.info("Grid scan of shape %s, snake ordering %s", plan.shape, snake)
+        if recorder is not None:
+            recorder.open(plan)
+        self._start_plan(plan, recorder, float(settle) / 1000.0)
+
+    def _grid_dimension(self, description):
+        # Compile the description of one dimension of a grid scan
+        if "dwell" not in description:
+            raise ValueError("Dwell time (ms) required for each scan dimension", description)
+        dwell = float(description["dwell"]) / 1000.0
+        steps = int(description.get("steps", 1)) + 1
+        if "setpoints" in description:
+            set_points = description["setpoints"]
+            if not isinstance(set_points, list):
+                set_points = set_points.split(",")
+            channels, values = self._matrix.path(set_points, description.get("channels"))
+            return GridDimension.from_set_points(channels, values, steps, dwell)
+        channels = description.get("channels", description.get("channel"))
+        if channels is None:
+            raise ValueError("No set-points or channels given for a scan dimension", description)
+        if not isinstance(channels, list):
+            channels = [channels]
+        if "values" in description:
+            # A single channel may give its list of values directly
+            rows = description["values"]
+            if len(rows) > 0 and not isinstance(rows[0], list):
+                rows = [rows]
+            if len(rows) != len(channels):
+                raise ValueError("A list of values is required for each channel of a scan dimension", description)
+            return GridDimension(channels, [[float(value) for value in row] for row in rows], dwell)
+        if "start" in description and "stop" in description:
+            start = description["start"] if isinstance(description["start"], list) else [description["start"]]
+            stop = description["stop"] if isinstance(description["stop"], list) else [description["stop"]]
+            if len(start) != len(channels) or len(stop) != len(channels):
+                raise ValueError("A start and stop value is required for each channel of a scan dimension",
+                                 description)
+            values = [[float(first), float(last)] for first, last in zip(start, stop)]
+            return GridDimension.from_set_points(channels, values, steps, dwell)
+        raise ValueError("Start and stop (or values) required for a scan dimension", description)
 
     def safety_scan_set_point(self, set_point, steps, delay, device_list=None):
-        # Need to create a dictionary of discrete position steps for each channel
         self._log.info("!!! Safety scan initiated to setpoint %s !!!", set_point)
-        set_point_map = {}
-        if set_point in self.set_points:
-            sps = self._set_point_ini.get_setpoints(self._sp_dict[set_point])
-            # If device_list is left as default then append all values in the set_point
-            if not device_list:
-                for sp in sps:
-                    value = int(float(sps[sp]))
-                    self._log.info("Construct scan over set_point [%s] = %d", sp, value)
-                    if sp not in set_point_map:
-                        set_point_map[sp] = []
-                    set_point_map[sp].append(value)
-            elif isinstance(device_list, list):
-                # Iterate through the list appending the set point
-                for item in device_list:
-                    if item in sps:
-                        self._log.debug("Construct scan over set_point [%s] = %d", item, sps[item])
-                        if item not in set_point_map:
-                            set_point_map[item] = []
-                        set_point_map[item].append(sps[item])
-            else:
-                # Single item requested, so append the set point
-                if device_list in sps:
-                    item = device_list
-                    self._log.debug("Construct scan over set_point [%s] = %d", item, sps[item])
-                    if item not in set_point_map:
-                        set_point_map[item] = []
-                    set_point_map[item].append(sps[item])
-        else:
-            # Serious error, generate exception
-            self._log.error("The set point [%s] is not available", set_point)
-            raise ValueError("Set point is not available", set_point)
-
-        self._log.debug("Setpoints: %s", set_point_map)
-        # Now use the steps value to create the full scan range
-        self._scan_points = {}
-        for sp in set_point_map:
-            self._scan_points[sp] = numpy.empty([0], dtype=float)
-            start_value = self._detector.get_value(sp)
-            stop_value = set_point_map[sp][0]
-            self._scan_points[sp] = numpy.append(self._scan_points[sp],
-                                                 numpy.linspace(start_value, stop_value, steps, dtype=int))
-        self._log.debug("Scan description: %s", self._scan_points)
-        self._scan_delay = float(delay) / 1000.0
-        self._scan_steps = steps
-        # Now that the set of scan points have been generated for each device notify the scan_loop
-        # that we are ready to begin the scan
-        # First clear the waiting flag
-        self._wait_for_scan_complete.clear()
-        # Set the scanning flag to True
-        self._error = None
-        self._scanning = True
-        self._start_scan.set()
+        values = self._set_point_values(set_point, device_list)
+        self._log.debug("Setpoints: %s", values)
+        # Scan from the current value of each channel to the set point
+        channels = sorted(values)
+        matrix = [[self._detector.get_value(channel), values[channel]] for channel in channels]
+        self._start_plan(ScanPlan.from_set_points(channels, matrix, steps, float(delay) / 1000.0), safety=True)
+
+    def ramp_set_point(self, set_point, slew_rates, period, device_list=None):
+        """
+        Ramp from the current values to a set-point, every channel moving concurrently at no more than its
+        maximum slew rate.
+
+        :param set_point: Name of the set-point
+        :param slew_rates: Maximum slew rate (DAC counts per second, 0 for no limit) of each channel, by name
+        :type  slew_rates: dict
+        :param period: Time between the writes of the ramp (seconds)
+        :param device_list: Control channels to ramp, defaults to all of the channels of the set-point
+        """
+        self._check_safety_scan()
+        self._log.info("Ramp to setpoint %s", set_point)
+        values = self._set_point_values(set_point, device_list)
+        channels = sorted(values)
+        start = [self._detector.get_value(channel) for channel in channels]
+        target = [values[channel] for channel in channels]
+        slew = [slew_rates.get(channel, 0.0) for channel in channels]
+        self._start_plan(ScanPlan.from_ramp(channels, start, target, slew, period))
+
+    def _start_plan(self, plan, recorder=None, settle=0.0, safety=False):
+        with self._plan_lock:
+            if not safety:
+                try:
+                    self._check_safety_scan()
+                except PercivalDetectorError:
+                    if recorder is not None:
+                        recorder.close()
+                    raise
+            if self._executing and not self._wait_for_scan_complete.is_set():
+                # The previous scan has been aborted but is still applying a step; wait for the scan loop to finish
+                # with it and close its recording before it is replaced
+                self._scanning = False
+                self._stop_scan.set()
+                while not self._wait_for_scan_complete.wait(1.0):
+                    self._log.warning("Waiting for the previous scan to stop")
+            self._replaced = (self._scan_id, self._error)
+            self._scan_id += 1
+            self._safety_scan = safety
+            self._plan = plan
+            self._recorder = recorder
+            self._settle = settle
+            self._log.debug("Scan description: %s", plan.as_dict())
+            self._log.info("Scan of %d steps compiled, expected to take %f seconds", plan.steps, plan.duration)
+            # Now that the scan has been compiled notify the scan_loop that we are ready to begin the scan
+            # First clear the waiting flag
+            self._wait_for_scan_complete.clear()
+            # Start the clock of the scan, each step is due at a fixed time from here
+            self._stop_scan.clear()
+            plan.start()
+            self._scan_index = 0
+            self._last_step = None
+            # Set the scanning flag to True
+            self._error = None
+            self._scanning = True
+            self._start_scan.set()
 
     def wait_for_scan_to_complete(self):
-        while self._scanning:
+        # The scan loop signals completion once the scan has ended and its recording is closed
+        scan_id = self._scan_id
+        while self._scan_id == scan_id and \
+                (self._scanning or (self._executing and not self._wait_for_scan_complete.is_set())):
             self._wait_for_scan_complete.wait(1.0)
-        if self._error is not None:
+        if self._scan_id != scan_id:
+            # The scan was replaced by another (a safety scan), report how it ended
+            replaced_id, error = self._replaced
+            if replaced_id == scan_id and error is not None:
+                raise error
+        elif self._error is not None:
             raise self._error
 
     def scan_loop(self):
         while self._executing:
             if not self._scanning:
+                self._close_recorder()
                 # Notify any waiting threads a scan is complete
                 self._wait_for_scan_complete.set()
                 # Wait for the scan event
                 self._start_scan.wait()
-                # Reset the scan event
+                # Reset the scan event, the scan index is reset when the scan is started so the progress of the
+                # last scan is kept if the event was already set
                 self._start_scan.clear()
-                # Reset the scan index to 0
-                self._scan_index = 0
                 # Record the time of scan start
                 self._start_time = datetime.now()
 
+            if self._scanning and self._scan_index >= self._plan.steps:
+                self._scanning = False
+
+            if self._scanning:
+                # Wait for either a stop scan or the deadline of the step, then check again
+                delay = self._plan.time_to(self._scan_index)
+                if delay > 0.0:
+                    self._log.debug("Pausing for %f seconds", delay)
+                    self._stop_scan.wait(delay)
+                    self._stop_scan.clear()
+                    continue
+
             # Main loop of set-point scan
-            # Apply the current set of set-points
+            # Apply the demands which differ from the previous step applied.  A ramp skips to the latest step due
+            # if its writes have overrun
             if self._scanning:
-                for sp in self._scan_points:
+                self._scan_index = self._plan.due_step(self._scan_index)
+                self._plan.record(self._scan_index)
+                writes = self._plan.writes(self._scan_index, self._last_step)
+                self._last_step = self._scan_index
+                for sp, value in writes:
                     try:
-                        # For a scan index of greater than 0 check to see if we are being asked to scan to the
-                        # same point.  If we are then do not actually send the demand
-                        if self._scan_index == 0 or int(self._scan_points[sp][self._scan_index]) != \
-                                    int(self._scan_points[sp][self._scan_index - 1]):
-                            self._detector.set_value(sp, int(self._scan_points[sp][self._scan_index]))
+                        self._detector.set_value(sp, value)
                     except Exception as ex:
                         # Caught an exception whilst scanning, so exit out and set error
                         self._scanning = False
@@ -257,25 +379,81 @@ class SetPointControl(object):
                     if not self._scanning:
                         break
 
+                if self._recorder is not None:
+                    self._record_step(self._scan_index)
+
                 # Increment the scan index
                 self._scan_index += 1
-                if self._scan_index == self._scan_steps:
+                if self._scan_index == self._plan.steps:
                     self._scanning = False
 
-            if self._scanning:
-                self._log.debug("Pausing for %f seconds", self._scan_delay)
-                # Wait for either a stop scan or the calculated time delay
-                self._stop_scan.wait(self._scan_delay)
-                self._stop_scan.clear()
-
+        self._close_recorder()
         self._log.debug("Scan set-point thread exiting...")
 
+    def _record_step(self, step):
+        # Wait for the step to settle, then capture the monitors
+        delay = self._plan.time_to(step) + self._settle
+        while self._scanning and delay > 0.0:
+            self._stop_scan.wait(delay)
+            self._stop_scan.clear()
+            delay = self._plan.time_to(step) + self._settle
+        if self._scanning:
+            try:
+                self._recorder.record(step)
+            except Exception as ex:
+                # A failure to capture the monitors ends the scan
+                self._log.error("Failed to record scan step %d: %s", step, str(ex))
+                self._scanning = False
+                self._error = ex
+
+    def _close_recorder(self):
+        if self._recorder is not None:
+            try:
+                self._recorder.close()
+            except Exception as ex:
+                self._log.error("Failed to close the scan recording: %s", str(ex))
+                if self._error is None:
+                    self._error = ex
+
+    @property
+    def recorder(self):
+        """Recorder of the current (or last) scan, None if it was not recorded"""
+        return self._recorder
+
+    def get_timing(self):
+        """
+        :returns: Timing of the current (or last) scan, including the lateness of each step against its deadline
+        :rtype: dict
+        """
+        if self._plan is None:
+            return {"steps": 0, "executed": 0}
+        return self._plan.get_timing()
+
+    def get_progress(self):
+        """
+        :returns: Progress of the current (or last) scan: steps applied, the fraction complete, the time elapsed and
+                  remaining, and for a grid scan its shape and the position in each dimension
+        :rtype: dict
+        """
+        if self._plan is None:
+            return {"step": 0, "steps": 0}
+        progress = self._plan.get_progress(self._scan_index)
+        progress["scanning"] = self._scanning
+        return progress
+
     def get_status(self):
         status = {
             "scanning": self._scanning,
+            "safety_scan": self.safety_scan_active,
             "scan_index": self._scan_index
         }
-        if self._scan_points:
-            status["scan"] = str(self._scan_points)
+        if self._plan is not None:
+            status["progress"] = self._plan.get_progress(self._scan_index)
+            timing = self._plan.get_timing()
+            del timing["lateness"]
+            status["timing"] = timing
+            status["scan"] = str(self._plan.as_dict())
+        if self._recorder is not None:
+            status["recording"] = self._recorder.get_status()
         self._log.debug("Status: %s", status)
         return status
@@ -0,0 +1,170 @@
+"""
+Compiled set-point values.
+
+The set-point INI file is read once, when it is loaded, into a :class:`SetPointMatrix`: a dense matrix of
+set-points by control channels holding every value as a number, with a mask of the entries which are defined.
+Selecting a set-point, a path through several set-points, the difference between two set-points or the distance
+of every set-point from the current demands are then array operations, and the paths feed
+:class:`percival.detector.scan_plan.ScanPlan` directly.
+"""
+from __future__ import division
+
+import logging
+
+import numpy as np
+
+
+class SetPointMatrix(object):
+    """
+    Values of every set-point for every control channel.
+    """
+    def __init__(self, names, channels, values, defined):
+        """
+        :param names: Names of the set-points
+        :type  names: list
+        :param channels: Names of the control channels
+        :type  channels: list
+        :param values: Matrix of set-points by channels
+        :param defined: Mask of set-points by channels, True where a set-point defines the value of a channel
+        """
+        self._log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
+        self._names = list(names)
+        self._channels = list(channels)
+        self._rows = {name: index for index, name in enumerate(self._names)}
+        self._columns = {channel: index for index, channel in enumerate(self._channels)}
+        self._values = np.asarray(values, dtype=float).reshape(len(self._names), len(self._channels))
+        self._defined = np.asarray(defined, dtype=bool).reshape(self._values.shape)
+
+    @classmethod
+    def compile(cls, set_point_ini):
+        """
+        Read every set-point of a set-point INI file.
+
+        :param set_point_ini: Loaded set-point INI file
+        :type  set_point_ini: :obj:`percival.carrier.configuration.SetpointGroupParameters`
+        """
+        log = logging.getLogger(".".join([__name__, cls.__name__]))
+        names = []
+        channels = []
+        columns = {}
+        entries = []
+        for section in set_point_ini.sections:
+            names.append(set_point_ini.get_name(section))
+            for channel, value in set_point_ini.get_setpoints(section).items():
+                try:
+                    value = float(str(value).strip("\""))
+                except ValueError:
+                    log.error("Invalid value %s for %s in set-point %s", value, channel, names[-1])
+                    continue
+                if channel not in columns:
+                    columns[channel] = len(channels)
+                    channels.append(channel)
+                entries.append((len(names) - 1, columns[channel], value))
+        values = np.zeros((len(names), len(channels)))
+        defined = np.zeros((len(names), len(channels)), dtype=bool)
+        if entries:
+            rows, cols, numbers = zip(*entries)
+            values[rows, cols] = numbers
+            defined[rows, cols] = True
+        return cls(names, channels, values, defined)
+
+    @property
+    def names(self):
+        return list(self._names)
+
+    @property
+    def channels(self):
+        return list(self._channels)
+
+    @property
+    def values(self):
+        """Matrix of set-points by channels (undefined entries are 0)"""
+        return self._values
+
+    @property
+    def defined(self):
+        """Mask of set-points by channels, True where the value is defined"""
+        return self._defined
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    def _row(self, name):
+        if name not in self._rows:
+            self._log.error("The set point [%s] is not available", name)
+            raise ValueError("Set point is not available", name)
+        return self._rows[name]
+
+    def _select(self, channels):
+        # Column indices of the requested channels (all channels by default), ignoring unknown channels
+        if channels is None:
+            return np.arange(len(self._channels))
+        if not isinstance(channels, list):
+            channels = [channels]
+        return np.array([self._columns[channel] for channel in channels if channel in self._columns], dtype=int)
+
+    def get(self, name, channels=None):
+        """
+        Return the values a set-point defines.
+
+        :param name: Name of the set-point
+        :param channels: Channel or list of channels to return, defaults to all of the channels of the set-point
+        :returns: Value of each channel defined, keyed by channel name
+        :rtype: dict
+        """
+        row = self._row(name)
+        columns = self._select(channels)
+        columns = columns[self._defined[row, columns]]
+        return {self._channels[column]: int(self._values[row, column]) for column in columns}
+
+    def path(self, names, channels=None):
+        """
+        Return the values of the channels along a sequence of set-points.
+
+        :param names: Names of the set-points
+        :param channels: Channels to return, defaults to every channel defined by any of the set-points
+        :returns: Tuple of the channel names and the matrix of channels by set-points
+        :raises ValueError: If a set-point does not define every channel
+        """
+        rows = np.array([self._row(name) for name in names], dtype=int)
+        columns = self._select(channels)
+        if channels is None:
+            columns = columns[self._defined[rows][:, columns].any(axis=0)]
+        if not self._defined[rows][:, columns].all():
+            self._log.error("Invalid set point values given, check they map the same devices")
+            raise ValueError("Invalid set point values given, check they map the same devices")
+        return [self._channels[column] for column in columns], self._values[rows][:, columns].T
+
+    def difference(self, start, end):
+        """
+        Return the change of every channel defined by two set-points, moving from one to the other.
+
+        :returns: Change (end - start) of each channel, keyed by channel name
+        :rtype: dict
+        """
+        first = self._row(start)
+        second = self._row(end)
+        columns = np.flatnonzero(self._defined[first] & self._defined[second])
+        changes = self._values[second, columns] - self._values[first, columns]
+        return {self._channels[column]: float(change) for column, change in zip(columns, changes)}
+
+    def distance(self, current):
+        """
+        Return the distance of every set-point from the current demands.
+
+        :param current: Current demand of each channel, keyed by channel name; channels without a current
+                        demand are ignored
+        :type  current: dict
+        :returns: Dictionary for each set-point of "max" (largest change of any channel), "total" (sum of the
+                  changes) and "channels" (number of channels which would change)
+        :rtype: dict
+        """
+        known = np.array([channel in current for channel in self._channels], dtype=bool)
+        state = np.array([float(current.get(channel, 0.0)) for channel in self._channels])
+        changes = np.where(self._defined & known[np.newaxis, :], np.abs(self._values - state[np.newaxis, :]), 0.0)
+        distances = {}
+        for row, name in enumerate(self._names):
+            distances[name] = {"max": float(changes[row].max()) if len(self._channels) else 0.0,
+                               "total": float(changes[row].sum()),
+                               "channels": int(np.count_nonzero(changes[row]))}
+        return distances
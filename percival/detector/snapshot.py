@@ -0,0 +1,82 @@
+"""
+Immutable snapshots of the detector state for readers.
+
+The threads that talk to the hardware (status loop, command loop) publish the results of their reads
+into a :class:`SnapshotStore`.  Each publish creates a new :class:`Snapshot` and replaces the current
+one with a single reference assignment, so readers (for example HTTP GET requests) never take a lock,
+never wait on the hardware and always see a consistent set of values.
+"""
+from __future__ import print_function
+
+import copy
+import logging
+import threading
+from datetime import datetime
+
+
+class Snapshot(object):
+    """
+    A read-only set of named detector parameters captured at a point in time.
+
+    The values are deep copies taken when the snapshot was published and are shared between all readers,
+    so they must not be modified.
+    """
+
+    def __init__(self, items=None, generation=0, timestamp=None):
+        self._items = items or {}
+        self._generation = generation
+        self._timestamp = timestamp or datetime.now()
+
+    @property
+    def generation(self):
+        return self._generation
+
+    @property
+    def timestamp(self):
+        return self._timestamp
+
+    @property
+    def parameters(self):
+        return list(self._items.keys())
+
+    def get(self, parameter, default=None):
+        return self._items.get(parameter, default)
+
+    def __contains__(self, parameter):
+        return parameter in self._items
+
+
+class SnapshotStore(object):
+    """
+    Holds the current :class:`Snapshot`.  Publishers are serialised, readers are lock free.
+    """
+
+    def __init__(self):
+        self._log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
+        self._publish_lock = threading.Lock()
+        self._current = Snapshot()
+
+    @property
+    def current(self):
+        return self._current
+
+    def publish(self, items):
+        """
+        Publish new values for a set of parameters.  Parameters not supplied keep their previous values.
+
+        :param items: Dictionary of parameter name to value
+        :type items: dict
+        :returns: The newly published snapshot
+        :rtype: Snapshot
+        """
+        items = copy.deepcopy(items)
+        with self._publish_lock:
+            merged = dict(self._current._items)
+            merged.update(items)
+            snapshot = Snapshot(merged, self._current.generation + 1)
+            self._current = snapshot
+        self._log.debug("Published snapshot %d: %s", snapshot.generation, list(items.keys()))
+        return snapshot
+
+    def get(self, parameter, default=None):
+        return self._current.get(parameter, default)
@@ -18,6 +18,11 @@ class PercivalStandalone(object):
         self._detector = PercivalDetector(download_config, initialise_hardware)
         self._ctrl_channel = None
         self._status_channel = None
+        self._event_channel = None
+        # Number of the last event published
+        self._event_id = None
+        # Timestamp of the last status snapshot published
+        self._published = None
         self._reactor = IpcReactor()
 
     def setup_control_channel(self, endpoint):
@@ -29,13 +34,43 @@ class PercivalStandalone(object):
         self._status_channel = IpcChannel(IpcChannel.CHANNEL_TYPE_PUB)
         self._status_channel.bind(endpoint)
 
+    def setup_event_channel(self, endpoint):
+        self._event_channel = IpcChannel(IpcChannel.CHANNEL_TYPE_PUB)
+        self._event_channel.bind(endpoint)
+        # Only the events detected from now on are published
+        self._event_id = self._detector.read_events()["last"]
+
+    def publish_events(self):
+        # Status reads, and so the detection of events, run on the reactor, command and web server threads, but a
+        # ZMQ socket must only be used from one thread.  The events are collected from the event log and
+        # published from the reactor thread, like the status.
+        events = self._detector.read_events(self._event_id)
+        self._event_id = events["last"]
+        if not events["events"]:
+            return
+        event_msg = IpcMessage(IpcMessage.MSG_TYPE_NOTIFY, IpcMessage.MSG_VAL_NOTIFY_EVENT)
+        event_msg.set_param("events", events["events"])
+        event_msg.set_param("lost", events["lost"])
+        self._event_channel.send(event_msg.encode())
+
     def start_reactor(self):
         self._reactor.register_timer(100, 0, self.update_status)
         self._reactor.run()
 
     def update_status(self):
+        # Read the hardware only if the shared status snapshot is out of date
+        self._detector.update_status(max_age=self._detector.status_period)
+        if self._event_channel is not None:
+            self.publish_events()
+        # Publish only the monitors which have changed since the last publish (all monitors on a keyframe)
+        changes = self._detector.read_status_changes(self._published)
+        if changes["timestamp"] == self._published:
+            return
+        self._published = changes["timestamp"]
         status_msg = IpcMessage(IpcMessage.MSG_TYPE_NOTIFY, IpcMessage.MSG_VAL_CMD_STATUS)
-        status_msg.set_param("status", self._detector.update_status())
+        status_msg.set_param("status", changes["channels"])
+        status_msg.set_param("stale", changes["stale"])
+        status_msg.set_param("keyframe", changes["keyframe"])
         # self._log.debug("Publishing: %s", status_msg.encode())
         self._status_channel.send(status_msg.encode())
 
@@ -0,0 +1,269 @@
+"""
+Coalesced reading of the detector status.
+
+The :class:`StatusService` performs at most one hardware status read per configured period and keeps the
+result as a timestamped :class:`StatusSnapshot`.  Every consumer (read('status'), ZeroMQ status publishing,
+database logging) is served from the latest snapshot.  A consumer can request a fresh read; if a read is
+already in progress the request waits for it and shares its result instead of starting another one.
+"""
+from __future__ import print_function
+
+from datetime import datetime
+import logging
+import threading
+import time
+
+from percival.clock import monotonic
+
+
+class StatusSnapshot(object):
+    """
+    The detector and monitor channel status from one status read, along with the time at which each
+    channel was last successfully read.
+    """
+
+    def __init__(self, detector, channels, channel_times, updated, read_time, detector_updated=True, changed=None,
+                 keyframe=True, read_clock=None):
+        """ StatusSnapshot constructor.
+
+        :param detector: System status of the detector (None if it has never been read)
+        :type  detector: dict
+        :param channels: Status of each monitor channel, keyed by channel name
+        :type  channels: dict
+        :param channel_times: Time (seconds since the epoch) each channel was last read
+        :type  channel_times: dict
+        :param updated: Names of the channels read by this status read
+        :type  updated: list
+        :param read_time: Time (seconds since the epoch) of this status read
+        :type  read_time: float
+        :param detector_updated: True if the system status was read by this status read
+        :type  detector_updated: bool
+        :param changed: Names of the channels read by this status read which should be published (see
+                        :class:`percival.detector.change_filter.ChangeFilter`), defaults to all channels read
+        :type  changed: list
+        :param keyframe: True if every channel read should be published
+        :type  keyframe: bool
+        :param read_clock: Monotonic time of this status read, for measuring intervals between reads, defaults to
+                           read_time
+        :type  read_clock: float
+        """
+        self._detector = detector
+        self._channels = channels
+        self._channel_times = channel_times
+        self._updated = updated
+        self._read_time = read_time
+        self._read_clock = read_time if read_clock is None else read_clock
+        self._detector_updated = detector_updated
+        self._changed = updated if changed is None else changed
+        self._keyframe = keyframe
+        self._timestamp = datetime.utcfromtimestamp(read_time)
+
+    @property
+    def detector(self):
+        return self._detector
+
+    @property
+    def detector_updated(self):
+        return self._detector_updated
+
+    @property
+    def channels(self):
+        return self._channels
+
+    @property
+    def updated(self):
+        return self._updated
+
+    @property
+    def changed(self):
+        return self._changed
+
+    @property
+    def keyframe(self):
+        return self._keyframe
+
+    @property
+    def read_time(self):
+        return self._read_time
+
+    @property
+    def read_clock(self):
+        return self._read_clock
+
+    @property
+    def timestamp(self):
+        return self._timestamp
+
+    def age(self, channel=None, now=None):
+        """
+        Return the age in seconds of the snapshot, or of the last value of a channel.
+        """
+        now = now or time.time()
+        if channel is None:
+            return now - self._read_time
+        return now - self._channel_times[channel]
+
+    def get_status(self, now=None):
+        """
+        Return the status report with the timestamp of the snapshot and the age of each channel.
+        """
+        now = now or time.time()
+        status = {'detector': self._detector,
+                  'timestamp': str(self._timestamp)}
+        for name in self._channels:
+            channel = dict(self._channels[name])
+            channel['age'] = round(now - self._channel_times[name], 3)
+            status[name] = channel
+        return status
+
+
+class StatusService(object):
+    """
+    Periodically read the detector status in a background thread and share the results.
+    """
+
+    def __init__(self, read_status, period=0.25, change_filter=None):
+        """ StatusService constructor.
+
+        :param read_status: Callable performing the hardware read, returning a tuple of the detector system
+                            status (or None if it could not be read) and a dictionary of monitor channel status
+        :type  read_status: callable
+        :param period: Time between status reads (seconds)
+        :type  period: float
+        :param change_filter: Optional filter selecting the channels of each read to publish
+        :type  change_filter: percival.detector.change_filter.ChangeFilter
+        """
+        self._log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
+        self._read_status = read_status
+        self._period = period
+        self._change_filter = change_filter
+        self._condition = threading.Condition()
+        self._in_flight = False
+        self._latest = None
+        self._reads = 0
+        self._listeners = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def period(self):
+        return self._period
+
+    @property
+    def latest(self):
+        return self._latest
+
+    @property
+    def reads(self):
+        """Number of hardware status reads performed"""
+        return self._reads
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def add_listener(self, callback):
+        """
+        Register a callable to be passed each new :class:`StatusSnapshot`.  Listeners are called from the
+        thread which performed the read.
+        """
+        self._listeners.append(callback)
+
+    def start(self):
+        if not self.running:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(max(1.0, 2.0 * self._period))
+            self._thread = None
+
+    def _run(self):
+        next_read = time.time()
+        while not self._stop.is_set():
+            # Skip the read if a consumer requested one during this period
+            self.refresh(max_age=0.5 * self._period)
+            next_read += self._period
+            delay = next_read - time.time()
+            if delay < 0.0:
+                # Fallen behind (e.g. a slow read) so restart the schedule rather than reading back to back
+                next_read = time.time()
+                delay = 0.0
+            self._stop.wait(delay)
+
+    def refresh(self, max_age=None):
+        """
+        Return a status snapshot no older than max_age, reading the hardware if required.
+
+        If a read is already in progress the caller waits for it to complete and receives its snapshot.
+
+        :param max_age: Maximum age (seconds) of an acceptable existing snapshot; None forces a new read
+        :type  max_age: float
+        :returns: The status snapshot, or the previous snapshot if the new one could not be made (None if there
+                  has never been one)
+        :rtype: StatusSnapshot
+        """
+        with self._condition:
+            if max_age is not None and self._latest is not None and self._latest.age() <= max_age:
+                return self._latest
+            if self._in_flight:
+                while self._in_flight:
+                    self._condition.wait()
+                return self._latest
+            self._in_flight = True
+
+        snapshot = None
+        try:
+            read_time = time.time()
+            read_clock = monotonic()
+            try:
+                detector, channels = self._read_status()
+            except Exception as ex:
+                self._log.error("Status read failed: %s", str(ex))
+                detector, channels = None, {}
+            snapshot = self._update(detector, channels, read_time, read_clock)
+        except Exception as ex:
+            self._log.error("Status update failed: %s", str(ex))
+        finally:
+            with self._condition:
+                self._in_flight = False
+                self._condition.notify_all()
+
+        if snapshot is None:
+            # Listeners are only passed new snapshots
+            return self._latest
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception as ex:
+                self._log.error("Status listener %s failed: %s", listener, str(ex))
+        return snapshot
+
+    def _update(self, detector, channels, read_time, read_clock):
+        # Values that could not be read are carried over from the previous snapshot with their original age
+        previous = self._latest
+        detector_updated = detector is not None
+        all_channels = {}
+        channel_times = {}
+        if previous is not None:
+            if detector is None:
+                detector = previous.detector
+            all_channels.update(previous.channels)
+            channel_times.update(previous._channel_times)
+        all_channels.update(channels)
+        for name in channels:
+            channel_times[name] = read_time
+        changed = None
+        keyframe = True
+        if self._change_filter is not None:
+            changed, keyframe = self._change_filter.update(read_time, channels)
+        snapshot = StatusSnapshot(detector, all_channels, channel_times, list(channels.keys()), read_time,
+                                  detector_updated, changed, keyframe, read_clock)
+        with self._condition:
+            self._latest = snapshot
+            self._reads += 1
+        return snapshot
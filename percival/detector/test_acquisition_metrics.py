@@ -0,0 +1,71 @@
+from __future__ import division
+
+import unittest
+
+from percival.detector.acquisition_metrics import AcquisitionMetrics
+from percival.detector.status_service import StatusSnapshot
+
+
+def snapshot(images, acquisitions, train, acquiring, clock):
+    # The wall clock time of the read is unrelated to the monotonic time the samples are timed by
+    return StatusSnapshot({"Image_counter": images,
+                           "Acquisition_counter": acquisitions,
+                           "Train_number": train,
+                           "acquiring": acquiring}, {}, {}, [], 1e9 - clock, read_clock=clock)
+
+
+class TestAcquisitionMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = AcquisitionMetrics(window=2.0)
+
+    def test_rates(self):
+        self.metrics.update(snapshot(0, 0, 100, 0, 10.0))
+        status = self.metrics.get_status()
+        self.assertIsNone(status["frames_per_second"])
+        self.assertFalse(status["acquiring"])
+        self.assertEqual(status["Train_number"], 100)
+        # 10 trains/s with one acquisition of 32 frames per train
+        self.metrics.update(snapshot(0, 0, 105, 1, 10.5))
+        self.metrics.update(snapshot(160, 5, 110, 1, 11.0))
+        self.metrics.update(snapshot(320, 10, 115, 1, 11.5))
+        status = self.metrics.get_status()
+        self.assertAlmostEqual(status["trains_per_second"], 10.0)
+        self.assertAlmostEqual(status["acquisitions_per_second"], 20.0 / 3)
+        self.assertAlmostEqual(status["frames_per_second"], 320 / 1.5)
+        self.assertAlmostEqual(status["window"], 1.5)
+        self.assertEqual(status["missed_trains"], 0)
+        self.assertAlmostEqual(status["duration"], 1.0)
+        self.assertEqual(status["frames"], 320)
+        # The window only holds the last 2 seconds
+        self.metrics.update(snapshot(480, 15, 120, 1, 13.0))
+        self.assertAlmostEqual(self.metrics.get_status()["window"], 2.0)
+        self.assertAlmostEqual(self.metrics.get_status()["trains_per_second"], 5.0)
+
+    def test_missed_trains(self):
+        self.metrics.update(snapshot(0, 0, 0, 1, 0.0))
+        self.metrics.update(snapshot(32, 1, 3, 1, 0.3))
+        self.metrics.update(snapshot(64, 2, 4, 1, 0.4))
+        self.assertEqual(self.metrics.get_status()["missed_trains"], 2)
+        # The acquisition ends
+        self.metrics.update(snapshot(64, 2, 6, 0, 0.6))
+        self.metrics.update(snapshot(64, 2, 8, 0, 0.8))
+        status = self.metrics.get_status()
+        self.assertAlmostEqual(status["duration"], 0.6)
+        self.assertEqual(status["missed_trains"], 2)
+        # A new acquisition restarts the count, the total carries on
+        self.metrics.update(snapshot(64, 2, 9, 1, 0.9))
+        self.metrics.update(snapshot(96, 3, 11, 1, 1.1))
+        status = self.metrics.get_status()
+        self.assertEqual(status["missed_trains"], 1)
+        self.assertEqual(status["missed_trains_total"], 3)
+        self.assertEqual(status["frames"], 32)
+
+    def test_reset(self):
+        self.metrics.update(snapshot(100, 10, 50, 0, 0.0))
+        self.metrics.update(snapshot(200, 20, 60, 0, 1.0))
+        self.metrics.update(snapshot(0, 0, 0, 0, 1.5))
+        status = self.metrics.get_status()
+        self.assertIsNone(status["frames_per_second"])
+        # A failed read of the system status is ignored
+        self.metrics.update(StatusSnapshot(None, {}, {}, [], 0.0, detector_updated=False, read_clock=2.0))
+        self.assertEqual(self.metrics.get_status()["Image_counter"], 0)
@@ -0,0 +1,41 @@
+import unittest
+from datetime import datetime
+from percival.detector.aggregator import StatusAggregator
+
+
+def status(raw_value, safety_exception=0):
+    return {"raw_value": raw_value, "value": raw_value / 10.0, "sample_number": 0,
+            "safety_exception": safety_exception}
+
+
+class TestStatusAggregator(unittest.TestCase):
+    def setUp(self):
+        self._aggregator = StatusAggregator(interval=1.0, max_channels=4)
+
+    def test_intervals(self):
+        self.assertEqual(self._aggregator.add(100.0, {"m1": status(10), "m2": status(20)}), [])
+        self.assertEqual(self._aggregator.add(100.4, {"m1": status(30, safety_exception=1)}), [])
+        self.assertEqual(self._aggregator.add(100.8, {"m1": status(20), "t1": {"raw_value": 5, "temperature": 25.0}}),
+                         [])
+        points = self._aggregator.add(101.1, {"m1": status(40)})
+        self.assertEqual(len(points), 3)
+        points = {name: (timestamp, point) for timestamp, name, point in points}
+        timestamp, m1 = points["m1"]
+        self.assertEqual(timestamp, datetime.utcfromtimestamp(100.0))
+        self.assertEqual(m1["samples"], 3)
+        self.assertAlmostEqual(m1["value"], 2.0)
+        self.assertEqual(m1["value_min"], 1.0)
+        self.assertEqual(m1["value_max"], 3.0)
+        self.assertEqual(m1["value_last"], 2.0)
+        self.assertEqual(m1["raw_value"], 20)
+        self.assertEqual(m1["safety_exception_count"], 1)
+        self.assertEqual(m1["i2c_comms_error_count"], 0)
+        self.assertEqual(points["m2"][1]["samples"], 1)
+        self.assertEqual(points["t1"][1]["temperature_max"], 25.0)
+
+        # Channels without samples in an interval are not written
+        points = self._aggregator.flush()
+        self.assertEqual([(name, point["value"]) for timestamp, name, point in points], [("m1", 4.0)])
+        self.assertEqual(self._aggregator.flush(), [])
+        self.assertEqual(self._aggregator.get_status()["points"], 4)
+        self.assertEqual(self._aggregator.get_status()["samples"], 6)
@@ -0,0 +1,51 @@
+import unittest
+from percival.detector.change_filter import ChangeFilter
+
+
+def status(value, sample_number, safety_exception=0):
+    return {"raw_value": int(value * 1000), "value": value, "sample_number": sample_number,
+            "safety_exception": safety_exception}
+
+
+class TestChangeFilter(unittest.TestCase):
+    def setUp(self):
+        self._filter = ChangeFilter(heartbeat=10.0, stale_after=1.0, max_channels=2)
+        self._filter.set_deadband("m1", absolute=0.1)
+        self._filter.set_deadband("m2", relative=0.01)
+
+    def test_deadband(self):
+        changed, keyframe = self._filter.update(100.0, {"m1": status(1.0, 1), "m2": status(2.0, 1)})
+        self.assertEqual(sorted(changed), ["m1", "m2"])
+        self.assertTrue(keyframe)
+        # Within the deadbands
+        self.assertEqual(self._filter.update(100.2, {"m1": status(1.05, 2), "m2": status(2.01, 2)}), ([], False))
+        # Outside the deadbands, relative to the last published value
+        changed, keyframe = self._filter.update(100.4, {"m1": status(1.11, 3), "m2": status(2.03, 3)})
+        self.assertEqual(sorted(changed), ["m1", "m2"])
+        # A value changed without a new sample is not published
+        self.assertEqual(self._filter.update(100.6, {"m1": status(2.0, 3)})[0], [])
+        # Flag changes are always published
+        self.assertEqual(self._filter.update(100.8, {"m1": status(1.11, 4, safety_exception=1)})[0], ["m1"])
+        self.assertEqual(self._filter.changed_since(100.5), ["m1"])
+        self.assertEqual(sorted(self._filter.changed_since()), ["m1", "m2"])
+        # Keyframes publish every channel
+        changed, keyframe = self._filter.update(110.0, {"m1": status(1.11, 5), "m2": status(2.03, 4)})
+        self.assertTrue(keyframe)
+        self.assertEqual(sorted(changed), ["m1", "m2"])
+
+    def test_stale(self):
+        self._filter.update(100.0, {"m1": status(1.0, 1)})
+        self.assertEqual(self._filter.update(100.5, {"m1": status(1.0, 1)})[0], [])
+        # Published once when it becomes stale, and again when a new sample arrives
+        self.assertEqual(self._filter.update(101.0, {"m1": status(1.0, 1)})[0], ["m1"])
+        self.assertEqual(self._filter.stale, ["m1"])
+        self.assertEqual(self._filter.update(101.5, {"m1": status(1.0, 1)})[0], [])
+        self.assertEqual(self._filter.update(102.0, {"m1": status(1.0, 2)})[0], ["m1"])
+        self.assertEqual(self._filter.stale, [])
+
+    def test_unfiltered(self):
+        # Channels beyond the maximum are always published
+        self._filter.update(100.0, {"m1": status(1.0, 1), "m2": status(1.0, 1)})
+        self.assertEqual(self._filter.update(100.05, {"m3": status(1.0, 1)})[0], ["m3"])
+        self.assertEqual(self._filter.update(100.1, {"m3": status(1.0, 1)})[0], ["m3"])
+        self.assertEqual(self._filter.get_status()["channels"], 2)
@@ -50,3 +50,19 @@ class TestPercivalCommand(unittest.TestCase):
         self.assertEqual(data['Source_Address'], '1.2.3.4')
         self.assertEqual(data['Source_ID'], 'test_user_agent')
 
+
+    def test_sub_command(self):
+        request = MagicMock()
+        request.path = "/cmd_queue_sequence"
+        request.query = ""
+        request.remote_ip = "1.2.3.4"
+        request.method = "PUT"
+        request.headers = {'User': 'test_user'}
+        request.body = '{"commands": [{"command": "cmd_set_channel", "parameters": {"channel": "c1"}}]}'
+        command = Command(request)
+        item = command.get_param('commands')[0]
+        sub_command = command.sub_command(item['command'], item['parameters'])
+        self.assertEqual(sub_command.command_name, 'cmd_set_channel')
+        self.assertEqual(sub_command.command_type, 'PUT')
+        self.assertEqual(sub_command.get_param('channel'), 'c1')
+        self.assertEqual(sub_command.format_trace['Username'], 'test_user')
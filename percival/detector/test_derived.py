@@ -0,0 +1,81 @@
+import unittest
+
+import numpy
+
+from percival.carrier.configuration import DerivedChannelParameters
+from percival.detector.derived import DerivedChannel, DerivedChannels
+
+CHANNELS = u"[Derived_channel<0000>]\n" \
+           u"Channel_name = \"P_VDD\"\n" \
+           u"Expression = \"V_VDD * I_VDD\"\n" \
+           u"Unit = \"W\"\n" \
+           u"\n" \
+           u"[Derived_channel<0001>]\n" \
+           u"Channel_name = \"P_TOTAL\"\n" \
+           u"Expression = \"P_VDD + abs({-8V_supply}) * I_NEG\"\n" \
+           u"Unit = \"W\"\n" \
+           u"\n" \
+           u"[Derived_channel<0002>]\n" \
+           u"Channel_name = \"RATIO\"\n" \
+           u"Expression = \"I_VDD / I_NEG\"\n"
+
+
+class TestDerivedChannels(unittest.TestCase):
+    def setUp(self):
+        ini = DerivedChannelParameters(CHANNELS)
+        ini.load_ini()
+        self.derived = DerivedChannels()
+        self.derived.load([DerivedChannel.from_ini(ini.get_name(section), ini.get_options(section))
+                           for section in ini.sections])
+
+    def test_load(self):
+        self.assertEqual(self.derived.names, ["P_VDD", "P_TOTAL", "RATIO"])
+        self.assertIn("P_TOTAL", self.derived)
+        self.assertNotIn("V_VDD", self.derived)
+        self.assertEqual(sorted(self.derived.inputs()), ["-8V_supply", "I_NEG", "I_VDD", "V_VDD"])
+        # Inputs of derived channels used by a derived channel are included
+        self.assertEqual(sorted(self.derived.inputs(["P_TOTAL"])), ["-8V_supply", "I_NEG", "I_VDD", "V_VDD"])
+        self.assertEqual(self.derived.get_status()["P_TOTAL"]["inputs"], ["-8V_supply", "I_NEG", "P_VDD"])
+
+    def test_invalid(self):
+        for expression in ["V_VDD +", "__import__('os')", "V_VDD.real", "open(V_VDD)", "sqrt(x=V_VDD)",
+                           "V_VDD if V_VDD else 0", "'text'", "sqrt(V_VDD, I_VDD)", "max(V_VDD)", "abs()"]:
+            with self.assertRaises(ValueError):
+                DerivedChannel("BAD", expression)
+        with self.assertRaises(ValueError):
+            DerivedChannel.from_ini("BAD", {"Unit": "W"})
+        # A channel using a derived channel defined after it is left out
+        self.derived.load([DerivedChannel("A", "B * 2"), DerivedChannel("B", "V_VDD"), DerivedChannel("C", "B")])
+        self.assertEqual(self.derived.names, ["B", "C"])
+
+    def test_evaluate(self):
+        status = self.derived.evaluate({"V_VDD": {"value": 2.0},
+                                        "I_VDD": {"value": 1.5},
+                                        "-8V_supply": {"value": -8.0},
+                                        "I_NEG": {"value": 0.25}})
+        self.assertEqual(status["P_VDD"], {"value": 3.0, "unit": "W"})
+        self.assertEqual(status["P_TOTAL"], {"value": 5.0, "unit": "W"})
+        self.assertEqual(status["RATIO"], {"value": 6.0, "unit": ""})
+        # Inputs which were not read are taken from the previous status, non-finite results are left out
+        status = self.derived.evaluate({"I_NEG": {"value": 0.0}}, {"I_VDD": {"value": 1.0},
+                                                                   "-8V_supply": {"value": -8.0},
+                                                                   "P_VDD": {"value": 2.0}})
+        self.assertEqual(status, {"P_TOTAL": {"value": 2.0, "unit": "W"}})
+        self.assertEqual(self.derived.evaluate({"I_NEG": {"value": 1.0}}), {})
+        # Nothing is evaluated when none of the inputs were read
+        self.assertEqual(self.derived.evaluate({"OTHER": {"value": 1.0}}, {"V_VDD": {"value": 2.0}}), {})
+
+    def test_failure(self):
+        channels = [DerivedChannel("A", "V * 2"), DerivedChannel("B", "A + 1"), DerivedChannel("C", "V + 1")]
+        self.derived.load(channels)
+
+        def fail(values):
+            raise TypeError("Unsupported operand")
+        channels[0].evaluate = fail
+        # Only the failing channel, and the channels using it, are left out
+        self.assertEqual(self.derived.evaluate({"V": {"value": 1.0}}), {"C": {"value": 2.0, "unit": ""}})
+
+    def test_arrays(self):
+        channel = DerivedChannel("P", "max(V, 0) * I")
+        values = channel.evaluate({"V": numpy.array([-1.0, 2.0, 3.0]), "I": numpy.array([1.0, 2.0, 0.5])})
+        numpy.testing.assert_array_equal(values, [0.0, 4.0, 1.5])
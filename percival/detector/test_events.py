@@ -0,0 +1,61 @@
+import unittest
+import time
+
+from percival.detector.events import EventLog
+from percival.detector.status_service import StatusSnapshot
+
+
+def snapshot(detector, channels=None, read_time=None):
+    channels = channels or {}
+    read_time = read_time or time.time()
+    return StatusSnapshot(detector, channels, {name: read_time for name in channels}, list(channels), read_time,
+                          detector_updated=detector is not None)
+
+
+class TestEventLog(unittest.TestCase):
+    def setUp(self):
+        self.published = []
+        self.events = EventLog(max_events=4)
+        self.events.add_listener(self.published.append)
+
+    def test_status_changes(self):
+        # The first read is the reference
+        self.assertEqual(self.events.update(snapshot({"acquiring": 0, "system_armed": 0, "Train_number": 10})), [])
+        events = self.events.update(snapshot({"acquiring": 1, "system_armed": 0, "Train_number": 12}, read_time=5.0))
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]["id"], 1)
+        self.assertEqual(events[0]["type"], "status")
+        self.assertEqual((events[0]["field"], events[0]["old"], events[0]["new"]), ("acquiring", 0, 1))
+        self.assertEqual(events[0]["timestamp"], 5.0)
+        self.assertEqual(events[0]["Train_number"], 12)
+        self.assertEqual(self.published, [events])
+        # Counters are not reported, a read without changes produces no events
+        self.assertEqual(self.events.update(snapshot({"acquiring": 1, "system_armed": 0, "Train_number": 20})), [])
+        # A failed system status read is not compared
+        self.assertEqual(self.events.update(snapshot(None)), [])
+        self.assertEqual(len(self.published), 1)
+
+    def test_flag_changes(self):
+        self.events.update(snapshot(None, {"T1": {"value": 20.0, "high_threshold": 0}}))
+        events = self.events.update(snapshot(None, {"T1": {"value": 70.0, "high_threshold": 1, "safety_exception": 1},
+                                                    "T2": {"value": 20.0}}))
+        self.assertEqual([(event["channel"], event["field"], event["old"], event["new"]) for event in events],
+                         [("T1", "high_threshold", 0, 1), ("T1", "safety_exception", 0, 1)])
+        self.assertEqual(events[0]["type"], "monitor")
+        self.assertIsNone(events[0]["Train_number"])
+
+    def test_since(self):
+        self.events.update(snapshot({"acquiring": 0, "system_armed": 0}))
+        for value in [1, 0, 1]:
+            self.events.update(snapshot({"acquiring": value, "system_armed": value}))
+        self.assertEqual(self.events.last_id, 6)
+        # The log holds the last 4 events
+        reply = self.events.since(3)
+        self.assertEqual([event["id"] for event in reply["events"]], [4, 5, 6])
+        self.assertEqual(reply["last"], 6)
+        self.assertFalse(reply["lost"])
+        self.assertTrue(self.events.since(1)["lost"])
+        self.assertEqual(self.events.since(6)["events"], [])
+        self.assertFalse(self.events.since(6)["lost"])
+        reply = self.events.since(None, ["system_armed"])
+        self.assertEqual([event["id"] for event in reply["events"]], [4, 6])
@@ -0,0 +1,47 @@
+import unittest
+import numpy as np
+from percival.detector.history import HistoryBuffer, to_lists
+
+
+def status(raw_value, sample_number=0):
+    return {"raw_value": raw_value, "value": raw_value / 1000.0, "sample_number": sample_number,
+            "safety_exception": 0, "high_threshold": 1}
+
+
+class TestHistoryBuffer(unittest.TestCase):
+    def setUp(self):
+        self._history = HistoryBuffer(capacity=4, max_channels=3)
+
+    def test_window(self):
+        for index in range(3):
+            self._history.record(100.0 + index, {"m1": status(index, index), "m2": status(10 + index)})
+        self._history.record(103.0, {"m1": {"raw_value": 3, "temperature": 25.0, "sample_number": 3}})
+        samples = self._history.window(["m2", "m1"])
+        self.assertEqual(samples["channels"], ["m2", "m1"])
+        np.testing.assert_array_equal(samples["time"], [100.0, 101.0, 102.0, 103.0])
+        self.assertEqual(samples["raw_value"].shape, (2, 4))
+        np.testing.assert_array_equal(samples["raw_value"][1], [0, 1, 2, 3])
+        self.assertTrue(np.isnan(samples["value"][0][3]))
+        self.assertEqual(samples["value"][1][3], 25.0)
+        self.assertEqual(samples["flags"][1][0], 4)
+        self.assertEqual(samples["sample_number"][0][3], -1)
+
+        # Windowed queries of a single channel exclude the reads which did not include it
+        np.testing.assert_array_equal(self._history.channel("m2", window=2.0, now=103.0)["raw_value"], [11, 12])
+        self.assertEqual(len(self._history.channel("m2")["time"]), 3)
+
+        # The oldest reads are overwritten once the buffer is full
+        self._history.record(104.0, {"m1": status(4)})
+        np.testing.assert_array_equal(self._history.window()["time"], [101.0, 102.0, 103.0, 104.0])
+        with self.assertRaises(KeyError):
+            self._history.window(["m9"])
+
+    def test_limits_and_lists(self):
+        self._history.record(100.0, {"m{}".format(index): status(index) for index in range(5)})
+        self.assertEqual(len(self._history.channels), 3)
+        reply = to_lists(self._history.window(window=10.0, now=105.0))
+        self.assertEqual(reply["time"], [100.0])
+        self._history.record(101.0, {"m0": status(1)})
+        reply = to_lists(self._history.window(["m0", self._history.channels[1]]))
+        self.assertEqual(reply["raw_value"][1], [self._history.window()["raw_value"][1][0], None])
+        self.assertEqual(reply["sample_number"][1][1], None)
@@ -0,0 +1,94 @@
+import unittest, threading
+from mock import MagicMock
+from percival.detector.errors import PercivalDetectorError
+from percival.detector.job_queue import Job, JobQueue
+
+
+def make_command(name):
+    command = MagicMock()
+    command.command_name = name
+    command.param_names = []
+    command.parameters = {}
+    command.command_time = "now"
+    return command
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self._queue = JobQueue(max_queued=4, max_history=6)
+
+    def test_submit_and_execute(self):
+        job1 = self._queue.submit(make_command("cmd_1"))
+        job2 = self._queue.submit(make_command("cmd_2"))
+        self.assertEqual(job2.id, job1.id + 1)
+        self.assertEqual(job1.state, Job.QUEUED)
+        self.assertEqual(self._queue.queued, 2)
+
+        job = self._queue.get()
+        self.assertIs(job, job1)
+        self.assertEqual(job.state, Job.ACTIVE)
+        self._queue.finish(job, True, result={'data': 1})
+        status = self._queue.get_job(job1.id).get_status()
+        self.assertEqual(status['response'], Job.COMPLETED)
+        self.assertEqual(status['result'], {'data': 1})
+        self.assertNotEqual(status['started'], '')
+        self.assertNotEqual(status['finished'], '')
+        self.assertEqual(self._queue.get_status()['queued'], [job2.id])
+
+    def test_bounded(self):
+        for index in range(4):
+            self._queue.submit(make_command("cmd_{}".format(index)))
+        with self.assertRaises(PercivalDetectorError):
+            self._queue.submit(make_command("cmd_full"))
+        # History is trimmed of finished jobs only
+        for index in range(4):
+            self._queue.finish(self._queue.get(), True)
+        for index in range(4):
+            self._queue.submit(make_command("cmd_{}".format(index + 4)))
+        self.assertEqual(len(self._queue.get_status()['jobs']), 6)
+        self.assertIsNone(self._queue.get_job(1))
+        self.assertIsNotNone(self._queue.get_job(3))
+
+    def test_cancel(self):
+        job1 = self._queue.submit(make_command("cmd_1"))
+        job2 = self._queue.submit(make_command("cmd_2"))
+        self.assertTrue(self._queue.cancel(job2.id))
+        self.assertEqual(job2.state, Job.CANCELLED)
+        self.assertFalse(self._queue.cancel(job2.id))
+        self.assertIs(self._queue.get(), job1)
+        # Active jobs cannot be cancelled
+        self.assertFalse(self._queue.cancel(job1.id))
+        self.assertFalse(self._queue.cancel(99))
+
+    def test_sequence(self):
+        jobs = self._queue.submit_sequence([make_command("cmd_1"), make_command("cmd_2"), make_command("cmd_3")])
+        self.assertEqual(len(set(job.sequence for job in jobs)), 1)
+        self.assertIsNotNone(jobs[0].sequence)
+        self.assertIsNone(self._queue.submit(make_command("cmd_4")).sequence)
+        # A failure cancels the remainder of the sequence
+        self._queue.finish(self._queue.get(), False, "Error")
+        self.assertEqual(jobs[0].state, Job.FAILED)
+        self.assertEqual(jobs[0].message, "Error")
+        self.assertEqual(jobs[1].state, Job.CANCELLED)
+        self.assertEqual(jobs[2].state, Job.CANCELLED)
+        self.assertEqual(self._queue.get().command.command_name, "cmd_4")
+
+        jobs = self._queue.submit_sequence([make_command("cmd_5"), make_command("cmd_6")])
+        self.assertEqual(self._queue.cancel_sequence(jobs[0].sequence), 2)
+
+    def test_consume_and_shutdown(self):
+        job = self._queue.submit(make_command("cmd_1"))
+
+        def consume():
+            self._queue.finish(self._queue.get(), True)
+        thread = threading.Thread(target=consume)
+        thread.start()
+        thread.join(5.0)
+        self.assertTrue(job.finished)
+
+        queued = self._queue.submit(make_command("cmd_2"))
+        self._queue.shutdown()
+        self.assertEqual(queued.state, Job.CANCELLED)
+        self.assertIsNone(self._queue.get())
+        with self.assertRaises(PercivalDetectorError):
+            self._queue.submit(make_command("cmd_3"))
@@ -1,8 +1,15 @@
 from unittest import TestCase
 
+import json
 import os
+import shutil
+import tempfile
+from mock import MagicMock
+from percival.carrier.configuration import SafetyRuleParameters
 from percival.carrier.simulator import Simulator
+from percival.detector.command import Command
 from percival.detector.detector import PercivalDetector
+from percival.detector.errors import PercivalDetectorError
 
 
 class TestPercivalDetector(TestCase):
@@ -52,3 +59,113 @@ class TestPercivalDetector(TestCase):
         self.assertIsInstance(result, dict)
         pcvl.cleanup()
 
+
+
+class TestScanDataFile(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.detector = MagicMock(spec=PercivalDetector)
+        self.detector._percival_params = MagicMock()
+        self.detector._percival_params.scan_data_dir = os.path.join(self.directory, "scans")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_scan_data_file(self):
+        path = PercivalDetector.scan_data_file(self.detector, "scan.h5")
+        self.assertEqual(path, os.path.join(self.directory, "scans", "scan.h5"))
+        self.assertTrue(os.path.isdir(os.path.join(self.directory, "scans")))
+        # Only new files directly in the scan data directory can be written
+        for name in ["", "..", "../scan.h5", "/tmp/scan.h5", "sub/scan.h5"]:
+            with self.assertRaises(PercivalDetectorError):
+                PercivalDetector.scan_data_file(self.detector, name)
+        open(path, "w").close()
+        with self.assertRaises(PercivalDetectorError):
+            PercivalDetector.scan_data_file(self.detector, "scan.h5")
+        self.detector._percival_params.scan_data_dir = None
+        with self.assertRaises(PercivalDetectorError):
+            PercivalDetector.scan_data_file(self.detector, "scan.h5")
+
+
+class TestReplayMeasurement(TestCase):
+    def test_replay_measurement(self):
+        detector = MagicMock(spec=PercivalDetector)
+        detector._aggregator = None
+        detector._raw_channels = set(["fast"])
+        self.assertEqual(PercivalDetector.replay_measurement(detector, "slow"), "slow")
+        # Replayed reads of aggregated channels are kept apart from the interval means
+        detector._aggregator = MagicMock()
+        self.assertEqual(PercivalDetector.replay_measurement(detector, "slow"), "slow_replay")
+        self.assertEqual(PercivalDetector.replay_measurement(detector, "fast"), "fast")
+
+
+class TestQueueSequence(TestCase):
+    def _sequence(self, names):
+        request = MagicMock()
+        request.path = "/cmd_queue_sequence"
+        request.query = ""
+        request.remote_ip = "1.2.3.4"
+        request.method = "PUT"
+        request.headers = {'User': 'test_user'}
+        request.body = json.dumps({"commands": [{"command": name, "parameters": {}} for name in names]})
+        return Command(request)
+
+    def test_sequence_items(self):
+        detector = MagicMock(spec=PercivalDetector)
+        detector.check_for_abort_command.return_value = False
+        detector.check_for_cancel_command.return_value = False
+        detector._jobs = MagicMock()
+        PercivalDetector.queue_command(detector, self._sequence(["cmd_set_channel", "cmd_apply_setpoint"]))
+        commands = detector._jobs.submit_sequence.call_args[0][0]
+        self.assertEqual([c.command_name for c in commands], ["cmd_set_channel", "cmd_apply_setpoint"])
+        # Commands that are executed immediately, and nested sequences, are rejected
+        for name in ["cmd_abort_scan", "cmd_cancel_job", "cmd_queue_sequence"]:
+            detector._jobs.reset_mock()
+            with self.assertRaises(PercivalDetectorError):
+                PercivalDetector.queue_command(detector, self._sequence(["cmd_set_channel", name]))
+            self.assertFalse(detector._jobs.submit_sequence.called)
+
+
+class TestLoadSafety(TestCase):
+    def test_targets(self):
+        ini = SafetyRuleParameters(u"[Safety_rule<0000>]\n"
+                                   u"Rule_name = \"Known\"\n"
+                                   u"Channels = \"T1\"\n"
+                                   u"High_threshold = 60.0\n"
+                                   u"Action = \"setpoint\"\n"
+                                   u"Setpoint = \"SAFE_OFF\"\n"
+                                   u"\n"
+                                   u"[Safety_rule<0001>]\n"
+                                   u"Rule_name = \"Unknown_setpoint\"\n"
+                                   u"Channels = \"T1\"\n"
+                                   u"High_threshold = 60.0\n"
+                                   u"Action = \"setpoint\"\n"
+                                   u"Setpoint = \"SAFE_0FF\"\n"
+                                   u"\n"
+                                   u"[Safety_rule<0002>]\n"
+                                   u"Rule_name = \"Command\"\n"
+                                   u"Channels = \"V1\"\n"
+                                   u"Low_threshold = 1.0\n"
+                                   u"Action = \"system_command\"\n"
+                                   u"Command = \"fast_sensor_powerdown\"\n"
+                                   u"\n"
+                                   u"[Safety_rule<0003>]\n"
+                                   u"Rule_name = \"Unknown_command\"\n"
+                                   u"Channels = \"V1\"\n"
+                                   u"Low_threshold = 1.0\n"
+                                   u"Action = \"system_command\"\n"
+                                   u"Command = \"fast_sensor_shutdown\"\n")
+        ini.load_ini()
+        detector = MagicMock(spec=PercivalDetector)
+        detector._log = MagicMock()
+        detector._percival_params = MagicMock()
+        detector._percival_params.safety_params = ini
+        detector._setpoint_control = MagicMock()
+        detector._setpoint_control.set_points = ["SAFE_OFF"]
+        detector._safety = MagicMock()
+        detector._global_monitoring = True
+        PercivalDetector.load_safety(detector)
+        # Rules whose set-point or system command does not exist are left out
+        rules = detector._safety.load.call_args[0][0]
+        self.assertEqual([rule.name for rule in rules], ["Known", "Command"])
+        self.assertEqual(detector._log.error.call_count, 2)
@@ -0,0 +1,92 @@
+import unittest
+import time
+
+from percival.carrier.configuration import SafetyRuleParameters
+from percival.detector.safety import SafetyEngine, SafetyRule
+from percival.detector.status_service import StatusSnapshot
+
+RULES = u"[Safety_rule<0000>]\n" \
+        u"Rule_name = \"Overtemperature\"\n" \
+        u"Channels = \"Temperatures\"\n" \
+        u"High_threshold = 60.0\n" \
+        u"Hysteresis = 5.0\n" \
+        u"Action = \"setpoint\"\n" \
+        u"Setpoint = \"SAFE_OFF\"\n" \
+        u"Steps = 5\n" \
+        u"\n" \
+        u"[Safety_rule<0001>]\n" \
+        u"Rule_name = \"Undervoltage\"\n" \
+        u"Channels = \"V1, V2\"\n" \
+        u"Low_threshold = 1.0\n" \
+        u"Action = \"system_command\"\n" \
+        u"Command = \"fast_sensor_powerdown\"\n"
+
+
+def snapshot(values):
+    channels = {name: {"value": value} for name, value in values.items()}
+    return StatusSnapshot(None, channels, {name: time.time() for name in values}, list(values), time.time())
+
+
+class TestSafetyEngine(unittest.TestCase):
+    def setUp(self):
+        ini = SafetyRuleParameters(RULES)
+        ini.load_ini()
+        self.rules = [SafetyRule.from_ini(ini.get_name(section), ini.get_options(section)) for section in ini.sections]
+        self.actions = []
+        self.engine = SafetyEngine(lambda rule, channels: self.actions.append((rule.name, channels)))
+        groups = {"Temperatures": ["T1", "T2"]}
+        self.engine.load(self.rules, lambda names: [channel for name in names for channel in groups.get(name, [name])])
+
+    def test_rules(self):
+        self.assertEqual([rule.name for rule in self.rules], ["Overtemperature", "Undervoltage"])
+        self.assertEqual(self.rules[0].channels, ["Temperatures"])
+        self.assertEqual(self.rules[0].target, "SAFE_OFF")
+        self.assertEqual(self.rules[0].steps, 5)
+        self.assertIsNone(self.rules[0].low)
+        self.assertEqual(self.rules[1].channels, ["V1", "V2"])
+        self.assertEqual(self.rules[1].target, "fast_sensor_powerdown")
+        self.assertEqual(self.engine.channels, ["T1", "T2", "V1", "V2"])
+        with self.assertRaises(ValueError):
+            SafetyRule.from_ini("No thresholds", {"Channels": "T1", "Action": "setpoint", "Setpoint": "OFF"})
+        with self.assertRaises(ValueError):
+            SafetyRule.from_ini("No action", {"Channels": "T1", "High_threshold": "1.0"})
+
+    def test_hysteresis(self):
+        self.assertEqual(self.engine.evaluate(snapshot({"T1": 50.0, "T2": 55.0, "V1": 2.0, "V2": 2.0})), [])
+        events = self.engine.evaluate(snapshot({"T1": 50.0, "T2": 61.0, "V1": 2.0, "V2": 2.0}))
+        self.assertEqual(self.actions, [("Overtemperature", ["T2"])])
+        self.assertEqual(events[0]["values"], [61.0])
+        self.assertTrue(events[0]["success"])
+        self.assertGreaterEqual(events[0]["detection_to_action"], 0.0)
+        self.assertGreaterEqual(events[0]["read_to_detection"], 0.0)
+        # The rule stays tripped, without acting again, until the channel is back below 55
+        self.engine.evaluate(snapshot({"T1": 62.0, "T2": 58.0}))
+        self.engine.evaluate(snapshot({"T1": 54.0, "T2": 58.0}))
+        self.assertEqual(len(self.actions), 1)
+        self.assertEqual(self.engine.get_status()["tripped"], ["T2"])
+        self.engine.evaluate(snapshot({"T1": 54.0, "T2": 54.0}))
+        self.assertFalse(self.engine.get_status()["rules"][0]["tripped"])
+        self.engine.evaluate(snapshot({"T1": 70.0, "T2": 54.0}))
+        self.assertEqual(self.actions[-1], ("Overtemperature", ["T1"]))
+
+    def test_status(self):
+        # Missing values neither trip nor clear a rule, failed actions are recorded
+        self.engine = SafetyEngine(lambda rule, channels: 1 / 0)
+        self.engine.load(self.rules, lambda names: names)
+        self.assertEqual(self.engine.evaluate(snapshot({"V1": 2.0})), [])
+        events = self.engine.evaluate(snapshot({"V1": 2.0, "V2": 0.5}))
+        self.assertFalse(events[0]["success"])
+        status = self.engine.get_status()
+        self.assertEqual(status["latency"]["count"], 1)
+        self.assertIn("max", status["latency"])
+        self.assertEqual(len(status["events"]), 1)
+        self.assertTrue(status["rules"][1]["tripped"])
+
+    def test_stale(self):
+        self.engine.evaluate(snapshot({"V1": 2.0, "V2": 2.0}))
+        # A value carried over from an earlier read is not checked again
+        stale = StatusSnapshot(None, {"V1": {"value": 2.0}, "V2": {"value": 0.5}}, {}, ["V1"], time.time())
+        self.assertEqual(self.engine.evaluate(stale), [])
+        self.assertEqual(self.actions, [])
+        self.engine.evaluate(snapshot({"V2": 0.5}))
+        self.assertEqual(self.actions, [("Undervoltage", ["V2"])])
@@ -0,0 +1,47 @@
+import unittest
+
+import numpy
+
+from percival.detector.scan_grid import GridDimension, GridPlan, grid_indices
+
+
+class TestScanGrid(unittest.TestCase):
+    def test_indices(self):
+        numpy.testing.assert_array_equal(grid_indices([2, 3], snake=False),
+                                         [[0, 0], [0, 1], [0, 2], [1, 0], [1, 1], [1, 2]])
+        numpy.testing.assert_array_equal(grid_indices([2, 3]),
+                                         [[0, 0], [0, 1], [0, 2], [1, 2], [1, 1], [1, 0]])
+        # With snake ordering every step moves one dimension by one point
+        indices = grid_indices([3, 2, 4])
+        self.assertEqual(indices.shape, (24, 3))
+        self.assertEqual(len(set(map(tuple, indices))), 24)
+        numpy.testing.assert_array_equal(numpy.abs(numpy.diff(indices, axis=0)).sum(axis=1), [1] * 23)
+
+    def test_dimension(self):
+        # The set-point shared by two segments is only visited once
+        dimension = GridDimension.from_set_points(["a"], [[0, 4, 0]], 3, 0.1)
+        numpy.testing.assert_array_equal(dimension.values, [[0, 2, 4, 2, 0]])
+        self.assertEqual(dimension.size, 5)
+        with self.assertRaises(ValueError):
+            GridDimension(["a"], [[]], 0.1)
+
+    def test_plan(self):
+        outer = GridDimension(["a"], [[0, 10]], 1.0)
+        inner = GridDimension(["b", "c"], [[1, 2, 3], [5, 5, 6]], 0.1)
+        plan = GridPlan([outer, inner])
+        self.assertEqual(plan.shape, [2, 3])
+        self.assertEqual(plan.channels, ["a", "b", "c"])
+        numpy.testing.assert_array_equal(plan.points, [[0, 0, 0, 10, 10, 10],
+                                                       [1, 2, 3, 3, 2, 1],
+                                                       [5, 5, 6, 6, 5, 5]])
+        # Steps are held for the dwell of the outermost dimension which moved into them
+        numpy.testing.assert_array_almost_equal(plan.dwell, [1.0, 0.1, 0.1, 1.0, 0.1, 0.1])
+        self.assertAlmostEqual(plan.duration, 2.3)
+        self.assertEqual(plan.writes(3), [("a", 10)])
+        plan.start()
+        self.assertAlmostEqual(plan.deadline(3) - plan.deadline(0), 1.2)
+        progress = plan.get_progress(4)
+        self.assertEqual(progress["position"], [1, 2])
+        self.assertAlmostEqual(progress["fraction"], 4.0 / 6.0)
+        with self.assertRaises(ValueError):
+            GridPlan([outer, GridDimension(["a"], [[1, 2]], 0.1)])
@@ -0,0 +1,80 @@
+import unittest
+import time
+
+import numpy
+
+from percival.detector.scan_plan import ScanPlan, interpolate, ramp
+
+
+class TestScanPlan(unittest.TestCase):
+    def test_interpolate(self):
+        values = [[1, 10, 4], [0, 7, 7], [15, 3, 15]]
+        points = interpolate(values, 6)
+        self.assertEqual(points.shape, (3, 12))
+        for channel, row in enumerate(values):
+            expected = numpy.concatenate([numpy.linspace(row[0], row[1], 6, dtype=int),
+                                          numpy.linspace(row[1], row[2], 6, dtype=int)])
+            numpy.testing.assert_array_equal(points[channel], expected)
+        numpy.testing.assert_array_equal(interpolate([[3, 8]], 1), [[3]])
+
+    def test_changes(self):
+        plan = ScanPlan.from_set_points(["a", "b"], [[0, 4], [2, 2]], 5, 0.1)
+        self.assertEqual(plan.steps, 5)
+        self.assertAlmostEqual(plan.duration, 0.4)
+        # Every channel is written at the first step, then only the demands which change
+        self.assertEqual(plan.writes(0), [("a", 0), ("b", 2)])
+        self.assertEqual(plan.writes(1), [("a", 1)])
+        self.assertEqual(plan.changes[1].tolist(), [True, False, False, False, False])
+        self.assertEqual(plan.as_dict()["a"].tolist(), [0, 1, 2, 3, 4])
+
+    def test_timing(self):
+        plan = ScanPlan.from_set_points(["a"], [[0, 2]], 3, 0.05)
+        self.assertEqual(plan.get_timing()["executed"], 0)
+        plan.start()
+        self.assertAlmostEqual(plan.deadline(2) - plan.deadline(0), 0.1, places=6)
+        plan.record(0)
+        time.sleep(plan.time_to(1) + 0.01)
+        plan.record(1)
+        timing = plan.get_timing()
+        self.assertEqual(timing["executed"], 2)
+        self.assertEqual(len(timing["lateness"]), 2)
+        self.assertGreaterEqual(timing["max_lateness"], 0.01)
+        self.assertIn("expected_end", timing)
+        self.assertTrue(numpy.isnan(plan.lateness[2]))
+
+    def test_ramp(self):
+        # 10 counts at 5 counts/s, 100 counts at 100 counts/s, a channel at its target and an unlimited channel
+        points = ramp([0, 100, 50, 0], [10, 0, 50, 7], [5, 100, 0, 0], 0.5)
+        numpy.testing.assert_array_equal(points, [[0, 2, 5, 7, 10],
+                                                  [100, 50, 0, 0, 0],
+                                                  [50, 50, 50, 50, 50],
+                                                  [7, 7, 7, 7, 7]])
+        # The slew rate is never exceeded, demands are rounded towards the start
+        numpy.testing.assert_array_equal(ramp([0], [10], [3], 1.0), [[0, 3, 6, 9, 10]])
+
+    def test_catch_up(self):
+        plan = ScanPlan.from_ramp(["a", "b"], [0, 0], [40, 4], [100, 10], 0.1)
+        self.assertTrue(plan.catch_up)
+        self.assertEqual(plan.steps, 5)
+        plan.start()
+        self.assertEqual(plan.due_step(0), 0)
+        time.sleep(0.25)
+        # Steps 1 and 2 are overdue, so step 2 is applied next with the demands which differ from step 0
+        self.assertEqual(plan.due_step(1), 2)
+        self.assertEqual(plan.writes(2, 0), [("a", 20), ("b", 2)])
+        time.sleep(0.3)
+        self.assertEqual(plan.due_step(3), 4)
+        # A plan which does not catch up applies every step
+        plan = ScanPlan.from_set_points(["a"], [[0, 4]], 5, 0.01)
+        plan.start()
+        time.sleep(0.05)
+        self.assertEqual(plan.due_step(1), 1)
+
+    def test_dwell_per_step(self):
+        plan = ScanPlan(["a"], [[0, 1, 2, 3]], [0.5, 0.1, 0.2, 0.3])
+        self.assertAlmostEqual(plan.duration, 0.8)
+        self.assertEqual(plan.get_progress(0), {"step": 0, "steps": 4, "fraction": 0.0})
+        plan.start()
+        self.assertAlmostEqual(plan.deadline(2) - plan.deadline(0), 0.6, places=6)
+        self.assertAlmostEqual(plan.get_progress(2)["remaining"], 0.8, places=1)
+        self.assertEqual(plan.get_timing()["dwell"], [0.5, 0.1, 0.2, 0.3])
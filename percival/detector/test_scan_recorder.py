@@ -0,0 +1,66 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+import h5py
+import numpy
+
+from percival.detector.scan_plan import ScanPlan
+from percival.detector.scan_recorder import ScanRecorder
+
+
+def read_channels(channels):
+    # Every channel reads back its position in the list, except "missing" which cannot be read
+    return {name: {"value": 0.5 * index, "raw_value": 10 * index, "sample_number": index, "high_threshold": 1}
+            for index, name in enumerate(channels) if name != "missing"}
+
+
+class TestScanRecorder(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.plan = ScanPlan.from_set_points(["dac1", "dac2"], [[0, 4], [10, 10]], 5, 0.0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_memory(self):
+        recorder = ScanRecorder(["mon1", "missing", "mon2"], read_channels)
+        recorder.open(self.plan)
+        for step in range(3):
+            recorder.record(step)
+        recorder.close()
+        self.assertEqual(recorder.rows, 3)
+        data = recorder.get_data()
+        self.assertEqual(data["channels"], ["mon1", "missing", "mon2"])
+        self.assertEqual(data["controls"], ["dac1", "dac2"])
+        self.assertEqual(data["step"], [0, 1, 2])
+        self.assertEqual(data["demands"], [[0, 10], [1, 10], [2, 10]])
+        self.assertEqual(data["value"][1], [0.0, None, 1.0])
+        self.assertEqual(data["raw_value"][1], [0, None, 20])
+        self.assertEqual(data["flags"][0], [4, None, 4])
+        self.assertEqual(len(data["time"]), 3)
+
+    def test_file(self):
+        filename = os.path.join(self.directory, "scan.h5")
+        recorder = ScanRecorder(["mon1", "mon2"], read_channels, filename, chunk_rows=2)
+        recorder.open(self.plan)
+        for step in range(3):
+            recorder.record(step)
+            if step == 1:
+                # A full chunk is written to the file as the scan progresses
+                with h5py.File(filename, "r") as scan_file:
+                    self.assertEqual(scan_file["monitors/value"].shape, (2, 2))
+        recorder.close()
+        with h5py.File(filename, "r") as scan_file:
+            self.assertEqual(scan_file.attrs["steps"], 5)
+            numpy.testing.assert_array_equal(scan_file["step"][:], [0, 1, 2])
+            numpy.testing.assert_array_equal(scan_file["demands"][:], [[0, 10], [1, 10], [2, 10]])
+            numpy.testing.assert_array_equal(scan_file["monitors/raw_value"][:], [[0, 10]] * 3)
+            # Older versions of h5py return the names as bytes
+            names = [name.decode("utf-8") if isinstance(name, bytes) else name
+                     for name in scan_file["monitors"].attrs["channels"]]
+            self.assertEqual(names, ["mon1", "mon2"])
+        # An existing file is never overwritten
+        with self.assertRaises((IOError, OSError, ValueError)):
+            ScanRecorder(["mon1"], read_channels, filename).open(self.plan)
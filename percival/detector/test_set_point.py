@@ -1,6 +1,7 @@
-import unittest, logging, time
+import unittest, logging, threading, time
 from mock import MagicMock, call
 from percival.detector.set_point import SetPointControl
+from percival.detector.errors import PercivalDetectorError
 
 
 class TestSetPointControl(unittest.TestCase):
@@ -117,3 +118,190 @@ class TestSetPointControl(unittest.TestCase):
         # Verify no other calls were made to the Mock
         self.assertEqual(self._detector.set_value.call_count, 10)
 
+
+    def test_scan_deadlines(self):
+        ini = MagicMock()
+        ini.sections = ["sp1", "sp2", "sp3"]
+        ini.get_name = MagicMock()
+        ini.get_name.side_effect = ["sp_name_1", "sp_name_2", "sp_name_3"]
+        ini.get_setpoints = MagicMock()
+        ini.get_setpoints.side_effect = [{"device1": 0.0, "device2": 5.0},
+                                         {"device1": 4.0, "device2": 5.0},
+                                         {"device1": 0.0, "device2": 9.0}]
+        self._spc.load_ini(ini)
+
+        # Each write takes 20 ms, which must not add to the 50 ms period of the steps
+        self._detector.set_value = MagicMock(side_effect=lambda name, value: time.sleep(0.02))
+        self._spc.start_scan_loop()
+        start = time.time()
+        self._spc.scan_set_points(["sp_name_1", "sp_name_2", "sp_name_3"], 5, 50)
+        self._spc.wait_for_scan_to_complete()
+        elapsed = time.time() - start
+        self._spc.stop_scan_loop()
+
+        # Both segments are scanned, writing only the demands which change
+        calls = [call("device1", 0), call("device2", 5),
+                 call("device1", 1), call("device1", 2), call("device1", 3), call("device1", 4),
+                 call("device1", 3), call("device2", 6), call("device1", 2), call("device2", 7),
+                 call("device1", 1), call("device2", 8), call("device1", 0), call("device2", 9)]
+        self.assertEqual(self._detector.set_value.call_args_list, calls)
+        # 9 steps of 50 ms after the first, plus the writes of the last step
+        self.assertLess(elapsed, 0.6)
+        timing = self._spc.get_timing()
+        self.assertEqual(timing["executed"], 10)
+        self.assertLess(timing["max_lateness"], 0.05)
+        self.assertEqual(self._spc.get_status()["timing"]["steps"], 10)
+
+    def test_scan_record(self):
+        ini = MagicMock()
+        ini.sections = ["sp1", "sp2"]
+        ini.get_name = MagicMock()
+        ini.get_name.side_effect = ["sp_name_1", "sp_name_2"]
+        ini.get_setpoints = MagicMock()
+        ini.get_setpoints.side_effect = [{"device1": 0.0}, {"device1": 3.0}]
+        self._spc.load_ini(ini)
+
+        recorder = MagicMock()
+        # Record the time each step was captured relative to the time its demand was written
+        written = {}
+        captured = {}
+        self._detector.set_value = MagicMock(side_effect=lambda name, value: written.update({value: time.time()}))
+        recorder.record = MagicMock(side_effect=lambda step: captured.update({step: time.time()}))
+        self._spc.start_scan_loop()
+        self._spc.scan_set_points(["sp_name_1", "sp_name_2"], 4, 100, recorder=recorder, settle=30)
+        self._spc.wait_for_scan_to_complete()
+        self._spc.stop_scan_loop()
+
+        recorder.open.assert_called_once()
+        self.assertEqual(recorder.record.call_args_list, [call(0), call(1), call(2), call(3)])
+        recorder.close.assert_called()
+        for step in range(4):
+            self.assertGreaterEqual(captured[step] - written[step], 0.025)
+        self.assertIs(self._spc.recorder, recorder)
+
+    def test_ramp(self):
+        ini = MagicMock()
+        ini.sections = ["sp1"]
+        ini.get_name = MagicMock(return_value="sp_name_1")
+        ini.get_setpoints = MagicMock(return_value={"device{}".format(index): 40.0 for index in range(10)})
+        self._spc.load_ini(ini)
+        self.assertEqual(self._spc.get_channels("sp_name_1"), ["device{}".format(index) for index in range(10)])
+
+        # Every channel starts at 0, device0 is the slowest at 100 counts/s.  Each write takes 5 ms so writing all
+        # ten channels overruns the 20 ms ticks, but the ramp still finishes when the slowest channel does
+        self._detector.get_value = MagicMock(return_value=0)
+        values = {}
+        self._detector.set_value = MagicMock(side_effect=lambda name, value: (time.sleep(0.005),
+                                                                              values.update({name: value})))
+        slew_rates = {"device{}".format(index): 1000.0 for index in range(10)}
+        slew_rates["device0"] = 100.0
+        self._spc.start_scan_loop()
+        start = time.time()
+        self._spc.ramp_set_point("sp_name_1", slew_rates, 0.02)
+        self._spc.wait_for_scan_to_complete()
+        elapsed = time.time() - start
+        self._spc.stop_scan_loop()
+
+        self.assertEqual(values, {"device{}".format(index): 40 for index in range(10)})
+        self.assertGreaterEqual(elapsed, 0.4)
+        self.assertLess(elapsed, 0.55)
+        # device0 never moves faster than its slew rate
+        demands = [args[1] for args, kwargs in self._detector.set_value.call_args_list if args[0] == "device0"]
+        self.assertEqual(demands, sorted(demands))
+
+    def test_scan_grid(self):
+        ini = MagicMock()
+        ini.sections = ["sp1", "sp2"]
+        ini.get_name = MagicMock()
+        ini.get_name.side_effect = ["sp_name_1", "sp_name_2"]
+        ini.get_setpoints = MagicMock()
+        ini.get_setpoints.side_effect = [{"device1": 0.0}, {"device1": 20.0}]
+        self._spc.load_ini(ini)
+
+        self._detector.set_value = MagicMock()
+        self._spc.start_scan_loop()
+        # Two points of the set-points outer dimension, three points of the device2 inner dimension
+        self._spc.scan_grid([{"setpoints": ["sp_name_1", "sp_name_2"], "steps": 1, "dwell": 60},
+                             {"channel": "device2", "start": 0, "stop": 4, "steps": 2, "dwell": 20}])
+        self._spc.wait_for_scan_to_complete()
+        progress = self._spc.get_progress()
+        self._spc.stop_scan_loop()
+
+        # The inner dimension runs backwards on the second pass
+        calls = [call("device1", 0), call("device2", 0), call("device2", 2), call("device2", 4),
+                 call("device1", 20), call("device2", 2), call("device2", 0)]
+        self.assertEqual(self._detector.set_value.call_args_list, calls)
+        self.assertEqual(progress["step"], 6)
+        self.assertEqual(progress["shape"], [2, 3])
+        self.assertEqual(progress["position"], [1, 0])
+        self.assertAlmostEqual(self._spc.get_timing()["dwell"][3], 0.06)
+        with self.assertRaises(ValueError):
+            self._spc.scan_grid([{"channel": "device2", "start": 0, "stop": 4}])
+
+    def test_safety_scan(self):
+        ini = MagicMock()
+        ini.sections = ["sp1", "sp2"]
+        ini.get_name = MagicMock()
+        ini.get_name.side_effect = ["sp_name_1", "sp_name_2"]
+        ini.get_setpoints = MagicMock()
+        ini.get_setpoints.side_effect = [{"device1": 0.0}, {"device1": 20.0}]
+        self._spc.load_ini(ini)
+
+        self._detector.get_value = MagicMock(return_value=0)
+        self._detector.set_value = MagicMock()
+        recorder = MagicMock()
+        self._spc.start_scan_loop()
+        self._spc.safety_scan_set_point("sp_name_2", 5, 100)
+        self.assertTrue(self._spc.get_status()["safety_scan"])
+        # Scans requested by users are rejected until the safety scan has finished or is aborted
+        with self.assertRaises(PercivalDetectorError):
+            self._spc.scan_set_points(["sp_name_1", "sp_name_2"], 2, 10)
+        with self.assertRaises(PercivalDetectorError):
+            self._spc.ramp_set_point("sp_name_1", {}, 0.01)
+        with self.assertRaises(PercivalDetectorError):
+            self._spc.scan_grid([{"channel": "device1", "start": 0, "stop": 4, "dwell": 10}])
+        with self.assertRaises(PercivalDetectorError):
+            self._spc._start_plan(MagicMock(), recorder)
+        recorder.close.assert_called_once_with()
+        self._spc.abort_scan(1.0)
+        self.assertFalse(self._spc.safety_scan_active)
+        self._spc.scan_set_points(["sp_name_1", "sp_name_2"], 2, 10)
+        self._spc.wait_for_scan_to_complete()
+        self._spc.stop_scan_loop()
+        self.assertEqual(self._detector.set_value.call_args_list[-1], call("device1", 20))
+
+    def test_safety_preemption(self):
+        ini = MagicMock()
+        ini.sections = ["sp1", "sp2"]
+        ini.get_name = MagicMock()
+        ini.get_name.side_effect = ["sp_name_1", "sp_name_2"]
+        ini.get_setpoints = MagicMock()
+        ini.get_setpoints.side_effect = [{"device1": 0.0}, {"device1": 20.0}]
+        self._spc.load_ini(ini)
+
+        self._detector.get_value = MagicMock(return_value=0)
+        self._detector.set_value = MagicMock(side_effect=lambda name, value: time.sleep(0.1))
+        recorder = MagicMock()
+        errors = []
+
+        def wait():
+            try:
+                self._spc.wait_for_scan_to_complete()
+            except PercivalDetectorError as ex:
+                errors.append(ex)
+        self._spc.start_scan_loop()
+        self._spc.scan_set_points(["sp_name_1", "sp_name_2"], 20, 10, recorder=recorder)
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        time.sleep(0.05)
+        # The scan loop is still applying a step when the safety scan starts
+        error = PercivalDetectorError("Scan aborted by safety rule")
+        self.assertFalse(self._spc.abort_scan(error=error))
+        self._spc.safety_scan_set_point("sp_name_1", 2, 10)
+        # The recording of the aborted scan is closed before it is replaced, and its job fails
+        recorder.close.assert_called_once_with()
+        self.assertIsNone(self._spc.recorder)
+        waiter.join(5.0)
+        self.assertEqual(errors, [error])
+        self._spc.wait_for_scan_to_complete()
+        self._spc.stop_scan_loop()
@@ -0,0 +1,71 @@
+import unittest
+
+import numpy
+
+from percival.carrier.configuration import SetpointGroupParameters
+from percival.detector.set_point_matrix import SetPointMatrix
+
+SETPOINTS = u"[Setpoint_Group<0000>]\n" \
+            u"Setpoint_name = \"LOW\"\n" \
+            u"Setpoint_description = \"Low\"\n" \
+            u"dac1 = 0\n" \
+            u"dac2 = 10\n" \
+            u"\n" \
+            u"[Setpoint_Group<0001>]\n" \
+            u"Setpoint_name = \"HIGH\"\n" \
+            u"Setpoint_description = \"High\"\n" \
+            u"dac1 = 100\n" \
+            u"dac2 = 50\n" \
+            u"dac3 = 7\n" \
+            u"\n" \
+            u"[Setpoint_Group<0002>]\n" \
+            u"Setpoint_name = \"PARTIAL\"\n" \
+            u"Setpoint_description = \"Partial\"\n" \
+            u"dac2 = \"30\"\n" \
+            u"dac4 = bad\n"
+
+
+class TestSetPointMatrix(unittest.TestCase):
+    def setUp(self):
+        ini = SetpointGroupParameters(SETPOINTS)
+        ini.load_ini()
+        self.matrix = SetPointMatrix.compile(ini)
+
+    def test_compile(self):
+        self.assertEqual(self.matrix.names, ["LOW", "HIGH", "PARTIAL"])
+        # Channels with invalid values are left out
+        self.assertEqual(self.matrix.channels, ["dac1", "dac2", "dac3"])
+        numpy.testing.assert_array_equal(self.matrix.values, [[0, 10, 0], [100, 50, 7], [0, 30, 0]])
+        numpy.testing.assert_array_equal(self.matrix.defined, [[True, True, False],
+                                                               [True, True, True],
+                                                               [False, True, False]])
+        self.assertIn("HIGH", self.matrix)
+        self.assertNotIn("MISSING", self.matrix)
+
+    def test_get(self):
+        self.assertEqual(self.matrix.get("HIGH"), {"dac1": 100, "dac2": 50, "dac3": 7})
+        self.assertEqual(self.matrix.get("LOW", "dac2"), {"dac2": 10})
+        # Channels which are not defined by the set-point are not returned
+        self.assertEqual(self.matrix.get("PARTIAL", ["dac1", "dac2"]), {"dac2": 30})
+        with self.assertRaises(ValueError):
+            self.matrix.get("MISSING")
+
+    def test_path(self):
+        channels, values = self.matrix.path(["LOW", "HIGH", "LOW"], ["dac1", "dac2"])
+        self.assertEqual(channels, ["dac1", "dac2"])
+        numpy.testing.assert_array_equal(values, [[0, 100, 0], [10, 50, 10]])
+        channels, values = self.matrix.path(["PARTIAL", "HIGH"], ["dac2"])
+        self.assertEqual(channels, ["dac2"])
+        numpy.testing.assert_array_equal(values, [[30, 50]])
+        # Every set-point of a path must define every channel
+        with self.assertRaises(ValueError):
+            self.matrix.path(["LOW", "HIGH"])
+        with self.assertRaises(ValueError):
+            self.matrix.path(["PARTIAL", "HIGH"], ["dac1", "dac2"])
+
+    def test_distance(self):
+        self.assertEqual(self.matrix.difference("LOW", "HIGH"), {"dac1": 100.0, "dac2": 40.0})
+        distances = self.matrix.distance({"dac1": 0, "dac2": 20})
+        self.assertEqual(distances["LOW"], {"max": 10.0, "total": 10.0, "channels": 1})
+        self.assertEqual(distances["HIGH"], {"max": 100.0, "total": 130.0, "channels": 2})
+        self.assertEqual(distances["PARTIAL"], {"max": 10.0, "total": 10.0, "channels": 1})
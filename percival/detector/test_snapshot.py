@@ -0,0 +1,42 @@
+import unittest, threading
+from percival.detector.snapshot import SnapshotStore
+
+
+class TestSnapshotStore(unittest.TestCase):
+    def setUp(self):
+        self._store = SnapshotStore()
+
+    def test_publish(self):
+        self.assertEqual(self._store.current.generation, 0)
+        self.assertIsNone(self._store.get("status"))
+        status = {"monitor1": {"value": 1.0}}
+        self._store.publish({"status": status, "controls": ["c1"]})
+        first = self._store.current
+        self.assertEqual(first.generation, 1)
+        self.assertEqual(sorted(first.parameters), ["controls", "status"])
+
+        # Published values are copies so later changes by the publisher are not visible
+        status["monitor1"]["value"] = 2.0
+        self.assertEqual(self._store.get("status"), {"monitor1": {"value": 1.0}})
+
+        # Publishing a subset keeps the other parameters and does not alter the previous snapshot
+        self._store.publish({"status": status})
+        self.assertEqual(self._store.current.generation, 2)
+        self.assertEqual(self._store.get("controls"), ["c1"])
+        self.assertEqual(self._store.get("status"), {"monitor1": {"value": 2.0}})
+        self.assertEqual(first.get("status"), {"monitor1": {"value": 1.0}})
+        self.assertIn("controls", self._store.current)
+        self.assertNotIn("groups", self._store.current)
+
+    def test_concurrent_publish(self):
+        def publish(name):
+            for index in range(200):
+                self._store.publish({name: index})
+        threads = [threading.Thread(target=publish, args=("p{}".format(index),)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self._store.current.generation, 800)
+        for index in range(4):
+            self.assertEqual(self._store.get("p{}".format(index)), 199)
@@ -0,0 +1,100 @@
+import unittest, threading, time
+from mock import MagicMock
+from percival.clock import monotonic
+from percival.detector.status_service import StatusService
+
+
+class TestStatusService(unittest.TestCase):
+    def setUp(self):
+        self._value = 0
+        self._release = threading.Event()
+        self._release.set()
+        self._service = StatusService(self.read_status, period=0.1)
+
+    def tearDown(self):
+        self._service.stop()
+
+    def read_status(self):
+        self._release.wait()
+        self._value += 1
+        return {"Image_counter": self._value}, {"m1": {"value": self._value}}
+
+    def test_refresh(self):
+        listener = MagicMock()
+        self._service.add_listener(listener)
+        self.assertIsNone(self._service.latest)
+        snapshot = self._service.refresh()
+        self.assertEqual(snapshot.detector, {"Image_counter": 1})
+        self.assertEqual(snapshot.updated, ["m1"])
+        self.assertLessEqual(snapshot.read_clock, monotonic())
+        listener.assert_called_once_with(snapshot)
+
+        # A recent snapshot is shared, a forced refresh reads again
+        self.assertIs(self._service.refresh(max_age=10.0), snapshot)
+        self.assertEqual(self._service.reads, 1)
+        self.assertEqual(self._service.refresh().channels["m1"], {"value": 2})
+        self.assertEqual(self._service.reads, 2)
+
+        status = self._service.latest.get_status(now=self._service.latest.read_time + 0.5)
+        self.assertEqual(status["m1"]["value"], 2)
+        self.assertAlmostEqual(status["m1"]["age"], 0.5)
+        self.assertIn("timestamp", status)
+
+    def test_channel_age(self):
+        channels = [{"m1": {"value": 1}, "m2": {"value": 1}}, {"m1": {"value": 2}}]
+        service = StatusService(lambda: (None, channels.pop(0)), period=0.1)
+        first = service.refresh()
+        second = service.refresh()
+        self.assertEqual(second.updated, ["m1"])
+        # Channels which were not read keep their last value and age
+        self.assertEqual(second.channels["m2"], {"value": 1})
+        self.assertAlmostEqual(second.age("m2", now=second.read_time), second.read_time - first.read_time)
+        self.assertEqual(second.age("m1", now=second.read_time), 0.0)
+        self.assertFalse(second.detector_updated)
+
+    def test_coalesced(self):
+        self._release.clear()
+        results = []
+
+        def request():
+            results.append(self._service.refresh())
+        threads = [threading.Thread(target=request) for index in range(5)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)
+        self._release.set()
+        for thread in threads:
+            thread.join()
+        # All concurrent requests are served by a single read
+        self.assertEqual(self._service.reads, 1)
+        self.assertEqual(len(set(id(snapshot) for snapshot in results)), 1)
+
+    def test_read_failure(self):
+        self._service.refresh()
+        self._service._read_status = MagicMock(side_effect=RuntimeError("No response"))
+        snapshot = self._service.refresh()
+        self.assertEqual(snapshot.updated, [])
+        self.assertEqual(snapshot.detector, {"Image_counter": 1})
+
+    def test_update_failure(self):
+        listener = MagicMock()
+        self._service.add_listener(listener)
+        # Without a previous snapshot there is nothing to return and the listeners are not called
+        self._service._read_status = MagicMock(return_value=({"Image_counter": 1}, None))
+        self.assertIsNone(self._service.refresh())
+        self.assertFalse(listener.called)
+        self._service._read_status = self.read_status
+        snapshot = self._service.refresh()
+        self._service._read_status = MagicMock(return_value=({"Image_counter": 1}, None))
+        self.assertIs(self._service.refresh(), snapshot)
+        listener.assert_called_once_with(snapshot)
+
+    def test_periodic(self):
+        self._service.start()
+        self.assertTrue(self._service.running)
+        time.sleep(0.55)
+        self._service.stop()
+        self.assertFalse(self._service.running)
+        # One read per period
+        self.assertGreaterEqual(self._service.reads, 4)
+        self.assertLessEqual(self._service.reads, 7)
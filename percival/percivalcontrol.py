@@ -16,6 +16,7 @@ def options():
     parser.add_argument("-i", "--init", action="store_true", help="Initialise DAC channels on the board")
     parser.add_argument("-c", "--control", action="store", default="tcp://127.0.0.1:8888", help="ZeroMQ control endpoint")
     parser.add_argument("-s", "--status",  action="store", default="tcp://127.0.0.1:8889", help="ZeroMQ status endpoint")
+    parser.add_argument("-e", "--events",  action="store", default="tcp://127.0.0.1:8890", help="ZeroMQ status change events endpoint")
     args = parser.parse_args()
     return args
 
@@ -33,6 +34,9 @@ def main():
     # Initialise the status endpoint
     percival.setup_status_channel(args.status)
 
+    # Initialise the status change events endpoint
+    percival.setup_event_channel(args.events)
+
     # Startup the IpcReactor
     percival.start_reactor()
 
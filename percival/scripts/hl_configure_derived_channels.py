@@ -0,0 +1,39 @@
+'''
+Load the derived monitor channels evaluated by the server on every status read.
+'''
+from __future__ import print_function
+
+import argparse
+
+from percival.log import log
+from percival.scripts.util import PercivalClient
+
+
+def options():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-a", "--address", action="store", default="127.0.0.1:8888",
+                        help="Odin server address (default 127.0.0.1:8888)")
+    parser.add_argument("-i", "--input", required=True, action='store', help="Input derived channels ini file to apply")
+    wait_help = "Wait for the command to complete (default true)"
+    parser.add_argument("-w", "--wait", action="store", default="true", help=wait_help)
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = options()
+    log.info(args)
+
+    with open(args.input, 'r') as ini_file:
+        ini_str = ini_file.read()
+
+    pc = PercivalClient(args.address)
+    result = pc.send_configuration('derived_channels',
+                                   ini_str,
+                                   'hl_configure_derived_channels.py',
+                                   wait=(args.wait.lower() == "true"))
+    log.info("Response: %s", result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+'''
+Ramp all of the channels of a set-point from their current values, each at its maximum slew rate.
+'''
+from __future__ import print_function
+
+import argparse
+import signal
+
+from percival.log import log
+from percival.scripts.util import PercivalClient
+
+
+def options():
+    desc = """Ramp from the current position to a demand setpoint.  Every channel moves concurrently at no more than
+    its maximum slew rate (Maximum_slew_rate of the channel or max_slew_rate of the [Control] section).
+    """
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument("-a", "--address", action="store", default="127.0.0.1:8888",
+                        help="Odin server address (default 127.0.0.1:8888)")
+    final_help = "Set-point to ramp to"
+    parser.add_argument("-f", "--final_setpoint", action="store", help=final_help)
+    period_help = "Time between the writes of the ramp in ms (default ramp_period of the [Control] section)"
+    parser.add_argument("-p", "--period", action="store", default=None, help=period_help)
+    wait_help = "Wait for the command to complete (default true)"
+    parser.add_argument("-w", "--wait", action="store", default="true", help=wait_help)
+    args = parser.parse_args()
+
+    return args
+
+
+def sigint_handler(signum, frame):
+    args = options()
+    pc = PercivalClient(args.address)
+    result = pc.send_command('cmd_abort_scan', 'hl_ramp_setpoint.py')
+    log.info("Response: %s", result)
+
+signal.signal(signal.SIGINT, sigint_handler)
+
+
+def main():
+    args = options()
+    log.info(args)
+
+    data = {
+               'setpoint': args.final_setpoint
+           }
+    if args.period is not None:
+        data['period'] = args.period
+
+    pc = PercivalClient(args.address)
+    result = pc.send_command('cmd_ramp_setpoint',
+                             'hl_ramp_setpoint.py',
+                             arguments=data,
+                             wait=(args.wait.lower() == "true"))
+    log.info("Response: %s", result)
+
+
+if __name__ == '__main__':
+    main()
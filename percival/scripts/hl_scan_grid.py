@@ -0,0 +1,86 @@
+'''
+Scan over an N-dimensional grid of set-points or control channels, executed by the server.
+'''
+from __future__ import print_function
+
+import argparse
+import json
+import signal
+
+from percival.log import log
+from percival.scripts.util import PercivalClient
+
+
+def options():
+    desc = """Scan over an N-dimensional grid.  Each dimension is given as SCAN:STEPS:DWELL, outermost first, where
+    SCAN is either a comma separated list of set-points or CHANNEL=START,STOP, STEPS is the number of steps between
+    the set-points (or from START to STOP) and DWELL is the time in ms each step is held after the dimension moves.
+    For example -d VRST_LOW,VRST_HIGH:10:500 -d PS_LOW,PS_HIGH:5:2000
+    """
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument("-a", "--address", action="store", default="127.0.0.1:8888",
+                        help="Odin server address (default 127.0.0.1:8888)")
+    dimension_help = "Dimension of the grid as SCAN:STEPS:DWELL (repeat for each dimension, outermost first)"
+    parser.add_argument("-d", "--dimension", action="append", default=[], help=dimension_help)
+    snake_help = "Reverse every other pass of each dimension to minimise moves (default true)"
+    parser.add_argument("-n", "--snake", action="store", default="true", help=snake_help)
+    record_help = "Comma separated monitor groups (or channels) to record at each step (default none)"
+    parser.add_argument("-r", "--record", action="store", default=None, help=record_help)
+    settle_help = "Settle time after each step before recording the monitors in ms (default 0)"
+    parser.add_argument("-s", "--settle", action="store", default=0, help=settle_help)
+    output_help = "Name of a new HDF5 file in the scan data directory of the server to stream the recorded " \
+                  "monitors to (default record in memory)"
+    parser.add_argument("-o", "--output", action="store", default=None, help=output_help)
+    wait_help = "Wait for the command to complete (default true)"
+    parser.add_argument("-w", "--wait", action="store", default="true", help=wait_help)
+    args = parser.parse_args()
+
+    return args
+
+
+def parse_dimension(text):
+    scan, steps, dwell = text.rsplit(":", 2)
+    if "=" in scan:
+        channel, limits = scan.split("=", 1)
+        start, stop = limits.split(",")
+        dimension = {'channel': channel, 'start': float(start), 'stop': float(stop)}
+    else:
+        dimension = {'setpoints': scan.split(",")}
+    dimension['steps'] = int(steps)
+    dimension['dwell'] = float(dwell)
+    return dimension
+
+
+def sigint_handler(signum, frame):
+    args = options()
+    pc = PercivalClient(args.address)
+    result = pc.send_command('cmd_abort_scan', 'hl_scan_grid.py')
+    log.info("Response: %s", result)
+
+signal.signal(signal.SIGINT, sigint_handler)
+
+
+def main():
+    args = options()
+    log.info(args)
+
+    data = {
+               'dimensions': [parse_dimension(dimension) for dimension in args.dimension],
+               'snake': args.snake
+           }
+    if args.record:
+        data['record'] = args.record
+        data['settle'] = args.settle
+        if args.output:
+            data['file'] = args.output
+
+    pc = PercivalClient(args.address)
+    result = pc.send_command('cmd_scan_grid',
+                             'hl_scan_grid.py',
+                             arguments=json.dumps(data),
+                             wait=(args.wait.lower() == "true"))
+    log.info("Response: %s", result)
+
+
+if __name__ == '__main__':
+    main()
@@ -26,6 +26,13 @@ def options():
     parser.add_argument("-n", "--number_of_steps", action="store", default=10, help=number_help)
     delay_help = "Delay time between steps in ms (default 1000)"
     parser.add_argument("-d", "--delay_between_steps", action="store", default=1000, help=delay_help)
+    record_help = "Comma separated monitor groups (or channels) to record at each step (default none)"
+    parser.add_argument("-r", "--record", action="store", default=None, help=record_help)
+    settle_help = "Settle time after each step before recording the monitors in ms (default 0)"
+    parser.add_argument("-s", "--settle", action="store", default=0, help=settle_help)
+    output_help = "Name of a new HDF5 file in the scan data directory of the server to stream the recorded " \
+                  "monitors to (default record in memory)"
+    parser.add_argument("-o", "--output", action="store", default=None, help=output_help)
     wait_help = "Wait for the command to complete (default true)"
     parser.add_argument("-w", "--wait", action="store", default="true", help=wait_help)
     args = parser.parse_args()
@@ -53,6 +60,11 @@ def main():
                'dwell': args.delay_between_steps,
                'steps': args.number_of_steps
            }
+    if args.record:
+        data['record'] = args.record
+        data['settle'] = args.settle
+        if args.output:
+            data['file'] = args.output
 
     pc = PercivalClient(args.address)
     result = pc.send_command('cmd_scan_setpoints',
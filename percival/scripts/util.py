@@ -1,5 +1,6 @@
 from __future__ import print_function
 
+import json
 import requests
 import time
 import getpass
@@ -35,11 +36,43 @@ class PercivalClient(object):
             log.exception(result['error'])
 
         if wait:
-            if result['response'] != 'Failed':
-                result = self.wait_for_command_completion()
+            if result.get('response') not in ('Failed', 'Completed', None):
+                job_ids = result.get('job_ids')
+                if job_ids:
+                    # Wait for the last job, which finishes after any others submitted with it
+                    result = self.wait_for_command_completion(job_id=job_ids[-1])
+                else:
+                    result = self.wait_for_command_completion()
 
         return result
 
+    def send_sequence(self, commands, command_id="python_script", wait=True):
+        """
+        Submit a list of commands to be executed in order.  Each item is a (command, arguments) tuple.
+        If any command of the sequence fails the remaining commands are cancelled.
+        """
+        arguments = json.dumps({
+            'commands': [{'command': command, 'parameters': parameters or {}} for command, parameters in commands]
+        })
+        return self.send_command('cmd_queue_sequence', command_id, arguments, wait=wait)
+
+    def cancel_job(self, job_id, command_id="python_script"):
+        arguments = {
+            'id': job_id
+        }
+        return self.send_command('cmd_cancel_job', command_id, arguments, wait=False)
+
+    def get_job(self, job_id):
+        return self.get_status('jobs', {'id': job_id})
+
+    def get_events(self, since=0, fields=None):
+        arguments = {
+            'since': since
+        }
+        if fields:
+            arguments['field'] = ",".join(fields)
+        return self.get_status('events', arguments)
+
     def get_status(self, status_item, arguments=None):
         try:
             url = self._url + status_item
@@ -60,13 +93,16 @@ class PercivalClient(object):
 
         return result
 
-    def wait_for_command_completion(self, wait_time=0.5):
+    def wait_for_command_completion(self, wait_time=0.5, job_id=None):
         response = None
         command_active = True
         while command_active:
-            response = self.get_status('action')
+            if job_id is None:
+                response = self.get_status('action')
+            else:
+                response = self.get_job(job_id)
             log.debug(response)
-            if response['response'] == 'Active':
+            if response.get('response') in ('Queued', 'Active'):
                 time.sleep(wait_time)
             else:
                 command_active = False
@@ -56,7 +56,7 @@ setup(
     packages=find_packages(exclude=['docs', 'sandbox', 'tests*']),
 
     # run-time dependencies here. These will be installed by pip when the project is installed.
-    install_requires=['numpy==1.12.0', 'h5py==2.6.0', 'future==0.15.2', 'enum34==1.1.6', 'npyscreen==4.10.5', 'pyzmq==15.3.0'],
+    install_requires=['numpy==1.12.0', 'h5py==2.6.0', 'future==0.15.2', 'enum34==1.1.6', 'monotonic==1.5', 'npyscreen==4.10.5', 'pyzmq==15.3.0'],
 
     # Additional groups of dependencies (e.g. development dependencies). 
     # You can install these using the following syntax, for example:
@@ -94,15 +94,22 @@ setup(
             'percival-hl-configure-control-groups=percival.scripts.hl_configure_control_groups:main',
             'percival-hl-configure-monitor-groups=percival.scripts.hl_configure_monitor_groups:main',
             'percival-hl-configure-setpoints=percival.scripts.hl_configure_setpoints:main',
+            'percival-hl-configure-safety-rules=percival.scripts.hl_configure_safety_rules:main',
+            'percival-hl-configure-derived-channels=percival.scripts.hl_configure_derived_channels:main',
             'percival-hl-initialise-channels=percival.scripts.hl_initialise_channels:main',
             'percival-hl-download-channel-settings=percival.scripts.hl_download_channel_settings:main',
             'percival-hl-scan-setpoints=percival.scripts.hl_scan_setpoints:main',
             'percival-hl-safety-setpoint-scan=percival.scripts.hl_safety_setpoint_scan:main',
+            'percival-hl-ramp-setpoint=percival.scripts.hl_ramp_setpoint:main',
+            'percival-hl-scan-grid=percival.scripts.hl_scan_grid:main',
             'percival-hl-set-channel=percival.scripts.hl_set_channel:main',
             'percival-hl-system-command=percival.scripts.hl_system_command:main',
             'percival-hl-update-monitors=percival.scripts.hl_update_monitors:main',
             'percival-hl-apply-sensor-roi=percival.scripts.hl_apply_sensor_roi:main',
             'percival-hl-set-system-setting=percival.scripts.hl_set_system_setting:main',
+            'percival-benchmark=percival.benchmarks.end_to_end:main',
+            'percival-micro-benchmark=percival.benchmarks.micro:main',
+            'percival-ingest-benchmark=percival.benchmarks.ingest:main',
         ],
     },
 )
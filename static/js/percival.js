@@ -8,6 +8,11 @@ percival = {
     api_version: '0.1',
     current_page: '.home-view',
     monitors: {},
+    // Latest status of each monitor, merged from the changes returned by each status poll
+    monitor_status: {},
+    // Timestamp of the last status poll, the next poll returns only the monitors changed since then
+    status_since: 0,
+    stale_monitors: [],
     monitor_count: 0,
     monitor_divs: 0,
     groups: {},
@@ -953,8 +958,16 @@ function render_config_view()
 
 function update_api_read_status()
 {
-  $.getJSON('/api/' + api_version + '/percival/status/', function(response) {
+  $.getJSON('/api/' + api_version + '/percival/status/?since=' + percival.status_since, function(response) {
     var detector = response['detector'];
+    if (detector == null){
+      // No status has been read yet
+      return;
+    }
+    var changed = response['channels'];
+    percival.status_since = response['timestamp'];
+    percival.stale_monitors = response['stale'];
+    $.extend(percival.monitor_status, changed);
     $('#det-image-counter').html(detector['Image_counter']);
     $('#det-acq-counter').html(detector['Acquisition_counter']);
     $('#det-train-number').html(detector['Train_number']);
@@ -1013,10 +1026,14 @@ function update_api_read_status()
     render_status_view();
     var tableData = [];
     for (var index = 0; index < len; index++){
+      var status = percival.monitor_status[monitor_names[index]];
+      if (status == null){
+        continue;
+      }
       if (percival.monitors[monitor_names[index]] == null){
-        percival.monitors[monitor_names[index]] = new Monitor('#stat-' + (index+1), monitor_names[index], response[monitor_names[index]]);
-      } else {
-        percival.monitors[monitor_names[index]].update(response[monitor_names[index]]);
+        percival.monitors[monitor_names[index]] = new Monitor('#stat-' + (index+1), monitor_names[index], status);
+      } else if (monitor_names[index] in changed){
+        percival.monitors[monitor_names[index]].update(status);
       }
     }
   });